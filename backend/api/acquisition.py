@@ -0,0 +1,288 @@
+"""
+Получение измерений для активных партий на стороне сервера.
+
+Источник данных (DataSource) отдает очередное измерение для партии,
+цикл AcquisitionLoop опрашивает источник с заданной частотой и
+записывает накопленные измерения пачками через ingest_readings.
+PlantSource симулирует линию, которая следует действующим уставкам
+(см. controller.py), для проверки регулятора на стенде.
+"""
+import logging
+import math
+import random
+import time
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import get_active_settings, get_active_setpoints
+from .chunks import latest_parameter
+from .ingest import ingest_readings
+from .models import Batch, PARAMETER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Значения параметров, если нет ни измерений, ни активных настроек
+DEFAULT_PARAMETERS = {
+    'temperature': 170.0,
+    'pressure': 2.5,
+    'mixing_speed': 60.0,
+    'glazing_thickness': 2.0,
+}
+
+# Диапазоны приращений случайного блуждания для каждого параметра
+RANDOM_WALK_STEPS = {
+    'temperature': (-0.1, 0.2),
+    'pressure': (-0.01, 0.02),
+    'mixing_speed': (-0.2, 0.2),
+    'glazing_thickness': (-0.01, 0.02),
+}
+
+# Динамика симулированной линии (PlantSimulator) по параметрам:
+# постоянная времени отклика на уставку, с; шум датчика; интенсивность
+# случайного блуждания смещения процесса, ед./√с; систематический уход
+# смещения (износ нагревателя, засорение форсунок), ед./с
+PLANT_DYNAMICS = {
+    'temperature': (5.0, 0.3, 0.05, 0.005),
+    'pressure': (2.0, 0.03, 0.005, 0.0005),
+    'mixing_speed': (1.0, 0.3, 0.05, 0.0),
+    'glazing_thickness': (3.0, 0.02, 0.003, 0.0002),
+}
+
+
+def initial_parameters(line_id=None):
+    """Начальные значения параметров из активной настройки производства линии"""
+    production_settings = get_active_settings(line_id)
+    if production_settings:
+        return {field: getattr(production_settings, field) for field in PARAMETER_FIELDS}
+    return dict(DEFAULT_PARAMETERS)
+
+
+class DataSource:
+    """Источник измерений параметров партии"""
+
+    def read(self, batch):
+        """Возвращает очередное измерение партии в виде словаря значений параметров"""
+        raise NotImplementedError
+
+    def forget(self, batch_id):
+        """Сбрасывает состояние завершенной партии"""
+
+
+class RandomWalkSource(DataSource):
+    """
+    Симуляция датчиков: каждое измерение - предыдущее значение
+    со случайным приращением. Последние значения хранятся в памяти,
+    поэтому база читается только при первом обращении к партии.
+    """
+
+    def __init__(self):
+        self.last_values = {}
+
+    @staticmethod
+    def step(values):
+        """Следующее измерение по предыдущему"""
+        return {
+            field: values[field] + random.uniform(*RANDOM_WALK_STEPS[field])
+            for field in PARAMETER_FIELDS
+        }
+
+    def read(self, batch):
+        values = self.last_values.get(batch.pk)
+        if values is None:
+            last_parameter = latest_parameter(batch.pk)
+            if last_parameter:
+                values = self.step({field: getattr(last_parameter, field) for field in PARAMETER_FIELDS})
+            else:
+                values = initial_parameters(batch.line_id)
+        else:
+            values = self.step(values)
+        self.last_values[batch.pk] = values
+        return dict(values)
+
+    def forget(self, batch_id):
+        self.last_values.pop(batch_id, None)
+
+
+class PlantSimulator:
+    """
+    Симуляция отклика линии на уставки: параметр с постоянной времени
+    стремится к уставке плюс смещение процесса, смещение блуждает и
+    уходит со временем, к измерению добавляется шум датчика. Две модели
+    с одинаковым seed получают одинаковые возмущения
+    """
+
+    def __init__(self, values, seed=None):
+        self.random = np.random.default_rng(seed)
+        dynamics = np.array([PLANT_DYNAMICS[field] for field in PARAMETER_FIELDS], dtype=np.float64)
+        self.time_constant, self.noise, self.diffusion, self.trend = dynamics.T
+        self.state = np.array([values[field] for field in PARAMETER_FIELDS], dtype=np.float64)
+        self.bias = np.zeros(len(PARAMETER_FIELDS))
+
+    def step(self, setpoints, elapsed):
+        """Измерение через elapsed секунд при уставках setpoints (словарь)"""
+        size = len(PARAMETER_FIELDS)
+        target = np.array([setpoints[field] for field in PARAMETER_FIELDS], dtype=np.float64)
+        self.bias += self.trend * elapsed + self.diffusion * math.sqrt(elapsed) * self.random.standard_normal(size)
+        self.state += (target + self.bias - self.state) * -np.expm1(-elapsed / self.time_constant)
+        measured = self.state + self.noise * self.random.standard_normal(size)
+        return dict(zip(PARAMETER_FIELDS, measured.tolist()))
+
+
+class PlantSource(DataSource):
+    """Симуляция линии, которая следует действующим уставкам (get_active_setpoints)"""
+
+    def __init__(self):
+        self.plants = {}
+
+    def read(self, batch):
+        setpoints = get_active_setpoints(batch.line_id) or initial_parameters(batch.line_id)
+        now = time.monotonic()
+        entry = self.plants.get(batch.pk)
+        if entry is None:
+            last_parameter = latest_parameter(batch.pk)
+            if last_parameter:
+                values = {field: getattr(last_parameter, field) for field in PARAMETER_FIELDS}
+            else:
+                values = setpoints
+            entry = self.plants[batch.pk] = [PlantSimulator(values), now]
+        plant, last_read = entry
+        entry[1] = now
+        return plant.step(setpoints, max(now - last_read, 1e-3))
+
+    def forget(self, batch_id):
+        self.plants.pop(batch_id, None)
+
+
+class AcquisitionLoop:
+    """
+    Цикл получения измерений для всех активных партий.
+
+    Измерения снимаются с частотой rate (Гц) и копятся в буфере,
+    который раз в flush_interval секунд записывается одной транзакцией
+    на партию. Измерения партии, остановленной до записи буфера,
+    отбрасываются. Раз в report_interval секунд в лог пишется фактическая
+    частота в сравнении с целевой.
+    """
+
+    def __init__(self, source, rate, flush_interval=1.0, report_interval=10.0, refresh_interval=1.0):
+        self.source = source
+        self.rate = rate
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.refresh_interval = refresh_interval
+        self.batches = []
+        self.buffers = {}
+        self.stopped = False
+        self.report_readings = 0
+        self.report_ticks = 0
+        self.late_ticks = 0
+
+    def refresh_batches(self):
+        batches = list(Batch.objects.filter(is_active=True))
+        active_ids = {batch.pk for batch in batches}
+        for batch in self.batches:
+            if batch.pk not in active_ids:
+                self.drop_buffer(batch)
+                self.source.forget(batch.pk)
+        self.batches = batches
+
+    def drop_buffer(self, batch):
+        # Завершенная партия не принимает измерений, как и при загрузке через API
+        readings = self.buffers.pop(batch.pk, None)
+        if readings:
+            logger.warning('Партия %s остановлена: отброшено измерений: %s', batch.batch_number, len(readings))
+
+    def tick(self):
+        now = timezone.now()
+        for batch in self.batches:
+            reading = self.source.read(batch)
+            reading['timestamp'] = now
+            self.buffers.setdefault(batch.pk, []).append(reading)
+
+    def flush_batch(self, batch):
+        if not self.buffers.get(batch.pk):
+            return
+        with transaction.atomic():
+            # Блокировка строки партии: остановка партии дождется записи
+            # или запись увидит, что партия уже остановлена
+            if not Batch.objects.select_for_update().filter(pk=batch.pk, is_active=True).exists():
+                self.drop_buffer(batch)
+                return
+            summary = ingest_readings(batch, self.buffers.pop(batch.pk))
+        self.report_readings += summary['accepted']
+        if summary['rejected']:
+            logger.warning('Партия %s: отклонено измерений: %s', batch.batch_number, summary['rejected'])
+
+    def flush(self):
+        for batch in self.batches:
+            self.flush_batch(batch)
+
+    def report(self, elapsed):
+        achieved = self.report_ticks / elapsed if elapsed > 0 else 0.0
+        stats = {
+            'target_rate': self.rate,
+            'achieved_rate': achieved,
+            'readings_per_second': self.report_readings / elapsed if elapsed > 0 else 0.0,
+            'active_batches': len(self.batches),
+            'late_ticks': self.late_ticks,
+        }
+        self.report_readings = 0
+        self.report_ticks = 0
+        self.late_ticks = 0
+        return stats
+
+    def run(self, duration=None, on_report=None):
+        """
+        Запускает цикл до вызова stop() или истечения duration секунд.
+        on_report получает словарь со статистикой частоты.
+        """
+        period = 1.0 / self.rate
+        started = last_flush = last_refresh = last_report = time.monotonic()
+        next_tick = started
+        self.refresh_batches()
+        try:
+            while not self.stopped:
+                now = time.monotonic()
+                if duration is not None and now - started >= duration:
+                    break
+
+                if now >= next_tick:
+                    self.tick()
+                    self.report_ticks += 1
+                    next_tick += period
+                    # Если цикл отстал больше чем на такт, пропущенные такты не догоняются
+                    if now - next_tick > period:
+                        self.late_ticks += 1
+                        next_tick = now + period
+
+                if now - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = now
+                if now - last_refresh >= self.refresh_interval:
+                    self.refresh_batches()
+                    last_refresh = now
+                if now - last_report >= self.report_interval:
+                    stats = self.report(now - last_report)
+                    if on_report:
+                        on_report(stats)
+                    last_report = now
+
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            self.flush()
+
+    def stop(self):
+        self.stopped = True
+
+
+def get_data_source(path=None):
+    """Создает источник данных по пути импорта (по умолчанию ACQUISITION_SOURCE)"""
+    path = path or getattr(settings, 'ACQUISITION_SOURCE', 'api.acquisition.RandomWalkSource')
+    return import_string(path)()
@@ -1,10 +1,15 @@
 from django.contrib import admin
-from .models import Batch, BatchParameter, ProductionSettings, Notification
+from .models import Batch, BatchArchive, BatchParameter, BatchParameterChunk, DefectRiskModel, ProductionLine, SetpointAdjustment, ProductionSettings, DefectRule, Notification
+
+@admin.register(ProductionLine)
+class ProductionLineAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'active_settings')
+    search_fields = ('code', 'name')
 
 @admin.register(Batch)
 class BatchAdmin(admin.ModelAdmin):
-    list_display = ('batch_number', 'start_time', 'end_time', 'is_active', 'defect_count', 'total_count', 'defect_percentage')
-    list_filter = ('is_active',)
+    list_display = ('batch_number', 'line', 'start_time', 'end_time', 'is_active', 'defect_count', 'total_count', 'defect_percentage')
+    list_filter = ('is_active', 'line')
     search_fields = ('batch_number',)
     readonly_fields = ('defect_percentage',)
 
@@ -14,14 +19,42 @@ class BatchParameterAdmin(admin.ModelAdmin):
     list_filter = ('is_defect', 'batch')
     search_fields = ('batch__batch_number',)
 
+@admin.register(BatchParameterChunk)
+class BatchParameterChunkAdmin(admin.ModelAdmin):
+    list_display = ('batch', 'start_time', 'end_time', 'count', 'defect_count')
+    list_filter = ('batch',)
+    exclude = ('timestamps', 'values', 'defects')
+
 @admin.register(ProductionSettings)
 class ProductionSettingsAdmin(admin.ModelAdmin):
     list_display = ('name', 'temperature', 'pressure', 'mixing_speed', 'glazing_thickness', 'is_active', 'timestamp')
     list_filter = ('is_active',)
     search_fields = ('name',)
 
+@admin.register(DefectRule)
+class DefectRuleAdmin(admin.ModelAdmin):
+    list_display = ('settings', 'rule_type', 'parameter', 'min_value', 'max_value', 'secondary_parameter', 'is_enabled')
+    list_filter = ('rule_type', 'parameter', 'is_enabled', 'settings')
+
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('message', 'notification_type', 'batch', 'timestamp', 'is_read')
+    list_display = ('message', 'notification_type', 'batch', 'occurrences', 'timestamp', 'is_read')
     list_filter = ('notification_type', 'is_read', 'batch')
-    search_fields = ('message', 'batch__batch_number') 
\ No newline at end of file
+    search_fields = ('message', 'batch__batch_number')
+
+@admin.register(BatchArchive)
+class BatchArchiveAdmin(admin.ModelAdmin):
+    list_display = ('batch', 'status', 'parameter_count', 'vision_count', 'created_at', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('batch__batch_number',)
+    readonly_fields = ('checksums',) 
+
+@admin.register(DefectRiskModel)
+class DefectRiskModelAdmin(admin.ModelAdmin):
+    list_display = ('line', 'samples', 'positives', 'trained_at')
+    readonly_fields = ('state', 'cursors')
+
+@admin.register(SetpointAdjustment)
+class SetpointAdjustmentAdmin(admin.ModelAdmin):
+    list_display = ('line', 'parameter', 'mode', 'previous_value', 'value', 'measured', 'is_limited', 'is_dry_run', 'timestamp')
+    list_filter = ('line', 'parameter', 'mode', 'is_limited', 'is_dry_run')
@@ -0,0 +1,490 @@
+"""
+Архив исходных измерений завершенных партий.
+
+Измерения завершенной партии не меняются, поэтому их строки
+(BatchParameter, ComputerVisionData) переносятся из таблиц базы
+в файлы: по каталогу на партию в ARCHIVE_ROOT. Каждый столбец измерений
+хранится в отдельном несжатом файле .npy, который читается отображением
+в память без загрузки целиком; время хранится в микросекундах (int64),
+чтобы значения совпадали с базой точно. Данные компьютерного зрения
+хранятся одним сжатым файлом vision.npz, текстовые столбцы - в JSON.
+
+Перенос партии (archive_batch) идет по шагам, каждый из которых можно
+повторить после сбоя:
+
+1. столбцы записываются во временный каталог, сверяются со строками
+   базы значение в значение и переименовываются в каталог партии;
+2. создается манифест BatchArchive (status='verified') с количеством
+   строк и контрольными суммами файлов - с этого момента чтение идет
+   из архива;
+3. строки партии удаляются из базы порциями, после чего манифест
+   получает status='archived'.
+
+Поминутные агрегаты и уведомления остаются в базе. Кадры, на которые
+ссылаются перенесенные записи компьютерного зрения, purge_frames
+больше не видит и не удаляет.
+"""
+import hashlib
+import heapq
+import json
+import os
+import shutil
+from itertools import islice
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .chunks import (
+    after_cursor, chunk_queryset, count_chunk_readings, iter_chunk_arrays, iter_chunk_columns, iter_chunk_rows,
+    load_chunk_arrays, merge_arrays,
+)
+from .models import Batch, BatchArchive, BatchParameter, BatchParameterChunk, ComputerVisionData, PARAMETER_FIELDS
+from .timeseries import BLOCK_SIZE, iter_parameter_blocks, load_parameter_arrays
+from .versions import bump_version
+
+# Наборы данных выгрузки, строки которых переносятся в архив
+ARCHIVED_KINDS = ('parameters', 'vision')
+
+PARAMETER_COLUMNS = ('id', 'timestamp_us') + PARAMETER_FIELDS + ('is_defect',)
+VISION_FILE = 'vision.npz'
+VISION_TEXT_COLUMNS = ('image_path', 'image_hash', 'detected_objects')
+
+
+class ArchiveError(Exception):
+    """Архив не совпадает с данными базы или поврежден"""
+
+
+def archive_root():
+    return Path(getattr(settings, 'ARCHIVE_ROOT', Path(settings.BASE_DIR) / 'archive'))
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _microseconds(value):
+    # Целочисленно, без округления через float
+    return (value - EPOCH) // MICROSECOND
+
+
+def _to_microseconds(timestamps):
+    return np.fromiter((_microseconds(value) for value in timestamps), dtype=np.int64, count=len(timestamps))
+
+
+def _to_datetime(microseconds):
+    return EPOCH + timedelta(microseconds=int(microseconds))
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _column_dtype(name):
+    if name in ('id', 'timestamp_us'):
+        return np.int64
+    if name == 'is_defect':
+        return np.bool_
+    return np.float64
+
+
+def _parameter_blocks(batch_id, block_size):
+    """
+    Измерения партии блоками столбцов архива: строки читаются курсором
+    по block_size, пачки - по одной. Порядок блоков не гарантируется
+    """
+    rows = (
+        BatchParameter.objects.filter(batch_id=batch_id)
+        .order_by('id')
+        .values_list('id', 'timestamp', *PARAMETER_FIELDS, 'is_defect')
+        .iterator(chunk_size=block_size)
+    )
+    while True:
+        block = list(islice(rows, block_size))
+        if not block:
+            break
+        columns = list(zip(*block))
+        result = {
+            'id': np.array(columns[0], dtype=np.int64),
+            'timestamp_us': _to_microseconds(columns[1]),
+            'is_defect': np.array(columns[-1], dtype=bool),
+        }
+        for position, field in enumerate(PARAMETER_FIELDS, start=2):
+            result[field] = np.array(columns[position], dtype=np.float64)
+        yield result
+    yield from iter_chunk_columns(batch_id)
+
+
+def _write_parameter_files(batch_id, directory, block_size):
+    """
+    Записывает столбцы измерений партии в файлы .npy, упорядочивая их
+    по (время, id). Блоки измерений пишутся в заранее выделенные файлы
+    (open_memmap) в порядке чтения, затем столбцы переставляются по
+    порядку времени тоже блоками: в памяти находятся только блок
+    и массив перестановки. Возвращает количество измерений
+    """
+    total = BatchParameter.objects.filter(batch_id=batch_id).count() + count_chunk_readings(batch_id)
+    unsorted = directory / 'unsorted'
+    unsorted.mkdir()
+    columns = {
+        name: np.lib.format.open_memmap(unsorted / f'{name}.npy', mode='w+', dtype=_column_dtype(name), shape=(total,))
+        for name in PARAMETER_COLUMNS
+    }
+    offset = 0
+    for block in _parameter_blocks(batch_id, block_size):
+        size = len(block['id'])
+        if offset + size > total:
+            raise ArchiveError(f'Партия {batch_id}: измерения изменились во время записи архива')
+        for name, column in columns.items():
+            column[offset:offset + size] = block[name]
+        offset += size
+    if offset != total:
+        raise ArchiveError(f'Партия {batch_id}: измерения изменились во время записи архива')
+
+    order = np.lexsort((columns['id'], columns['timestamp_us']))
+    for name, column in columns.items():
+        target = np.lib.format.open_memmap(directory / f'{name}.npy', mode='w+', dtype=column.dtype, shape=(total,))
+        for start in range(0, total, block_size):
+            target[start:start + block_size] = column[order[start:start + block_size]]
+        target.flush()
+        del target
+    del columns
+    shutil.rmtree(unsorted)
+    return total
+
+
+def _verify_parameter_files(batch_id, directory, total, block_size):
+    """
+    Сверяет файлы измерений с базой значение в значение: каждое измерение
+    базы находится в файлах по id, файлы упорядочены и не содержат лишнего
+    """
+    written = {name: np.load(directory / f'{name}.npy', mmap_mode='r') for name in PARAMETER_COLUMNS}
+    ids, timestamps = written['id'], written['timestamp_us']
+    if len(ids) != total:
+        return False
+    if total > 1:
+        later = timestamps[1:] > timestamps[:-1]
+        if not (later | ((timestamps[1:] == timestamps[:-1]) & (ids[1:] > ids[:-1]))).all():
+            return False
+    by_id = np.argsort(ids)
+    sorted_ids = ids[by_id]
+    if total > 1 and not (sorted_ids[1:] > sorted_ids[:-1]).all():
+        return False
+    seen = 0
+    for block in _parameter_blocks(batch_id, block_size):
+        found = np.minimum(np.searchsorted(sorted_ids, block['id']), max(total - 1, 0))
+        if not total or not np.array_equal(sorted_ids[found], block['id']):
+            return False
+        positions = by_id[found]
+        if not all(np.array_equal(written[name][positions], block[name]) for name in PARAMETER_COLUMNS):
+            return False
+        seen += len(positions)
+    return seen == total
+
+
+def _vision_columns(batch_id):
+    rows = list(
+        ComputerVisionData.objects.filter(batch_id=batch_id)
+        .order_by('timestamp', 'id')
+        .values_list('id', 'timestamp', 'confidence_score', 'is_defect', *VISION_TEXT_COLUMNS)
+    )
+    columns = list(zip(*rows)) if rows else [()] * 7
+    result = {
+        'id': np.array(columns[0], dtype=np.int64),
+        'timestamp_us': _to_microseconds(columns[1]),
+        'confidence_score': np.array(columns[2], dtype=np.float64),
+        'is_defect': np.array(columns[3], dtype=bool),
+    }
+    for position, name in enumerate(VISION_TEXT_COLUMNS, start=4):
+        result[name] = np.array([json.dumps(value, ensure_ascii=False) for value in columns[position]], dtype=str)
+    return result
+
+
+def _same(expected, actual):
+    if set(expected) != set(actual):
+        return False
+    return all(
+        expected[name].shape == actual[name].shape and np.array_equal(expected[name], actual[name])
+        for name in expected
+    )
+
+
+def _write_files(batch_id, directory, block_size=BLOCK_SIZE):
+    """Записывает столбцы партии в каталог и сверяет записанное с базой"""
+    parameter_count = _write_parameter_files(batch_id, directory, block_size)
+    vision = _vision_columns(batch_id)
+    np.savez_compressed(directory / VISION_FILE, **vision)
+
+    if not _verify_parameter_files(batch_id, directory, parameter_count, block_size):
+        raise ArchiveError(f'Партия {batch_id}: записанные измерения не совпадают с базой')
+    with np.load(directory / VISION_FILE) as stored:
+        if not _same(vision, {name: stored[name] for name in stored.files}):
+            raise ArchiveError(f'Партия {batch_id}: записанные данные компьютерного зрения не совпадают с базой')
+
+    checksums = {path.name: _checksum(path) for path in sorted(directory.iterdir())}
+    return parameter_count, len(vision['id']), checksums
+
+
+def write_archive(batch):
+    """Шаги 1-2: файлы архива и манифест. Возвращает манифест"""
+    root = archive_root()
+    root.mkdir(parents=True, exist_ok=True)
+    final = root / str(batch.pk)
+    temporary = root / f'.{batch.pk}.tmp'
+    # Остатки прерванной записи: архив без манифеста не используется
+    for leftover in (temporary, final):
+        if leftover.exists():
+            shutil.rmtree(leftover)
+    temporary.mkdir()
+    try:
+        parameter_count, vision_count, checksums = _write_files(batch.pk, temporary)
+    except Exception:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+    os.replace(temporary, final)
+    return BatchArchive.objects.create(
+        batch=batch,
+        path=str(batch.pk),
+        parameter_count=parameter_count,
+        vision_count=vision_count,
+        checksums=checksums
+    )
+
+
+def purge_hot_rows(archive, chunk_size=5000):
+    """Шаг 3: удаляет перенесенные строки партии из базы порциями"""
+    deleted = 0
+    for model in (BatchParameter, BatchParameterChunk, ComputerVisionData):
+        while True:
+            ids = list(
+                model.objects.filter(batch_id=archive.batch_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            deleted += model.objects.filter(id__in=ids).delete()[0]
+    archive.status = 'archived'
+    archive.archived_at = timezone.now()
+    archive.save(update_fields=['status', 'archived_at'])
+    # Вложенные измерения и данные компьютерного зрения партии больше не отдаются из базы
+    bump_version('batches')
+    return deleted
+
+
+def archive_batch(batch, chunk_size=5000):
+    """
+    Переносит измерения завершенной партии в архив, продолжая прерванный
+    перенос. Возвращает манифест
+    """
+    if batch.is_active:
+        raise ArchiveError(f'Партия {batch.batch_number} еще активна')
+    archive = BatchArchive.objects.filter(batch=batch).first()
+    if archive is None:
+        archive = write_archive(batch)
+    if archive.status != 'archived':
+        verify_archive(archive)
+        purge_hot_rows(archive, chunk_size)
+    return archive
+
+
+def archive_candidates(days):
+    """Завершенные больше days дней назад партии, перенос которых не закончен"""
+    return (
+        Batch.objects.filter(is_active=False, end_time__lt=timezone.now() - timedelta(days=days))
+        .exclude(archive__status='archived')
+        .order_by('end_time')
+    )
+
+
+def archive_directory(archive):
+    return archive_root() / archive.path
+
+
+def verify_archive(archive):
+    """Сверяет контрольные суммы файлов архива с манифестом"""
+    directory = archive_directory(archive)
+    for name, expected in archive.checksums.items():
+        path = directory / name
+        if not path.exists():
+            raise ArchiveError(f'{archive}: нет файла {name}')
+        if _checksum(path) != expected:
+            raise ArchiveError(f'{archive}: контрольная сумма файла {name} не совпадает')
+
+
+def archived_frame_hashes():
+    """Хеши кадров, на которые ссылаются данные компьютерного зрения в архивах партий"""
+    hashes = set()
+    for archive in BatchArchive.objects.filter(vision_count__gt=0):
+        with np.load(archive_directory(archive) / VISION_FILE) as stored:
+            hashes.update(json.loads(value) for value in stored['image_hash'])
+    hashes.discard(None)
+    return hashes
+
+
+def delete_archive_files(archive):
+    shutil.rmtree(archive_directory(archive), ignore_errors=True)
+
+
+def _window(timestamps, since, until):
+    """Срез упорядоченного столбца времени по интервалу [since, until] двоичным поиском"""
+    start, end = 0, len(timestamps)
+    if since is not None:
+        start = int(np.searchsorted(timestamps, _microseconds(since), side='left'))
+    if until is not None:
+        end = int(np.searchsorted(timestamps, _microseconds(until), side='right'))
+    return slice(start, max(start, end))
+
+
+def get_archive(batch_id):
+    return BatchArchive.objects.filter(batch_id=batch_id).first()
+
+
+def read_parameter_arrays(archive, since=None, until=None, after=None):
+    """
+    Столбцы измерений из архива в формате load_parameter_arrays.
+    Читается только нужный интервал отображенных в память файлов
+    """
+    directory = archive_directory(archive)
+    columns = {name: np.load(directory / f'{name}.npy', mmap_mode='r') for name in PARAMETER_COLUMNS}
+    timestamps = columns['timestamp_us']
+    selected = _window(timestamps, since, until)
+    arrays = {name: columns[name][selected] for name in PARAMETER_FIELDS}
+    arrays['id'] = columns['id'][selected]
+    arrays['is_defect'] = columns['is_defect'][selected]
+    arrays['timestamp'] = timestamps[selected] / 1_000_000
+    if after is not None:
+        mask = after_cursor(arrays['id'], after)
+        arrays = {name: array[mask] for name, array in arrays.items()}
+    return arrays
+
+
+def load_batch_arrays(batch_id, since=None, until=None, after=None):
+    """
+    Измерения партии в виде столбцов (см. load_parameter_arrays):
+    из архива, если партия перенесена, иначе из строк и пачек в базе.
+    after - позиция (id строки, id измерения из пачки) из advance_cursor:
+    читаются только измерения после нее
+    """
+    row_id, chunk_id = after or (None, None)
+    archive = get_archive(batch_id)
+    if archive is not None:
+        return read_parameter_arrays(archive, since, until, after)
+    queryset = BatchParameter.objects.filter(batch_id=batch_id)
+    if since is not None:
+        queryset = queryset.filter(timestamp__gte=since)
+    if until is not None:
+        queryset = queryset.filter(timestamp__lte=until)
+    if row_id is not None:
+        queryset = queryset.filter(id__gt=row_id)
+    return merge_arrays(load_parameter_arrays(queryset), load_chunk_arrays(batch_id, since, until, chunk_id))
+
+
+def iter_batch_blocks(batch_id, since=None, until=None, block_size=BLOCK_SIZE):
+    """
+    Измерения партии за интервал [since, until] блоками столбцов в формате
+    load_parameter_arrays: из архива или из строк и пачек базы. Порядок
+    между блоками не гарантируется; в памяти одновременно находится один блок
+    """
+    archive = get_archive(batch_id)
+    if archive is not None:
+        directory = archive_directory(archive)
+        columns = {name: np.load(directory / f'{name}.npy', mmap_mode='r') for name in PARAMETER_COLUMNS}
+        window = _window(columns['timestamp_us'], since, until)
+        for offset in range(window.start, window.stop, block_size):
+            part = slice(offset, min(offset + block_size, window.stop))
+            block = {name: np.asarray(columns[name][part]) for name in PARAMETER_FIELDS + ('id', 'is_defect')}
+            block['timestamp'] = columns['timestamp_us'][part] / 1_000_000
+            yield block
+        return
+    queryset = BatchParameter.objects.filter(batch_id=batch_id)
+    if since is not None:
+        queryset = queryset.filter(timestamp__gte=since)
+    if until is not None:
+        queryset = queryset.filter(timestamp__lte=until)
+    yield from iter_parameter_blocks(queryset, block_size)
+    yield from iter_chunk_arrays(batch_id, since, until)
+
+
+def batch_time_range(batch_id):
+    """Время первого и последнего измерения партии или None, если измерений нет"""
+    archive = get_archive(batch_id)
+    if archive is not None:
+        timestamps = np.load(archive_directory(archive) / 'timestamp_us.npy', mmap_mode='r')
+        if not len(timestamps):
+            return None
+        return _to_datetime(timestamps[0]), _to_datetime(timestamps[-1])
+    rows = BatchParameter.objects.filter(batch_id=batch_id).aggregate(first=Min('timestamp'), last=Max('timestamp'))
+    chunks = chunk_queryset(batch_id).aggregate(first=Min('start_time'), last=Max('end_time'))
+    firsts = [value for value in (rows['first'], chunks['first']) if value is not None]
+    lasts = [value for value in (rows['last'], chunks['last']) if value is not None]
+    if not firsts:
+        return None
+    return min(firsts), max(lasts)
+
+
+def count_batch_readings(batch_id):
+    archive = get_archive(batch_id)
+    if archive is not None:
+        return archive.parameter_count
+    return BatchParameter.objects.filter(batch_id=batch_id).count() + count_chunk_readings(batch_id)
+
+
+def iter_archive_rows(archive, kind, columns, since=None, until=None, chunk_size=2000):
+    """Строки архива партии (kind = parameters | vision) в порядке времени, как values_list"""
+    directory = archive_directory(archive)
+    if kind == 'parameters':
+        source = {name: np.load(directory / f'{name}.npy', mmap_mode='r') for name in PARAMETER_COLUMNS}
+    else:
+        with np.load(directory / VISION_FILE) as stored:
+            source = {name: stored[name] for name in stored.files}
+    timestamps = source['timestamp_us']
+    window = _window(timestamps, since, until)
+
+    for offset in range(window.start, window.stop, chunk_size):
+        part = slice(offset, min(offset + chunk_size, window.stop))
+        values = []
+        for column in columns:
+            if column == 'batch_id':
+                values.append([archive.batch_id] * (part.stop - part.start))
+            elif column == 'timestamp':
+                values.append([_to_datetime(value) for value in timestamps[part]])
+            elif column in VISION_TEXT_COLUMNS:
+                values.append([json.loads(value) for value in source[column][part]])
+            else:
+                values.append(source[column][part].tolist())
+        yield from zip(*values)
+
+
+def merge_with_archives(kind, queryset, columns, iter_rows, batch_id=None, since=None, until=None):
+    """
+    Строки выгрузки из базы (для измерений - и из пачек) и из архивов
+    партий, объединенные по времени. Строки перенесенных партий берутся
+    только из архива
+    """
+    archives = BatchArchive.objects.select_related('batch')
+    if batch_id is not None:
+        archives = archives.filter(batch_id=batch_id)
+    if since is not None:
+        archives = archives.filter(batch__end_time__gte=since)
+    if until is not None:
+        archives = archives.filter(batch__start_time__lte=until)
+    archives = list(archives.order_by('batch__start_time'))
+    archived_ids = [archive.batch_id for archive in archives]
+
+    queryset = queryset.exclude(batch_id__in=archived_ids)
+    sources = [iter_rows(queryset, columns)] + [
+        iter_archive_rows(archive, kind, columns, since, until) for archive in archives
+    ]
+    if kind == 'parameters' and chunk_queryset(batch_id, since, until).exists():
+        sources.append(iter_chunk_rows(columns, batch_id, since, until, exclude_batches=archived_ids))
+    if len(sources) == 1:
+        return sources[0]
+    position = columns.index('timestamp')
+    return heapq.merge(*sources, key=lambda row: (row[position], row[0]))
+
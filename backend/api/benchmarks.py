@@ -0,0 +1,261 @@
+"""
+Нагрузочные замеры API.
+
+generate_history наполняет базу правдоподобной историей: партии
+с измерениями, браком, уведомлениями и данными компьютерного зрения.
+run_scenarios многократно вызывает горячие точки API внутри процесса
+(django.test.Client, без сети) и считает задержки p50/p99, пропускную
+способность и количество запросов к базе на вызов. compare сравнивает
+результаты с сохраненными ранее, чтобы замечать регрессии между коммитами.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import rollups
+from .acquisition import DEFAULT_PARAMETERS
+from .cache import get_active_batch
+from .defects import DEFECT_LIMITS
+from .models import (
+    Batch, BatchParameter, ComputerVisionData, Notification, ProductionLine,
+    PARAMETER_FIELDS, default_line_id
+)
+from .rules import CompiledRuleSet
+
+# Амплитуда медленного дрейфа и шум параметров в синтетической истории
+DRIFT = {'temperature': 4.0, 'pressure': 0.3, 'mixing_speed': 2.0, 'glazing_thickness': 0.15}
+NOISE = {'temperature': 0.8, 'pressure': 0.05, 'mixing_speed': 0.5, 'glazing_thickness': 0.03}
+
+
+def _lines(count):
+    lines = [ProductionLine.objects.get(pk=default_line_id())]
+    for index in range(2, count + 1):
+        line, _ = ProductionLine.objects.get_or_create(
+            code=f'bench-{index}', defaults={'name': f'Линия {index} (замеры)'}
+        )
+        lines.append(line)
+    return lines
+
+
+def _synthetic_values(rng, count, seconds):
+    """Медленный дрейф и шум вокруг номинальных значений параметров"""
+    values = np.empty((count, len(PARAMETER_FIELDS)))
+    for column, field in enumerate(PARAMETER_FIELDS):
+        period = rng.uniform(600, 3600)
+        phase = rng.uniform(0, 2 * np.pi)
+        values[:, column] = (
+            DEFAULT_PARAMETERS[field]
+            + DRIFT[field] * np.sin(2 * np.pi * seconds / period + phase)
+            + rng.normal(0, NOISE[field], count)
+        )
+    return values
+
+
+def _inject_defects(rng, values, defect_rate):
+    spikes = np.flatnonzero(rng.random(len(values)) < defect_rate)
+    columns = rng.integers(0, len(PARAMETER_FIELDS), len(spikes))
+    for row, column in zip(spikes, columns):
+        low, high = DEFECT_LIMITS[PARAMETER_FIELDS[column]]
+        margin = (high - low) * rng.uniform(0.05, 0.3)
+        values[row, column] = high + margin if rng.random() < 0.5 else low - margin
+
+
+def _defect_notifications(batch, timestamps, defects, window):
+    """Уведомления о браке, объединенные по окнам, как их создает notify"""
+    notifications = []
+    defect_times = [timestamps[index] for index in np.flatnonzero(defects)]
+    start = 0
+    while start < len(defect_times):
+        end = start
+        while end + 1 < len(defect_times) and defect_times[end + 1] - defect_times[start] < window:
+            end += 1
+        notifications.append(Notification(
+            batch=batch,
+            message=f"Обнаружен брак в партии {batch.batch_number}",
+            notification_type='warning',
+            timestamp=defect_times[start],
+            last_timestamp=defect_times[end],
+            occurrences=end - start + 1,
+            is_read=True
+        ))
+        start = end + 1
+    return notifications
+
+
+def generate_history(batch_count, readings_per_batch, interval=1.0, defect_rate=0.02, vision_every=10,
+                     line_count=1, seed=None, chunk_size=5000, progress=None):
+    """
+    Создает batch_count завершенных партий по readings_per_batch измерений
+    с шагом interval секунд. Партии идут друг за другом на line_count линиях
+    и заканчиваются к текущему моменту. Признак брака вычисляется правилами
+    по умолчанию; поминутные агрегаты строятся заново.
+    """
+    rng = np.random.default_rng(seed)
+    rule_set = CompiledRuleSet.default()
+    lines = _lines(line_count)
+    window = timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', 300))
+    duration = timedelta(seconds=readings_per_batch * interval)
+    gap = timedelta(minutes=5)
+    slots = -(-batch_count // line_count)
+    now = timezone.now()
+    prefix = f"G{now:%Y%m%d%H%M%S}"
+    seconds = np.arange(readings_per_batch) * interval
+
+    created = []
+    for index in range(batch_count):
+        line = lines[index % line_count]
+        start_time = now - (slots - index // line_count) * (duration + gap)
+        values = _synthetic_values(rng, readings_per_batch, seconds)
+        _inject_defects(rng, values, defect_rate)
+        defects = rule_set.evaluate(values, seconds)
+        timestamps = [start_time + timedelta(seconds=float(offset)) for offset in seconds]
+
+        with transaction.atomic():
+            batch = Batch.objects.create(
+                line=line,
+                batch_number=f"{prefix}-{index + 1}",
+                start_time=start_time,
+                end_time=start_time + duration,
+                is_active=False,
+                total_count=readings_per_batch,
+                defect_count=int(defects.sum())
+            )
+            for offset in range(0, readings_per_batch, chunk_size):
+                BatchParameter.objects.bulk_create([
+                    BatchParameter(
+                        batch=batch,
+                        timestamp=timestamps[row],
+                        is_defect=bool(defects[row]),
+                        **dict(zip(PARAMETER_FIELDS, values[row].tolist()))
+                    )
+                    for row in range(offset, min(offset + chunk_size, readings_per_batch))
+                ])
+            if vision_every:
+                ComputerVisionData.objects.bulk_create([
+                    ComputerVisionData(
+                        batch=batch,
+                        timestamp=timestamps[row],
+                        detected_objects={"objects": ["protein_bar"], "boxes": [[100, 100, 200, 200]]},
+                        confidence_score=float(rng.uniform(0.7, 0.99)),
+                        is_defect=bool(defects[row])
+                    )
+                    for row in range(0, readings_per_batch, vision_every)
+                ], batch_size=chunk_size)
+            Notification.objects.bulk_create(
+                [
+                    Notification(batch=batch, message=f"Партия {batch.batch_number} запущена",
+                                 notification_type='success', timestamp=start_time,
+                                 last_timestamp=start_time, is_read=True),
+                    Notification(batch=batch, message=f"Партия {batch.batch_number} завершена",
+                                 notification_type='info', timestamp=batch.end_time,
+                                 last_timestamp=batch.end_time, is_read=True),
+                ] + _defect_notifications(batch, timestamps, defects, window),
+                batch_size=chunk_size
+            )
+            rollups.rebuild(batch.pk)
+        created.append(batch)
+        if progress:
+            progress(batch)
+    return created
+
+
+def _percentile(values, percent):
+    return float(np.percentile(values, percent)) * 1000 if len(values) else 0.0
+
+
+def _scenarios(context):
+    return {
+        'simulate_parameter': lambda client: client.post(
+            f"/api/batches/{context['active_batch']}/simulate_parameter/"
+        ),
+        'current_parameters': lambda client: client.get('/api/parameters/current_parameters/'),
+        'batch_list': lambda client: client.get('/api/batches/'),
+        'batch_detail': lambda client: client.get(f"/api/batches/{context['detail_batch']}/"),
+        'notifications_list': lambda client: client.get('/api/notifications/'),
+    }
+
+
+SCENARIO_NAMES = ('simulate_parameter', 'current_parameters', 'batch_list', 'batch_detail', 'notifications_list')
+
+
+def prepare_context(client):
+    """Активная партия основной линии (запускается при отсутствии) и самая крупная партия"""
+    active_batch = get_active_batch()
+    if active_batch is None:
+        response = client.post('/api/batches/start_production/')
+        active_batch_id = response.json()['id']
+    else:
+        active_batch_id = active_batch.pk
+    detail_batch_id = Batch.objects.order_by('-total_count').values_list('id', flat=True).first()
+    return {'active_batch': active_batch_id, 'detail_batch': detail_batch_id}
+
+
+def run_scenario(client, call, iterations, warmup=10):
+    """Выполняет сценарий и возвращает задержки, пропускную способность и запросы к базе"""
+    for _ in range(warmup):
+        call(client)
+    durations = np.empty(iterations)
+    queries = 0
+    started = time.perf_counter()
+    for index in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            request_started = time.perf_counter()
+            response = call(client)
+            durations[index] = time.perf_counter() - request_started
+        if response.status_code >= 400:
+            raise RuntimeError(f'Ответ {response.status_code}: {response.content[:200]!r}')
+        queries += len(captured)
+    elapsed = time.perf_counter() - started
+    return {
+        'iterations': iterations,
+        'p50_ms': _percentile(durations, 50),
+        'p99_ms': _percentile(durations, 99),
+        'mean_ms': float(durations.mean()) * 1000,
+        'max_ms': float(durations.max()) * 1000,
+        'throughput_rps': iterations / elapsed if elapsed > 0 else 0.0,
+        'queries_per_request': queries / iterations,
+    }
+
+
+def run_scenarios(names=SCENARIO_NAMES, iterations=200, warmup=10, on_result=None):
+    client = Client()
+    context = prepare_context(client)
+    scenarios = _scenarios(context)
+    results = {}
+    for name in names:
+        results[name] = run_scenario(client, scenarios[name], iterations, warmup)
+        if on_result:
+            on_result(name, results[name])
+    return results
+
+
+# Сравниваемые показатели: для задержек допускается относительный рост
+# в пределах порога, количество запросов к базе расти не должно
+COMPARED_METRICS = ('p50_ms', 'p99_ms', 'queries_per_request')
+
+
+def compare(current, baseline, threshold=0.2):
+    """
+    Сравнивает результаты с базовыми. Возвращает строки
+    (сценарий, показатель, было, стало, изменение, регрессия)
+    """
+    rows = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = base[metric], result[metric]
+            change = (after - before) / before if before else 0.0
+            if metric == 'queries_per_request':
+                regressed = after > before + 1e-9
+            else:
+                regressed = change > threshold
+            rows.append((name, metric, before, after, change, regressed))
+    return rows
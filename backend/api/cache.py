@@ -0,0 +1,138 @@
+"""
+Кэш часто запрашиваемых значений: активная партия и активная настройка
+производства линии, действующие уставки линии, а также последнее
+измерение партии.
+
+Активная партия и настройка сбрасываются явно при их изменении
+(запуск и остановка производства, активация настройки), последнее
+измерение обновляется при записи новых измерений. Срок жизни записей
+(ACTIVE_CACHE_TIMEOUT) ограничивает рассинхронизацию, если несколько
+процессов используют локальный кэш в памяти.
+
+Функции с необязательным line_id без указания линии работают с линией
+по умолчанию (DEFAULT_LINE_CODE).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .chunks import latest_parameter
+from .models import Batch, PARAMETER_FIELDS, ProductionLine, default_line_id
+from .serializers import BatchParameterSerializer
+
+DEFAULT_LINE_KEY = 'api:default_line'
+ACTIVE_BATCH_KEY = 'api:active_batch:{line_id}'
+ACTIVE_SETTINGS_KEY = 'api:active_settings:{line_id}'
+ACTIVE_SETPOINTS_KEY = 'api:active_setpoints:{line_id}'
+LATEST_PARAMETER_KEY = 'api:latest_parameter:{batch_id}'
+
+_MISSING = object()
+
+
+def _timeout():
+    return getattr(settings, 'ACTIVE_CACHE_TIMEOUT', 60)
+
+
+def get_default_line_id():
+    """Идентификатор линии по умолчанию"""
+    line_id = cache.get(DEFAULT_LINE_KEY)
+    if line_id is None:
+        line_id = default_line_id()
+        cache.set(DEFAULT_LINE_KEY, line_id, _timeout())
+    return line_id
+
+
+def resolve_line_id(line_id=None):
+    return get_default_line_id() if line_id is None else line_id
+
+
+def get_active_batch(line_id=None):
+    """Активная партия линии или None"""
+    key = ACTIVE_BATCH_KEY.format(line_id=resolve_line_id(line_id))
+    batch = cache.get(key, _MISSING)
+    if batch is _MISSING:
+        batch = Batch.objects.filter(line_id=resolve_line_id(line_id), is_active=True).first()
+        cache.set(key, batch, _timeout())
+    return batch
+
+
+def get_active_settings(line_id=None):
+    """Активная настройка производства линии или None"""
+    key = ACTIVE_SETTINGS_KEY.format(line_id=resolve_line_id(line_id))
+    production_settings = cache.get(key, _MISSING)
+    if production_settings is _MISSING:
+        line = ProductionLine.objects.select_related('active_settings').filter(pk=resolve_line_id(line_id)).first()
+        production_settings = line.active_settings if line else None
+        cache.set(key, production_settings, _timeout())
+    return production_settings
+
+
+def get_active_setpoints(line_id=None):
+    """
+    Действующие уставки линии: значения активной настройки с поправками
+    регулятора (см. controller.py). Без активной настройки - None.
+    Регулятор работает в отдельном процессе, поэтому запись живет
+    SETPOINTS_CACHE_TIMEOUT секунд
+    """
+    key = ACTIVE_SETPOINTS_KEY.format(line_id=resolve_line_id(line_id))
+    setpoints = cache.get(key, _MISSING)
+    if setpoints is _MISSING:
+        production_settings = get_active_settings(line_id)
+        setpoints = None
+        if production_settings is not None:
+            setpoints = {field: getattr(production_settings, field) for field in PARAMETER_FIELDS}
+            adjusted = ProductionLine.objects.filter(pk=resolve_line_id(line_id)).values_list('setpoints', flat=True).first()
+            if adjusted and adjusted.get('settings_id') == production_settings.pk:
+                setpoints.update(adjusted['values'])
+        cache.set(key, setpoints, getattr(settings, 'SETPOINTS_CACHE_TIMEOUT', 1))
+    return setpoints
+
+
+def _line_keys(template, line_id):
+    if line_id is None:
+        line_ids = ProductionLine.objects.values_list('id', flat=True)
+    else:
+        line_ids = [line_id]
+    return [template.format(line_id=value) for value in line_ids]
+
+
+def invalidate_active_batch(line_id=None):
+    """Сбрасывает активную партию линии (без line_id - всех линий)"""
+    cache.delete_many(_line_keys(ACTIVE_BATCH_KEY, line_id))
+
+
+def invalidate_active_settings(line_id=None):
+    """Сбрасывает активную настройку и уставки линии (без line_id - всех линий)"""
+    cache.delete_many(_line_keys(ACTIVE_SETTINGS_KEY, line_id) + _line_keys(ACTIVE_SETPOINTS_KEY, line_id))
+
+
+def invalidate_active_setpoints(line_id=None):
+    """Сбрасывает действующие уставки линии (без line_id - всех линий)"""
+    cache.delete_many(_line_keys(ACTIVE_SETPOINTS_KEY, line_id))
+
+
+def get_latest_parameter(batch_id):
+    """Сериализованное последнее измерение партии или None"""
+    key = LATEST_PARAMETER_KEY.format(batch_id=batch_id)
+    entry = cache.get(key)
+    if entry is None:
+        parameter = latest_parameter(batch_id)
+        if parameter is None:
+            return None
+        entry = (parameter.timestamp, BatchParameterSerializer(parameter).data)
+        cache.set(key, entry, _timeout())
+    return entry[1]
+
+
+def remember_latest_parameter(parameter, extra=None):
+    """
+    Запоминает измерение как последнее для партии, если оно не старше
+    уже сохраненного (пакетная загрузка может содержать архивные измерения).
+    extra - дополнительные поля ответа (например, риск брака)
+    """
+    key = LATEST_PARAMETER_KEY.format(batch_id=parameter.batch_id)
+    entry = cache.get(key)
+    if entry is not None and entry[0] > parameter.timestamp:
+        return
+    data = dict(BatchParameterSerializer(parameter).data)
+    data.update(extra or {})
+    cache.set(key, (parameter.timestamp, data), _timeout())
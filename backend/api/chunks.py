@@ -0,0 +1,466 @@
+"""
+Компактное хранение измерений пачками (PARAMETER_STORAGE = 'chunks').
+
+Вместо строки BatchParameter на каждое измерение партия хранит строки
+BatchParameterChunk по PARAMETER_CHUNK_SIZE измерений: значения упакованы
+в float32 (около 7 значащих цифр), время - разностями с предыдущим
+измерением в микросекундах (int32), признаки брака - битами. Диапазон
+времени пачки (start_time, end_time) позволяет читать только пачки,
+попадающие в запрошенный интервал.
+
+Пачки только добавляются: каждая запись измерений создает новые пачки
+и не блокирует и не переписывает уже записанные, поэтому стоимость
+записи не растет с заполнением пачки и писатели одной партии не ждут
+друг друга. Мелкие пачки завершенных партий объединяет команда
+compact_chunks (compact_batch_chunks).
+
+Измерения из пачек получают идентификаторы
+CHUNK_ID_BASE + id пачки * CHUNK_ID_STRIDE + номер в пачке: они не
+пересекаются с id строк и растут в порядке записи. Читатели (API
+параметров, ряды, статистика, выгрузка, архив) объединяют строки
+и пачки, поэтому режим можно менять на ходу. Измерения из пачек
+доступны только для чтения, кроме признака брака (перепроверка правил).
+При объединении пачек измерения получают новые идентификаторы, но не
+больше прежних: позиции чтения (advance_cursor) остаются верными.
+"""
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import BatchParameter, BatchParameterChunk, PARAMETER_FIELDS
+
+CHUNK_ID_BASE = 1 << 52
+CHUNK_ID_STRIDE = 1 << 16
+
+# Разность времени соседних измерений пачки (около 35 минут); при большем
+# разрыве начинается новая пачка
+DELTA_LIMIT = int(np.iinfo(np.int32).max)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def storage_mode():
+    return getattr(settings, 'PARAMETER_STORAGE', 'rows')
+
+
+def chunk_size():
+    return max(1, min(getattr(settings, 'PARAMETER_CHUNK_SIZE', 1000), CHUNK_ID_STRIDE))
+
+
+def is_chunk_reading(pk):
+    return pk is not None and int(pk) >= CHUNK_ID_BASE
+
+
+def reading_chunk_id(pk):
+    """Идентификатор пачки, в которой хранится измерение pk"""
+    return (int(pk) - CHUNK_ID_BASE) // CHUNK_ID_STRIDE
+
+
+def advance_cursor(cursor, ids):
+    """
+    Позиция чтения (последний id строки, последний id измерения из пачки)
+    после измерений с идентификаторами ids. Строки и пачки могут
+    записываться одновременно, поэтому позиция у каждого источника своя
+    """
+    row_id, chunk_id = cursor or (None, None)
+    ids = np.asarray(ids, dtype=np.int64)
+    rows = ids[ids < CHUNK_ID_BASE]
+    chunks = ids[ids >= CHUNK_ID_BASE]
+    if len(rows):
+        row_id = max(row_id or 0, int(rows.max()))
+    if len(chunks):
+        chunk_id = max(chunk_id or 0, int(chunks.max()))
+    return row_id, chunk_id
+
+
+def after_cursor(ids, cursor):
+    """Маска идентификаторов ids, идущих после позиции cursor (см. advance_cursor)"""
+    row_id, chunk_id = cursor
+    ids = np.asarray(ids, dtype=np.int64)
+    mask = np.ones(len(ids), dtype=bool)
+    if row_id is not None:
+        mask &= (ids >= CHUNK_ID_BASE) | (ids > row_id)
+    if chunk_id is not None:
+        mask &= (ids < CHUNK_ID_BASE) | (ids > chunk_id)
+    return mask
+
+
+def _microseconds(value):
+    return (value - EPOCH) // MICROSECOND
+
+
+def _to_datetime(microseconds):
+    return EPOCH + timedelta(microseconds=int(microseconds))
+
+
+def _widen(values):
+    """
+    float32 -> float64 с округлением до 7 значащих цифр: 1.8 остается 1.8,
+    а не 1.79999995, и сравнение с границами правил не меняется
+    """
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.floor(np.log10(np.abs(np.where(values == 0, 1.0, values))))
+    scale = 10.0 ** (6 - magnitude)
+    return np.round(values * scale) / scale
+
+
+def _decode(chunk):
+    """Идентификаторы, время (мкс), значения (n x 4, float64) и признаки брака пачки"""
+    deltas = np.frombuffer(bytes(chunk.timestamps), dtype='<i4')
+    timestamps = _microseconds(chunk.base_time) + np.cumsum(deltas, dtype=np.int64)
+    values = _widen(np.frombuffer(bytes(chunk.values), dtype='<f4').reshape(-1, len(PARAMETER_FIELDS)))
+    defects = np.unpackbits(np.frombuffer(bytes(chunk.defects), dtype=np.uint8), count=chunk.count).astype(bool)
+    ids = CHUNK_ID_BASE + chunk.pk * CHUNK_ID_STRIDE + np.arange(chunk.count, dtype=np.int64)
+    return ids, timestamps, values, defects
+
+
+def _new_chunk(batch_id, timestamp):
+    chunk = BatchParameterChunk(
+        batch_id=batch_id,
+        base_time=timestamp,
+        start_time=timestamp,
+        end_time=timestamp,
+        timestamps=b'',
+        values=b'',
+        defects=b''
+    )
+    for field in PARAMETER_FIELDS:
+        setattr(chunk, f'{field}_min', np.inf)
+        setattr(chunk, f'{field}_max', -np.inf)
+    return chunk
+
+
+def _fill(chunk, timestamps, values, defects):
+    """
+    Заполняет новую пачку началом переданных измерений, пока разности
+    времени помещаются в int32. Возвращает количество измерений в пачке
+    """
+    deltas = np.diff(timestamps, prepend=timestamps[0])
+    overflow = np.flatnonzero(np.abs(deltas) > DELTA_LIMIT)
+    taken = int(overflow[0]) if len(overflow) else len(timestamps)
+
+    values = values[:taken]
+    chunk.timestamps = deltas[:taken].astype('<i4').tobytes()
+    chunk.values = values.astype('<f4').tobytes()
+    chunk.defects = np.packbits(defects[:taken]).tobytes()
+    chunk.count = taken
+    chunk.defect_count = int(defects[:taken].sum())
+    chunk.start_time = _to_datetime(timestamps[:taken].min())
+    chunk.end_time = _to_datetime(timestamps[:taken].max())
+    stored = _widen(values.astype(np.float32))
+    for index, field in enumerate(PARAMETER_FIELDS):
+        setattr(chunk, f'{field}_min', float(stored[:, index].min()))
+        setattr(chunk, f'{field}_max', float(stored[:, index].max()))
+    return taken
+
+
+def append_readings(batch, parameters):
+    """
+    Записывает несохраненные измерения партии в новые пачки вместо строк
+    и присваивает им идентификаторы (как bulk_create). Уже записанные
+    пачки не блокируются и не переписываются
+    """
+    if not parameters:
+        return
+    timestamps = np.array([_microseconds(parameter.timestamp) for parameter in parameters], dtype=np.int64)
+    values = np.array([[getattr(parameter, field) for field in PARAMETER_FIELDS] for parameter in parameters])
+    defects = np.array([parameter.is_defect for parameter in parameters], dtype=bool)
+    limit = chunk_size()
+
+    with transaction.atomic():
+        position = 0
+        while position < len(parameters):
+            chunk = _new_chunk(batch.pk, parameters[position].timestamp)
+            part = slice(position, position + limit)
+            taken = _fill(chunk, timestamps[part], values[part], defects[part])
+            chunk.save()
+            first_id = CHUNK_ID_BASE + chunk.pk * CHUNK_ID_STRIDE
+            for offset, parameter in enumerate(parameters[position:position + taken]):
+                parameter.pk = first_id + offset
+            position += taken
+
+
+def _merge_group(group):
+    """
+    Объединяет пачки group (по порядку записи) в первую из них.
+    Значения и признаки брака переносятся без перекодирования
+    """
+    merged = group[0]
+    timestamps = np.concatenate([_decode(chunk)[1] for chunk in group])
+    defects = np.concatenate([
+        np.unpackbits(np.frombuffer(bytes(chunk.defects), dtype=np.uint8), count=chunk.count)
+        for chunk in group
+    ])
+    merged.base_time = _to_datetime(timestamps[0])
+    merged.timestamps = np.diff(timestamps, prepend=timestamps[0]).astype('<i4').tobytes()
+    merged.values = b''.join(bytes(chunk.values) for chunk in group)
+    merged.defects = np.packbits(defects).tobytes()
+    merged.count = len(timestamps)
+    merged.defect_count = sum(chunk.defect_count for chunk in group)
+    merged.start_time = min(chunk.start_time for chunk in group)
+    merged.end_time = max(chunk.end_time for chunk in group)
+    for field in PARAMETER_FIELDS:
+        setattr(merged, f'{field}_min', min(getattr(chunk, f'{field}_min') for chunk in group))
+        setattr(merged, f'{field}_max', max(getattr(chunk, f'{field}_max') for chunk in group))
+    return merged
+
+
+def compact_batch_chunks(batch_id):
+    """
+    Объединяет идущие подряд мелкие пачки партии в пачки не больше
+    PARAMETER_CHUNK_SIZE измерений. Пачки не делятся: объединенная
+    пачка сохраняется под id первой из группы, поэтому новые
+    идентификаторы измерений не больше прежних и не пересекаются
+    с другими пачками. Предназначено для завершенных партий.
+    Возвращает (количество пачек до, после)
+    """
+    limit = chunk_size()
+    with transaction.atomic():
+        chunks = list(BatchParameterChunk.objects.select_for_update().filter(batch_id=batch_id).order_by('id'))
+        groups = []
+        last_timestamp = None
+        for chunk in chunks:
+            timestamps = _decode(chunk)[1]
+            if (
+                groups
+                and sum(item.count for item in groups[-1]) + chunk.count <= limit
+                and abs(int(timestamps[0]) - last_timestamp) <= DELTA_LIMIT
+            ):
+                groups[-1].append(chunk)
+            else:
+                groups.append([chunk])
+            last_timestamp = int(timestamps[-1])
+
+        removed = []
+        for group in groups:
+            if len(group) > 1:
+                _merge_group(group).save()
+                removed += [chunk.pk for chunk in group[1:]]
+        BatchParameterChunk.objects.filter(pk__in=removed).delete()
+    return len(chunks), len(groups)
+
+
+def chunk_queryset(batch_id=None, since=None, until=None):
+    """Пачки партии (или всех партий), пересекающиеся с интервалом [since, until]"""
+    chunks = BatchParameterChunk.objects.all()
+    if batch_id is not None:
+        chunks = chunks.filter(batch_id=batch_id)
+    if since is not None:
+        chunks = chunks.filter(end_time__gte=since)
+    if until is not None:
+        chunks = chunks.filter(start_time__lte=until)
+    return chunks
+
+
+def _window_mask(timestamps, since, until):
+    mask = np.ones(len(timestamps), dtype=bool)
+    if since is not None:
+        mask &= timestamps >= _microseconds(since)
+    if until is not None:
+        mask &= timestamps <= _microseconds(until)
+    return mask
+
+
+def load_chunk_columns(batch_id, since=None, until=None, after_id=None):
+    """
+    Измерения партии из пачек по столбцам в порядке (время, id):
+    id, timestamp_us (мкс), параметры (float64) и is_defect
+    """
+    chunks = chunk_queryset(batch_id, since, until)
+    if after_id is not None and after_id >= CHUNK_ID_BASE:
+        chunks = chunks.filter(pk__gte=(after_id - CHUNK_ID_BASE) // CHUNK_ID_STRIDE)
+    parts = [_decode(chunk) for chunk in chunks]
+    if parts:
+        ids, timestamps, values, defects = (np.concatenate(arrays) for arrays in zip(*parts))
+    else:
+        ids, timestamps = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        values, defects = np.empty((0, len(PARAMETER_FIELDS))), np.empty(0, dtype=bool)
+    mask = _window_mask(timestamps, since, until)
+    if after_id is not None:
+        mask &= ids > after_id
+    selected = np.flatnonzero(mask)
+    selected = selected[np.lexsort((ids[selected], timestamps[selected]))]
+    columns = {
+        'id': ids[selected],
+        'timestamp_us': timestamps[selected],
+        'is_defect': defects[selected],
+    }
+    for index, field in enumerate(PARAMETER_FIELDS):
+        columns[field] = values[selected, index]
+    return columns
+
+
+def iter_chunk_columns(batch_id, since=None, until=None):
+    """
+    Измерения партии из пачек по одной пачке в формате load_chunk_columns
+    (порядок между пачками не гарантируется)
+    """
+    for chunk in chunk_queryset(batch_id, since, until).iterator(chunk_size=16):
+        ids, timestamps, values, defects = _decode(chunk)
+        selected = _window_mask(timestamps, since, until)
+        columns = {
+            'id': ids[selected],
+            'timestamp_us': timestamps[selected],
+            'is_defect': defects[selected],
+        }
+        for index, field in enumerate(PARAMETER_FIELDS):
+            columns[field] = values[selected, index]
+        yield columns
+
+
+def iter_chunk_arrays(batch_id, since=None, until=None):
+    """То же, что iter_chunk_columns, в формате load_parameter_arrays"""
+    for columns in iter_chunk_columns(batch_id, since, until):
+        columns['timestamp'] = columns.pop('timestamp_us') / 1_000_000
+        yield columns
+
+
+def load_chunk_arrays(batch_id, since=None, until=None, after_id=None):
+    """Измерения партии из пачек в формате load_parameter_arrays"""
+    arrays = load_chunk_columns(batch_id, since, until, after_id)
+    arrays['timestamp'] = arrays.pop('timestamp_us') / 1_000_000
+    return arrays
+
+
+def merge_arrays(first, second, time_column='timestamp'):
+    """Объединяет столбцы измерений двух источников в порядке (время, id)"""
+    if not len(second['id']):
+        return first
+    if not len(first['id']):
+        return second
+    merged = {name: np.concatenate([first[name], second[name]]) for name in first}
+    order = np.lexsort((merged['id'], merged[time_column]))
+    return {name: array[order] for name, array in merged.items()}
+
+
+def count_chunk_readings(batch_id):
+    return BatchParameterChunk.objects.filter(batch_id=batch_id).aggregate(total=Sum('count'))['total'] or 0
+
+
+def _parameters(chunk, ids, timestamps, values, defects, selected):
+    """Измерения пачки в виде (несохраняемых) экземпляров BatchParameter"""
+    return [
+        BatchParameter(
+            pk=int(ids[index]),
+            batch_id=chunk.batch_id,
+            timestamp=_to_datetime(timestamps[index]),
+            is_defect=bool(defects[index]),
+            **{field: float(values[index, position]) for position, field in enumerate(PARAMETER_FIELDS)}
+        )
+        for index in selected
+    ]
+
+
+def chunk_parameters(batch_id=None, since=None, until=None, cursor=None, descending=True, limit=100, before_id=None):
+    """
+    Первые limit измерений из пачек в порядке (время, id) - по убыванию
+    при descending - после позиции cursor = (время, id).
+    Пачки читаются по порядку границ времени, пока они могут содержать
+    измерения раньше (позже) уже отобранных
+    """
+    chunks = chunk_queryset(batch_id, since, until)
+    if before_id is not None:
+        if before_id < CHUNK_ID_BASE:
+            return []
+        chunks = chunks.filter(pk__lte=(before_id - CHUNK_ID_BASE) // CHUNK_ID_STRIDE)
+    if cursor is not None:
+        if descending:
+            chunks = chunks.filter(start_time__lte=cursor[0])
+        else:
+            chunks = chunks.filter(end_time__gte=cursor[0])
+    chunks = chunks.order_by('-end_time', '-id') if descending else chunks.order_by('start_time', 'id')
+
+    key = lambda parameter: (parameter.timestamp, parameter.pk)
+    selected = []
+    for chunk in chunks.iterator(chunk_size=16):
+        if len(selected) >= limit:
+            boundary = chunk.end_time if descending else chunk.start_time
+            last = selected[limit - 1].timestamp
+            if (boundary < last) if descending else (boundary > last):
+                break
+        ids, timestamps, values, defects = _decode(chunk)
+        mask = _window_mask(timestamps, since, until)
+        if before_id is not None:
+            mask &= ids < before_id
+        if cursor is not None:
+            position, pk = _microseconds(cursor[0]), cursor[1]
+            if descending:
+                mask &= (timestamps < position) | ((timestamps == position) & (ids < pk))
+            else:
+                mask &= (timestamps > position) | ((timestamps == position) & (ids > pk))
+        indexes = np.flatnonzero(mask)
+        indexes = indexes[np.lexsort((ids[indexes], timestamps[indexes]))]
+        if descending:
+            indexes = indexes[::-1]
+        selected += _parameters(chunk, ids, timestamps, values, defects, indexes[:limit])
+        selected.sort(key=key, reverse=descending)
+        del selected[limit:]
+    return selected
+
+
+def get_chunk_parameter(pk):
+    """Измерение из пачки по идентификатору или None"""
+    chunk_id, position = divmod(int(pk) - CHUNK_ID_BASE, CHUNK_ID_STRIDE)
+    chunk = BatchParameterChunk.objects.filter(pk=chunk_id).first()
+    if chunk is None or position >= chunk.count:
+        return None
+    return _parameters(chunk, *_decode(chunk), [position])[0]
+
+
+def latest_parameter(batch_id, before=None):
+    """Последнее (не позже before) измерение партии из строк и пачек или None"""
+    queryset = BatchParameter.objects.filter(batch_id=batch_id)
+    if before is not None:
+        queryset = queryset.filter(timestamp__lte=before)
+    candidates = [queryset.order_by('-timestamp', '-id').first()]
+    candidates += chunk_parameters(batch_id, until=before, limit=1)
+    candidates = [parameter for parameter in candidates if parameter is not None]
+    return max(candidates, key=lambda parameter: (parameter.timestamp, parameter.pk), default=None)
+
+
+def iter_chunk_parameters(batch_id, since=None, until=None):
+    """Измерения партии из пачек за интервал [since, until] (без упорядочивания)"""
+    for chunk in chunk_queryset(batch_id, since, until).iterator(chunk_size=16):
+        ids, timestamps, values, defects = _decode(chunk)
+        selected = np.flatnonzero(_window_mask(timestamps, since, until))
+        yield from _parameters(chunk, ids, timestamps, values, defects, selected)
+
+
+def iter_chunk_rows(columns, batch_id=None, since=None, until=None, exclude_batches=(), chunk_size=16):
+    """
+    Строки измерений из пачек в порядке (время, id), как values_list(*columns).
+    Пачки читаются по времени начала, измерение отдается, когда ни одна
+    следующая пачка не может содержать более раннего
+    """
+    chunks = chunk_queryset(batch_id, since, until).exclude(batch_id__in=exclude_batches)
+    pending = []
+    for chunk in chunks.order_by('start_time', 'id').iterator(chunk_size=chunk_size):
+        while pending and pending[0][0] < chunk.start_time:
+            yield heapq.heappop(pending)[2]
+        ids, timestamps, values, defects = _decode(chunk)
+        selected = np.flatnonzero(_window_mask(timestamps, since, until))
+        for parameter in _parameters(chunk, ids, timestamps, values, defects, selected):
+            row = tuple(getattr(parameter, column) for column in columns)
+            heapq.heappush(pending, (parameter.timestamp, parameter.pk, row))
+    while pending:
+        yield heapq.heappop(pending)[2]
+
+
+def set_chunk_defects(ids, is_defect):
+    """Меняет признак брака измерений из пачек"""
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids):
+        return
+    chunk_ids, positions = np.divmod(ids - CHUNK_ID_BASE, CHUNK_ID_STRIDE)
+    chunks = BatchParameterChunk.objects.select_for_update().filter(pk__in=np.unique(chunk_ids).tolist())
+    for chunk in chunks:
+        defects = np.unpackbits(np.frombuffer(bytes(chunk.defects), dtype=np.uint8), count=chunk.count).astype(bool)
+        defects[positions[chunk_ids == chunk.pk]] = is_defect
+        chunk.defects = np.packbits(defects).tobytes()
+        chunk.defect_count = int(defects.sum())
+        chunk.save(update_fields=['defects', 'defect_count'])
@@ -0,0 +1,436 @@
+"""
+Регулятор уставок: замкнутый контур коррекции параметров линии.
+
+Для каждой линии с активной партией LineController держит собственные
+контрольные карты (см. spc.py) по потоку измерений партии и с заданной
+частотой пересчитывает уставки всех параметров сразу:
+
+- pid: уставка = цель + Kp·e + Ki·∫e dt + Kd·de/dt, где e - отклонение
+  сглаженного значения (EWMA карты) от цели активной настройки;
+- rule: при сигнале дрейфа карты (или риске брака не ниже
+  CONTROLLER_RISK_THRESHOLD, см. risk.py) уставка сдвигается против
+  отклонения с предельной скоростью.
+
+Отклонения в пределах deadband σ не регулируются. Уставка ограничена
+безопасными границами: не дальше max_offset от цели, внутри допуска
+правил брака, не быстрее max_rate ед./с; шаг уставки - resolution.
+Интеграл не накапливается, пока уставка упирается в границу.
+
+Изменения уставок копятся в памяти и раз в flush_interval секунд
+записываются одной транзакцией: журнал SetpointAdjustment (bulk_create)
+и действующие уставки линии (ProductionLine.setpoints, см.
+get_active_setpoints). В пробном режиме (dry_run) пишется только журнал.
+simulate прогоняет регулятор на симуляции линии без записи в базу.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .acquisition import DEFAULT_PARAMETERS, PlantSimulator
+from .archive import load_batch_arrays
+from .cache import get_active_settings, invalidate_active_setpoints
+from .chunks import advance_cursor
+from .models import Batch, BatchParameter, PARAMETER_FIELDS, ProductionLine, SetpointAdjustment
+from .notifications import notify
+from .risk import get_risk_model
+from .rules import get_rule_set
+from .spc import ControlChart
+
+# Контуры по умолчанию; CONTROLLER_LOOPS переопределяет отдельные значения
+DEFAULT_LOOPS = {
+    'temperature': {
+        'mode': 'pid', 'kp': 0.5, 'ki': 0.1, 'kd': 0.0,
+        'max_offset': 5.0, 'max_rate': 0.5, 'resolution': 0.1, 'deadband': 0.5,
+    },
+    'pressure': {
+        'mode': 'pid', 'kp': 0.5, 'ki': 0.2, 'kd': 0.0,
+        'max_offset': 0.3, 'max_rate': 0.05, 'resolution': 0.01, 'deadband': 0.5,
+    },
+    'mixing_speed': {
+        'mode': 'rule', 'kp': 0.0, 'ki': 0.0, 'kd': 0.0,
+        'max_offset': 3.0, 'max_rate': 0.5, 'resolution': 0.1, 'deadband': 1.0,
+    },
+    'glazing_thickness': {
+        'mode': 'pid', 'kp': 0.5, 'ki': 0.1, 'kd': 0.0,
+        'max_offset': 0.2, 'max_rate': 0.02, 'resolution': 0.005, 'deadband': 0.5,
+    },
+}
+
+LOOP_OPTIONS = ('kp', 'ki', 'kd', 'max_offset', 'max_rate', 'resolution', 'deadband')
+
+
+def _option(name, default):
+    return getattr(settings, name, default)
+
+
+def loop_config():
+    """Настройки контуров с учетом CONTROLLER_LOOPS"""
+    overrides = _option('CONTROLLER_LOOPS', {})
+    return {field: {**DEFAULT_LOOPS[field], **overrides.get(field, {})} for field in PARAMETER_FIELDS}
+
+
+def _vector(values):
+    return np.array([values[field] for field in PARAMETER_FIELDS], dtype=np.float64)
+
+
+def _settings_values(production_settings):
+    if production_settings is None:
+        return dict(DEFAULT_PARAMETERS)
+    return {field: getattr(production_settings, field) for field in PARAMETER_FIELDS}
+
+
+class LineController:
+    """Контуры регулирования параметров одной линии; массивы упорядочены по PARAMETER_FIELDS"""
+
+    def __init__(self, line_id, loops=None, dry_run=False):
+        loops = loops or loop_config()
+        self.line_id = line_id
+        self.dry_run = dry_run
+        self.modes = [loops[field]['mode'] for field in PARAMETER_FIELDS]
+        self.pid = np.array([mode == 'pid' for mode in self.modes])
+        for name in LOOP_OPTIONS:
+            setattr(self, name, np.array([float(loops[field][name]) for field in PARAMETER_FIELDS]))
+        self.risk_threshold = _option('CONTROLLER_RISK_THRESHOLD', 0.5)
+        self.stale_after = _option('CONTROLLER_STALE_SECONDS', 5.0)
+        self.settings_key = None
+        self.batch_id = None
+
+    def start(self, production_settings, setpoints=None):
+        """
+        Начинает регулирование относительно настройки production_settings
+        с уставок setpoints (по умолчанию - значения настройки)
+        """
+        rule_set = get_rule_set(production_settings)
+        self.settings_id = production_settings.pk if production_settings else None
+        self.settings_key = (self.settings_id, production_settings.timestamp if production_settings else None)
+        self.target = _vector(_settings_values(production_settings))
+        self.low = rule_set.low
+        self.high = rule_set.high
+        self.lower = np.minimum(np.maximum(self.target - self.max_offset, self.low), self.target)
+        self.upper = np.maximum(np.minimum(self.target + self.max_offset, self.high), self.target)
+        self.setpoints = self.target.copy() if setpoints is None else np.clip(_vector(setpoints), self.lower, self.upper)
+        self.published = self.setpoints.copy()
+        # Безударный пуск: интеграл соответствует уже действующей поправке
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.integral = np.where(self.ki > 0, (self.setpoints - self.target) / self.ki, 0.0)
+        self.limited = np.zeros(len(PARAMETER_FIELDS), dtype=bool)
+        # Выходы уставок на безопасную границу по параметрам (для предупреждений)
+        self.saturations = {}
+        self.pending = []
+        self.changed = False
+        self.attach(self.batch_id)
+
+    def attach(self, batch_id):
+        """Начинает контрольные карты заново (новая партия или настройка)"""
+        self.batch_id = batch_id
+        self.chart = ControlChart(batch_id, self.target, self.low, self.high)
+        self.previous_error = None
+        self.last = None
+        self.risk = None
+        self.observed_at = None
+
+    def observe(self, values, now=None):
+        """Учитывает новые измерения (матрица n x 4 в порядке времени)"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(PARAMETER_FIELDS))
+        if not len(values):
+            return
+        self.chart.update(values)
+        risks = get_risk_model(self.line_id).score(values, self.last)
+        self.risk = None if risks is None else float(risks.max())
+        self.last = values[-1]
+        self.observed_at = time.monotonic() if now is None else now
+
+    def step(self, elapsed, now=None, timestamp=None):
+        """
+        Пересчитывает уставки через elapsed секунд после прошлого шага.
+        Возвращает список несохраненных изменений SetpointAdjustment
+        """
+        now = time.monotonic() if now is None else now
+        if not self.chart.monitoring or self.observed_at is None or now - self.observed_at > self.stale_after:
+            return []
+        measured = self.chart.ewma
+        error = self.target - measured
+        active = np.abs(error) > self.deadband * self.chart.sigma
+        error = np.where(active, error, 0.0)
+
+        derivative = np.zeros_like(error) if self.previous_error is None else (error - self.previous_error) / elapsed
+        self.previous_error = error
+        # Интеграл не растет в сторону границы, в которую уже уперлась уставка
+        self.integral += np.where(self.limited & (np.sign(error) == np.sign(self.setpoints - self.target)), 0.0, error * elapsed)
+        pid = self.target + self.kp * error + self.ki * self.integral + self.kd * derivative
+
+        risky = self.risk is not None and self.risk >= self.risk_threshold
+        # Правило двигает уставку, пока отклонение за зоной нечувствительности
+        # и (при сигнале дрейфа) направлено в сторону дрейфа
+        drifting = (self.chart.drift != 0) & (np.sign(error) == -self.chart.drift)
+        direction = np.where(drifting | risky, np.sign(error), 0.0)
+        rule = self.setpoints + direction * self.max_rate * elapsed
+
+        desired = np.where(self.pid, pid, rule)
+        step = self.max_rate * elapsed
+        desired = np.clip(desired, self.setpoints - step, self.setpoints + step)
+        self.setpoints = np.clip(desired, self.lower, self.upper)
+        limited = self.setpoints != desired
+        for index in np.flatnonzero(limited & ~self.limited):
+            self.saturations[PARAMETER_FIELDS[index]] = self.saturations.get(PARAMETER_FIELDS[index], 0) + 1
+        self.limited = limited
+
+        # Наружу уставка выдается с шагом resolution, когда поправка набрала целый шаг
+        published = np.clip(np.round(np.round(self.setpoints / self.resolution) * self.resolution, 9), self.lower, self.upper)
+        moved = (np.abs(self.setpoints - self.published) >= self.resolution) | (limited & (published != self.published))
+        changed = np.flatnonzero(moved)
+        timestamp = timestamp or timezone.now()
+        adjustments = [
+            SetpointAdjustment(
+                line_id=self.line_id,
+                settings_id=self.settings_id,
+                batch_id=self.batch_id,
+                parameter=PARAMETER_FIELDS[index],
+                mode=self.modes[index],
+                previous_value=float(self.published[index]),
+                value=float(published[index]),
+                target=float(self.target[index]),
+                measured=float(measured[index]),
+                defect_risk=self.risk,
+                is_limited=bool(self.limited[index]),
+                is_dry_run=self.dry_run,
+                timestamp=timestamp,
+            )
+            for index in changed
+        ]
+        if len(changed):
+            self.published = np.where(moved, published, self.published)
+            self.changed = True
+        return adjustments
+
+    def as_setpoints(self):
+        """Выданные уставки в виде словаря"""
+        return dict(zip(PARAMETER_FIELDS, self.published.tolist()))
+
+
+class DatabaseStream:
+    """Новые измерения активных партий из базы (строки, пачки и архив)"""
+
+    def __init__(self, warmup=None):
+        self.warmup = _option('CONTROLLER_WARMUP_SECONDS', 60) if warmup is None else warmup
+        self.cursors = {}
+
+    def read(self, batch):
+        """Матрица измерений партии после прошлого чтения в порядке времени"""
+        # Нижняя граница времени остается прежней: иначе после чтения только
+        # строк (или только пачек) старые измерения другого источника
+        # попали бы в поток целиком
+        cursor, since = self.cursors.get(batch.pk) or (None, timezone.now() - timedelta(seconds=self.warmup))
+        arrays = load_batch_arrays(batch.pk, since=since, after=cursor)
+        if not len(arrays['id']):
+            self.cursors[batch.pk] = (cursor, since)
+            return np.empty((0, len(PARAMETER_FIELDS)))
+        self.cursors[batch.pk] = (advance_cursor(cursor, arrays['id']), since)
+        return np.column_stack([arrays[field] for field in PARAMETER_FIELDS])
+
+    def forget(self, batch_id):
+        self.cursors.pop(batch_id, None)
+
+
+class ControllerLoop:
+    """
+    Цикл регулирования всех линий с активной партией (или линий line_ids).
+
+    Шаг регулирования выполняется с частотой rate (Гц), новые измерения
+    читаются раз в poll_interval секунд, изменения уставок записываются
+    раз в flush_interval секунд, статистика отдается раз в report_interval
+    """
+
+    def __init__(self, rate, line_ids=None, dry_run=False, stream=None,
+                 poll_interval=0.5, flush_interval=1.0, report_interval=10.0, refresh_interval=1.0):
+        self.rate = rate
+        self.line_ids = line_ids
+        self.dry_run = dry_run
+        self.stream = stream or DatabaseStream()
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.refresh_interval = refresh_interval
+        self.controllers = {}
+        self.batches = {}
+        self.stopped = False
+        self.report_ticks = 0
+        self.report_adjustments = 0
+        self.late_ticks = 0
+
+    def refresh(self):
+        """Активные партии и настройки линий; смена настройки начинает регулирование заново"""
+        batches = Batch.objects.filter(is_active=True).order_by('start_time')
+        if self.line_ids:
+            batches = batches.filter(line_id__in=self.line_ids)
+        active = {batch.line_id: batch for batch in batches}
+        for line_id in list(self.controllers):
+            if line_id not in active:
+                self.flush_line(self.controllers.pop(line_id))
+                self.stream.forget(self.batches.pop(line_id).pk)
+
+        lines = ProductionLine.objects.select_related('active_settings').filter(pk__in=active)
+        for line in lines:
+            production_settings = line.active_settings
+            controller = self.controllers.get(line.pk)
+            key = (production_settings.pk, production_settings.timestamp) if production_settings else (None, None)
+            if controller is None:
+                controller = self.controllers[line.pk] = LineController(line.pk, dry_run=self.dry_run)
+                adjusted = line.setpoints if production_settings and line.setpoints.get('settings_id') == production_settings.pk else {}
+                controller.start(production_settings, adjusted.get('values'))
+            elif controller.settings_key != key:
+                self.flush_line(controller)
+                controller.start(production_settings)
+                controller.changed = True
+            batch = active[line.pk]
+            if controller.batch_id != batch.pk:
+                if line.pk in self.batches:
+                    self.stream.forget(self.batches[line.pk].pk)
+                controller.attach(batch.pk)
+            self.batches[line.pk] = batch
+
+    def poll(self):
+        for line_id, controller in self.controllers.items():
+            controller.observe(self.stream.read(self.batches[line_id]))
+
+    def tick(self, elapsed):
+        timestamp = timezone.now()
+        for controller in self.controllers.values():
+            adjustments = controller.step(elapsed, timestamp=timestamp)
+            controller.pending.extend(adjustments)
+            self.report_adjustments += len(adjustments)
+
+    def flush_line(self, controller):
+        """Записывает накопленные изменения уставок линии одной транзакцией"""
+        adjustments, controller.pending = controller.pending, []
+        saturations, controller.saturations = controller.saturations, {}
+        update = controller.changed and not controller.dry_run
+        if not adjustments and not update:
+            return
+        with transaction.atomic():
+            SetpointAdjustment.objects.bulk_create(adjustments)
+            if update:
+                ProductionLine.objects.filter(pk=controller.line_id).update(setpoints={
+                    'settings_id': controller.settings_id,
+                    'values': controller.as_setpoints(),
+                })
+        controller.changed = False
+        if update:
+            invalidate_active_setpoints(controller.line_id)
+            self.notify_limits(controller, saturations)
+
+    def notify_limits(self, controller, saturations):
+        """Одно предупреждение на параметр, уставка которого уперлась в безопасную границу"""
+        batch = self.batches.get(controller.line_id)
+        for field, count in saturations.items():
+            label = BatchParameter._meta.get_field(field).verbose_name
+            notify(batch, f"Уставка параметра «{label}» ограничена безопасной границей", 'warning', count=count)
+
+    def flush(self):
+        for controller in self.controllers.values():
+            self.flush_line(controller)
+
+    def report(self, elapsed):
+        stats = {
+            'target_rate': self.rate,
+            'achieved_rate': self.report_ticks / elapsed if elapsed > 0 else 0.0,
+            'adjustments': self.report_adjustments,
+            'lines': len(self.controllers),
+            'late_ticks': self.late_ticks,
+            'setpoints': {line_id: controller.as_setpoints() for line_id, controller in self.controllers.items()},
+        }
+        self.report_ticks = 0
+        self.report_adjustments = 0
+        self.late_ticks = 0
+        return stats
+
+    def run(self, duration=None, on_report=None):
+        """
+        Запускает цикл до вызова stop() или истечения duration секунд.
+        on_report получает словарь со статистикой
+        """
+        period = 1.0 / self.rate
+        started = last_tick = last_poll = last_flush = last_refresh = last_report = time.monotonic()
+        next_tick = started
+        self.refresh()
+        self.poll()
+        try:
+            while not self.stopped:
+                now = time.monotonic()
+                if duration is not None and now - started >= duration:
+                    break
+
+                if now - last_refresh >= self.refresh_interval:
+                    self.refresh()
+                    last_refresh = now
+                if now - last_poll >= self.poll_interval:
+                    self.poll()
+                    last_poll = now
+                if now >= next_tick:
+                    self.tick(max(now - last_tick, period))
+                    self.report_ticks += 1
+                    last_tick = now
+                    next_tick += period
+                    # Если цикл отстал больше чем на такт, пропущенные такты не догоняются
+                    if now - next_tick > period:
+                        self.late_ticks += 1
+                        next_tick = now + period
+                if now - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = now
+                if now - last_report >= self.report_interval:
+                    stats = self.report(now - last_report)
+                    if on_report:
+                        on_report(stats)
+                    last_report = now
+
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            self.flush()
+
+    def stop(self):
+        self.stopped = True
+
+
+def simulate(line_id, duration, rate, seed=None):
+    """
+    Пробный прогон регулятора на симуляции линии (PlantSimulator) без
+    записи в базу. Две одинаковые модели получают одинаковые возмущения:
+    одна следует уставкам регулятора, другая - уставкам настройки.
+    Возвращает сравнение отклонений от цели и доли брака по правилам
+    """
+    production_settings = get_active_settings(line_id)
+    rule_set = get_rule_set(production_settings)
+    controller = LineController(line_id, dry_run=True)
+    controller.start(production_settings)
+    target = controller.as_setpoints()
+    controlled = PlantSimulator(target, seed)
+    open_loop = PlantSimulator(target, seed)
+
+    elapsed = 1.0 / rate
+    steps = int(duration * rate)
+    values = {'controlled': np.empty((steps, len(PARAMETER_FIELDS))), 'open_loop': np.empty((steps, len(PARAMETER_FIELDS)))}
+    adjustments = []
+    for index in range(steps):
+        values['controlled'][index] = _vector(controlled.step(controller.as_setpoints(), elapsed))
+        values['open_loop'][index] = _vector(open_loop.step(target, elapsed))
+        controller.observe(values['controlled'][index:index + 1], now=index * elapsed)
+        adjustments += controller.step(elapsed, now=index * elapsed)
+
+    timestamps = np.arange(steps) * elapsed
+    result = {'steps': steps, 'adjustments': len(adjustments),
+              'limited': sum(controller.saturations.values()),
+              'setpoints': controller.as_setpoints()}
+    for name, matrix in values.items():
+        deviation = np.abs(matrix - controller.target).mean(axis=0)
+        result[name] = {
+            'defect_rate': float(rule_set.evaluate(matrix, timestamps).mean()) if steps else 0.0,
+            'mean_deviation': dict(zip(PARAMETER_FIELDS, deviation.tolist())),
+        }
+    return result
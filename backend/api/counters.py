@@ -0,0 +1,79 @@
+"""
+Счетчики измерений и брака партии (total_count, defect_count).
+
+Счетчики увеличиваются атомарным UPDATE с выражением F(), без чтения
+и перезаписи всей строки партии, поэтому параллельные писатели не теряют
+увеличения.
+
+При BATCH_COUNTER_SHARDS > 0 увеличения распределяются по случайной из
+нескольких строк BatchCounterShard, и писатели не ждут друг друга на
+блокировке строки партии. Накопленное периодически переносится в Batch
+(fold_counters, manage.py fold_batch_counters), а также при остановке партии.
+
+Увеличения не меняют версию партий (versions.py): счетчики активных
+партий входят в ETag списка партий сами, а перенос частей версию меняет.
+"""
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Batch, BatchCounterShard
+from .versions import bump_version
+
+
+def _shard_count():
+    return getattr(settings, 'BATCH_COUNTER_SHARDS', 0)
+
+
+def increment_counters(batch_id, total, defects=0):
+    """Увеличивает счетчики партии на total измерений, из них defects бракованных"""
+    if not total and not defects:
+        return
+    shards = _shard_count()
+    if shards <= 0:
+        Batch.objects.filter(pk=batch_id).update(
+            total_count=F('total_count') + total,
+            defect_count=F('defect_count') + defects
+        )
+        return
+
+    shard = random.randrange(shards)
+    updates = {'total_count': F('total_count') + total, 'defect_count': F('defect_count') + defects}
+    if BatchCounterShard.objects.filter(batch_id=batch_id, shard=shard).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            BatchCounterShard.objects.create(batch_id=batch_id, shard=shard, total_count=total, defect_count=defects)
+    except IntegrityError:
+        # Строку части успел создать параллельный писатель
+        BatchCounterShard.objects.filter(batch_id=batch_id, shard=shard).update(**updates)
+
+
+def fold_counters(batch_id=None):
+    """
+    Переносит накопленные в частях значения в счетчики партий (одной
+    партии или всех). Возвращает количество обновленных партий.
+    """
+    with transaction.atomic():
+        shards = BatchCounterShard.objects.select_for_update().exclude(total_count=0, defect_count=0)
+        if batch_id is not None:
+            shards = shards.filter(batch_id=batch_id)
+        # Строки частей блокируются до конца транзакции, новые увеличения ждут переноса
+        locked = list(shards.values_list('id', flat=True))
+        if not locked:
+            return 0
+        totals = (
+            BatchCounterShard.objects.filter(id__in=locked)
+            .values('batch_id')
+            .annotate(total=Sum('total_count'), defects=Sum('defect_count'))
+        )
+        for row in totals:
+            Batch.objects.filter(pk=row['batch_id']).update(
+                total_count=F('total_count') + row['total'],
+                defect_count=F('defect_count') + row['defects']
+            )
+        BatchCounterShard.objects.filter(id__in=locked).update(total_count=0, defect_count=0)
+        bump_version('batches')
+        return len(totals)
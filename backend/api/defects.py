@@ -0,0 +1,12 @@
+"""
+Критические значения параметров глазирования, при выходе за которые
+продукция считается браком. Действуют для каждого параметра, у которого
+в настройке производства нет собственного правила range (см. rules.py)
+"""
+
+DEFECT_LIMITS = {
+    'temperature': (160.0, 180.0),
+    'pressure': (2.0, 3.8),
+    'mixing_speed': (55.0, 65.0),
+    'glazing_thickness': (1.8, 2.8),
+}
@@ -0,0 +1,136 @@
+"""
+Прореживание временных рядов для графиков
+"""
+import numpy as np
+
+
+def bucket_aggregate(timestamps, values, buckets, start=None, end=None):
+    """
+    Делит интервал [start, end] на равные по времени корзины и считает
+    min/max/avg по каждой непустой корзине.
+
+    timestamps должны быть отсортированы по возрастанию; values - словарь
+    {имя ряда: массив}. Возвращает время середины корзин, количество точек
+    и агрегаты по каждому ряду.
+    """
+    if start is None:
+        start = timestamps[0]
+    if end is None:
+        end = timestamps[-1]
+    width = (end - start) / buckets if end > start else 1.0
+
+    index = np.floor((timestamps - start) / width).astype(np.int64)
+    np.clip(index, 0, buckets - 1, out=index)
+
+    # Индексы корзин не убывают, поэтому границы корзин находятся без сортировки
+    bucket_ids, offsets, counts = np.unique(index, return_index=True, return_counts=True)
+    result = {
+        'timestamp': start + (bucket_ids + 0.5) * width,
+        'count': counts,
+        'series': {},
+    }
+    for name, array in values.items():
+        result['series'][name] = {
+            'min': np.minimum.reduceat(array, offsets),
+            'max': np.maximum.reduceat(array, offsets),
+            'avg': np.add.reduceat(array, offsets) / counts,
+        }
+    return result
+
+
+class BucketAggregator:
+    """
+    Потоковый вариант bucket_aggregate: измерения добавляются блоками
+    в любом порядке, в памяти хранятся только buckets агрегатов на ряд.
+    Интервал [start, end] должен быть известен заранее
+    """
+    
+    def __init__(self, names, buckets, start, end):
+        self.buckets = buckets
+        self.start = start
+        self.width = (end - start) / buckets if end > start else 1.0
+        self.counts = np.zeros(buckets, dtype=np.int64)
+        self.series = {
+            name: {
+                'min': np.full(buckets, np.inf),
+                'max': np.full(buckets, -np.inf),
+                'sum': np.zeros(buckets),
+            }
+            for name in names
+        }
+    
+    @property
+    def total(self):
+        return int(self.counts.sum())
+    
+    def _index(self, timestamps):
+        index = np.floor((np.asarray(timestamps) - self.start) / self.width).astype(np.int64)
+        return np.clip(index, 0, self.buckets - 1)
+    
+    def add(self, timestamps, values):
+        """Добавляет измерения: values - словарь {имя ряда: массив}"""
+        self.add_summaries(timestamps, np.ones(len(timestamps), dtype=np.int64), values, values, values)
+    
+    def add_summaries(self, timestamps, counts, mins, maxs, sums):
+        """
+        Добавляет готовые агрегаты (например, поминутные): каждая строка
+        относится к корзине своего времени целиком
+        """
+        if not len(timestamps):
+            return
+        index = self._index(timestamps)
+        self.counts += np.bincount(index, weights=counts, minlength=self.buckets).astype(np.int64)
+        for name, aggregates in self.series.items():
+            np.minimum.at(aggregates['min'], index, mins[name])
+            np.maximum.at(aggregates['max'], index, maxs[name])
+            aggregates['sum'] += np.bincount(index, weights=sums[name], minlength=self.buckets)
+    
+    def result(self):
+        """Непустые корзины в формате bucket_aggregate"""
+        bucket_ids = np.flatnonzero(self.counts)
+        counts = self.counts[bucket_ids]
+        result = {
+            'timestamp': self.start + (bucket_ids + 0.5) * self.width,
+            'count': counts,
+            'series': {},
+        }
+        for name, aggregates in self.series.items():
+            result['series'][name] = {
+                'min': aggregates['min'][bucket_ids],
+                'max': aggregates['max'][bucket_ids],
+                'avg': aggregates['sum'][bucket_ids] / counts,
+            }
+        return result
+
+
+def lttb(timestamps, values, threshold):
+    """
+    Прореживание методом Largest-Triangle-Three-Buckets.
+    Сохраняет форму ряда (пики и провалы) при threshold выходных точках.
+    Возвращает индексы выбранных точек.
+    """
+    length = len(timestamps)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    # Границы threshold - 2 корзин для всех точек, кроме первой и последней;
+    # последней "следующей корзиной" служит последняя точка ряда
+    edges = np.append(np.linspace(1, length - 1, threshold - 1).astype(np.int64), length)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        lo, hi, next_hi = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        avg_x = timestamps[hi:next_hi].mean()
+        avg_y = values[hi:next_hi].mean()
+
+        px, py = timestamps[previous], values[previous]
+        xs = timestamps[lo:hi]
+        ys = values[lo:hi]
+        areas = np.abs((px - avg_x) * (ys - py) - (px - xs) * (avg_y - py))
+        previous = lo + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return selected
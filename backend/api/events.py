@@ -0,0 +1,261 @@
+"""
+Публикация событий о новых данных партии (параметры, уведомления,
+данные компьютерного зрения) для потоковой передачи клиентам.
+
+Брокер выбирается настройкой EVENTS_BROKER. InMemoryBroker работает
+в пределах одного процесса: события фоновых команд (run_acquisition,
+конвейер компьютерного зрения) и других процессов сервера до его
+подписчиков не доходят. RedisBroker передает события между процессами
+через Redis и используется, если задан REDIS_URL.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+EVENTS_STREAM_KEY = 'protein-bar-ius:events'
+
+# Идентификатор события из идентификатора записи потока Redis
+# (миллисекунды-номер): миллисекунды * SEQUENCE_LIMIT + номер
+SEQUENCE_LIMIT = 1 << 20
+
+
+class Event:
+    """Событие с монотонно возрастающим идентификатором"""
+
+    __slots__ = ('id', 'type', 'batch_id', 'data')
+
+    def __init__(self, event_id, event_type, batch_id, data):
+        self.id = event_id
+        self.type = event_type
+        self.batch_id = batch_id
+        self.data = data
+
+
+class BaseBroker:
+    """Интерфейс брокера событий"""
+
+    def publish(self, event_type, batch_id, data):
+        """Публикует событие и возвращает его идентификатор"""
+        raise NotImplementedError
+
+    def replay(self, after_id):
+        """Возвращает сохраненные события с идентификатором больше after_id"""
+        raise NotImplementedError
+
+    def subscribe(self, loop=None):
+        """
+        Создает подписку на новые события, доставляемые в цикл asyncio loop
+        (по умолчанию - работающий цикл); возвращает объект с async get()
+        и close()
+        """
+        raise NotImplementedError
+
+    async def areplay(self, after_id):
+        """replay для асинхронного кода: сетевые вызовы идут в отдельном потоке"""
+        return await asyncio.to_thread(self.replay, after_id)
+
+    async def asubscribe(self):
+        """subscribe для асинхронного кода: сетевые вызовы идут в отдельном потоке"""
+        return await asyncio.to_thread(self.subscribe, asyncio.get_running_loop())
+
+
+class Subscription:
+    """Подписка на события внутри процесса"""
+
+    def __init__(self, broker, queue_size, loop=None):
+        self.broker = broker
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # Выставляется, если клиент не успевает забирать события;
+        # пропущенное затем дочитывается из буфера брокера
+        self.lagged = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker(BaseBroker):
+    """
+    Брокер в памяти процесса с кольцевым буфером последних событий,
+    из которого клиенты дочитывают пропущенное по Last-Event-ID
+    """
+
+    def __init__(self, buffer_size=None, queue_size=None):
+        self.buffer = deque(maxlen=buffer_size or getattr(settings, 'EVENTS_BUFFER_SIZE', 1000))
+        self.queue_size = queue_size or getattr(settings, 'EVENTS_SUBSCRIBER_QUEUE_SIZE', 500)
+        self.counter = itertools.count(1)
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def publish(self, event_type, batch_id, data):
+        with self.lock:
+            event = Event(next(self.counter), event_type, batch_id, data)
+            self.buffer.append(event)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            # Публикация идет из потоков синхронных представлений
+            subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+        return event.id
+
+    def replay(self, after_id):
+        with self.lock:
+            return [event for event in self.buffer if event.id > after_id]
+
+    def subscribe(self, loop=None):
+        subscription = Subscription(self, self.queue_size, loop)
+        with self.lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    # Буфер в памяти не блокирует цикл asyncio, переход в поток не нужен
+
+    async def areplay(self, after_id):
+        return self.replay(after_id)
+
+    async def asubscribe(self):
+        return self.subscribe()
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+
+class RedisBroker(BaseBroker):
+    """
+    Брокер поверх потока Redis (REDIS_URL) для нескольких процессов.
+    Событие добавляется в поток XADD, Redis присваивает ему возрастающий
+    идентификатор и хранит последние EVENTS_BUFFER_SIZE событий, из
+    которых клиенты дочитывают пропущенное по Last-Event-ID. В каждом
+    процессе сервера один поток читает новые события (XREAD) и раздает
+    их своим подпискам. Требует пакета redis.
+    """
+
+    def __init__(self, url=None, buffer_size=None, queue_size=None):
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImproperlyConfigured(f'Для RedisBroker нужен пакет redis: {exc}')
+        url = url or getattr(settings, 'REDIS_URL', None)
+        if not url:
+            raise ImproperlyConfigured('Для RedisBroker нужно задать REDIS_URL')
+        self.client = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+        self.buffer_size = buffer_size or getattr(settings, 'EVENTS_BUFFER_SIZE', 1000)
+        self.queue_size = queue_size or getattr(settings, 'EVENTS_SUBSCRIBER_QUEUE_SIZE', 500)
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.listener = None
+
+    @staticmethod
+    def _event_id(stream_id):
+        milliseconds, sequence = stream_id.decode().split('-')
+        return int(milliseconds) * SEQUENCE_LIMIT + int(sequence)
+
+    @staticmethod
+    def _stream_id(event_id):
+        return f'{event_id // SEQUENCE_LIMIT}-{event_id % SEQUENCE_LIMIT}'
+
+    def _event(self, stream_id, fields):
+        batch_id = fields[b'batch_id'].decode()
+        return Event(
+            self._event_id(stream_id),
+            fields[b'type'].decode(),
+            int(batch_id) if batch_id else None,
+            json.loads(fields[b'data'])
+        )
+
+    def publish(self, event_type, batch_id, data):
+        fields = {
+            'type': event_type,
+            'batch_id': '' if batch_id is None else str(batch_id),
+            'data': json.dumps(data, ensure_ascii=False, default=str),
+        }
+        try:
+            stream_id = self.client.xadd(EVENTS_STREAM_KEY, fields, maxlen=self.buffer_size, approximate=True)
+        except self.errors:
+            # Данные уже записаны в базу, клиенты получат их при следующем чтении
+            logger.warning('Не удалось опубликовать событие %s', event_type, exc_info=True)
+            return None
+        return self._event_id(stream_id)
+
+    def replay(self, after_id):
+        entries = self.client.xrange(EVENTS_STREAM_KEY, min=f'({self._stream_id(after_id)}', max='+')
+        return [self._event(stream_id, fields) for stream_id, fields in entries]
+
+    def _listen(self, last_id):
+        while True:
+            try:
+                response = self.client.xread({EVENTS_STREAM_KEY: last_id}, count=self.queue_size, block=5000)
+            except self.errors:
+                logger.warning('Нет связи с Redis, чтение событий будет повторено', exc_info=True)
+                time.sleep(1)
+                continue
+            for _, entries in response or []:
+                for stream_id, fields in entries:
+                    last_id = stream_id
+                    event = self._event(stream_id, fields)
+                    with self.lock:
+                        subscribers = list(self.subscribers)
+                    for subscription in subscribers:
+                        subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+    def subscribe(self, loop=None):
+        subscription = Subscription(self, self.queue_size, loop)
+        with self.lock:
+            self.subscribers.add(subscription)
+            if self.listener is None:
+                # Чтение начинается с последнего события на момент подписки:
+                # более ранние подписчик дочитывает сам через replay
+                latest = self.client.xrevrange(EVENTS_STREAM_KEY, count=1)
+                last_id = latest[0][0] if latest else '0-0'
+                self.listener = threading.Thread(target=self._listen, args=(last_id,), daemon=True)
+                self.listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, 'EVENTS_BROKER', 'api.events.InMemoryBroker'))
+                _broker = broker_class()
+    return _broker
+
+
+def publish_rows(event_type, batch_id, rows):
+    """
+    Публикует сериализованные записи после фиксации текущей транзакции,
+    чтобы клиенты не получили данные откатанной транзакции
+    """
+    if not rows:
+        return
+    transaction.on_commit(lambda: get_broker().publish(event_type, batch_id, rows))
@@ -0,0 +1,106 @@
+"""
+Потоковая выгрузка истории партий в CSV и NDJSON.
+
+Строки читаются из базы серверным курсором (QuerySet.iterator) порциями
+и сразу отдаются клиенту, поэтому расход памяти не зависит от объема
+выгрузки.
+"""
+import csv
+import json
+import zlib
+
+from .models import BatchParameter, Notification, ComputerVisionData, PARAMETER_FIELDS
+
+# Выгружаемые наборы данных: модель и столбцы в порядке вывода
+EXPORT_KINDS = {
+    'parameters': (
+        BatchParameter,
+        ('id', 'batch_id', 'timestamp') + PARAMETER_FIELDS + ('is_defect',),
+    ),
+    'notifications': (
+        Notification,
+        ('id', 'batch_id', 'timestamp', 'notification_type', 'message', 'is_read'),
+    ),
+    'vision': (
+        ComputerVisionData,
+        ('id', 'batch_id', 'timestamp', 'image_path', 'image_hash', 'confidence_score', 'is_defect', 'detected_objects'),
+    ),
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Количество строк, читаемых из базы за раз и объединяемых в один фрагмент ответа
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _LineBuffer:
+    """Буфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def _serialize_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки выборки в виде кортежей значений столбцов"""
+    return queryset.order_by('timestamp', 'id').values_list(*columns).iterator(chunk_size=chunk_size)
+
+
+def iter_csv(rows, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(columns)
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow([
+            json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else _serialize_value(value)
+            for value in row
+        ]))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def iter_ndjson(rows, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    lines = []
+    for row in rows:
+        record = {column: _serialize_value(value) for column, value in zip(columns, row)}
+        lines.append(json.dumps(record, ensure_ascii=False))
+        lines.append('\n')
+        if len(lines) >= chunk_size * 2:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def iter_gzip(chunks):
+    """Сжимает поток фрагментов в формат gzip на лету"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(queryset, columns, export_format, compress=False, rows=None):
+    """Фрагменты выгрузки; rows заменяет строки выборки queryset"""
+    if rows is None:
+        rows = iter_rows(queryset, columns)
+    if export_format == 'csv':
+        chunks = iter_csv(rows, columns)
+    else:
+        chunks = iter_ndjson(rows, columns)
+    if compress:
+        return iter_gzip(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
@@ -0,0 +1,139 @@
+"""
+Хранилище кадров компьютерного зрения, адресуемое по содержимому.
+
+Кадр сохраняется один раз под своим хэшем SHA-256 в каталогах
+FRAMES_ROOT/ab/cd/<хэш>, поэтому одинаковые кадры не дублируются,
+а в одном каталоге не скапливаются сотни тысяч файлов. Записи
+ComputerVisionData ссылаются на кадр полем image_hash.
+
+Уменьшенные копии (миниатюры) создаются при первом запросе и хранятся
+рядом в FRAMES_ROOT/thumbnails. Для миниатюр нужен пакет Pillow;
+без него вместо миниатюры отдается исходный кадр.
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def frames_root():
+    return Path(getattr(settings, 'FRAMES_ROOT', Path(settings.BASE_DIR) / 'frames'))
+
+
+def _sharded(root, image_hash, suffix=''):
+    return root / image_hash[:2] / image_hash[2:4] / f'{image_hash}{suffix}'
+
+
+def frame_path(image_hash):
+    return _sharded(frames_root(), image_hash)
+
+
+def thumbnail_path(image_hash):
+    size = getattr(settings, 'FRAMES_THUMBNAIL_SIZE', 160)
+    return _sharded(frames_root() / 'thumbnails' / str(size), image_hash, '.jpg')
+
+
+def _write_atomic(path, data):
+    """Запись через временный файл, чтобы читатели не увидели файл наполовину"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+def store_frame(data):
+    """Сохраняет кадр, если его еще нет в хранилище, и возвращает его хэш"""
+    image_hash = hashlib.sha256(data).hexdigest()
+    path = frame_path(image_hash)
+    if not path.exists():
+        _write_atomic(path, data)
+    return image_hash
+
+
+def guess_content_type(path):
+    with open(path, 'rb') as file:
+        head = file.read(8)
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return 'application/octet-stream'
+
+
+def get_thumbnail(image_hash):
+    """
+    Путь к миниатюре кадра (создается при первом обращении).
+    None, если кадра нет; путь к исходному кадру, если миниатюру
+    построить нельзя (нет Pillow или кадр не является изображением).
+    """
+    source = frame_path(image_hash)
+    if not source.exists():
+        return None
+    path = thumbnail_path(image_hash)
+    if path.exists():
+        return path
+    try:
+        from PIL import Image
+    except ImportError:
+        return source
+
+    size = getattr(settings, 'FRAMES_THUMBNAIL_SIZE', 160)
+    try:
+        with Image.open(source) as image:
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.convert('RGB').save(buffer, 'JPEG', quality=80)
+    except OSError:
+        return source
+    _write_atomic(path, buffer.getvalue())
+    return path
+
+
+def delete_frame(image_hash):
+    """Удаляет кадр и его миниатюру"""
+    for path in (frame_path(image_hash), thumbnail_path(image_hash)):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range (один диапазон байтов).
+    Возвращает (начало, конец включительно), None если заголовок
+    не задан или не поддерживается, и ValueError если диапазон
+    не пересекается с файлом.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
@@ -0,0 +1,212 @@
+"""
+Пакетная запись измерений параметров партии
+"""
+import math
+from datetime import datetime
+
+import numpy as np
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import get_active_settings, get_latest_parameter, remember_latest_parameter
+from .chunks import append_readings, latest_parameter, storage_mode
+from .counters import increment_counters
+from .events import publish_rows
+from .models import BatchParameter, PARAMETER_FIELDS
+from .notifications import notify
+from .parsers import NDJSONLineError
+from .rollups import schedule_catch_up
+from .risk import get_risk_model, score_readings
+from .rules import get_rule_set
+from .serializers import BatchParameterSerializer
+from .spc import update_control_charts
+
+# Максимальное количество измерений в одном запросе
+MAX_READINGS_PER_REQUEST = 5000
+
+
+def _parse_reading(raw, now):
+    """
+    Проверяет одно измерение.
+    Возвращает кортеж (значения, ошибки) - заполнен ровно один из элементов.
+    """
+    if isinstance(raw, NDJSONLineError):
+        return None, {'non_field_errors': [raw.message]}
+    if not isinstance(raw, dict):
+        return None, {'non_field_errors': ['Ожидался объект с параметрами измерения']}
+
+    values = {}
+    errors = {}
+    for field in PARAMETER_FIELDS:
+        value = raw.get(field)
+        if value is None:
+            errors[field] = ['Обязательное поле.']
+            continue
+        if isinstance(value, bool):
+            errors[field] = ['Требуется численное значение.']
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            errors[field] = ['Требуется численное значение.']
+            continue
+        if not math.isfinite(value):
+            errors[field] = ['Требуется конечное численное значение.']
+            continue
+        values[field] = value
+
+    timestamp = raw.get('timestamp')
+    if timestamp is None:
+        values['timestamp'] = now
+    else:
+        if isinstance(timestamp, datetime):
+            parsed = timestamp
+        elif isinstance(timestamp, str):
+            parsed = parse_datetime(timestamp)
+        else:
+            parsed = None
+        if parsed is None:
+            errors['timestamp'] = ['Неправильный формат datetime.']
+        else:
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            values['timestamp'] = parsed
+
+    if errors:
+        return None, errors
+    return values, None
+
+
+def defect_message(batch_number):
+    """Текст предупреждения о бракованных измерениях партии"""
+    return f"Обнаружен брак в партии {batch_number}"
+
+
+def classify_readings(batch, readings):
+    """
+    Проверяет пачку измерений по правилам активной настройки производства
+    линии партии одним векторным вызовом. Возвращает булев массив признаков брака.
+    """
+    if not readings:
+        return np.zeros(0, dtype=bool)
+    rule_set = get_rule_set(get_active_settings(batch.line_id))
+    values = np.array([[reading[field] for field in PARAMETER_FIELDS] for reading in readings], dtype=np.float64)
+    if not rule_set.has_rate_rules:
+        return rule_set.evaluate(values)
+
+    # Правила скорости изменения требуют порядка по времени и предыдущего измерения
+    timestamps = np.array([reading['timestamp'].timestamp() for reading in readings])
+    order = np.argsort(timestamps, kind='stable')
+    first = readings[order[0]]['timestamp']
+    last_parameter = latest_parameter(batch.pk, before=first)
+    previous = None
+    if last_parameter:
+        previous = (
+            [getattr(last_parameter, field) for field in PARAMETER_FIELDS],
+            last_parameter.timestamp.timestamp()
+        )
+    defects = np.empty(len(readings), dtype=bool)
+    defects[order] = rule_set.evaluate(values[order], timestamps[order], previous)
+    return defects
+
+
+def score_risk(batch, readings):
+    """Риск брака пачки измерений по модели линии (None, пока модель не обучена)"""
+    if not readings or not get_risk_model(batch.line_id).trained:
+        return None
+    latest = get_latest_parameter(batch.pk)
+    previous = [latest[field] for field in PARAMETER_FIELDS] if latest else None
+    values = [[reading[field] for field in PARAMETER_FIELDS] for reading in readings]
+    timestamps = [reading['timestamp'].timestamp() for reading in readings]
+    return score_readings(batch.line_id, values, timestamps, previous)
+
+
+def save_parameter(parameter):
+    """
+    Сохраняет одно измерение партии: строкой BatchParameter или, в режиме
+    PARAMETER_STORAGE = 'chunks', в пачку. Для строки события, кэш,
+    агрегаты и контрольные карты обновляет обработчик post_save
+    (signals.py), для пачки - эта функция
+    """
+    if storage_mode() != 'chunks':
+        parameter.save()
+        return parameter
+    with transaction.atomic():
+        append_readings(parameter.batch, [parameter])
+        schedule_catch_up()
+        publish_rows('parameter', parameter.batch_id, [BatchParameterSerializer(parameter).data])
+        transaction.on_commit(lambda: remember_latest_parameter(parameter))
+        update_control_charts(parameter.batch, [parameter])
+    return parameter
+
+
+def ingest_readings(batch, raw_readings):
+    """
+    Проверяет и записывает пачку измерений для партии.
+
+    Все принятые измерения сохраняются одним bulk_create в транзакции
+    (в режиме PARAMETER_STORAGE = 'chunks' - в пачки, см. chunks.py),
+    счетчики партии обновляются один раз на пачку, риск брака по модели
+    линии (см. risk.py) считается для всей пачки сразу.
+    Возвращает сводку и статус по каждому измерению в порядке поступления.
+    """
+    now = timezone.now()
+    results = []
+    accepted = []
+    for index, raw in enumerate(raw_readings):
+        values, errors = _parse_reading(raw, now)
+        if errors:
+            results.append({'index': index, 'status': 'rejected', 'errors': errors})
+            continue
+        accepted.append(values)
+        results.append({'index': index, 'status': 'accepted'})
+
+    defects = classify_readings(batch, accepted)
+    risks = score_risk(batch, accepted)
+    parameters = [
+        BatchParameter(batch=batch, is_defect=bool(is_defect), **values)
+        for values, is_defect in zip(accepted, defects)
+    ]
+    flags = iter(zip(defects, risks if risks is not None else [None] * len(defects)))
+    for result in results:
+        if result['status'] == 'accepted':
+            is_defect, risk = next(flags)
+            result['is_defect'] = bool(is_defect)
+            if risk is not None:
+                result['defect_risk'] = float(risk)
+
+    defect_count = sum(1 for parameter in parameters if parameter.is_defect)
+
+    if parameters:
+        with transaction.atomic():
+            if storage_mode() == 'chunks':
+                append_readings(batch, parameters)
+            else:
+                BatchParameter.objects.bulk_create(parameters)
+            # Поминутные агрегаты обновляются после фиксации, вне транзакции записи
+            schedule_catch_up()
+            publish_rows('parameter', batch.pk, BatchParameterSerializer(parameters, many=True).data)
+            increment_counters(batch.pk, len(parameters), defect_count)
+            if defect_count:
+                notify(batch, defect_message(batch.batch_number), 'warning', count=defect_count)
+            update_control_charts(batch, parameters)
+
+        position = max(range(len(parameters)), key=lambda index: parameters[index].timestamp)
+        latest = parameters[position]
+        extra = {'defect_risk': float(risks[position])} if risks is not None else None
+        transaction.on_commit(lambda: remember_latest_parameter(latest, extra))
+
+    # bulk_create заполняет первичные ключи на PostgreSQL и SQLite 3.35+
+    accepted = iter(parameters)
+    for result in results:
+        if result['status'] == 'accepted':
+            result['id'] = next(accepted).pk
+
+    return {
+        'accepted': len(parameters),
+        'rejected': len(results) - len(parameters),
+        'defects': defect_count,
+        'results': results,
+    }
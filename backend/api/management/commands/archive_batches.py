@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import ArchiveError, archive_batch, archive_candidates, verify_archive
+from api.models import Batch, BatchArchive
+
+
+class Command(BaseCommand):
+    help = 'Перенос измерений завершенных партий из базы в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ARCHIVE_AFTER_DAYS', 30),
+                            help='Переносить партии, завершенные больше указанного количества дней назад')
+        parser.add_argument('--batch', type=int, action='append', dest='batches',
+                            help='Партия для переноса (можно указать несколько раз, срок при этом не учитывается)')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Количество строк, удаляемых из базы за раз')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать партии, которые будут перенесены')
+        parser.add_argument('--verify', action='store_true',
+                            help='Проверить контрольные суммы файлов уже перенесенных партий')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+            return
+        if options['days'] < 0:
+            raise CommandError('Срок не может быть отрицательным')
+
+        if options['batches']:
+            batches = Batch.objects.filter(pk__in=options['batches'], is_active=False).exclude(archive__status='archived')
+        else:
+            batches = archive_candidates(options['days'])
+        archived = 0
+        for batch in batches.order_by('end_time'):
+            if options['dry_run']:
+                self.stdout.write(f'{batch}: будет перенесена')
+                continue
+            try:
+                archive = archive_batch(batch, options['chunk_size'])
+            except ArchiveError as exc:
+                self.stderr.write(self.style.ERROR(str(exc)))
+                continue
+            archived += 1
+            self.stdout.write(
+                f'{batch}: перенесено измерений {archive.parameter_count}, '
+                f'данных компьютерного зрения {archive.vision_count}'
+            )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Перенесено партий: {archived}'))
+
+    def verify(self):
+        failed = 0
+        for archive in BatchArchive.objects.select_related('batch').order_by('batch_id'):
+            try:
+                verify_archive(archive)
+            except ArchiveError as exc:
+                failed += 1
+                self.stderr.write(self.style.ERROR(str(exc)))
+        if failed:
+            raise CommandError(f'Повреждено архивов: {failed}')
+        self.stdout.write(self.style.SUCCESS('Архивы в порядке'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api import rollups
+from api.chunks import compact_batch_chunks
+from api.models import Batch
+from api.stats import invalidate_batch_statistics
+from api.versions import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Объединение мелких пачек измерений завершенных партий (PARAMETER_STORAGE = chunks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, action='append', dest='batches',
+                            help='Партия для объединения (можно указать несколько раз)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать партии и количество их пачек')
+
+    def handle(self, *args, **options):
+        # Пачки активных партий еще дописываются, их объединяют после завершения
+        batches = Batch.objects.filter(is_active=False).annotate(chunks=Count('parameter_chunks')).filter(chunks__gt=1)
+        if options['batches']:
+            batches = batches.filter(pk__in=options['batches'])
+
+        # Объединенные пачки сохраняются под старыми id: до объединения
+        # все пачки должны быть учтены в поминутных агрегатах
+        if not options['dry_run']:
+            rollups.catch_up()
+        removed = 0
+        for batch in batches.order_by('end_time'):
+            if options['dry_run']:
+                self.stdout.write(f'{batch}: пачек {batch.chunks}')
+                continue
+            before, after = compact_batch_chunks(batch.pk)
+            if before == after:
+                continue
+            removed += before - after
+            invalidate_batch_statistics(batch.pk)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{batch}: пачек {before} -> {after}')
+        if not options['dry_run']:
+            if removed:
+                bump_version('batches')
+            self.stdout.write(self.style.SUCCESS(f'Объединено пачек: {removed}'))
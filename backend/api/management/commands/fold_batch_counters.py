@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.counters import fold_counters
+
+
+class Command(BaseCommand):
+    help = 'Перенос частей счетчиков (BatchCounterShard) в счетчики партий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=None,
+                            help='Перенести только для указанной партии')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Повторять перенос с указанным периодом, с (по умолчанию - один раз)')
+
+    def handle(self, *args, **options):
+        if options['interval'] is not None and options['interval'] <= 0:
+            raise CommandError('Период должен быть положительным')
+
+        try:
+            while True:
+                updated = fold_counters(options['batch'])
+                if options['verbosity'] > 1 or options['interval'] is None:
+                    self.stdout.write(f'Обновлено партий: {updated}')
+                if options['interval'] is None:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
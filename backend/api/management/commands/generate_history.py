@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import generate_history
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетической истории партий для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batches', type=int, default=10, help='Количество партий')
+        parser.add_argument('--readings', type=int, default=10000, help='Количество измерений в партии')
+        parser.add_argument('--interval', type=float, default=1.0, help='Шаг измерений, с')
+        parser.add_argument('--defect-rate', type=float, default=0.02,
+                            help='Доля измерений с выбросом за критические значения')
+        parser.add_argument('--vision-every', type=int, default=10,
+                            help='Одна запись компьютерного зрения на указанное число измерений (0 - без них)')
+        parser.add_argument('--lines', type=int, default=1, help='Количество линий')
+        parser.add_argument('--seed', type=int, default=None, help='Начальное значение генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        if options['batches'] <= 0 or options['readings'] <= 0 or options['lines'] <= 0:
+            raise CommandError('Количество партий, измерений и линий должно быть положительным')
+        if not 0 <= options['defect_rate'] <= 1:
+            raise CommandError('Доля брака должна быть в диапазоне [0, 1]')
+
+        started = time.monotonic()
+
+        def progress(batch):
+            self.stdout.write(f'{batch}: {batch.total_count} измерений, брак {batch.defect_count}')
+
+        batches = generate_history(
+            options['batches'],
+            options['readings'],
+            interval=options['interval'],
+            defect_rate=options['defect_rate'],
+            vision_every=options['vision_every'],
+            line_count=options['lines'],
+            seed=options['seed'],
+            progress=progress,
+        )
+        total = sum(batch.total_count for batch in batches)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано партий: {len(batches)}, измерений: {total} за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.archive import archived_frame_hashes
+from api.frames import delete_frame
+from api.models import ComputerVisionData
+
+
+class Command(BaseCommand):
+    help = 'Удаление устаревших кадров компьютерного зрения (кадры с дефектами хранятся дольше)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--defect-days', type=int,
+                            default=getattr(settings, 'FRAMES_RETENTION_DEFECT_DAYS', 90),
+                            help='Срок хранения кадров с дефектами, дней')
+        parser.add_argument('--ok-days', type=int,
+                            default=getattr(settings, 'FRAMES_RETENTION_OK_DAYS', 7),
+                            help='Срок хранения кадров без дефектов, дней')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество записей, обрабатываемых за раз')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только подсчитать, ничего не удаляя')
+
+    def handle(self, *args, **options):
+        if options['defect_days'] < 0 or options['ok_days'] < 0:
+            raise CommandError('Срок хранения не может быть отрицательным')
+
+        now = timezone.now()
+        expired = (
+            ComputerVisionData.objects.filter(is_defect=True, timestamp__lt=now - timedelta(days=options['defect_days']))
+            | ComputerVisionData.objects.filter(is_defect=False, timestamp__lt=now - timedelta(days=options['ok_days']))
+        ).filter(image_hash__isnull=False)
+
+        if options['dry_run']:
+            self.stdout.write(f'Записей с устаревшими кадрами: {expired.count()}')
+            return
+
+        # Кадры, на которые ссылаются перенесенные в архив записи, не удаляются
+        archived = archived_frame_hashes()
+        released = deleted = 0
+        while True:
+            rows = list(expired.order_by('id').values_list('id', 'image_hash')[:options['chunk_size']])
+            if not rows:
+                break
+            ComputerVisionData.objects.filter(id__in=[row[0] for row in rows]).update(image_hash=None)
+            released += len(rows)
+
+            # Один кадр может быть общим для нескольких записей: удаляем только те,
+            # на которые больше никто не ссылается
+            hashes = {row[1] for row in rows}
+            still_used = set(
+                ComputerVisionData.objects.filter(image_hash__in=hashes).values_list('image_hash', flat=True)
+            )
+            for image_hash in hashes - still_used - archived:
+                delete_frame(image_hash)
+                deleted += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Освобождено записей: {released}, удалено кадров: {deleted}'
+        ))
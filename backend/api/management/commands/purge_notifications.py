@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Notification
+from api.versions import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Удаление прочитанных уведомлений старше срока хранения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30),
+                            help='Срок хранения прочитанных уведомлений, дней')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Количество уведомлений, удаляемых за раз')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('Срок хранения не может быть отрицательным')
+
+        expired = Notification.objects.filter(
+            is_read=True,
+            timestamp__lt=timezone.now() - timedelta(days=options['days'])
+        )
+        # Удаление порциями, чтобы не держать долгую блокировку большой таблицы
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            deleted += Notification.objects.filter(id__in=ids).delete()[0]
+        if deleted:
+            bump_version('notifications')
+
+        self.stdout.write(self.style.SUCCESS(f'Удалено уведомлений: {deleted}'))
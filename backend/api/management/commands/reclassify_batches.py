@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import get_active_settings
+from api.models import Batch, ProductionSettings
+from api.rules import get_rule_set, reclassify_batch
+
+
+class Command(BaseCommand):
+    help = 'Перепроверка измерений партий по правилам выявления брака'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, action='append', dest='batches',
+                            help='Партия для перепроверки (можно указать несколько раз, по умолчанию все)')
+        parser.add_argument('--production-settings', type=int, default=None,
+                            help='Настройка производства, правила которой применяются '
+                                 '(по умолчанию активная настройка линии партии)')
+
+    def handle(self, *args, **options):
+        rule_set = None
+        if options['production_settings'] is not None:
+            try:
+                production_settings = ProductionSettings.objects.get(pk=options['production_settings'])
+            except ProductionSettings.DoesNotExist:
+                raise CommandError(f"Настройка производства {options['production_settings']} не найдена")
+            rule_set = get_rule_set(production_settings)
+
+        batches = Batch.objects.all()
+        if options['batches']:
+            batches = batches.filter(pk__in=options['batches'])
+        for batch in batches.select_related('archive').order_by('start_time'):
+            if hasattr(batch, 'archive'):
+                # Измерения перенесены в архив и не меняются
+                self.stdout.write(f'{batch}: партия в архиве, пропущена')
+                continue
+            changed = reclassify_batch(batch, rule_set or get_rule_set(get_active_settings(batch.line_id)))
+            self.stdout.write(f'{batch}: изменен признак брака у {changed} измерений')
@@ -0,0 +1,127 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Batch, ProductionSettings
+from api.replay import build_candidate, replay_batches
+
+
+def _parse_option(value):
+    name, separator, raw = value.partition('=')
+    if not separator:
+        raise CommandError(f'Настройка должна быть задана как ИМЯ=ЗНАЧЕНИЕ: {value}')
+    try:
+        return name, json.loads(raw)
+    except ValueError:
+        raise CommandError(f'Некорректное значение настройки {name}: {raw}')
+
+
+class Command(BaseCommand):
+    help = 'Воспроизведение завершенных партий с другими настройками и сравнение с фактом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, action='append', dest='batches',
+                            help='Партия (можно указать несколько раз)')
+        parser.add_argument('--days', type=int, default=7,
+                            help='Без --batch: партии, завершенные за последние N дней')
+        parser.add_argument('--line', type=int, default=None,
+                            help='Без --batch: только партии линии')
+        parser.add_argument('--production-settings', type=int, action='append', dest='production_settings',
+                            help='Настройка производства для сравнения (можно указать несколько раз, '
+                                 'по умолчанию активная настройка линии партии)')
+        parser.add_argument('--option', action='append', default=[],
+                            help='Замена настройки для всех конфигураций, например SPC_CUSUM_H=4')
+        parser.add_argument('--config', default=None,
+                            help='JSON-файл со списком конфигураций: name, settings, rules, setpoints, options')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов (по умолчанию REPLAY_WORKERS или число ядер)')
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести итоги в JSON')
+
+    def handle(self, *args, **options):
+        overrides = dict(_parse_option(value) for value in options['option'])
+        try:
+            candidates = self.candidates(options, overrides)
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        if options['batches']:
+            batches = Batch.objects.filter(pk__in=options['batches'])
+            missing = set(options['batches']) - set(batches.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"Партии не найдены: {', '.join(map(str, sorted(missing)))}")
+        else:
+            batches = Batch.objects.filter(
+                is_active=False, end_time__gte=timezone.now() - timedelta(days=options['days'])
+            )
+            if options['line'] is not None:
+                batches = batches.filter(line_id=options['line'])
+        batches = batches.order_by('start_time')
+
+        results = replay_batches(batches, candidates, workers=options['workers'])
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+            return
+        for result in results:
+            actual = result['actual']
+            self.stdout.write(
+                f"Партия {actual['batch_number']}: {actual['readings']} измерений "
+                f"за {timedelta(seconds=round(actual['duration']))}"
+            )
+            self.report(actual)
+            for summary in result['candidates']:
+                self.report(summary)
+        self.stdout.write(self.style.SUCCESS(f'Воспроизведено партий: {len(results)}'))
+
+    def candidates(self, options, overrides):
+        candidates = []
+        for pk in options['production_settings'] or []:
+            production_settings = ProductionSettings.objects.filter(pk=pk).first()
+            if production_settings is None:
+                raise CommandError(f'Настройка производства {pk} не найдена')
+            candidates.append(build_candidate(production_settings, options=overrides))
+        if options['config']:
+            try:
+                with open(options['config'], encoding='utf-8') as config:
+                    entries = json.load(config)
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Не удалось прочитать {options['config']}: {error}")
+            for entry in entries:
+                production_settings = None
+                if entry.get('settings') is not None:
+                    production_settings = ProductionSettings.objects.filter(pk=entry['settings']).first()
+                    if production_settings is None:
+                        raise CommandError(f"Настройка производства {entry['settings']} не найдена")
+                candidates.append(build_candidate(
+                    production_settings,
+                    name=entry.get('name'),
+                    rules=entry.get('rules'),
+                    setpoints=entry.get('setpoints'),
+                    options={**overrides, **entry.get('options', {})},
+                ))
+        if not candidates and overrides:
+            raise CommandError('--option применяется к конфигурациям из --production-settings или --config')
+        return candidates
+
+    def report(self, summary):
+        drift = sum(sum(directions.values()) for directions in summary['drift_signals'].values())
+        line = (
+            f"  {summary['name']}: брак {summary['defect_count']} ({summary['defect_rate']:.2%})"
+        )
+        if summary['elapsed'] is not None:
+            line += f", новых {summary['flagged']}, снятых {summary['cleared']}"
+        line += (
+            f", уведомлений {summary['notifications']} (повторений {summary['notification_occurrences']}), "
+            f"сигналов дрейфа {drift}"
+        )
+        if summary['vision'] is not None:
+            precision = summary['vision']['precision']
+            line += (
+                f", совпадение с компьютерным зрением: точность "
+                f"{'-' if precision is None else format(precision, '.2f')}, полнота {summary['vision']['recall']:.2f}"
+            )
+        if summary['speedup'] is not None:
+            line += f", ускорение {summary['speedup']:.0f}x"
+        self.stdout.write(line)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api import rollups
+from api.models import Batch
+
+
+class Command(BaseCommand):
+    help = 'Обновление поминутных агрегатов параметров по новым измерениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Полностью перестроить агрегаты вместо обработки только новых измерений')
+        parser.add_argument('--batch', type=int, action='append', dest='batches',
+                            help='Перестраиваемая партия (можно указать несколько раз, по умолчанию все)')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Размер порции измерений при обработке новых данных')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            batch_ids = options['batches'] or Batch.objects.values_list('id', flat=True)
+            for batch_id in batch_ids:
+                created = rollups.rebuild(batch_id)
+                self.stdout.write(f'Партия {batch_id}: минут с данными - {created}')
+            return
+
+        processed = rollups.catch_up(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано новых измерений: {processed}'))
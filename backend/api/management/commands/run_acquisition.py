@@ -0,0 +1,51 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.acquisition import AcquisitionLoop, get_data_source
+
+
+class Command(BaseCommand):
+    help = 'Получение измерений для всех активных партий с заданной частотой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'ACQUISITION_RATE_HZ', 10.0),
+                            help='Частота измерений на партию, Гц')
+        parser.add_argument('--source', default=None,
+                            help='Путь импорта класса источника данных (по умолчанию ACQUISITION_SOURCE)')
+        parser.add_argument('--flush-interval', type=float, default=1.0,
+                            help='Период записи накопленных измерений в базу, с')
+        parser.add_argument('--report-interval', type=float, default=10.0,
+                            help='Период вывода фактической частоты, с')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Время работы, с (по умолчанию - до остановки)')
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0:
+            self.stderr.write(self.style.ERROR('Частота должна быть положительной'))
+            return
+
+        loop = AcquisitionLoop(
+            get_data_source(options['source']),
+            rate=options['rate'],
+            flush_interval=options['flush_interval'],
+            report_interval=options['report_interval'],
+        )
+        signal.signal(signal.SIGTERM, lambda *_: loop.stop())
+
+        def report(stats):
+            self.stdout.write(
+                f"Целевая частота {stats['target_rate']:.1f} Гц, "
+                f"фактическая {stats['achieved_rate']:.1f} Гц, "
+                f"записано {stats['readings_per_second']:.1f} изм/с, "
+                f"активных партий {stats['active_batches']}, "
+                f"пропущено тактов {stats['late_ticks']}"
+            )
+
+        self.stdout.write(f"Запуск получения измерений с частотой {options['rate']} Гц")
+        try:
+            loop.run(duration=options['duration'], on_report=report)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Получение измерений остановлено'))
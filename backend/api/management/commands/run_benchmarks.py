@@ -0,0 +1,86 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from api.benchmarks import SCENARIO_NAMES, compare, run_scenarios
+
+
+class Command(BaseCommand):
+    help = 'Замер задержек, пропускной способности и числа запросов горячих точек API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIO_NAMES,
+                            help='Сценарий (можно указать несколько раз, по умолчанию все)')
+        parser.add_argument('--iterations', type=int, default=200, help='Количество вызовов на сценарий')
+        parser.add_argument('--warmup', type=int, default=10, help='Количество прогревочных вызовов')
+        parser.add_argument('--save', default=None, help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--compare', default=None, help='Сравнить с результатами из JSON-файла')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый относительный рост задержек при сравнении')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Завершиться с ошибкой, если найдены регрессии')
+
+    def handle(self, *args, **options):
+        if options['iterations'] <= 0:
+            raise CommandError('Количество вызовов должно быть положительным')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Не удалось прочитать {options['compare']}: {exc}")
+
+        self.stdout.write(
+            f"База данных: {connection.vendor}, вызовов на сценарий: {options['iterations']}"
+        )
+        results = run_scenarios(
+            options['scenarios'] or SCENARIO_NAMES,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            on_result=self.report,
+        )
+
+        if options['save']:
+            report = {
+                'created': timezone.now().isoformat(),
+                'commit': self.commit(),
+                'database': connection.vendor,
+                'results': results,
+            }
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты сохранены в {options['save']}")
+
+        if baseline is not None:
+            self.stdout.write(f"Сравнение с {options['compare']} (коммит {baseline.get('commit') or '-'}):")
+            regressions = 0
+            for name, metric, before, after, change, regressed in compare(
+                results, baseline['results'], options['threshold']
+            ):
+                line = f'  {name:<20} {metric:<20} {before:10.2f} -> {after:10.2f} ({change:+.1%})'
+                if regressed:
+                    regressions += 1
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Найдено регрессий: {regressions}')
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<20} p50 {result['p50_ms']:8.2f} мс  p99 {result['p99_ms']:8.2f} мс  "
+            f"{result['throughput_rps']:8.1f} запр/с  {result['queries_per_request']:5.1f} SQL/запр"
+        )
+
+    @staticmethod
+    def commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,87 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.controller import ControllerLoop, simulate
+from api.models import PARAMETER_FIELDS, ProductionLine
+
+
+class Command(BaseCommand):
+    help = 'Регулятор уставок линий с активной партией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'CONTROLLER_RATE_HZ', 10.0),
+                            help='Частота регулирования, Гц')
+        parser.add_argument('--line', type=int, action='append', default=None,
+                            help='Линия (можно указать несколько раз, по умолчанию - все)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только журнал изменений, уставки линии не меняются')
+        parser.add_argument('--simulate', action='store_true',
+                            help='Прогон на симуляции линии без записи в базу')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Начальное значение генератора возмущений для --simulate')
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'CONTROLLER_POLL_INTERVAL', 0.5),
+                            help='Период чтения новых измерений, с')
+        parser.add_argument('--flush-interval', type=float, default=getattr(settings, 'CONTROLLER_FLUSH_INTERVAL', 1.0),
+                            help='Период записи изменений уставок в базу, с')
+        parser.add_argument('--report-interval', type=float, default=10.0,
+                            help='Период вывода статистики, с')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Время работы, с (по умолчанию - до остановки; для --simulate - 600 с модельного времени)')
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0:
+            raise CommandError('Частота регулирования должна быть положительной')
+        if options['line'] and ProductionLine.objects.filter(pk__in=options['line']).count() != len(set(options['line'])):
+            raise CommandError('Линия не найдена')
+        if options['simulate']:
+            self.simulate(options)
+            return
+
+        loop = ControllerLoop(
+            options['rate'],
+            line_ids=options['line'],
+            dry_run=options['dry_run'],
+            poll_interval=options['poll_interval'],
+            flush_interval=options['flush_interval'],
+            report_interval=options['report_interval'],
+        )
+        signal.signal(signal.SIGTERM, lambda *_: loop.stop())
+
+        def report(stats):
+            self.stdout.write(
+                f"Целевая частота {stats['target_rate']:.1f} Гц, "
+                f"фактическая {stats['achieved_rate']:.1f} Гц, "
+                f"изменений уставок {stats['adjustments']}, "
+                f"линий {stats['lines']}, "
+                f"пропущено тактов {stats['late_ticks']}"
+            )
+
+        mode = ' (пробный режим)' if options['dry_run'] else ''
+        self.stdout.write(f"Запуск регулятора с частотой {options['rate']} Гц{mode}")
+        try:
+            loop.run(duration=options['duration'], on_report=report)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Регулятор остановлен'))
+
+    def simulate(self, options):
+        duration = options['duration'] or 600.0
+        for line in ProductionLine.objects.filter(pk__in=options['line']) if options['line'] else ProductionLine.objects.all():
+            result = simulate(line.pk, duration, options['rate'], seed=options['seed'])
+            self.stdout.write(
+                f"Линия {line.name}: {result['steps']} тактов, изменений уставок {result['adjustments']} "
+                f"(выходов на безопасную границу {result['limited']})"
+            )
+            for field in PARAMETER_FIELDS:
+                self.stdout.write(
+                    f"  {field}: среднее отклонение {result['controlled']['mean_deviation'][field]:.4g} "
+                    f"с регулятором, {result['open_loop']['mean_deviation'][field]:.4g} без него; "
+                    f"уставка {result['setpoints'][field]:.4g}"
+                )
+            self.stdout.write(
+                f"  Доля брака: {result['controlled']['defect_rate']:.3f} с регулятором, "
+                f"{result['open_loop']['defect_rate']:.3f} без него"
+            )
+        self.stdout.write(self.style.SUCCESS('Пробный прогон регулятора завершен'))
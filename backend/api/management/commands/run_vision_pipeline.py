@@ -0,0 +1,70 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Batch
+from api.vision import SyntheticFrameSource, get_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон конвейера компьютерного зрения с генератором кадров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=None,
+                            help='Партия, к которой относятся кадры (по умолчанию - активная)')
+        parser.add_argument('--fps', type=float, default=getattr(settings, 'VISION_CAMERA_FPS', 15.0),
+                            help='Частота поступления кадров, кадр/с')
+        parser.add_argument('--frame-size', type=int, default=0,
+                            help='Размер синтетического кадра, байт')
+        parser.add_argument('--report-interval', type=float, default=5.0,
+                            help='Период вывода статистики, с')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Время работы, с (по умолчанию - до остановки)')
+
+    def handle(self, *args, **options):
+        if options['fps'] <= 0:
+            raise CommandError('Частота кадров должна быть положительной')
+        if options['batch'] is not None:
+            batch = Batch.objects.filter(pk=options['batch']).first()
+        else:
+            batch = Batch.objects.filter(is_active=True).order_by('-start_time').first()
+        if batch is None:
+            raise CommandError('Партия не найдена')
+
+        pipeline = get_pipeline()
+        source = SyntheticFrameSource(pipeline, batch.id, options['fps'], options['frame_size'])
+        stopped = []
+        signal.signal(signal.SIGTERM, lambda *_: stopped.append(True))
+
+        self.stdout.write(f"Прогон конвейера для партии {batch.batch_number} с частотой {options['fps']} кадр/с")
+        pipeline.start()
+        source.start()
+        started = time.monotonic()
+        try:
+            while not stopped:
+                elapsed = time.monotonic() - started
+                if options['duration'] is not None and elapsed >= options['duration']:
+                    break
+                time.sleep(min(options['report_interval'], max(0.0, (options['duration'] or 1e9) - elapsed)))
+                self.report(pipeline.stats(window=options['report_interval']))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.stop()
+            pipeline.stop()
+
+        self.report(pipeline.stats(window=time.monotonic() - started))
+        self.stdout.write(self.style.SUCCESS('Прогон конвейера завершен'))
+
+    def report(self, stats):
+        stages = ', '.join(
+            f"{name} {stage['avg_ms']:.1f}/{stage['p99_ms']:.1f} мс"
+            for name, stage in stats['stages'].items()
+        )
+        self.stdout.write(
+            f"Обработано {stats['fps']:.1f} кадр/с, принято {stats['submitted']}, "
+            f"записано {stats['written']}, отброшено {stats['dropped']}, в очереди {stats['queued']}; "
+            f"задержки (сред./p99): {stages}"
+        )
@@ -0,0 +1,52 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import ProductionLine
+from api.risk import get_risk_model, train_line
+
+
+class Command(BaseCommand):
+    help = 'Дообучение моделей риска брака на новых измерениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--line', type=int, action='append', default=None,
+                            help='Линия (можно указать несколько раз, по умолчанию - все)')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Период дообучения, с (по умолчанию - однократно)')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Время работы в режиме --interval, с (по умолчанию - до остановки)')
+
+    def handle(self, *args, **options):
+        lines = ProductionLine.objects.order_by('pk')
+        if options['line']:
+            lines = lines.filter(pk__in=options['line'])
+            if lines.count() != len(set(options['line'])):
+                raise CommandError('Линия не найдена')
+        if options['interval'] is not None and options['interval'] <= 0:
+            raise CommandError('Период дообучения должен быть положительным')
+
+        stopped = []
+        signal.signal(signal.SIGTERM, lambda *_: stopped.append(True))
+        started = time.monotonic()
+        try:
+            while not stopped:
+                for line in lines:
+                    trained = train_line(line.pk)
+                    if trained:
+                        model = get_risk_model(line.pk).as_dict()
+                        self.stdout.write(
+                            f"Линия {line.name}: учтено {trained} измерений, всего {model['samples']}, "
+                            f"доля брака {model['defect_rate']:.3f}"
+                        )
+                if options['interval'] is None:
+                    break
+                elapsed = time.monotonic() - started
+                if options['duration'] is not None and elapsed >= options['duration']:
+                    break
+                time.sleep(min(options['interval'], max(0.0, (options['duration'] or 1e9) - elapsed)))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('Дообучение моделей риска завершено'))
@@ -0,0 +1,300 @@
+"""
+Метрики запросов API в формате Prometheus.
+
+QueryMetricsMiddleware для каждого запроса измеряет длительность,
+количество и суммарное время SQL-запросов и размер ответа. SQL-запросы
+учитывает обертка выполнения, установленная на каждом соединении
+с базой: она находит учет текущего запроса через contextvars, поэтому
+видит и запросы синхронных представлений, которые под ASGI выполняются
+в другом потоке. Потоковые ответы (выгрузка) учитываются до закрытия
+ответа, вместе с запросами при его отдаче. Значения копятся в
+гистограммах по представлению и действию DRF (например,
+BatchViewSet.current_parameters) и отдаются представлением metrics
+в текстовом формате Prometheus.
+
+Повтор одного и того же SQL-запроса больше METRICS_NPLUSONE_THRESHOLD
+раз за запрос считается признаком проблемы N+1: увеличивается счетчик
+и в лог пишется шаблон запроса. Запросы дольше METRICS_SLOW_REQUEST_MS
+пишутся в лог вместе с самыми долгими SQL-запросами.
+
+Метрики хранятся в памяти процесса; при нескольких процессах сервера
+каждый отдает свои значения.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Списки параметров IN (%s, %s, ...) разной длины дают один шаблон
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Метрики запросов процесса"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.durations = {}
+        self.queries = {}
+        self.sizes = {}
+        self.db_seconds = Counter()
+        self.nplusone = Counter()
+        self.reported_nplusone = set()
+
+    def _histogram(self, store, key, buckets):
+        histogram = store.get(key)
+        if histogram is None:
+            histogram = store[key] = Histogram(buckets)
+        return histogram
+
+    def record(self, endpoint, method, status, duration, query_count, db_time, size=None, nplusone=None):
+        key = (endpoint, method)
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            self._histogram(self.durations, key, DURATION_BUCKETS).observe(duration)
+            self._histogram(self.queries, key, QUERY_BUCKETS).observe(query_count)
+            self.db_seconds[key] += db_time
+            if size is not None:
+                self._histogram(self.sizes, key, SIZE_BUCKETS).observe(size)
+            if nplusone:
+                self.nplusone[key] += 1
+                first_time = (endpoint, nplusone[0]) not in self.reported_nplusone
+                self.reported_nplusone.add((endpoint, nplusone[0]))
+            else:
+                first_time = False
+        if first_time:
+            logger.warning('Возможная проблема N+1 в %s: %s раз выполнен запрос %s', endpoint, nplusone[1], nplusone[0])
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self.lock:
+            lines = []
+            lines += _render_counter(
+                'api_requests_total', 'Количество запросов', self.requests, ('endpoint', 'method', 'status')
+            )
+            lines += _render_histograms(
+                'api_request_duration_seconds', 'Длительность обработки запроса, с', self.durations
+            )
+            lines += _render_histograms(
+                'api_request_queries', 'Количество SQL-запросов на запрос', self.queries
+            )
+            lines += _render_counter(
+                'api_request_db_seconds_total', 'Суммарное время SQL-запросов, с', self.db_seconds,
+                ('endpoint', 'method')
+            )
+            lines += _render_histograms(
+                'api_response_size_bytes', 'Размер ответа, байт', self.sizes
+            )
+            lines += _render_counter(
+                'api_nplusone_total', 'Запросы с повторяющимся SQL (признак N+1)', self.nplusone,
+                ('endpoint', 'method')
+            )
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+def _render_counter(name, help_text, values, label_names):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+    for key, value in sorted(values.items()):
+        lines.append(f'{name}{_labels(label_names, key)} {value}')
+    return lines
+
+
+def _render_histograms(name, help_text, histograms):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    label_names = ('endpoint', 'method')
+    for key, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += count
+            bucket_labels = _labels(label_names, key, 'le="%s"' % bound)
+            lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+        lines.append(f'{name}_sum{_labels(label_names, key)} {histogram.sum}')
+        lines.append(f'{name}_count{_labels(label_names, key)} {histogram.count}')
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+class _QueryRecorder:
+    """Учет SQL-запросов одного запроса API: время каждого и повторы шаблонов"""
+
+    __slots__ = ('statements', 'total_time', 'started', 'active')
+
+    def __init__(self):
+        self.statements = []
+        self.total_time = 0.0
+        self.started = time.perf_counter()
+        self.active = True
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.total_time += elapsed
+            self.statements.append((elapsed, sql, params))
+
+    def repeated(self, threshold):
+        """Самый частый шаблон SQL, если он повторяется не меньше threshold раз"""
+        if len(self.statements) < threshold:
+            return None
+        templates = Counter(_IN_LIST_RE.sub('IN (...)', sql) for _, sql, _ in self.statements)
+        template, count = templates.most_common(1)[0]
+        return (template, count) if count >= threshold else None
+
+
+# Учет SQL-запросов текущего запроса API; contextvars передаются
+# и в потоки, где под ASGI выполняются синхронные представления
+_current_recorder = contextvars.ContextVar('metrics_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _current_recorder.get()
+    if recorder is None or not recorder.active:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _install_query_wrapper(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_install_query_wrapper)
+
+
+def _endpoint(request):
+    return getattr(request, '_metrics_endpoint', 'unmatched')
+
+
+class QueryMetricsMiddleware:
+    """Сбор метрик запросов (см. описание модуля)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.slow_seconds = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500)
+        if self.slow_seconds is not None:
+            self.slow_seconds /= 1000
+        self.nplusone_threshold = getattr(settings, 'METRICS_NPLUSONE_THRESHOLD', 10)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        # Соединение могло быть открыто до загрузки модуля
+        _install_query_wrapper(connection)
+        recorder = self.start()
+        return self.finish(request, self.get_response(request), recorder)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        recorder = self.start()
+        return self.finish(request, await self.get_response(request), recorder)
+
+    @staticmethod
+    def start():
+        recorder = _QueryRecorder()
+        _current_recorder.set(recorder)
+        return recorder
+
+    def finish(self, request, response, recorder):
+        if response.streaming:
+            # Потоковый ответ выполняет SQL-запросы при отдаче: итоги
+            # подводятся при его закрытии
+            response._resource_closers.append(lambda: self.record(request, response, recorder))
+        else:
+            self.record(request, response, recorder)
+        return response
+
+    def record(self, request, response, recorder):
+        recorder.active = False
+        duration = time.perf_counter() - recorder.started
+        endpoint = _endpoint(request)
+        if endpoint == 'metrics':
+            return
+        size = None if response.streaming else len(response.content)
+        nplusone = recorder.repeated(self.nplusone_threshold) if self.nplusone_threshold else None
+        registry.record(
+            endpoint, request.method, response.status_code, duration,
+            len(recorder.statements), recorder.total_time, size, nplusone
+        )
+        if self.slow_seconds is not None and duration >= self.slow_seconds:
+            self.log_slow_request(request, endpoint, duration, recorder)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Представления DRF: класс и действие; функции: имя функции
+        cls = getattr(view_func, 'cls', None)
+        if cls is not None:
+            actions = getattr(view_func, 'actions', None) or {}
+            action = actions.get(request.method.lower(), request.method.lower())
+            request._metrics_endpoint = f'{cls.__name__}.{action}'
+        else:
+            request._metrics_endpoint = getattr(view_func, '__name__', 'unknown')
+        return None
+
+    @staticmethod
+    def log_slow_request(request, endpoint, duration, recorder):
+        slowest = sorted(recorder.statements, key=lambda statement: statement[0], reverse=True)[:5]
+        details = ''.join(
+            f'\n  {elapsed * 1000:.1f} мс: {sql} {params!r}'[:2000] for elapsed, sql, params in slowest
+        )
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.1f мс, SQL-запросов %s, время SQL %.1f мс%s',
+            request.method, request.get_full_path(), endpoint, duration * 1000,
+            len(recorder.statements), recorder.total_time * 1000, details
+        )
+
+
+def metrics(request):
+    """Метрики запросов в текстовом формате Prometheus"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
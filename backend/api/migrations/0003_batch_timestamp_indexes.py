@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_computervisiondata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batchparameter',
+            index=models.Index(fields=['batch', 'timestamp'], name='api_param_batch_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='computervisiondata',
+            index=models.Index(fields=['batch', 'timestamp'], name='api_vision_batch_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['batch', 'timestamp'], name='api_notif_batch_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['timestamp'], name='api_notif_ts_idx'),
+        ),
+    ]
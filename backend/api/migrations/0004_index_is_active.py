@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_batch_timestamp_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='batch',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True, verbose_name='Активна'),
+        ),
+        migrations.AlterField(
+            model_name='productionsettings',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True, verbose_name='Активна'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_index_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField(verbose_name='Минута')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество измерений')),
+                ('defect_count', models.IntegerField(default=0, verbose_name='Количество брака')),
+                ('temperature_min', models.FloatField(verbose_name='Минимум температуры')),
+                ('temperature_max', models.FloatField(verbose_name='Максимум температуры')),
+                ('temperature_sum', models.FloatField(default=0.0, verbose_name='Сумма температуры')),
+                ('temperature_sumsq', models.FloatField(default=0.0, verbose_name='Сумма квадратов температуры')),
+                ('pressure_min', models.FloatField(verbose_name='Минимум давления')),
+                ('pressure_max', models.FloatField(verbose_name='Максимум давления')),
+                ('pressure_sum', models.FloatField(default=0.0, verbose_name='Сумма давления')),
+                ('pressure_sumsq', models.FloatField(default=0.0, verbose_name='Сумма квадратов давления')),
+                ('mixing_speed_min', models.FloatField(verbose_name='Минимум скорости перемешивания')),
+                ('mixing_speed_max', models.FloatField(verbose_name='Максимум скорости перемешивания')),
+                ('mixing_speed_sum', models.FloatField(default=0.0, verbose_name='Сумма скорости перемешивания')),
+                ('mixing_speed_sumsq', models.FloatField(default=0.0, verbose_name='Сумма квадратов скорости перемешивания')),
+                ('glazing_thickness_min', models.FloatField(verbose_name='Минимум толщины глазури')),
+                ('glazing_thickness_max', models.FloatField(verbose_name='Максимум толщины глазури')),
+                ('glazing_thickness_sum', models.FloatField(default=0.0, verbose_name='Сумма толщины глазури')),
+                ('glazing_thickness_sumsq', models.FloatField(default=0.0, verbose_name='Сумма квадратов толщины глазури')),
+                ('last_parameter_id', models.BigIntegerField(default=0, verbose_name='Последнее учтенное измерение')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.batch', verbose_name='Партия')),
+            ],
+            options={
+                'verbose_name': 'Поминутные агрегаты параметров',
+                'verbose_name_plural': 'Поминутные агрегаты параметров',
+                'ordering': ['minute'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='parameterrollup',
+            constraint=models.UniqueConstraint(fields=('batch', 'minute'), name='api_rollup_batch_minute_uniq'),
+        ),
+    ]
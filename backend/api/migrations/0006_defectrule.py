@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_parameterrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefectRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule_type', models.CharField(choices=[('range', 'Допустимый диапазон'), ('rate', 'Скорость изменения'), ('condition', 'Сочетание параметров')], default='range', max_length=20, verbose_name='Тип правила')),
+                ('parameter', models.CharField(choices=[('temperature', 'Температура'), ('pressure', 'Давление'), ('mixing_speed', 'Скорость перемешивания'), ('glazing_thickness', 'Толщина глазури')], max_length=30, verbose_name='Параметр')),
+                ('min_value', models.FloatField(blank=True, null=True, verbose_name='Нижняя граница')),
+                ('max_value', models.FloatField(blank=True, null=True, verbose_name='Верхняя граница')),
+                ('secondary_parameter', models.CharField(blank=True, choices=[('temperature', 'Температура'), ('pressure', 'Давление'), ('mixing_speed', 'Скорость перемешивания'), ('glazing_thickness', 'Толщина глазури')], max_length=30, null=True, verbose_name='Второй параметр')),
+                ('secondary_min_value', models.FloatField(blank=True, null=True, verbose_name='Нижняя граница второго параметра')),
+                ('secondary_max_value', models.FloatField(blank=True, null=True, verbose_name='Верхняя граница второго параметра')),
+                ('is_enabled', models.BooleanField(default=True, verbose_name='Включено')),
+                ('settings', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='api.productionsettings', verbose_name='Настройка производства')),
+            ],
+            options={
+                'verbose_name': 'Правило выявления брака',
+                'verbose_name_plural': 'Правила выявления брака',
+                'ordering': ['id'],
+            },
+        ),
+    ]
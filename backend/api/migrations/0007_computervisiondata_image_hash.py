@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_defectrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='computervisiondata',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Хэш кадра'),
+        ),
+    ]
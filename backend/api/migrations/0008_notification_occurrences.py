@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:45
+
+from django.db import migrations, models
+import django.utils.timezone
+from django.db.models import F
+
+
+def copy_timestamps(apps, schema_editor):
+    Notification = apps.get_model('api', 'Notification')
+    Notification.objects.update(first_timestamp=F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_computervisiondata_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='first_timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время первого повторения'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1, verbose_name='Количество повторений'),
+        ),
+        migrations.RunPython(copy_timestamps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_notification_occurrences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Номер части')),
+                ('total_count', models.IntegerField(default=0, verbose_name='Общее количество')),
+                ('defect_count', models.IntegerField(default=0, verbose_name='Количество брака')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='api.batch', verbose_name='Партия')),
+            ],
+            options={
+                'verbose_name': 'Часть счетчиков партии',
+                'verbose_name_plural': 'Части счетчиков партий',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='batchcountershard',
+            constraint=models.UniqueConstraint(fields=('batch', 'shard'), name='api_counter_batch_shard_uniq'),
+        ),
+    ]
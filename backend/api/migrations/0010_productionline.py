@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+# Код линии по умолчанию на момент миграции (api.models.DEFAULT_LINE_CODE):
+# миграция не зависит от текущего кода моделей
+DEFAULT_LINE_CODE = 'main'
+
+
+def create_default_line(apps, schema_editor):
+    """
+    Создает линию по умолчанию с текущей активной настройкой и относит к ней
+    все существующие партии. Из нескольких активных партий активной
+    остается последняя запущенная.
+    """
+    ProductionLine = apps.get_model('api', 'ProductionLine')
+    ProductionSettings = apps.get_model('api', 'ProductionSettings')
+    Batch = apps.get_model('api', 'Batch')
+
+    line = ProductionLine.objects.create(
+        code=DEFAULT_LINE_CODE,
+        name='Основная линия',
+        active_settings=ProductionSettings.objects.filter(is_active=True).order_by('-timestamp').first(),
+    )
+    Batch.objects.update(line=line)
+    latest_active = Batch.objects.filter(is_active=True).order_by('-start_time').values_list('id', flat=True).first()
+    Batch.objects.filter(is_active=True).exclude(id=latest_active).update(is_active=False, end_time=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_batchcountershard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductionLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=20, unique=True, verbose_name='Код линии')),
+                ('name', models.CharField(max_length=100, verbose_name='Название линии')),
+                ('active_settings', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lines', to='api.productionsettings', verbose_name='Активная настройка')),
+            ],
+            options={
+                'verbose_name': 'Производственная линия',
+                'verbose_name_plural': 'Производственные линии',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='line',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='batches', to='api.productionline', verbose_name='Линия'),
+        ),
+        # Линия по умолчанию создается только здесь; после переноса
+        # партий на нее поле становится обязательным, без значения по умолчанию
+        migrations.RunPython(create_default_line, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='batch',
+            name='line',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='batches', to='api.productionline', verbose_name='Линия'),
+        ),
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(fields=['line', 'is_active'], name='api_batch_line_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(fields=['line', 'start_time'], name='api_batch_line_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='batch',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('line',), name='api_batch_one_active_per_line'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_productionline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, verbose_name='Каталог архива')),
+                ('status', models.CharField(choices=[('verified', 'Записан и проверен'), ('archived', 'Перенесен из базы')], default='verified', max_length=20, verbose_name='Состояние')),
+                ('parameter_count', models.IntegerField(default=0, verbose_name='Количество измерений')),
+                ('vision_count', models.IntegerField(default=0, verbose_name='Количество записей компьютерного зрения')),
+                ('checksums', models.JSONField(default=dict, verbose_name='Контрольные суммы файлов')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время записи')),
+                ('archived_at', models.DateTimeField(blank=True, null=True, verbose_name='Время переноса')),
+                ('batch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='api.batch', verbose_name='Партия')),
+            ],
+            options={
+                'verbose_name': 'Архив партии',
+                'verbose_name_plural': 'Архивы партий',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
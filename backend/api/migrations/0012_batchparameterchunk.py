@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_batcharchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchParameterChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_time', models.DateTimeField(verbose_name='Время первого измерения')),
+                ('start_time', models.DateTimeField(verbose_name='Время самого раннего измерения')),
+                ('end_time', models.DateTimeField(verbose_name='Время самого позднего измерения')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество измерений')),
+                ('defect_count', models.IntegerField(default=0, verbose_name='Количество брака')),
+                ('timestamps', models.BinaryField(verbose_name='Разности времени, мкс (int32)')),
+                ('values', models.BinaryField(verbose_name='Значения параметров (float32)')),
+                ('defects', models.BinaryField(verbose_name='Признаки брака (биты)')),
+                ('temperature_min', models.FloatField(verbose_name='Минимум температуры')),
+                ('temperature_max', models.FloatField(verbose_name='Максимум температуры')),
+                ('pressure_min', models.FloatField(verbose_name='Минимум давления')),
+                ('pressure_max', models.FloatField(verbose_name='Максимум давления')),
+                ('mixing_speed_min', models.FloatField(verbose_name='Минимум скорости перемешивания')),
+                ('mixing_speed_max', models.FloatField(verbose_name='Максимум скорости перемешивания')),
+                ('glazing_thickness_min', models.FloatField(verbose_name='Минимум толщины глазури')),
+                ('glazing_thickness_max', models.FloatField(verbose_name='Максимум толщины глазури')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_chunks', to='api.batch', verbose_name='Партия')),
+            ],
+            options={
+                'verbose_name': 'Пачка измерений',
+                'verbose_name_plural': 'Пачки измерений',
+                'ordering': ['start_time'],
+                'indexes': [models.Index(fields=['batch', 'start_time'], name='api_chunk_batch_start_idx'), models.Index(fields=['batch', 'end_time'], name='api_chunk_batch_end_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_batchparameterchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefectRiskModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.JSONField(default=dict, verbose_name='Параметры модели')),
+                ('cursors', models.JSONField(default=dict, verbose_name='Последние учтенные измерения партий')),
+                ('samples', models.BigIntegerField(default=0, verbose_name='Количество обучающих измерений')),
+                ('positives', models.BigIntegerField(default=0, verbose_name='Количество измерений с браком')),
+                ('trained_at', models.DateTimeField(blank=True, null=True, verbose_name='Время обучения')),
+                ('line', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='risk_model', to='api.productionline', verbose_name='Линия')),
+            ],
+            options={
+                'verbose_name': 'Модель риска брака',
+                'verbose_name_plural': 'Модели риска брака',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_defectriskmodel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productionline',
+            name='setpoints',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Уставки регулятора'),
+        ),
+        migrations.CreateModel(
+            name='SetpointAdjustment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameter', models.CharField(choices=[('temperature', 'Температура'), ('pressure', 'Давление'), ('mixing_speed', 'Скорость перемешивания'), ('glazing_thickness', 'Толщина глазури')], max_length=30, verbose_name='Параметр')),
+                ('mode', models.CharField(choices=[('pid', 'ПИД-регулятор'), ('rule', 'Правило')], max_length=10, verbose_name='Режим регулирования')),
+                ('previous_value', models.FloatField(verbose_name='Прежняя уставка')),
+                ('value', models.FloatField(verbose_name='Новая уставка')),
+                ('target', models.FloatField(verbose_name='Целевое значение')),
+                ('measured', models.FloatField(verbose_name='Сглаженное измеренное значение')),
+                ('defect_risk', models.FloatField(blank=True, null=True, verbose_name='Риск брака')),
+                ('is_limited', models.BooleanField(default=False, verbose_name='Ограничена безопасной границей')),
+                ('is_dry_run', models.BooleanField(default=False, verbose_name='Пробный прогон')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время изменения')),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='setpoint_adjustments', to='api.batch', verbose_name='Партия')),
+                ('line', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='setpoint_adjustments', to='api.productionline', verbose_name='Линия')),
+                ('settings', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='setpoint_adjustments', to='api.productionsettings', verbose_name='Настройка производства')),
+            ],
+            options={
+                'verbose_name': 'Изменение уставки',
+                'verbose_name_plural': 'Изменения уставок',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['line', 'timestamp'], name='api_setpoint_line_ts_idx')],
+            },
+        ),
+    ]
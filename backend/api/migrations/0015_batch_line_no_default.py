@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_setpoint_controller'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='batch',
+            name='line',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='batches', to='api.productionline', verbose_name='Линия'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:10
+
+from django.db import migrations, models
+import django.utils.timezone
+from django.db.models import F
+
+
+def split_timestamps(apps, schema_editor):
+    # timestamp хранил время последнего повторения, first_timestamp - первого
+    Notification = apps.get_model('api', 'Notification')
+    Notification.objects.update(last_timestamp=F('timestamp'), timestamp=F('first_timestamp'))
+
+
+def merge_timestamps(apps, schema_editor):
+    Notification = apps.get_model('api', 'Notification')
+    Notification.objects.update(first_timestamp=F('timestamp'), timestamp=F('last_timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_batch_line_no_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='last_timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время последнего повторения'),
+        ),
+        migrations.RunPython(split_timestamps, merge_timestamps),
+        migrations.RemoveField(
+            model_name='notification',
+            name='first_timestamp',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_notification_last_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parameterrollup',
+            name='last_chunk_id',
+            field=models.BigIntegerField(default=0, verbose_name='Последняя учтенная пачка измерений'),
+        ),
+    ]
@@ -1,12 +1,38 @@
 from django.db import models
 from django.utils import timezone
 
+# Линия, к которой относятся партии и запросы без явного указания линии
+DEFAULT_LINE_CODE = 'main'
+
+class ProductionLine(models.Model):
+    """Модель линии глазирования"""
+    code = models.SlugField(max_length=20, unique=True, verbose_name='Код линии')
+    name = models.CharField(max_length=100, verbose_name='Название линии')
+    active_settings = models.ForeignKey('ProductionSettings', on_delete=models.SET_NULL, null=True, blank=True, related_name='lines', verbose_name='Активная настройка')
+    # Уставки, скорректированные регулятором (см. controller.py):
+    # {'settings_id': настройка, к которой относятся поправки, 'values': {параметр: значение}}
+    setpoints = models.JSONField(default=dict, blank=True, verbose_name='Уставки регулятора')
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        verbose_name = 'Производственная линия'
+        verbose_name_plural = 'Производственные линии'
+        ordering = ['id']
+
+def default_line_id():
+    """Линия по умолчанию (создается при первом обращении)"""
+    line, _ = ProductionLine.objects.get_or_create(code=DEFAULT_LINE_CODE, defaults={'name': 'Основная линия'})
+    return line.pk
+
 class Batch(models.Model):
     """Модель партии протеиновых батончиков"""
+    line = models.ForeignKey(ProductionLine, on_delete=models.PROTECT, related_name='batches', verbose_name='Линия')
     batch_number = models.CharField(max_length=50, unique=True, verbose_name='Номер партии')
     start_time = models.DateTimeField(default=timezone.now, verbose_name='Время начала')
     end_time = models.DateTimeField(null=True, blank=True, verbose_name='Время окончания')
-    is_active = models.BooleanField(default=True, verbose_name='Активна')
+    is_active = models.BooleanField(default=True, db_index=True, verbose_name='Активна')
     defect_count = models.IntegerField(default=0, verbose_name='Количество брака')
     total_count = models.IntegerField(default=0, verbose_name='Общее количество')
     
@@ -20,10 +46,27 @@ class Batch(models.Model):
     def __str__(self):
         return f"Партия {self.batch_number}"
     
+    def save(self, *args, **kwargs):
+        # Линия по умолчанию определяется только при записи партии без линии
+        if self.line_id is None:
+            self.line_id = default_line_id()
+        super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name = 'Партия'
         verbose_name_plural = 'Партии'
         ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['line', 'is_active'], name='api_batch_line_active_idx'),
+            models.Index(fields=['line', 'start_time'], name='api_batch_line_start_idx'),
+        ]
+        constraints = [
+            # На каждой линии не больше одной активной партии
+            models.UniqueConstraint(fields=['line'], condition=models.Q(is_active=True), name='api_batch_one_active_per_line'),
+        ]
+
+# Измеряемые параметры процесса глазирования
+PARAMETER_FIELDS = ('temperature', 'pressure', 'mixing_speed', 'glazing_thickness')
 
 class BatchParameter(models.Model):
     """Модель параметров партии протеиновых батончиков"""
@@ -42,6 +85,46 @@ class BatchParameter(models.Model):
         verbose_name = 'Параметр партии'
         verbose_name_plural = 'Параметры партии'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['batch', 'timestamp'], name='api_param_batch_ts_idx'),
+        ]
+
+class BatchParameterChunk(models.Model):
+    """
+    Пачка измерений партии в компактном виде (см. chunks.py): значения
+    упакованы в float32, время - разностями в микросекундах, признаки
+    брака - битами. Диапазон времени и значений пачки позволяет
+    отбрасывать пачки без распаковки
+    """
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='parameter_chunks', verbose_name='Партия')
+    base_time = models.DateTimeField(verbose_name='Время первого измерения')
+    start_time = models.DateTimeField(verbose_name='Время самого раннего измерения')
+    end_time = models.DateTimeField(verbose_name='Время самого позднего измерения')
+    count = models.IntegerField(default=0, verbose_name='Количество измерений')
+    defect_count = models.IntegerField(default=0, verbose_name='Количество брака')
+    timestamps = models.BinaryField(verbose_name='Разности времени, мкс (int32)')
+    values = models.BinaryField(verbose_name='Значения параметров (float32)')
+    defects = models.BinaryField(verbose_name='Признаки брака (биты)')
+    temperature_min = models.FloatField(verbose_name='Минимум температуры')
+    temperature_max = models.FloatField(verbose_name='Максимум температуры')
+    pressure_min = models.FloatField(verbose_name='Минимум давления')
+    pressure_max = models.FloatField(verbose_name='Максимум давления')
+    mixing_speed_min = models.FloatField(verbose_name='Минимум скорости перемешивания')
+    mixing_speed_max = models.FloatField(verbose_name='Максимум скорости перемешивания')
+    glazing_thickness_min = models.FloatField(verbose_name='Минимум толщины глазури')
+    glazing_thickness_max = models.FloatField(verbose_name='Максимум толщины глазури')
+    
+    def __str__(self):
+        return f"Пачка измерений партии {self.batch_id} с {self.start_time}"
+    
+    class Meta:
+        verbose_name = 'Пачка измерений'
+        verbose_name_plural = 'Пачки измерений'
+        ordering = ['start_time']
+        indexes = [
+            models.Index(fields=['batch', 'start_time'], name='api_chunk_batch_start_idx'),
+            models.Index(fields=['batch', 'end_time'], name='api_chunk_batch_end_idx'),
+        ]
 
 class ProductionSettings(models.Model):
     """Модель настроек производства"""
@@ -50,7 +133,7 @@ class ProductionSettings(models.Model):
     pressure = models.FloatField(verbose_name='Давление')
     mixing_speed = models.FloatField(verbose_name='Скорость перемешивания')
     glazing_thickness = models.FloatField(verbose_name='Толщина глазури')
-    is_active = models.BooleanField(default=True, verbose_name='Активна')
+    is_active = models.BooleanField(default=True, db_index=True, verbose_name='Активна')
     timestamp = models.DateTimeField(auto_now=True, verbose_name='Время обновления')
     
     def __str__(self):
@@ -61,6 +144,38 @@ class ProductionSettings(models.Model):
         verbose_name_plural = 'Настройки производства'
         ordering = ['-timestamp']
 
+class DefectRule(models.Model):
+    """Модель правила выявления брака для настройки производства"""
+    RULE_TYPES = (
+        ('range', 'Допустимый диапазон'),
+        ('rate', 'Скорость изменения'),
+        ('condition', 'Сочетание параметров'),
+    )
+    PARAMETERS = (
+        ('temperature', 'Температура'),
+        ('pressure', 'Давление'),
+        ('mixing_speed', 'Скорость перемешивания'),
+        ('glazing_thickness', 'Толщина глазури'),
+    )
+    
+    settings = models.ForeignKey(ProductionSettings, on_delete=models.CASCADE, related_name='rules', verbose_name='Настройка производства')
+    rule_type = models.CharField(max_length=20, choices=RULE_TYPES, default='range', verbose_name='Тип правила')
+    parameter = models.CharField(max_length=30, choices=PARAMETERS, verbose_name='Параметр')
+    min_value = models.FloatField(null=True, blank=True, verbose_name='Нижняя граница')
+    max_value = models.FloatField(null=True, blank=True, verbose_name='Верхняя граница')
+    secondary_parameter = models.CharField(max_length=30, choices=PARAMETERS, null=True, blank=True, verbose_name='Второй параметр')
+    secondary_min_value = models.FloatField(null=True, blank=True, verbose_name='Нижняя граница второго параметра')
+    secondary_max_value = models.FloatField(null=True, blank=True, verbose_name='Верхняя граница второго параметра')
+    is_enabled = models.BooleanField(default=True, verbose_name='Включено')
+    
+    def __str__(self):
+        return f"{self.get_rule_type_display()}: {self.get_parameter_display()}"
+    
+    class Meta:
+        verbose_name = 'Правило выявления брака'
+        verbose_name_plural = 'Правила выявления брака'
+        ordering = ['id']
+
 class Notification(models.Model):
     """Модель уведомлений"""
     NOTIFICATION_TYPES = (
@@ -74,6 +189,8 @@ class Notification(models.Model):
     message = models.TextField(verbose_name='Сообщение')
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES, default='info', verbose_name='Тип уведомления')
     timestamp = models.DateTimeField(default=timezone.now, verbose_name='Время уведомления')
+    last_timestamp = models.DateTimeField(default=timezone.now, verbose_name='Время последнего повторения')
+    occurrences = models.PositiveIntegerField(default=1, verbose_name='Количество повторений')
     is_read = models.BooleanField(default=False, verbose_name='Прочитано')
     
     def __str__(self):
@@ -83,11 +200,16 @@ class Notification(models.Model):
         verbose_name = 'Уведомление'
         verbose_name_plural = 'Уведомления'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['batch', 'timestamp'], name='api_notif_batch_ts_idx'),
+            models.Index(fields=['timestamp'], name='api_notif_ts_idx'),
+        ]
 
 class ComputerVisionData(models.Model):
     """Модель для данных компьютерного зрения"""
     batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='vision_data', verbose_name='Партия')
     image_path = models.TextField(blank=True, null=True, verbose_name='Путь к изображению')
+    image_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, verbose_name='Хэш кадра')
     detected_objects = models.JSONField(default=dict, verbose_name='Обнаруженные объекты')
     confidence_score = models.FloatField(default=0.0, verbose_name='Оценка достоверности')
     timestamp = models.DateTimeField(default=timezone.now, verbose_name='Время фиксации')
@@ -99,4 +221,141 @@ class ComputerVisionData(models.Model):
     class Meta:
         verbose_name = 'Данные компьютерного зрения'
         verbose_name_plural = 'Данные компьютерного зрения'
-        ordering = ['-timestamp'] 
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['batch', 'timestamp'], name='api_vision_batch_ts_idx'),
+        ] 
+
+class ParameterRollup(models.Model):
+    """Поминутные агрегаты параметров партии"""
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='rollups', verbose_name='Партия')
+    minute = models.DateTimeField(verbose_name='Минута')
+    count = models.IntegerField(default=0, verbose_name='Количество измерений')
+    defect_count = models.IntegerField(default=0, verbose_name='Количество брака')
+    temperature_min = models.FloatField(verbose_name='Минимум температуры')
+    temperature_max = models.FloatField(verbose_name='Максимум температуры')
+    temperature_sum = models.FloatField(default=0.0, verbose_name='Сумма температуры')
+    temperature_sumsq = models.FloatField(default=0.0, verbose_name='Сумма квадратов температуры')
+    pressure_min = models.FloatField(verbose_name='Минимум давления')
+    pressure_max = models.FloatField(verbose_name='Максимум давления')
+    pressure_sum = models.FloatField(default=0.0, verbose_name='Сумма давления')
+    pressure_sumsq = models.FloatField(default=0.0, verbose_name='Сумма квадратов давления')
+    mixing_speed_min = models.FloatField(verbose_name='Минимум скорости перемешивания')
+    mixing_speed_max = models.FloatField(verbose_name='Максимум скорости перемешивания')
+    mixing_speed_sum = models.FloatField(default=0.0, verbose_name='Сумма скорости перемешивания')
+    mixing_speed_sumsq = models.FloatField(default=0.0, verbose_name='Сумма квадратов скорости перемешивания')
+    glazing_thickness_min = models.FloatField(verbose_name='Минимум толщины глазури')
+    glazing_thickness_max = models.FloatField(verbose_name='Максимум толщины глазури')
+    glazing_thickness_sum = models.FloatField(default=0.0, verbose_name='Сумма толщины глазури')
+    glazing_thickness_sumsq = models.FloatField(default=0.0, verbose_name='Сумма квадратов толщины глазури')
+    last_parameter_id = models.BigIntegerField(default=0, verbose_name='Последнее учтенное измерение')
+    last_chunk_id = models.BigIntegerField(default=0, verbose_name='Последняя учтенная пачка измерений')
+    
+    def __str__(self):
+        return f"Агрегаты партии {self.batch_id} за {self.minute}"
+    
+    class Meta:
+        verbose_name = 'Поминутные агрегаты параметров'
+        verbose_name_plural = 'Поминутные агрегаты параметров'
+        ordering = ['minute']
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'minute'], name='api_rollup_batch_minute_uniq'),
+        ]
+
+class BatchCounterShard(models.Model):
+    """
+    Часть счетчиков партии. Параллельные писатели увеличивают разные
+    части, а не одну строку партии; части периодически переносятся в Batch
+    """
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='counter_shards', verbose_name='Партия')
+    shard = models.PositiveSmallIntegerField(verbose_name='Номер части')
+    total_count = models.IntegerField(default=0, verbose_name='Общее количество')
+    defect_count = models.IntegerField(default=0, verbose_name='Количество брака')
+    
+    def __str__(self):
+        return f"Счетчики партии {self.batch_id}, часть {self.shard}"
+    
+    class Meta:
+        verbose_name = 'Часть счетчиков партии'
+        verbose_name_plural = 'Части счетчиков партий'
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'shard'], name='api_counter_batch_shard_uniq'),
+        ]
+
+class BatchArchive(models.Model):
+    """
+    Манифест архива исходных измерений завершенной партии (см. archive.py).
+    Пока запись существует, измерения партии читаются из архива
+    """
+    STATUSES = [
+        ('verified', 'Записан и проверен'),
+        ('archived', 'Перенесен из базы'),
+    ]
+    
+    batch = models.OneToOneField(Batch, on_delete=models.CASCADE, related_name='archive', verbose_name='Партия')
+    path = models.CharField(max_length=255, verbose_name='Каталог архива')
+    status = models.CharField(max_length=20, choices=STATUSES, default='verified', verbose_name='Состояние')
+    parameter_count = models.IntegerField(default=0, verbose_name='Количество измерений')
+    vision_count = models.IntegerField(default=0, verbose_name='Количество записей компьютерного зрения')
+    checksums = models.JSONField(default=dict, verbose_name='Контрольные суммы файлов')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Время записи')
+    archived_at = models.DateTimeField(null=True, blank=True, verbose_name='Время переноса')
+    
+    def __str__(self):
+        return f"Архив партии {self.batch_id}"
+    
+    class Meta:
+        verbose_name = 'Архив партии'
+        verbose_name_plural = 'Архивы партий'
+        ordering = ['-created_at']
+
+class DefectRiskModel(models.Model):
+    """
+    Состояние модели риска брака линии (см. risk.py): веса онлайн
+    логистической регрессии, статистики признаков и позиции обучения по партиям
+    """
+    line = models.OneToOneField(ProductionLine, on_delete=models.CASCADE, related_name='risk_model', verbose_name='Линия')
+    state = models.JSONField(default=dict, verbose_name='Параметры модели')
+    cursors = models.JSONField(default=dict, verbose_name='Последние учтенные измерения партий')
+    samples = models.BigIntegerField(default=0, verbose_name='Количество обучающих измерений')
+    positives = models.BigIntegerField(default=0, verbose_name='Количество измерений с браком')
+    trained_at = models.DateTimeField(null=True, blank=True, verbose_name='Время обучения')
+    
+    def __str__(self):
+        return f"Модель риска брака линии {self.line_id}"
+    
+    class Meta:
+        verbose_name = 'Модель риска брака'
+        verbose_name_plural = 'Модели риска брака'
+
+class SetpointAdjustment(models.Model):
+    """Изменение уставки параметра регулятором линии (см. controller.py)"""
+    MODES = (
+        ('pid', 'ПИД-регулятор'),
+        ('rule', 'Правило'),
+    )
+    
+    line = models.ForeignKey(ProductionLine, on_delete=models.CASCADE, related_name='setpoint_adjustments', verbose_name='Линия')
+    settings = models.ForeignKey(ProductionSettings, on_delete=models.SET_NULL, null=True, blank=True, related_name='setpoint_adjustments', verbose_name='Настройка производства')
+    batch = models.ForeignKey(Batch, on_delete=models.SET_NULL, null=True, blank=True, related_name='setpoint_adjustments', verbose_name='Партия')
+    parameter = models.CharField(max_length=30, choices=DefectRule.PARAMETERS, verbose_name='Параметр')
+    mode = models.CharField(max_length=10, choices=MODES, verbose_name='Режим регулирования')
+    previous_value = models.FloatField(verbose_name='Прежняя уставка')
+    value = models.FloatField(verbose_name='Новая уставка')
+    target = models.FloatField(verbose_name='Целевое значение')
+    measured = models.FloatField(verbose_name='Сглаженное измеренное значение')
+    defect_risk = models.FloatField(null=True, blank=True, verbose_name='Риск брака')
+    is_limited = models.BooleanField(default=False, verbose_name='Ограничена безопасной границей')
+    is_dry_run = models.BooleanField(default=False, verbose_name='Пробный прогон')
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name='Время изменения')
+    
+    def __str__(self):
+        return f"{self.get_parameter_display()}: {self.previous_value} -> {self.value}"
+    
+    class Meta:
+        verbose_name = 'Изменение уставки'
+        verbose_name_plural = 'Изменения уставок'
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['line', 'timestamp'], name='api_setpoint_line_ts_idx'),
+        ]
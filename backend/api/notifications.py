@@ -0,0 +1,81 @@
+"""
+Создание уведомлений с объединением повторов.
+
+Одинаковые непрочитанные уведомления (партия, тип, текст) в пределах
+окна NOTIFICATION_COALESCE_SECONDS от первого повторения не создают
+новых записей: у существующей записи увеличивается счетчик повторений
+(occurrences) и обновляется время последнего повторения (last_timestamp).
+Так серия бракованных измерений дает одну запись в окно вместо тысяч.
+Время уведомления (timestamp) при этом не меняется, поэтому порядок
+записей и курсоры (timestamp, id) остаются стабильными.
+
+Запись для объединения запоминается в кэше, поэтому повтор обходится
+без поиска по таблице. Если запись тем временем прочитана или удалена,
+обновление не затрагивает ни одной строки и создается новая запись.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .events import publish_rows
+from .models import Notification
+from .serializers import NotificationSerializer
+from .versions import bump_version
+
+COALESCE_KEY = 'api:notification:{batch_id}:{notification_type}:{digest}'
+
+
+def _coalesce_key(batch_id, notification_type, message):
+    digest = hashlib.md5(message.encode('utf-8')).hexdigest()
+    return COALESCE_KEY.format(batch_id=batch_id, notification_type=notification_type, digest=digest)
+
+
+def notify(batch, message, notification_type='info', count=1):
+    """
+    Создает уведомление или добавляет count повторений к такому же
+    непрочитанному уведомлению текущего окна. Возвращает уведомление.
+    """
+    now = timezone.now()
+    window = getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', 300)
+    batch_id = batch.pk if batch is not None else None
+    key = _coalesce_key(batch_id, notification_type, message)
+
+    if window > 0:
+        window_start = now - timedelta(seconds=window)
+        candidate = cache.get(key)
+        if candidate is None:
+            candidate = (
+                Notification.objects.filter(
+                    batch_id=batch_id, notification_type=notification_type, message=message,
+                    is_read=False, timestamp__gte=window_start
+                )
+                .order_by('-timestamp')
+                .values_list('id', 'timestamp')
+                .first()
+            )
+        if candidate is not None and candidate[1] >= window_start:
+            updated = Notification.objects.filter(pk=candidate[0], is_read=False).update(
+                occurrences=F('occurrences') + count,
+                last_timestamp=now
+            )
+            if updated:
+                bump_version('notifications')
+                notification = Notification.objects.get(pk=candidate[0])
+                publish_rows('notification', batch_id, [NotificationSerializer(notification).data])
+                return notification
+
+    notification = Notification.objects.create(
+        batch=batch,
+        message=message,
+        notification_type=notification_type,
+        timestamp=now,
+        last_timestamp=now,
+        occurrences=count
+    )
+    if window > 0:
+        cache.set(key, (notification.pk, now), window)
+    return notification
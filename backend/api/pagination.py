@@ -0,0 +1,140 @@
+import base64
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def parse_time_param(query_params, name):
+    """Разбирает параметр запроса с датой и временем в формате ISO 8601"""
+    value = query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({name: ['Неправильный формат datetime.']})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_time_window(queryset, query_params, field='timestamp'):
+    """Ограничивает выборку интервалом [since, until] по полю времени"""
+    since = parse_time_param(query_params, 'since')
+    until = parse_time_param(query_params, 'until')
+    if since is not None:
+        queryset = queryset.filter(**{f'{field}__gte': since})
+    if until is not None:
+        queryset = queryset.filter(**{f'{field}__lte': until})
+    return queryset
+
+
+class TimestampCursorPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по паре (timestamp, id).
+
+    Курсор хранит позицию последней выданной записи, поэтому следующая
+    страница выбирается по индексу (batch_id, timestamp) без OFFSET
+    и стоит одинаково независимо от глубины и размера партии.
+    """
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.descending = request.query_params.get(self.ordering_query_param, '-timestamp') != 'timestamp'
+
+        if self.descending:
+            queryset = queryset.order_by('-timestamp', '-id')
+        else:
+            queryset = queryset.order_by('timestamp', 'id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        position = None
+        if cursor:
+            position = timestamp, pk = self.decode_cursor(cursor)
+            # Условие по timestamp вынесено отдельно, чтобы использовался диапазон индекса
+            if self.descending:
+                queryset = queryset.filter(timestamp__lte=timestamp).filter(
+                    Q(timestamp__lt=timestamp) | Q(id__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(timestamp__gte=timestamp).filter(
+                    Q(timestamp__gt=timestamp) | Q(id__gt=pk)
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        # Записи вне выборки (например, измерения из пачек), отобранные представлением
+        extra_items = getattr(view, 'get_extra_page_items', None)
+        if extra_items is not None:
+            results += extra_items(position, self.descending, self.page_size + 1)
+            results.sort(key=lambda item: (item.timestamp, item.pk), reverse=self.descending)
+            results = results[:self.page_size + 1]
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last_item = results[-1] if results else None
+        return results
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: ['Требуется целое число.']})
+        if page_size <= 0:
+            raise ValidationError({self.page_size_query_param: ['Требуется положительное число.']})
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, item):
+        raw = f'{item.timestamp.isoformat()}|{item.pk}'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+            timestamp, pk = raw.rsplit('|', 1)
+            timestamp = parse_datetime(timestamp)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound('Неверный курсор')
+        if timestamp is None:
+            raise NotFound('Неверный курсор')
+        return timestamp, pk
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last_item))
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('first', self.get_first_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,42 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONLineError:
+    """Маркер строки NDJSON, которую не удалось разобрать"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class NDJSONParser(BaseParser):
+    """
+    Парсер потока NDJSON (один JSON-объект на строку).
+
+    Ошибка в отдельной строке не отклоняет весь запрос: вместо объекта
+    в результат попадает NDJSONLineError, чтобы вызывающий код мог
+    вернуть статус по каждому измерению.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            text = stream.read().decode(encoding)
+        except UnicodeDecodeError as exc:
+            raise ParseError(f'Ошибка декодирования NDJSON - {exc}')
+
+        items = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                items.append(NDJSONLineError(f'Строка {line_number}: {exc}'))
+        return items
@@ -0,0 +1,264 @@
+"""
+Воспроизведение партий с другими настройками (what-if).
+
+Измерения партии загружаются в память столбцами (load_batch_arrays:
+строки, пачки или архив), после чего каждая конфигурация - правила
+брака, цели контрольных карт и настройки SPC_* / уведомлений -
+прогоняется по ним без обращения к базе:
+
+- признак брака считается одним векторным вызовом по всей партии;
+- измерения делятся на пачки по REPLAY_PACKET_SECONDS секунд, как их
+  записывает получение измерений: пачка с браком дает уведомление
+  о браке, контрольные карты обновляются по пачкам и дают
+  предупреждения о дрейфе;
+- уведомления объединяются в окне NOTIFICATION_COALESCE_SECONDS так же,
+  как notify (в предположении, что оператор их не читал).
+
+Итоги сравниваются с тем, что произошло на самом деле: сохраненными
+признаками брака и уведомлениями партии, а при наличии данных
+компьютерного зрения - с найденными им дефектами. Несколько
+конфигураций и партий считаются параллельно в пуле процессов
+(REPLAY_WORKERS, по умолчанию по числу ядер).
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Sum
+
+from .archive import load_batch_arrays
+from .cache import get_active_settings
+from .ingest import defect_message
+from .models import DefectRule, Notification, PARAMETER_FIELDS
+from .risk import vision_labels
+from .rules import CompiledRuleSet, get_rule_set, with_default_limits
+from .spc import DIRECTIONS, ControlChart, drift_message
+
+# Настройки, которые можно заменить в конфигурации воспроизведения
+REPLAY_OPTIONS = (
+    'NOTIFICATION_COALESCE_SECONDS', 'REPLAY_PACKET_SECONDS',
+    'SPC_BASELINE_READINGS', 'SPC_WINDOW', 'SPC_EWMA_LAMBDA', 'SPC_EWMA_L',
+    'SPC_CUSUM_K', 'SPC_CUSUM_H', 'SPC_MIN_SIGMA_FRACTION',
+)
+
+RULE_FIELDS = ('min_value', 'max_value', 'secondary_parameter', 'secondary_min_value', 'secondary_max_value')
+
+
+def _option(name, default):
+    return getattr(settings, name, default)
+
+
+def _validate_rules(rules):
+    rule_types = {value for value, _ in DefectRule.RULE_TYPES}
+    result = []
+    for rule in rules:
+        if rule.get('rule_type', 'range') not in rule_types:
+            raise ValueError(f"Неизвестный тип правила: {rule.get('rule_type')}")
+        if rule.get('parameter') not in PARAMETER_FIELDS:
+            raise ValueError(f"Неизвестный параметр правила: {rule.get('parameter')}")
+        if rule.get('secondary_parameter') not in (None, *PARAMETER_FIELDS):
+            raise ValueError(f"Неизвестный второй параметр правила: {rule.get('secondary_parameter')}")
+        result.append({
+            'rule_type': rule.get('rule_type', 'range'),
+            'parameter': rule['parameter'],
+            **{field: rule.get(field) for field in RULE_FIELDS},
+        })
+    return result
+
+
+def build_candidate(production_settings=None, name=None, rules=None, setpoints=None, options=None):
+    """
+    Конфигурация для воспроизведения: правила и цели настройки
+    production_settings с заменой правил (rules - список словарей полей
+    DefectRule), целей (setpoints - словарь по параметрам) и настроек
+    (options - словарь из REPLAY_OPTIONS)
+    """
+    options = dict(options or {})
+    unknown = set(options) - set(REPLAY_OPTIONS)
+    if unknown:
+        raise ValueError(f"Настройки нельзя заменить при воспроизведении: {', '.join(sorted(unknown))}")
+    unknown = set(setpoints or {}) - set(PARAMETER_FIELDS)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры целей: {', '.join(sorted(unknown))}")
+
+    if rules is not None:
+        rules = _validate_rules(rules)
+        rule_set = CompiledRuleSet(with_default_limits(rules))
+    else:
+        rule_set = get_rule_set(production_settings)
+    targets = None
+    if production_settings is not None:
+        targets = {field: getattr(production_settings, field) for field in PARAMETER_FIELDS}
+    if setpoints:
+        targets = {**(targets or {}), **setpoints}
+        if set(targets) != set(PARAMETER_FIELDS):
+            raise ValueError('Без настройки производства нужно задать цели всех параметров')
+    return {
+        'name': name or (production_settings.name if production_settings else 'Правила по умолчанию'),
+        'rule_set': rule_set,
+        'setpoints': None if targets is None else [targets[field] for field in PARAMETER_FIELDS],
+        'options': options,
+    }
+
+
+def load_replay_data(batch):
+    """Измерения партии в памяти и дефекты компьютерного зрения рядом с ними"""
+    arrays = load_batch_arrays(batch.pk)
+    labels = vision_labels(batch.pk, arrays['timestamp'])
+    return {
+        'batch_id': batch.pk,
+        'batch_number': batch.batch_number,
+        'timestamps': arrays['timestamp'],
+        'values': np.column_stack([arrays[field] for field in PARAMETER_FIELDS]),
+        'is_defect': arrays['is_defect'],
+        'vision': labels if labels.any() else None,
+    }
+
+
+def _defect_summary(data, defects):
+    timestamps = data['timestamps']
+    count = int(defects.sum())
+    first = np.flatnonzero(defects)
+    summary = {
+        'batch_id': data['batch_id'],
+        'batch_number': data['batch_number'],
+        'readings': len(timestamps),
+        'duration': float(timestamps[-1] - timestamps[0]) if len(timestamps) else 0.0,
+        'defect_count': count,
+        'defect_rate': count / len(timestamps) if len(timestamps) else 0.0,
+        'first_defect': float(timestamps[first[0]] - timestamps[0]) if len(first) else None,
+        'vision': None,
+    }
+    if data['vision'] is not None:
+        matched = int((defects & data['vision']).sum())
+        summary['vision'] = {
+            'precision': matched / count if count else None,
+            'recall': matched / int(data['vision'].sum()),
+        }
+    return summary
+
+
+def _empty_signals():
+    return {field: {direction: 0 for direction in DIRECTIONS} for field in PARAMETER_FIELDS}
+
+
+def coalesce(events, window):
+    """
+    Объединяет события (время, текст, количество) как notify: повтор
+    в пределах window секунд от первого повторения не создает записи.
+    Возвращает (количество записей, сумма повторений)
+    """
+    opened = {}
+    rows = 0
+    occurrences = 0
+    for moment, message, count in sorted(events, key=lambda event: event[0]):
+        first = opened.get(message)
+        if window <= 0 or first is None or moment - first > window:
+            opened[message] = moment
+            rows += 1
+        occurrences += count
+    return rows, occurrences
+
+
+def replay(data, candidate):
+    """Воспроизводит партию (load_replay_data) с конфигурацией (build_candidate)"""
+    started = time.perf_counter()
+    options = candidate['options']
+    rule_set = candidate['rule_set']
+    timestamps = data['timestamps']
+    values = data['values']
+    defects = rule_set.evaluate(values, timestamps)
+    summary = _defect_summary(data, defects)
+
+    events = []
+    signals = _empty_signals()
+    if len(timestamps):
+        packet = options.get('REPLAY_PACKET_SECONDS', _option('REPLAY_PACKET_SECONDS', 1.0))
+        packets = np.floor((timestamps - timestamps[0]) / packet).astype(np.int64)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(packets)) + 1])
+        ends = np.append(starts[1:], len(timestamps))
+        message = defect_message(data['batch_number'])
+        for end, count in zip(ends, np.add.reduceat(defects.astype(np.int64), starts)):
+            if count:
+                events.append((timestamps[end - 1], message, int(count)))
+
+        chart = ControlChart(data['batch_id'], candidate['setpoints'], rule_set.low, rule_set.high, options)
+        for start, end in zip(starts, ends):
+            for (field, direction), count in chart.update(values[start:end]).items():
+                events.append((timestamps[end - 1], drift_message(field, direction, data['batch_number']), count))
+                signals[field][direction] += count
+
+    window = options.get('NOTIFICATION_COALESCE_SECONDS', _option('NOTIFICATION_COALESCE_SECONDS', 300))
+    rows, occurrences = coalesce(events, window)
+    actual = data['is_defect']
+    elapsed = time.perf_counter() - started
+    summary.update({
+        'name': candidate['name'],
+        'flagged': int((defects & ~actual).sum()),
+        'cleared': int((~defects & actual).sum()),
+        'notifications': rows,
+        'notification_occurrences': occurrences,
+        'drift_signals': signals,
+        'elapsed': elapsed,
+        'speedup': summary['duration'] / elapsed if elapsed > 0 else None,
+    })
+    return summary
+
+
+def actual_summary(data):
+    """Что произошло с партией на самом деле: сохраненный брак и уведомления"""
+    summary = _defect_summary(data, data['is_defect'])
+    messages = {defect_message(data['batch_number']): None}
+    for field in PARAMETER_FIELDS:
+        for direction in DIRECTIONS:
+            messages[drift_message(field, direction, data['batch_number'])] = (field, direction)
+    rows = Notification.objects.filter(batch_id=data['batch_id'], message__in=list(messages)).values(
+        'message'
+    ).annotate(rows=Count('id'), occurrences=Sum('occurrences'))
+    signals = _empty_signals()
+    summary.update({'name': 'Фактически', 'flagged': 0, 'cleared': 0, 'notifications': 0,
+                    'notification_occurrences': 0, 'drift_signals': signals, 'elapsed': None, 'speedup': None})
+    for row in rows:
+        summary['notifications'] += row['rows']
+        summary['notification_occurrences'] += row['occurrences']
+        if messages[row['message']] is not None:
+            field, direction = messages[row['message']]
+            signals[field][direction] += row['occurrences']
+    return summary
+
+
+def _replay_task(task):
+    return replay(*task)
+
+
+def replay_batches(batches, candidates=None, workers=None):
+    """
+    Воспроизводит партии с каждой из конфигураций candidates (по умолчанию -
+    активная настройка линии партии). Возвращает по партиям словари
+    {'actual': фактические итоги, 'candidates': итоги конфигураций}
+    """
+    batches = list(batches)
+    data = [load_replay_data(batch) for batch in batches]
+    tasks = []
+    for batch, item in zip(batches, data):
+        for candidate in candidates or [build_candidate(get_active_settings(batch.line_id))]:
+            tasks.append((item, candidate))
+    results = [{'actual': actual_summary(item), 'candidates': []} for item in data]
+
+    workers = workers or _option('REPLAY_WORKERS', None) or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        # Процессы пула не работают с базой и не должны делить соединения родителя
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=django.setup) as pool:
+            summaries = list(pool.map(_replay_task, tasks))
+    else:
+        summaries = [replay(*task) for task in tasks]
+
+    positions = {item['batch_id']: index for index, item in enumerate(data)}
+    for summary in summaries:
+        results[positions[summary['batch_id']]]['candidates'].append(summary)
+    return results
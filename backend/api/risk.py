@@ -0,0 +1,229 @@
+"""
+Модель риска брака: онлайн логистическая регрессия по измерениям.
+
+Признаки измерения - значения четырех параметров и их приращения
+относительно предыдущего измерения партии, нормированные по накопленным
+среднему и σ, и квадраты нормированных значений (брак возникает при
+отклонении параметра в любую сторону). Метка - брак по правилам (is_defect) или дефект, найденный
+компьютерным зрением не дальше RISK_VISION_WINDOW секунд от измерения.
+
+Оценка риска (вероятность брака) для пачки измерений - одно матричное
+умножение, поэтому она считается при записи каждого измерения
+(ingest_readings) и отдается вместе с текущими параметрами партии.
+Обучение идет вне запросов: команда manage.py train_risk_model
+дообучает модель каждой линии на измерениях, записанных после прошлого
+обучения (AdaGrad по мини-пачкам), и сохраняет ее в DefectRiskModel.
+Процессы сервера читают модель из базы не чаще раза в
+RISK_MODEL_CACHE_TIMEOUT секунд.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import load_batch_arrays
+from .chunks import advance_cursor
+from .models import Batch, ComputerVisionData, DefectRiskModel, PARAMETER_FIELDS
+
+RISK_MODEL_KEY = 'api:risk_model:{line_id}'
+
+FEATURE_NAMES = PARAMETER_FIELDS + tuple(f'{field}_delta' for field in PARAMETER_FIELDS)
+
+WEIGHT_NAMES = FEATURE_NAMES + tuple(f'{field}_squared' for field in PARAMETER_FIELDS)
+
+
+def _option(name, default):
+    return getattr(settings, name, default)
+
+
+def _sigmoid(values):
+    return 1.0 / (1.0 + np.exp(-np.clip(values, -30.0, 30.0)))
+
+
+def features(values, previous=None):
+    """Матрица признаков пачки измерений (n x 4 в порядке времени)"""
+    values = np.asarray(values, dtype=np.float64).reshape(-1, len(PARAMETER_FIELDS))
+    start = values[:1] if previous is None else np.asarray(previous, dtype=np.float64).reshape(1, -1)
+    return np.hstack([values, np.diff(values, axis=0, prepend=start)])
+
+
+class RiskModel:
+    """Онлайн логистическая регрессия по признакам FEATURE_NAMES и квадратам значений"""
+
+    def __init__(self, state=None):
+        size = len(FEATURE_NAMES)
+        state = state or {}
+        self.weights = np.array(state.get('weights', np.zeros(len(WEIGHT_NAMES))), dtype=np.float64)
+        self.bias = float(state.get('bias', 0.0))
+        self.gradient_squares = np.array(
+            state.get('gradient_squares', np.zeros(len(WEIGHT_NAMES) + 1)), dtype=np.float64
+        )
+        self.count = int(state.get('count', 0))
+        self.mean = np.array(state.get('mean', np.zeros(size)), dtype=np.float64)
+        self.m2 = np.array(state.get('m2', np.zeros(size)), dtype=np.float64)
+        self.positives = int(state.get('positives', 0))
+
+    @property
+    def trained(self):
+        return self.count > 0
+
+    def state(self):
+        return {
+            'weights': self.weights.tolist(),
+            'bias': self.bias,
+            'gradient_squares': self.gradient_squares.tolist(),
+            'count': self.count,
+            'mean': self.mean.tolist(),
+            'm2': self.m2.tolist(),
+            'positives': self.positives,
+        }
+
+    def _standardize(self, matrix):
+        scale = np.sqrt(self.m2 / max(self.count, 1))
+        standardized = (matrix - self.mean) / np.where(scale > 1e-9, scale, 1.0)
+        return np.hstack([standardized, standardized[:, :len(PARAMETER_FIELDS)] ** 2])
+
+    def predict(self, matrix):
+        """Вероятность брака для матрицы признаков"""
+        return _sigmoid(self._standardize(matrix) @ self.weights + self.bias)
+
+    def score(self, values, previous=None):
+        """Риск брака пачки измерений (n x 4 в порядке времени) или None, пока модель не обучена"""
+        if not self.trained:
+            return None
+        return self.predict(features(values, previous))
+
+    def partial_fit(self, matrix, labels, learning_rate=0.1, l2=1e-4, batch_size=256):
+        """Дообучает модель на пачке примеров: статистики признаков, затем шаги AdaGrad"""
+        count = len(matrix)
+        if not count:
+            return
+        labels = np.asarray(labels, dtype=np.float64)
+        mean = matrix.mean(axis=0)
+        m2 = ((matrix - mean) ** 2).sum(axis=0)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.positives += int(labels.sum())
+
+        standardized = self._standardize(matrix)
+        for start in range(0, count, batch_size):
+            part = standardized[start:start + batch_size]
+            error = _sigmoid(part @ self.weights + self.bias) - labels[start:start + batch_size]
+            gradient = np.append(part.T @ error / len(part) + l2 * self.weights, error.mean())
+            self.gradient_squares += gradient ** 2
+            step = learning_rate * gradient / (np.sqrt(self.gradient_squares) + 1e-8)
+            self.weights -= step[:-1]
+            self.bias -= float(step[-1])
+
+    def as_dict(self):
+        """Веса признаков (в единицах σ) для отображения"""
+        return {
+            'trained': self.trained,
+            'samples': self.count,
+            'defect_rate': self.positives / self.count if self.count else None,
+            'bias': self.bias,
+            'weights': dict(zip(WEIGHT_NAMES, self.weights.tolist())),
+        }
+
+
+def _key(line_id):
+    return RISK_MODEL_KEY.format(line_id=line_id)
+
+
+def get_risk_model(line_id):
+    """Модель риска линии из кэша или базы (необученная, если ее еще нет)"""
+    model = cache.get(_key(line_id))
+    if model is None:
+        record = DefectRiskModel.objects.filter(line_id=line_id).first()
+        model = RiskModel(record.state if record else None)
+        cache.set(_key(line_id), model, _option('RISK_MODEL_CACHE_TIMEOUT', 60))
+    return model
+
+
+def score_readings(line_id, values, timestamps, previous=None):
+    """
+    Риск брака пачки измерений (строки values в любом порядке, previous -
+    значения измерения перед пачкой). None, пока модель линии не обучена
+    """
+    model = get_risk_model(line_id)
+    if not model.trained or not len(values):
+        return None
+    order = np.argsort(np.asarray(timestamps, dtype=np.float64), kind='stable')
+    risks = np.empty(len(values))
+    risks[order] = model.score(np.asarray(values, dtype=np.float64)[order], previous)
+    return risks
+
+
+def score_parameter(line_id, parameter):
+    """Риск брака одного сериализованного измерения (без приращений) или None"""
+    risks = score_readings(line_id, [[parameter[field] for field in PARAMETER_FIELDS]], [0.0])
+    return None if risks is None else float(risks[0])
+
+
+def vision_labels(batch_id, timestamps):
+    """Признак дефекта, найденного компьютерным зрением рядом с каждым моментом времени"""
+    window = _option('RISK_VISION_WINDOW', 1.0)
+    defects = np.sort(np.fromiter(
+        (value.timestamp() for value in ComputerVisionData.objects.filter(
+            batch_id=batch_id, is_defect=True
+        ).values_list('timestamp', flat=True)),
+        dtype=np.float64
+    ))
+    if not len(defects) or not len(timestamps):
+        return np.zeros(len(timestamps), dtype=bool)
+    positions = np.searchsorted(defects, timestamps - window, side='left')
+    found = positions < len(defects)
+    found[found] = defects[positions[found]] <= timestamps[found] + window
+    return found
+
+
+def train_line(line_id):
+    """
+    Дообучает модель риска линии на измерениях, записанных после прошлого
+    обучения. Возвращает количество учтенных измерений
+    """
+    record, _ = DefectRiskModel.objects.get_or_create(line_id=line_id)
+    model = RiskModel(record.state)
+    cursors = dict(record.cursors)
+    options = {
+        'learning_rate': _option('RISK_LEARNING_RATE', 0.1),
+        'l2': _option('RISK_L2', 1e-4),
+        'batch_size': _option('RISK_BATCH_SIZE', 256),
+    }
+
+    # Партии, в которых могли появиться новые измерения
+    batches = Batch.objects.filter(line_id=line_id)
+    if record.trained_at is not None:
+        batches = batches.filter(
+            Q(is_active=True) | Q(end_time__gte=record.trained_at) | Q(end_time__isnull=True)
+            | ~Q(pk__in=[int(batch_id) for batch_id in cursors])
+        )
+    started = timezone.now()
+    trained = 0
+    for batch in batches.order_by('start_time'):
+        cursor = cursors.get(str(batch.pk))
+        after = cursor.get('ids') if cursor else None
+        arrays = load_batch_arrays(batch.pk, after=after)
+        if not len(arrays['id']):
+            continue
+        values = np.column_stack([arrays[field] for field in PARAMETER_FIELDS])
+        labels = arrays['is_defect'] | vision_labels(batch.pk, arrays['timestamp'])
+        model.partial_fit(features(values, cursor['values'] if cursor else None), labels, **options)
+        cursors[str(batch.pk)] = {
+            'ids': advance_cursor(after, arrays['id']),
+            'values': values[-1].tolist(),
+        }
+        trained += len(values)
+
+    record.state = model.state()
+    record.cursors = cursors
+    record.samples = model.count
+    record.positives = model.positives
+    record.trained_at = started
+    record.save()
+    cache.set(_key(line_id), model, _option('RISK_MODEL_CACHE_TIMEOUT', 60))
+    return trained
@@ -0,0 +1,284 @@
+"""
+Поминутные агрегаты параметров партии (ParameterRollup).
+
+Агрегаты обновляет задание catch_up: оно пересчитывает по исходным
+данным только те минуты, в которые попали измерения (строки
+BatchParameter и пачки BatchParameterChunk) новее последних учтенных.
+Запись измерений агрегаты не трогает: писатели одной партии не ждут
+друг друга на строке текущей минуты. После фиксации записи
+schedule_catch_up запускает catch_up в фоновом потоке процесса через
+ROLLUP_CATCH_UP_DELAY секунд, так что записи за это время учитываются
+одним проходом. Команда rollup_parameters выполняет то же задание
+вручную или по расписанию.
+"""
+import logging
+import math
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncMinute
+
+from .chunks import is_chunk_reading, iter_chunk_parameters, reading_chunk_id
+from .models import BatchArchive, BatchParameter, BatchParameterChunk, ParameterRollup, PARAMETER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def _truncate_to_minute(timestamp):
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def _group_parameters(parameters):
+    """Группирует измерения по (партия, минута) и считает агрегаты групп"""
+    groups = {}
+    for parameter in parameters:
+        key = (parameter.batch_id, _truncate_to_minute(parameter.timestamp))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'count': 0, 'defect_count': 0, 'last_parameter_id': 0, 'last_chunk_id': 0}
+            for field in PARAMETER_FIELDS:
+                group[f'{field}_min'] = math.inf
+                group[f'{field}_max'] = -math.inf
+                group[f'{field}_sum'] = 0.0
+                group[f'{field}_sumsq'] = 0.0
+        group['count'] += 1
+        group['defect_count'] += int(parameter.is_defect)
+        # У строк и пачек в catch_up свои курсоры
+        if is_chunk_reading(parameter.pk):
+            group['last_chunk_id'] = max(group['last_chunk_id'], reading_chunk_id(parameter.pk))
+        else:
+            group['last_parameter_id'] = max(group['last_parameter_id'], parameter.pk or 0)
+        for field in PARAMETER_FIELDS:
+            value = getattr(parameter, field)
+            group[f'{field}_min'] = min(group[f'{field}_min'], value)
+            group[f'{field}_max'] = max(group[f'{field}_max'], value)
+            group[f'{field}_sum'] += value
+            group[f'{field}_sumsq'] += value * value
+    return groups
+
+
+def _merge_groups(first, second):
+    """Объединяет агрегаты двух групп измерений одной минуты"""
+    merged = {
+        'count': first['count'] + second['count'],
+        'defect_count': first['defect_count'] + second['defect_count'],
+        'last_parameter_id': max(first['last_parameter_id'] or 0, second['last_parameter_id']),
+        'last_chunk_id': max(first.get('last_chunk_id', 0), second['last_chunk_id']),
+    }
+    for field in PARAMETER_FIELDS:
+        merged[f'{field}_min'] = min(first[f'{field}_min'], second[f'{field}_min'])
+        merged[f'{field}_max'] = max(first[f'{field}_max'], second[f'{field}_max'])
+        merged[f'{field}_sum'] = first[f'{field}_sum'] + second[f'{field}_sum']
+        merged[f'{field}_sumsq'] = first[f'{field}_sumsq'] + second[f'{field}_sumsq']
+    return merged
+
+
+def _aggregate_expressions():
+    expressions = {
+        'count': Count('id'),
+        'defect_count': Count('id', filter=Q(is_defect=True)),
+        'last_parameter_id': Max('id'),
+    }
+    for field in PARAMETER_FIELDS:
+        expressions[f'{field}_min'] = Min(field)
+        expressions[f'{field}_max'] = Max(field)
+        expressions[f'{field}_sum'] = Sum(field)
+        expressions[f'{field}_sumsq'] = Sum(F(field) * F(field))
+    return expressions
+
+
+def recompute(batch_id, minutes):
+    """Пересчитывает агрегаты указанных минут партии по исходным измерениям"""
+    for minute in minutes:
+        with transaction.atomic():
+            # Строка блокируется до чтения измерений: параллельный пересчет
+            # той же минуты дождется фиксации и прочитает более свежие данные
+            ParameterRollup.objects.select_for_update().filter(batch_id=batch_id, minute=minute).first()
+            values = BatchParameter.objects.filter(
+                batch_id=batch_id,
+                timestamp__gte=minute,
+                timestamp__lt=minute + timedelta(minutes=1)
+            ).aggregate(**_aggregate_expressions())
+            end = minute + timedelta(minutes=1) - timedelta(microseconds=1)
+            for group in _group_parameters(iter_chunk_parameters(batch_id, minute, end)).values():
+                values = _merge_groups(values, group) if values['count'] else group
+            if not values['count']:
+                ParameterRollup.objects.filter(batch_id=batch_id, minute=minute).delete()
+                continue
+            values['last_parameter_id'] = values['last_parameter_id'] or 0
+            ParameterRollup.objects.update_or_create(batch_id=batch_id, minute=minute, defaults=values)
+
+
+def rebuild(batch_id):
+    """
+    Полностью перестраивает агрегаты партии одним групповым запросом.
+    Агрегаты перенесенной в архив партии не трогаются: ее измерений в базе нет
+    """
+    if BatchArchive.objects.filter(batch_id=batch_id, status='archived').exists():
+        return ParameterRollup.objects.filter(batch_id=batch_id).count()
+    rows = (
+        BatchParameter.objects.filter(batch_id=batch_id)
+        .annotate(bucket=TruncMinute('timestamp'))
+        .order_by()
+        .values('bucket')
+        .annotate(**_aggregate_expressions())
+    )
+    groups = {row.pop('bucket'): row for row in rows}
+    # Измерения из пачек (см. chunks.py) агрегируются в памяти
+    for (_, minute), group in _group_parameters(iter_chunk_parameters(batch_id)).items():
+        groups[minute] = _merge_groups(groups[minute], group) if minute in groups else group
+    rollups = [
+        ParameterRollup(batch_id=batch_id, minute=minute, **group)
+        for minute, group in groups.items()
+    ]
+    with transaction.atomic():
+        ParameterRollup.objects.filter(batch_id=batch_id).delete()
+        ParameterRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def _chunk_minutes(start_time, end_time):
+    minute = _truncate_to_minute(start_time)
+    while minute <= end_time:
+        yield minute
+        minute += timedelta(minutes=1)
+
+
+def catch_up(chunk_size=10000):
+    """
+    Учитывает все измерения новее последних учтенных в агрегатах: строки
+    просматриваются порциями по chunk_size, пачки - порциями по
+    chunk_size // 100. Возвращает количество учтенных строк и пачек.
+    """
+    cursors = ParameterRollup.objects.aggregate(rows=Max('last_parameter_id'), chunks=Max('last_chunk_id'))
+    processed = 0
+
+    cursor = cursors['rows'] or 0
+    while True:
+        pending = list(
+            BatchParameter.objects.filter(id__gt=cursor)
+            .order_by('id')
+            .values_list('id', 'batch_id', 'timestamp')[:chunk_size]
+        )
+        if not pending:
+            break
+        touched = {}
+        for _, batch_id, timestamp in pending:
+            touched.setdefault(batch_id, set()).add(_truncate_to_minute(timestamp))
+        for batch_id, minutes in touched.items():
+            recompute(batch_id, sorted(minutes))
+        cursor = pending[-1][0]
+        processed += len(pending)
+
+    cursor = cursors['chunks'] or 0
+    while True:
+        pending = list(
+            BatchParameterChunk.objects.filter(id__gt=cursor)
+            .order_by('id')
+            .values_list('id', 'batch_id', 'start_time', 'end_time')[:max(1, chunk_size // 100)]
+        )
+        if not pending:
+            return processed
+        touched = {}
+        for _, batch_id, start_time, end_time in pending:
+            touched.setdefault(batch_id, set()).update(_chunk_minutes(start_time, end_time))
+        for batch_id, minutes in touched.items():
+            recompute(batch_id, sorted(minutes))
+        cursor = pending[-1][0]
+        processed += len(pending)
+
+
+_scheduled = None
+_scheduled_lock = threading.Lock()
+
+
+def _run_catch_up():
+    global _scheduled
+    with _scheduled_lock:
+        # Записи, зафиксированные во время прохода, запланируют следующий
+        _scheduled = None
+    try:
+        catch_up()
+    except Exception:
+        logger.exception('Не удалось обновить поминутные агрегаты')
+    finally:
+        connection.close()
+
+
+def schedule_catch_up():
+    """
+    Планирует catch_up в фоновом потоке процесса через
+    ROLLUP_CATCH_UP_DELAY секунд после фиксации текущей транзакции
+    (если он еще не запланирован)
+    """
+    def schedule():
+        global _scheduled
+        with _scheduled_lock:
+            if _scheduled is not None:
+                return
+            _scheduled = threading.Timer(getattr(settings, 'ROLLUP_CATCH_UP_DELAY', 1.0), _run_catch_up)
+            _scheduled.daemon = True
+            _scheduled.start()
+
+    transaction.on_commit(schedule)
+
+
+def summarize(rollup_rows):
+    """
+    Переводит суммы в средние и стандартные отклонения.
+    Принимает словари со столбцами ParameterRollup (или их суммами).
+    """
+    count = rollup_rows['count'] or 0
+    summary = {'count': count, 'defect_count': rollup_rows['defect_count'] or 0, 'parameters': {}}
+    for field in PARAMETER_FIELDS:
+        if not count:
+            summary['parameters'][field] = None
+            continue
+        mean = rollup_rows[f'{field}_sum'] / count
+        variance = max(rollup_rows[f'{field}_sumsq'] / count - mean * mean, 0.0)
+        summary['parameters'][field] = {
+            'min': rollup_rows[f'{field}_min'],
+            'max': rollup_rows[f'{field}_max'],
+            'mean': mean,
+            'std': math.sqrt(variance),
+        }
+    return summary
+
+
+def overview(queryset):
+    """Сводка по выборке агрегатов, посчитанная в базе данных"""
+    expressions = {'count': Sum('count'), 'defect_count': Sum('defect_count')}
+    for field in PARAMETER_FIELDS:
+        expressions[f'{field}_min'] = Min(f'{field}_min')
+        expressions[f'{field}_max'] = Max(f'{field}_max')
+        expressions[f'{field}_sum'] = Sum(f'{field}_sum')
+        expressions[f'{field}_sumsq'] = Sum(f'{field}_sumsq')
+    return summarize(queryset.aggregate(**expressions))
+
+
+def minute_columns(batch_id, since=None, until=None):
+    """
+    Поминутные агрегаты партии по столбцам для прореживания рядов:
+    время середины минуты (секунды Unix), количество измерений
+    и словари {параметр: массив} минимумов, максимумов и сумм.
+    Минуты, в которые попадают since и until, берутся целиком
+    """
+    queryset = ParameterRollup.objects.filter(batch_id=batch_id)
+    if since is not None:
+        queryset = queryset.filter(minute__gte=_truncate_to_minute(since))
+    if until is not None:
+        queryset = queryset.filter(minute__lte=until)
+    names = [f'{field}_{key}' for field in PARAMETER_FIELDS for key in ('min', 'max', 'sum')]
+    rows = list(queryset.values_list('minute', 'count', *names))
+    columns = list(zip(*rows)) or [()] * (len(names) + 2)
+    timestamps = np.array([minute.timestamp() + 30 for minute in columns[0]], dtype=np.float64)
+    counts = np.array(columns[1], dtype=np.int64)
+    aggregates = {'min': {}, 'max': {}, 'sum': {}}
+    for position, name in enumerate(names, start=2):
+        field, key = name.rsplit('_', 1)
+        aggregates[key][field] = np.array(columns[position], dtype=np.float64)
+    return timestamps, counts, aggregates['min'], aggregates['max'], aggregates['sum']
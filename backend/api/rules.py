@@ -0,0 +1,199 @@
+"""
+Векторизованная проверка измерений по правилам выявления брака.
+
+Правила настройки производства (DefectRule) компилируются в массивы
+NumPy, после чего пачка из n измерений проверяется несколькими
+операциями над матрицей n x 4 без цикла по измерениям:
+
+- range: брак, если значение вне [min_value, max_value];
+- rate: брак, если |dV/dt| (в единицах параметра в секунду) больше max_value;
+- condition: брак, если параметр в [min_value, max_value] и одновременно
+  второй параметр в [secondary_min_value, secondary_max_value].
+
+Не заданная граница считается бесконечной. Для параметра, у которого
+нет включенного правила range, действуют критические значения
+DEFECT_LIMITS; чтобы снять ограничение, нужно правило range без границ.
+Пользовательские правила других типов критические значения не отменяют.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .chunks import CHUNK_ID_BASE, load_chunk_arrays, merge_arrays, set_chunk_defects
+from .defects import DEFECT_LIMITS
+from .models import Batch, BatchArchive, BatchParameter, DefectRule, PARAMETER_FIELDS
+from .rollups import rebuild
+from .timeseries import load_parameter_arrays
+from .versions import bump_version
+
+RULE_SET_KEY = 'api:rule_set:{settings_id}'
+
+_FIELD_INDEX = {field: index for index, field in enumerate(PARAMETER_FIELDS)}
+
+
+def _bound(value, default):
+    return default if value is None else value
+
+
+class CompiledRuleSet:
+    """Набор правил, скомпилированный в массивы для векторной проверки"""
+
+    def __init__(self, rules):
+        size = len(PARAMETER_FIELDS)
+        self.low = np.full(size, -np.inf)
+        self.high = np.full(size, np.inf)
+        self.max_rate = np.full(size, np.inf)
+        conditions = []
+
+        for rule in rules:
+            index = _FIELD_INDEX[rule['parameter']]
+            if rule['rule_type'] == 'range':
+                self.low[index] = max(self.low[index], _bound(rule['min_value'], -np.inf))
+                self.high[index] = min(self.high[index], _bound(rule['max_value'], np.inf))
+            elif rule['rule_type'] == 'rate':
+                self.max_rate[index] = min(self.max_rate[index], _bound(rule['max_value'], np.inf))
+            elif rule['rule_type'] == 'condition' and rule['secondary_parameter']:
+                conditions.append((
+                    index,
+                    _bound(rule['min_value'], -np.inf),
+                    _bound(rule['max_value'], np.inf),
+                    _FIELD_INDEX[rule['secondary_parameter']],
+                    _bound(rule['secondary_min_value'], -np.inf),
+                    _bound(rule['secondary_max_value'], np.inf),
+                ))
+
+        conditions = np.array(conditions, dtype=np.float64).reshape(-1, 6)
+        self.condition_first = conditions[:, 0].astype(np.intp)
+        self.condition_first_bounds = conditions[:, 1:3]
+        self.condition_second = conditions[:, 3].astype(np.intp)
+        self.condition_second_bounds = conditions[:, 4:6]
+        self.has_rate_rules = bool(np.isfinite(self.max_rate).any())
+
+    @classmethod
+    def default(cls):
+        return cls(with_default_limits([]))
+
+    def evaluate(self, values, timestamps=None, previous=None):
+        """
+        Проверяет измерения.
+
+        values - матрица n x 4 в порядке PARAMETER_FIELDS, timestamps -
+        время в секундах Unix (нужно только для правил скорости изменения,
+        измерения должны идти по возрастанию времени), previous - пара
+        (значения, время) измерения, предшествующего первому в пачке.
+        Возвращает булев массив длины n.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(PARAMETER_FIELDS))
+        defects = ((values < self.low) | (values > self.high)).any(axis=1)
+
+        if len(self.condition_first):
+            first = values[:, self.condition_first]
+            second = values[:, self.condition_second]
+            matched = (
+                (first >= self.condition_first_bounds[:, 0]) & (first <= self.condition_first_bounds[:, 1]) &
+                (second >= self.condition_second_bounds[:, 0]) & (second <= self.condition_second_bounds[:, 1])
+            )
+            defects |= matched.any(axis=1)
+
+        if self.has_rate_rules and timestamps is not None and len(values):
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            if previous is not None:
+                series = np.vstack([np.asarray(previous[0], dtype=np.float64), values])
+                times = np.concatenate([[previous[1]], timestamps])
+            else:
+                series, times = values, timestamps
+            delta_values = np.diff(series, axis=0)
+            delta_times = np.diff(times)[:, np.newaxis]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rates = np.where(delta_times > 0, np.abs(delta_values) / delta_times, 0.0)
+            exceeded = (rates > self.max_rate).any(axis=1)
+            if previous is not None:
+                defects |= exceeded
+            else:
+                defects[1:] |= exceeded
+
+        return defects
+
+    def evaluate_one(self, values, timestamp=None, previous=None):
+        """Проверяет одно измерение, заданное словарем значений параметров"""
+        row = [values[field] for field in PARAMETER_FIELDS]
+        timestamps = None if timestamp is None else [timestamp]
+        return bool(self.evaluate([row], timestamps, previous)[0])
+
+
+def with_default_limits(rules):
+    """
+    Дополняет правила критическими значениями DEFECT_LIMITS для параметров,
+    у которых нет собственного правила range
+    """
+    limited = {rule['parameter'] for rule in rules if rule['rule_type'] == 'range'}
+    defaults = [
+        {'rule_type': 'range', 'parameter': field, 'min_value': low, 'max_value': high}
+        for field, (low, high) in DEFECT_LIMITS.items() if field not in limited
+    ]
+    return list(rules) + defaults
+
+
+def get_rule_set(production_settings):
+    """Скомпилированный набор правил настройки производства (с кэшированием)"""
+    if production_settings is None:
+        return CompiledRuleSet.default()
+    key = RULE_SET_KEY.format(settings_id=production_settings.pk)
+    rule_set = cache.get(key)
+    if rule_set is None:
+        rules = list(
+            DefectRule.objects.filter(settings=production_settings, is_enabled=True).values(
+                'rule_type', 'parameter', 'min_value', 'max_value',
+                'secondary_parameter', 'secondary_min_value', 'secondary_max_value'
+            )
+        )
+        rule_set = CompiledRuleSet(with_default_limits(rules))
+        cache.set(key, rule_set, getattr(settings, 'RULE_SET_CACHE_TIMEOUT', 300))
+    return rule_set
+
+
+def invalidate_rule_set(*settings_ids):
+    cache.delete_many([RULE_SET_KEY.format(settings_id=settings_id) for settings_id in settings_ids])
+
+
+def reclassify_batch(batch, rule_set, chunk_size=1000):
+    """
+    Перепроверяет все измерения партии по набору правил (например, после
+    изменения правил), обновляет признак брака только у изменившихся
+    измерений, счетчик брака партии и поминутные агрегаты.
+    Измерения, записанные во время перепроверки, в нее не попадают;
+    их брак уже учтен писателями, поэтому счетчик меняется на разность
+    (F()), а не перезаписывается.
+    Возвращает количество измерений, признак которых изменился.
+    Измерения перенесенной в архив партии не меняются.
+    """
+    if BatchArchive.objects.filter(batch=batch).exists():
+        return 0
+    arrays = merge_arrays(
+        load_parameter_arrays(BatchParameter.objects.filter(batch=batch)),
+        load_chunk_arrays(batch.pk)
+    )
+    values = np.column_stack([arrays[field] for field in PARAMETER_FIELDS])
+    defects = rule_set.evaluate(values, arrays['timestamp'])
+    changed = defects != arrays['is_defect']
+    if not changed.any():
+        return 0
+
+    # stats.py зависит от правил, поэтому импортируется здесь
+    from .stats import invalidate_batch_statistics
+
+    with transaction.atomic():
+        for is_defect in (True, False):
+            ids = arrays['id'][changed & (defects == is_defect)]
+            set_chunk_defects(ids[ids >= CHUNK_ID_BASE], is_defect)
+            ids = ids[ids < CHUNK_ID_BASE].tolist()
+            for start in range(0, len(ids), chunk_size):
+                BatchParameter.objects.filter(id__in=ids[start:start + chunk_size]).update(is_defect=is_defect)
+        delta = int(defects.sum()) - int(arrays['is_defect'].sum())
+        Batch.objects.filter(pk=batch.pk).update(defect_count=F('defect_count') + delta)
+        bump_version('batches')
+        rebuild(batch.pk)
+    invalidate_batch_statistics(batch.pk)
+    return int(changed.sum())
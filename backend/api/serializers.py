@@ -1,5 +1,9 @@
+from django.db.models import Prefetch
+from django.urls import reverse
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
-from .models import Batch, BatchParameter, ProductionSettings, Notification, ComputerVisionData
+from .chunks import chunk_parameters
+from .models import Batch, BatchParameter, ProductionLine, ProductionSettings, DefectRule, Notification, ComputerVisionData, SetpointAdjustment, default_line_id
 
 class BatchParameterSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,35 +13,191 @@ class BatchParameterSerializer(serializers.ModelSerializer):
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'batch', 'message', 'notification_type', 'timestamp', 'is_read']
+        fields = ['id', 'batch', 'message', 'notification_type', 'timestamp', 'last_timestamp', 'occurrences', 'is_read']
 
 class ComputerVisionDataSerializer(serializers.ModelSerializer):
+    image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    
     class Meta:
         model = ComputerVisionData
-        fields = ['id', 'batch', 'image', 'detected_objects', 'confidence_score', 'timestamp', 'is_defect']
+        fields = ['id', 'batch', 'image_path', 'image_hash', 'image_url', 'thumbnail_url',
+                  'detected_objects', 'confidence_score', 'timestamp', 'is_defect']
+    
+    def _frame_url(self, obj, name):
+        if not obj.image_hash:
+            return None
+        url = reverse(name, kwargs={'image_hash': obj.image_hash})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+    
+    def get_image_url(self, obj):
+        return self._frame_url(obj, 'frame-file')
+    
+    def get_thumbnail_url(self, obj):
+        return self._frame_url(obj, 'frame-thumbnail')
 
 class BatchSerializer(serializers.ModelSerializer):
-    parameters = BatchParameterSerializer(many=True, read_only=True)
-    notifications = NotificationSerializer(many=True, read_only=True)
-    vision_data = ComputerVisionDataSerializer(many=True, read_only=True)
+    """
+    Детальное представление партии.
+
+    Вложенные связи ограничены последними nested_limit записями.
+    Через контекст можно сузить набор полей (fields) и список
+    раскрываемых связей (expand), см. context_from_query_params.
+    """
+    NESTED_SERIALIZERS = {
+        'parameters': BatchParameterSerializer,
+        'notifications': NotificationSerializer,
+        'vision_data': ComputerVisionDataSerializer,
+    }
+    DEFAULT_NESTED_LIMIT = 50
+    MAX_NESTED_LIMIT = 500
+    
+    parameters = serializers.SerializerMethodField()
+    notifications = serializers.SerializerMethodField()
+    vision_data = serializers.SerializerMethodField()
     defect_percentage = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Batch
-        fields = ['id', 'batch_number', 'start_time', 'end_time', 'is_active', 
+        fields = ['id', 'line', 'batch_number', 'start_time', 'end_time', 'is_active', 
                   'defect_count', 'total_count', 'defect_percentage', 'parameters', 
                   'notifications', 'vision_data']
+        # Без линии партия относится к линии по умолчанию (см. Batch.save)
+        extra_kwargs = {'line': {'required': False}}
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields')
+        expand = self.context.get('expand')
+        for name in list(self.fields):
+            if requested is not None and name not in requested:
+                self.fields.pop(name)
+            elif expand is not None and name in self.NESTED_SERIALIZERS and name not in expand:
+                self.fields.pop(name)
+    
+    def validate(self, attrs):
+        is_active = attrs.get('is_active', getattr(self.instance, 'is_active', True))
+        line = attrs.get('line', getattr(self.instance, 'line', None))
+        if is_active:
+            active = Batch.objects.filter(line_id=line.pk if line else default_line_id(), is_active=True)
+            if self.instance is not None:
+                active = active.exclude(pk=self.instance.pk)
+            if active.exists():
+                raise serializers.ValidationError({'is_active': ['На линии уже есть активная партия.']})
+        return attrs
+    
+    @classmethod
+    def context_from_query_params(cls, query_params):
+        """
+        Разбирает параметры запроса ?fields=, ?expand= и ?limit=
+        """
+        context = {'nested_limit': cls.DEFAULT_NESTED_LIMIT}
+        if 'fields' in query_params:
+            context['fields'] = {name for name in query_params['fields'].split(',') if name}
+        if 'expand' in query_params:
+            context['expand'] = {name for name in query_params['expand'].split(',') if name}
+        if 'limit' in query_params:
+            try:
+                limit = int(query_params['limit'])
+            except ValueError:
+                raise serializers.ValidationError({'limit': ['Требуется целое число.']})
+            context['nested_limit'] = max(0, min(limit, cls.MAX_NESTED_LIMIT))
+        return context
+    
+    @classmethod
+    def expanded_relations(cls, context):
+        """Список вложенных связей, которые попадут в ответ"""
+        requested = context.get('fields')
+        expand = context.get('expand')
+        return [
+            name for name in cls.NESTED_SERIALIZERS
+            if (requested is None or name in requested) and (expand is None or name in expand)
+        ]
+    
+    @classmethod
+    def prefetch_latest(cls, queryset, context):
+        """
+        Добавляет к выборке партий предзагрузку последних записей
+        только для тех связей, которые будут сериализованы
+        """
+        limit = context.get('nested_limit', cls.DEFAULT_NESTED_LIMIT)
+        lookups = []
+        for name in cls.expanded_relations(context):
+            model = cls.NESTED_SERIALIZERS[name].Meta.model
+            lookups.append(Prefetch(
+                name,
+                queryset=model.objects.order_by('-timestamp', '-id')[:limit],
+                to_attr=f'latest_{name}'
+            ))
+        return queryset.prefetch_related(*lookups)
+    
+    def _latest(self, batch, relation, extra_items=None):
+        limit = self.context.get('nested_limit', self.DEFAULT_NESTED_LIMIT)
+        items = getattr(batch, f'latest_{relation}', None)
+        if items is None:
+            items = getattr(batch, relation).order_by('-timestamp', '-id')[:limit]
+        if extra_items is not None:
+            items = list(items) + extra_items(limit)
+            items = sorted(items, key=lambda item: (item.timestamp, item.pk), reverse=True)[:limit]
+        return self.NESTED_SERIALIZERS[relation](items, many=True).data
+    
+    @swagger_serializer_method(serializer_or_field=BatchParameterSerializer(many=True))
+    def get_parameters(self, batch):
+        # Измерения партии могут храниться и в пачках (см. chunks.py)
+        return self._latest(batch, 'parameters', lambda limit: chunk_parameters(batch.pk, limit=limit))
+    
+    @swagger_serializer_method(serializer_or_field=NotificationSerializer(many=True))
+    def get_notifications(self, batch):
+        return self._latest(batch, 'notifications')
+    
+    @swagger_serializer_method(serializer_or_field=ComputerVisionDataSerializer(many=True))
+    def get_vision_data(self, batch):
+        return self._latest(batch, 'vision_data')
 
 class BatchListSerializer(serializers.ModelSerializer):
     defect_percentage = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Batch
-        fields = ['id', 'batch_number', 'start_time', 'end_time', 'is_active', 
+        fields = ['id', 'line', 'batch_number', 'start_time', 'end_time', 'is_active', 
                   'defect_count', 'total_count', 'defect_percentage']
 
+class ProductionLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductionLine
+        fields = ['id', 'code', 'name', 'active_settings']
+
 class ProductionSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductionSettings
         fields = ['id', 'name', 'temperature', 'pressure', 'mixing_speed', 
-                  'glazing_thickness', 'is_active', 'timestamp'] 
\ No newline at end of file
+                  'glazing_thickness', 'is_active', 'timestamp'] 
+
+class DefectRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DefectRule
+        fields = ['id', 'settings', 'rule_type', 'parameter', 'min_value', 'max_value',
+                  'secondary_parameter', 'secondary_min_value', 'secondary_max_value', 'is_enabled']
+    
+    def validate(self, attrs):
+        rule_type = attrs.get('rule_type', getattr(self.instance, 'rule_type', 'range'))
+        min_value = attrs.get('min_value', getattr(self.instance, 'min_value', None))
+        max_value = attrs.get('max_value', getattr(self.instance, 'max_value', None))
+        secondary_parameter = attrs.get('secondary_parameter', getattr(self.instance, 'secondary_parameter', None))
+        
+        if rule_type == 'rate' and (max_value is None or max_value <= 0):
+            raise serializers.ValidationError({'max_value': 'Для правила скорости изменения нужна положительная верхняя граница.'})
+        if rule_type == 'range' and min_value is None and max_value is None:
+            raise serializers.ValidationError('Для правила диапазона нужна хотя бы одна граница.')
+        if rule_type == 'condition' and not secondary_parameter:
+            raise serializers.ValidationError({'secondary_parameter': 'Для правила сочетания параметров нужен второй параметр.'})
+        if min_value is not None and max_value is not None and min_value > max_value:
+            raise serializers.ValidationError('Нижняя граница больше верхней.')
+        return attrs
+
+class SetpointAdjustmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SetpointAdjustment
+        fields = ['id', 'line', 'settings', 'batch', 'parameter', 'mode', 'previous_value', 'value',
+                  'target', 'measured', 'defect_risk', 'is_limited', 'is_dry_run', 'timestamp']
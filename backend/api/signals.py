@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .archive import delete_archive_files
+from .cache import remember_latest_parameter
+from .events import publish_rows
+from .rollups import schedule_catch_up
+from .rules import invalidate_rule_set
+from .models import Batch, BatchArchive, BatchParameter, DefectRule, Notification, ComputerVisionData, ProductionLine, ProductionSettings
+from .serializers import BatchParameterSerializer, NotificationSerializer, ComputerVisionDataSerializer
+from .spc import update_control_charts
+from .stats import invalidate_batch_statistics
+from .versions import bump_version
+
+
+# Пакетные записи через bulk_create не вызывают post_save, поэтому такие
+# места сами обновляют агрегаты и кэш и публикуют события (см. ingest.py)
+
+@receiver(post_save, sender=BatchParameter)
+def handle_parameter_created(sender, instance, created, **kwargs):
+    if created:
+        schedule_catch_up()
+        publish_rows('parameter', instance.batch_id, [BatchParameterSerializer(instance).data])
+        transaction.on_commit(lambda: remember_latest_parameter(instance))
+        update_control_charts(instance.batch, [instance])
+
+
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance, created, **kwargs):
+    if created:
+        publish_rows('notification', instance.batch_id, [NotificationSerializer(instance).data])
+
+
+@receiver(post_save, sender=ComputerVisionData)
+def publish_vision_data(sender, instance, created, **kwargs):
+    if created:
+        publish_rows('vision', instance.batch_id, [ComputerVisionDataSerializer(instance).data])
+
+
+# Версии ресурсов для условных GET-запросов (см. versions.py). Обновления
+# через QuerySet.update() меняют версии в местах вызова
+
+@receiver(post_save, sender=Batch)
+def bump_batches_version(sender, instance, **kwargs):
+    bump_version('batches')
+    # Итог статистики завершенной партии тоже сбрасывается после фиксации,
+    # чтобы параллельный расчет не сохранил его по старым данным
+    batch_id = instance.pk
+    transaction.on_commit(lambda: invalidate_batch_statistics(batch_id))
+
+
+@receiver(post_delete, sender=Batch)
+def bump_deleted_batch_versions(sender, instance, **kwargs):
+    # Уведомления партии удаляются каскадно, без сигналов
+    bump_version('batches', 'notifications')
+    batch_id = instance.pk
+    transaction.on_commit(lambda: invalidate_batch_statistics(batch_id))
+
+
+@receiver(post_save, sender=Notification)
+def bump_notifications_version(sender, instance, **kwargs):
+    bump_version('notifications')
+
+
+@receiver(post_save, sender=ProductionSettings)
+@receiver(post_delete, sender=ProductionSettings)
+@receiver(post_save, sender=ProductionLine)
+@receiver(post_delete, sender=ProductionLine)
+def bump_settings_version(sender, instance, **kwargs):
+    bump_version('settings')
+
+
+@receiver(pre_save, sender=DefectRule)
+def remember_rule_settings(sender, instance, **kwargs):
+    # Правило могли перенести в другую настройку: сбросить нужно и ее прежний набор
+    instance._saved_settings_id = (
+        DefectRule.objects.filter(pk=instance.pk).values_list('settings_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=DefectRule)
+@receiver(post_delete, sender=DefectRule)
+def reset_rule_set(sender, instance, **kwargs):
+    settings_ids = {instance.settings_id, getattr(instance, '_saved_settings_id', None)} - {None}
+    transaction.on_commit(lambda: invalidate_rule_set(*settings_ids))
+
+
+@receiver(post_delete, sender=BatchArchive)
+def remove_archive_files(sender, instance, **kwargs):
+    # Файлы архива удаляются вместе с манифестом (и партией)
+    transaction.on_commit(lambda: delete_archive_files(instance))
@@ -0,0 +1,320 @@
+"""
+Статистическое управление процессом: контрольные карты EWMA и CUSUM
+по параметрам партии.
+
+Правила брака срабатывают, когда значение уже вышло за допуск.
+Контрольные карты замечают смещение процесса раньше: EWMA сглаживает
+измерения и выходит за свои границы при устойчивом сдвиге среднего,
+CUSUM накапливает отклонения от цели и реагирует на медленный дрейф.
+
+Первые SPC_BASELINE_READINGS измерений партии - базовый участок: по ним
+оценивается σ процесса (не меньше SPC_MIN_SIGMA_FRACTION ширины допуска).
+Цель - значение параметра в активной настройке производства линии,
+а без настройки - среднее базового участка. Дальше каждое измерение
+обновляет состояние карт без обращения к истории; пачка измерений
+обрабатывается векторно. О начале дрейфа параметра (переходе карты
+в состояние сигнала) создается предупреждение через notify.
+
+Состояние хранится по партии в общем для процессов кэше (см. CACHES)
+и записывается только после фиксации транзакции с измерениями: при ее
+откате карты не продвигаются. Если состояния нет (очистка кэша,
+истечение срока хранения), оно восстанавливается по базовому участку
+и последним SPC_WARMUP_READINGS измерениям партии. Параллельные писатели
+одной партии могут потерять обновления друг друга: состояние карт
+служит для предупреждений и не влияет на признак брака.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .cache import get_active_settings
+from .chunks import chunk_parameters
+from .models import BatchParameter, PARAMETER_FIELDS
+from .notifications import notify
+from .rules import get_rule_set
+
+SPC_STATE_KEY = 'api:spc:{batch_id}'
+
+DIRECTIONS = {'up': 'вверх', 'down': 'вниз'}
+
+
+def _option(name, default):
+    return getattr(settings, name, default)
+
+
+def _cusum(increments, initial):
+    """
+    Односторонняя сумма C_t = max(0, C_(t-1) + y_t) для всех t сразу:
+    C_t = S_t - min(-C_0, min(S_1..S_t)), где S - накопленная сумма y
+    """
+    sums = np.cumsum(increments, axis=0)
+    return sums - np.minimum(np.minimum.accumulate(sums, axis=0), -initial)
+
+
+def _number(array, index):
+    if array is None or not math.isfinite(array[index]):
+        return None
+    return float(array[index])
+
+
+class ControlChart:
+    """Состояние контрольных карт партии; массивы упорядочены по PARAMETER_FIELDS"""
+
+    def __init__(self, batch_id, setpoints=None, low=None, high=None, options=None):
+        """options заменяют отдельные настройки SPC_* (например, при воспроизведении партии)"""
+        size = len(PARAMETER_FIELDS)
+        options = options or {}
+
+        def option(name, default):
+            return options.get(name, _option(name, default))
+
+        self.batch_id = batch_id
+        self.baseline_size = option('SPC_BASELINE_READINGS', 30)
+        self.window = option('SPC_WINDOW', 50)
+        self.smoothing = option('SPC_EWMA_LAMBDA', 0.2)
+        self.width = option('SPC_EWMA_L', 3.0)
+        self.slack = option('SPC_CUSUM_K', 0.5)
+        self.threshold = option('SPC_CUSUM_H', 5.0)
+        if not 0 < self.smoothing < 1:
+            raise ImproperlyConfigured('SPC_EWMA_LAMBDA должен быть в интервале (0, 1)')
+        # Длина участка, на котором EWMA считается в замкнутой форме без переполнения
+        self.chunk = max(1, min(256, int(250 / -math.log10(1 - self.smoothing))))
+
+        self.setpoints = None if setpoints is None else np.asarray(setpoints, dtype=np.float64)
+        self.low = np.full(size, -np.inf) if low is None else np.asarray(low, dtype=np.float64)
+        self.high = np.full(size, np.inf) if high is None else np.asarray(high, dtype=np.float64)
+        spec_width = self.high - self.low
+        fraction = option('SPC_MIN_SIGMA_FRACTION', 0.01)
+        self.min_sigma = np.where(np.isfinite(spec_width), spec_width * fraction, 0.0) + 1e-9
+
+        self.readings = 0
+        self.last = None
+        self.recent = np.empty((0, size))
+        self.baseline_count = 0
+        self.baseline_mean = np.zeros(size)
+        self.baseline_m2 = np.zeros(size)
+        self.target = None
+        self.sigma = None
+        self.ewma = None
+        self.steps = 0
+        self.cusum_high = np.zeros(size)
+        self.cusum_low = np.zeros(size)
+        # Текущий сигнал по параметру: 1 - дрейф вверх, -1 - вниз, 0 - нет
+        self.drift = np.zeros(size, dtype=np.int8)
+
+    @property
+    def monitoring(self):
+        return self.target is not None
+
+    def _accumulate_baseline(self, values):
+        """Объединяет среднее и сумму квадратов отклонений с пачкой значений"""
+        count = len(values)
+        if not count:
+            return
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        total = self.baseline_count + count
+        delta = mean - self.baseline_mean
+        self.baseline_mean = self.baseline_mean + delta * count / total
+        self.baseline_m2 = self.baseline_m2 + m2 + delta ** 2 * self.baseline_count * count / total
+        self.baseline_count = total
+
+    def _start_monitoring(self):
+        variance = self.baseline_m2 / max(self.baseline_count - 1, 1)
+        self.sigma = np.maximum(np.sqrt(variance), self.min_sigma)
+        self.target = self.baseline_mean.copy() if self.setpoints is None else self.setpoints.copy()
+        self.ewma = self.target.copy()
+
+    def _ewma(self, values):
+        """z_t = λ x_t + (1 - λ) z_(t-1) для всех t участками в замкнутой форме"""
+        decay = 1 - self.smoothing
+        result = np.empty_like(values)
+        previous = self.ewma
+        for start in range(0, len(values), self.chunk):
+            chunk = values[start:start + self.chunk]
+            powers = decay ** np.arange(1, len(chunk) + 1)[:, None]
+            result[start:start + len(chunk)] = powers * (previous + self.smoothing * np.cumsum(chunk / powers, axis=0))
+            previous = result[start + len(chunk) - 1]
+        return result
+
+    def ewma_limit(self, steps):
+        """Полуширина границ EWMA после steps измерений"""
+        factor = self.smoothing / (2 - self.smoothing) * (1 - (1 - self.smoothing) ** (2 * np.asarray(steps)))
+        return self.width * np.multiply.outer(np.sqrt(factor), self.sigma)
+
+    def update(self, values):
+        """
+        Учитывает пачку измерений (матрица n x 4 в порядке времени).
+        Возвращает начавшиеся сигналы дрейфа: {(параметр, направление): количество}
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(PARAMETER_FIELDS))
+        if not len(values):
+            return {}
+        self.readings += len(values)
+        self.last = values[-1].copy()
+        self.recent = np.concatenate([self.recent, values[-self.window:]])[-self.window:]
+
+        if not self.monitoring:
+            needed = self.baseline_size - self.baseline_count
+            self._accumulate_baseline(values[:needed])
+            if self.baseline_count < self.baseline_size:
+                return {}
+            self._start_monitoring()
+            values = values[needed:]
+            if not len(values):
+                return {}
+
+        ewma = self._ewma(values)
+        limit = self.ewma_limit(self.steps + np.arange(1, len(values) + 1))
+        self.steps += len(values)
+        deviation = ewma - self.target
+        scores = (values - self.target) / self.sigma
+        cusum_high = _cusum(scores - self.slack, self.cusum_high)
+        cusum_low = _cusum(-scores - self.slack, self.cusum_low)
+
+        up = (deviation > limit) | (cusum_high > self.threshold)
+        down = ((deviation < -limit) | (cusum_low > self.threshold)) & ~up
+
+        started = {}
+        for direction, signal, code in (('up', up, 1), ('down', down, -1)):
+            previous = np.vstack([self.drift == code, signal[:-1]])
+            edges = signal & ~previous
+            for index in np.flatnonzero(edges.any(axis=0)):
+                started[(PARAMETER_FIELDS[index], direction)] = int(edges[:, index].sum())
+
+        self.ewma = ewma[-1]
+        self.cusum_high = cusum_high[-1]
+        self.cusum_low = cusum_low[-1]
+        self.drift = np.where(up[-1], 1, np.where(down[-1], -1, 0)).astype(np.int8)
+        return started
+
+    def as_dict(self):
+        """Состояние карт для графиков панели оператора"""
+        limit = self.ewma_limit(self.steps) if self.monitoring else None
+        recent_mean = self.recent.mean(axis=0) if len(self.recent) else None
+        recent_std = self.recent.std(axis=0) if len(self.recent) else None
+        parameters = {}
+        for index, field in enumerate(PARAMETER_FIELDS):
+            if not self.monitoring:
+                status = 'baseline'
+            else:
+                status = {1: 'drift_up', -1: 'drift_down'}.get(int(self.drift[index]), 'ok')
+            parameters[field] = {
+                'status': status,
+                'value': _number(self.last, index),
+                'target': _number(self.target, index),
+                'sigma': _number(self.sigma, index),
+                'ewma': _number(self.ewma, index),
+                'ewma_lower': _number(self.target - limit, index) if self.monitoring else None,
+                'ewma_upper': _number(self.target + limit, index) if self.monitoring else None,
+                'cusum_high': _number(self.cusum_high, index),
+                'cusum_low': _number(self.cusum_low, index),
+                'cusum_limit': self.threshold,
+                'rolling_mean': _number(recent_mean, index),
+                'rolling_std': _number(recent_std, index),
+                'spec_min': _number(self.low, index),
+                'spec_max': _number(self.high, index),
+            }
+        return {
+            'batch_id': self.batch_id,
+            'readings': self.readings,
+            'baseline_readings': self.baseline_size,
+            'window': self.window,
+            'parameters': parameters,
+        }
+
+
+def drift_message(field, direction, batch_number):
+    """Текст предупреждения о начале дрейфа параметра"""
+    label = BatchParameter._meta.get_field(field).verbose_name
+    return f"Дрейф параметра «{label}» {DIRECTIONS[direction]} в партии {batch_number}"
+
+
+def _key(batch_id):
+    return SPC_STATE_KEY.format(batch_id=batch_id)
+
+
+def _timeout():
+    return _option('SPC_STATE_TIMEOUT', 24 * 3600)
+
+
+def _save_chart(batch_id, chart):
+    transaction.on_commit(lambda: cache.set(_key(batch_id), chart, _timeout()))
+
+
+def new_chart(batch):
+    """Пустые карты партии с целью и допусками активной настройки линии"""
+    production_settings = get_active_settings(batch.line_id)
+    rule_set = get_rule_set(production_settings)
+    setpoints = None
+    if production_settings:
+        setpoints = [getattr(production_settings, field) for field in PARAMETER_FIELDS]
+    return ControlChart(batch.pk, setpoints, rule_set.low, rule_set.high)
+
+
+def _position(parameter):
+    return parameter.timestamp, parameter.pk
+
+
+def _warm_chart(batch, before_id=None):
+    """Восстанавливает карты по базовому участку и последним измерениям партии"""
+    chart = new_chart(batch)
+    warmup = _option('SPC_WARMUP_READINGS', 200)
+    queryset = BatchParameter.objects.filter(batch_id=batch.pk)
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    # Измерения партии из строк и из пачек (см. chunks.py)
+    baseline = list(queryset.order_by('timestamp', 'id')[:chart.baseline_size])
+    baseline += chunk_parameters(batch.pk, descending=False, limit=chart.baseline_size, before_id=before_id)
+    baseline = sorted(baseline, key=_position)[:chart.baseline_size]
+    tail = list(queryset.order_by('-timestamp', '-id')[:warmup])
+    tail += chunk_parameters(batch.pk, limit=warmup, before_id=before_id)
+    tail = sorted(tail, key=_position)[-warmup:]
+    seen = {parameter.pk for parameter in baseline}
+    rows = baseline + [parameter for parameter in tail if parameter.pk not in seen]
+    if rows:
+        chart.update(np.array([[getattr(parameter, field) for field in PARAMETER_FIELDS] for parameter in rows]))
+    return chart
+
+
+def get_control_chart(batch):
+    """Карты партии из кэша или восстановленные по истории"""
+    chart = cache.get(_key(batch.pk))
+    if chart is None:
+        chart = _warm_chart(batch)
+        cache.set(_key(batch.pk), chart, _timeout())
+    return chart
+
+
+def update_control_charts(batch, parameters):
+    """
+    Учитывает сохраненные измерения партии в контрольных картах
+    и предупреждает о начале дрейфа параметров
+    """
+    if not parameters:
+        return
+    parameters = sorted(parameters, key=lambda parameter: (parameter.timestamp, parameter.pk or 0))
+    chart = cache.get(_key(batch.pk))
+    if chart is None:
+        # Новые измерения уже записаны и не должны попасть в историю дважды
+        saved_ids = [parameter.pk for parameter in parameters if parameter.pk]
+        chart = _warm_chart(batch, before_id=min(saved_ids) if saved_ids else None)
+    started = chart.update([[getattr(parameter, field) for field in PARAMETER_FIELDS] for parameter in parameters])
+    _save_chart(batch.pk, chart)
+
+    for (field, direction), count in started.items():
+        notify(batch, drift_message(field, direction, batch.batch_number), 'warning', count=count)
+
+
+def reset_control_chart(batch):
+    """Начинает карты партии заново (после смены настройки производства)"""
+    _save_chart(batch.pk, new_chart(batch))
+
+
+def forget_control_chart(batch_id):
+    """Удаляет состояние карт завершенной партии"""
+    cache.delete(_key(batch_id))
@@ -0,0 +1,248 @@
+"""
+Статистика партии: моменты, перцентили и доля времени в допуске по
+каждому параметру, доля брака во времени.
+
+Состояние (BatchStatistics) копится инкрементально: при каждом запросе
+из базы читаются только измерения с id больше последнего учтенного,
+и они добавляются векторно: суммы для среднего и σ, минимум и максимум,
+гистограмма с фиксированными корзинами для перцентилей и время, которое
+каждый параметр провел в допуске. Перцентили вычисляются по гистограмме
+с точностью до ширины корзины (STATS_HISTOGRAM_BINS корзин на интервал
+из трех ширин допуска с центром в допуске).
+
+Допуски берутся из правил активной настройки линии партии на момент
+первого расчета. Доля брака во времени строится по поминутным агрегатам.
+Измерения перенесенных в архив партий читаются из архива (load_batch_arrays).
+
+Итог для завершенной партии хранится в кэше STATS_FINAL_TIMEOUT секунд.
+Раньше его сбрасывает invalidate_batch_statistics: при изменении или
+удалении партии (signals.py), перепроверке брака и объединении пачек.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .archive import count_batch_readings, load_batch_arrays
+from .cache import get_active_settings
+from .chunks import advance_cursor
+from .defects import DEFECT_LIMITS
+from .models import ParameterRollup, PARAMETER_FIELDS
+from .rules import get_rule_set
+
+STATS_KEY = 'api:batch_stats:{batch_id}'
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+def _option(name, default):
+    return getattr(settings, name, default)
+
+
+def _finite_or_none(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+class BatchStatistics:
+    """Накопленная статистика партии; массивы упорядочены по PARAMETER_FIELDS"""
+
+    def __init__(self, batch_id, low, high):
+        size = len(PARAMETER_FIELDS)
+        bins = _option('STATS_HISTOGRAM_BINS', 1000)
+        self.batch_id = batch_id
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        # Границы гистограммы: допуск (или критические значения) плюс его ширина с каждой стороны
+        self.edges = np.empty((size, bins + 1))
+        for index, field in enumerate(PARAMETER_FIELDS):
+            low_edge = self.low[index] if math.isfinite(self.low[index]) else DEFECT_LIMITS[field][0]
+            high_edge = self.high[index] if math.isfinite(self.high[index]) else DEFECT_LIMITS[field][1]
+            width = high_edge - low_edge
+            self.edges[index] = np.linspace(low_edge - width, high_edge + width, bins + 1)
+        # Корзины 0 и bins + 1 - значения ниже и выше границ гистограммы
+        self.histogram = np.zeros((size, bins + 2), dtype=np.int64)
+
+        self.cursor = None
+        self.count = 0
+        self.defect_count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.minimum = np.full(size, np.inf)
+        self.maximum = np.full(size, -np.inf)
+        self.last_timestamp = None
+        self.last_in_spec = None
+        self.in_spec_seconds = np.zeros(size)
+        self.all_in_spec_seconds = 0.0
+        self.total_seconds = 0.0
+        self.final = None
+
+    def update(self, arrays):
+        """Добавляет измерения (столбцы load_parameter_arrays, по времени)"""
+        count = len(arrays['id'])
+        if not count:
+            return
+        values = np.column_stack([arrays[field] for field in PARAMETER_FIELDS])
+        timestamps = arrays['timestamp']
+        self.cursor = advance_cursor(self.cursor, arrays['id'])
+        self.defect_count += int(arrays['is_defect'].sum())
+
+        # Среднее и сумма квадратов отклонений объединяются с накопленными
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.minimum = np.minimum(self.minimum, values.min(axis=0))
+        self.maximum = np.maximum(self.maximum, values.max(axis=0))
+
+        for index in range(len(PARAMETER_FIELDS)):
+            positions = np.searchsorted(self.edges[index], values[:, index], side='right')
+            self.histogram[index] += np.bincount(positions, minlength=self.histogram.shape[1])
+
+        # Состояние измерения действует до следующего измерения
+        in_spec = (values >= self.low) & (values <= self.high)
+        if self.last_timestamp is not None:
+            timestamps = np.concatenate([[self.last_timestamp], timestamps])
+            in_spec = np.vstack([self.last_in_spec, in_spec])
+        durations = np.clip(np.diff(timestamps), 0.0, None)
+        self.in_spec_seconds += (in_spec[:-1] * durations[:, None]).sum(axis=0)
+        self.all_in_spec_seconds += float(durations[in_spec[:-1].all(axis=1)].sum())
+        self.total_seconds += float(durations.sum())
+        self.last_timestamp = float(timestamps[-1])
+        self.last_in_spec = in_spec[-1]
+
+    def percentiles(self, index):
+        """Перцентили параметра по гистограмме с интерполяцией внутри корзины"""
+        counts = self.histogram[index]
+        cumulative = np.cumsum(counts)
+        result = {}
+        for percent in PERCENTILES:
+            rank = percent / 100 * self.count
+            position = int(np.searchsorted(cumulative, rank, side='left'))
+            if position == 0:
+                value = self.minimum[index]
+            elif position == len(counts) - 1:
+                value = self.maximum[index]
+            else:
+                before = cumulative[position - 1]
+                fraction = (rank - before) / counts[position] if counts[position] else 0.0
+                low, high = self.edges[index][position - 1], self.edges[index][position]
+                value = min(max(low + fraction * (high - low), self.minimum[index]), self.maximum[index])
+            result[f'p{percent}'] = float(value)
+        return result
+
+    def as_dict(self, end_timestamp):
+        """Сводка; последнее измерение считается действующим до end_timestamp"""
+        in_spec_seconds = self.in_spec_seconds.copy()
+        all_in_spec_seconds = self.all_in_spec_seconds
+        total_seconds = self.total_seconds
+        if self.last_timestamp is not None:
+            tail = max(end_timestamp - self.last_timestamp, 0.0)
+            in_spec_seconds += self.last_in_spec * tail
+            all_in_spec_seconds += tail if self.last_in_spec.all() else 0.0
+            total_seconds += tail
+
+        parameters = {}
+        for index, field in enumerate(PARAMETER_FIELDS):
+            if not self.count:
+                parameters[field] = None
+                continue
+            parameters[field] = {
+                'count': self.count,
+                'mean': float(self.mean[index]),
+                'std': math.sqrt(self.m2[index] / self.count),
+                'min': float(self.minimum[index]),
+                'max': float(self.maximum[index]),
+                'percentiles': self.percentiles(index),
+                'spec_min': _finite_or_none(self.low[index]),
+                'spec_max': _finite_or_none(self.high[index]),
+                'in_spec_fraction': float(in_spec_seconds[index] / total_seconds) if total_seconds else None,
+            }
+        return {
+            'count': self.count,
+            'defect_count': self.defect_count,
+            'defect_rate': self.defect_count / self.count if self.count else None,
+            'duration_seconds': total_seconds,
+            'in_spec_fraction': all_in_spec_seconds / total_seconds if total_seconds else None,
+            'parameters': parameters,
+        }
+
+
+def defect_rate_over_time(batch_id, points=None):
+    """Доля брака по интервалам времени из поминутных агрегатов (не больше points интервалов)"""
+    points = points or _option('STATS_DEFECT_RATE_POINTS', 120)
+    rows = list(
+        ParameterRollup.objects.filter(batch_id=batch_id)
+        .order_by('minute')
+        .values_list('minute', 'count', 'defect_count')
+    )
+    if not rows:
+        return []
+    minutes = np.array([row[0].timestamp() for row in rows])
+    counts = np.array([row[1] for row in rows], dtype=np.int64)
+    defects = np.array([row[2] for row in rows], dtype=np.int64)
+    span = minutes[-1] + 60 - minutes[0]
+    step = max(60.0, math.ceil(span / 60 / points) * 60)
+    buckets = ((minutes - minutes[0]) // step).astype(np.int64)
+    bucket_counts = np.bincount(buckets, weights=counts)
+    bucket_defects = np.bincount(buckets, weights=defects)
+    start = datetime.fromtimestamp(minutes[0], tz=dt_timezone.utc)
+    return [
+        {
+            'start': start + timedelta(seconds=step * index),
+            'count': int(count),
+            'defect_count': int(defect_count),
+            'defect_rate': defect_count / count,
+        }
+        for index, (count, defect_count) in enumerate(zip(bucket_counts, bucket_defects))
+        if count
+    ]
+
+
+def _key(batch_id):
+    return STATS_KEY.format(batch_id=batch_id)
+
+
+def _new_statistics(batch):
+    rule_set = get_rule_set(get_active_settings(batch.line_id))
+    return BatchStatistics(batch.pk, rule_set.low, rule_set.high)
+
+
+def get_batch_statistics(batch):
+    """Статистика партии с учетом измерений, записанных после прошлого расчета"""
+    state = cache.get(_key(batch.pk))
+    if state is not None and state.final is not None and not batch.is_active:
+        return state.final
+
+    if state is None:
+        state = _new_statistics(batch)
+    state.update(load_batch_arrays(batch.pk, after=state.cursor))
+    if not batch.is_active and state.count != count_batch_readings(batch.pk):
+        # Измерение с меньшим id зафиксировано позже уже учтенных: итог считается заново
+        state = _new_statistics(batch)
+        state.update(load_batch_arrays(batch.pk))
+
+    end_time = batch.end_time if not batch.is_active and batch.end_time else timezone.now()
+    result = {
+        'batch_id': batch.pk,
+        'is_active': batch.is_active,
+        **state.as_dict(end_time.timestamp()),
+        'defect_rate_over_time': defect_rate_over_time(batch.pk),
+    }
+    if batch.is_active:
+        cache.set(_key(batch.pk), state, _option('STATS_STATE_TIMEOUT', 3600))
+    else:
+        state.final = result
+        cache.set(_key(batch.pk), state, _option('STATS_FINAL_TIMEOUT', 24 * 3600))
+    return result
+
+
+def invalidate_batch_statistics(batch_id):
+    """Сбрасывает накопленную статистику партии"""
+    cache.delete(_key(batch_id))
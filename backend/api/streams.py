@@ -0,0 +1,202 @@
+"""
+Потоковые ответы: события через Server-Sent Events, выгрузка истории
+и отдача кадров компьютерного зрения
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import ValidationError
+
+from .archive import ARCHIVED_KINDS, merge_with_archives
+from .events import get_broker
+from .export import EXPORT_FORMATS, EXPORT_KINDS, iter_export, iter_rows
+from .frames import HASH_RE, frame_path, get_thumbnail, guess_content_type, parse_range
+from .pagination import filter_time_window, parse_time_param
+
+
+def _format_event(event):
+    data = json.dumps(event.data, ensure_ascii=False, default=str)
+    return f'id: {event.id}\nevent: {event.type}\ndata: {data}\n\n'
+
+
+async def event_stream(request):
+    """
+    Поток событий о новых параметрах, уведомлениях и данных компьютерного
+    зрения. Необязательный batch_id ограничивает поток одной партией.
+    Клиент возобновляет поток с заголовком Last-Event-ID (EventSource
+    передает его сам) или параметром last_event_id.
+    Требует запуска приложения через ASGI-сервер.
+    """
+    batch_id = request.GET.get('batch_id')
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or 0
+    try:
+        batch_id = int(batch_id) if batch_id else None
+        last_id = int(last_id)
+    except ValueError:
+        return JsonResponse({"detail": "Параметры batch_id и last_event_id должны быть целыми числами"}, status=400)
+
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    broker = get_broker()
+
+    async def stream():
+        # Подписка оформляется до чтения буфера, чтобы не потерять события между ними.
+        # Обращения к брокеру (Redis) не должны блокировать цикл asyncio,
+        # поэтому используются асинхронные asubscribe и areplay
+        subscription = await broker.asubscribe()
+        sent_id = last_id
+        try:
+            yield 'retry: 3000\n\n'
+            pending = await broker.areplay(sent_id)
+            while True:
+                for event in pending:
+                    if event.id <= sent_id:
+                        continue
+                    sent_id = event.id
+                    if batch_id is None or event.batch_id == batch_id:
+                        yield _format_event(event)
+                if subscription.lagged:
+                    subscription.lagged = False
+                    pending = await broker.areplay(sent_id)
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    pending = []
+                    continue
+                pending = [event]
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+
+async def _iterate_in_thread(iterator):
+    """
+    Отдает фрагменты синхронного итератора в асинхронный ответ по одному.
+    Без этой обертки Django под ASGI сначала собрал бы весь итератор в список.
+    Все шаги выполняются в одном потоке, чтобы серверный курсор оставался
+    на том же соединении с базой.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await step(iterator, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+@require_GET
+def export_data(request, kind):
+    """
+    Выгрузка параметров, уведомлений или данных компьютерного зрения
+    (kind = parameters | notifications | vision) за партию (batch_id)
+    и/или интервал времени (since, until).
+    format = csv | ndjson, compress=gzip включает сжатие
+    """
+    if kind not in EXPORT_KINDS:
+        return JsonResponse({"detail": "Неизвестный набор данных для выгрузки"}, status=404)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"detail": "Неизвестный формат выгрузки"}, status=400)
+    compress = request.GET.get('compress') == 'gzip'
+
+    model, columns = EXPORT_KINDS[kind]
+    queryset = model.objects.all()
+    batch_id = request.GET.get('batch_id')
+    if batch_id:
+        if not batch_id.isdigit():
+            return JsonResponse({"detail": "Параметр batch_id должен быть целым числом"}, status=400)
+        queryset = queryset.filter(batch_id=batch_id)
+    try:
+        queryset = filter_time_window(queryset, request.GET)
+        since = parse_time_param(request.GET, 'since')
+        until = parse_time_param(request.GET, 'until')
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=400)
+
+    rows = None
+    if kind in ARCHIVED_KINDS:
+        # Измерения перенесенных в архив партий читаются из файлов архива
+        rows = merge_with_archives(kind, queryset, columns, iter_rows, batch_id or None, since, until)
+    content = iter_export(queryset, columns, export_format, compress=compress, rows=rows)
+    if isinstance(request, ASGIRequest):
+        content = _iterate_in_thread(content)
+
+    filename = f"{kind}{'-' + batch_id if batch_id else ''}-{timezone.now():%Y%m%d%H%M%S}.{export_format}"
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    else:
+        content_type = f'{EXPORT_FORMATS[export_format]}; charset=utf-8'
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _read_range(path, start, end):
+    """Байты файла с start по end включительно блоками FileResponse.block_size"""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(FileResponse.block_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _serve_file(request, path, etag):
+    """
+    Отдача неизменяемого файла с поддержкой ETag (If-None-Match)
+    и запроса части содержимого (Range)
+    """
+    if etag in [value.strip() for value in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponse(status=304)
+    else:
+        size = path.stat().st_size
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        # Файл отдается по частям, а не читается в память целиком
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=guess_content_type(path))
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(path, start, end), status=206,
+                                             content_type=guess_content_type(path))
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@require_GET
+def frame_file(request, image_hash, thumbnail=False):
+    """
+    Кадр компьютерного зрения по его хэшу (или миниатюра кадра).
+    Содержимое по хэшу не меняется, поэтому ответ кэшируется клиентом навсегда
+    """
+    if not HASH_RE.match(image_hash):
+        return JsonResponse({"detail": "Некорректный хэш кадра"}, status=400)
+    path = get_thumbnail(image_hash) if thumbnail else frame_path(image_hash)
+    if path is None or not path.exists():
+        return JsonResponse({"detail": "Кадр не найден"}, status=404)
+    etag = f'"{image_hash}{"-thumb" if thumbnail and path != frame_path(image_hash) else ""}"'
+    return _serve_file(request, path, etag)
@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from api.acquisition import AcquisitionLoop, PlantSimulator, RandomWalkSource, get_data_source, initial_parameters
+from api.models import Batch, BatchParameter, ProductionLine, default_line_id
+
+SETPOINTS = {'temperature': 172.0, 'pressure': 2.6, 'mixing_speed': 61.0, 'glazing_thickness': 2.1}
+
+
+class PlantSimulatorTests(SimpleTestCase):
+    """Отклик симулированной линии на уставки"""
+
+    def test_same_seed_gives_same_readings(self):
+        first = PlantSimulator(SETPOINTS, seed=4)
+        second = PlantSimulator(SETPOINTS, seed=4)
+
+        self.assertEqual([first.step(SETPOINTS, 1.0) for _ in range(5)], [second.step(SETPOINTS, 1.0) for _ in range(5)])
+
+    def test_plant_follows_setpoints(self):
+        plant = PlantSimulator(SETPOINTS, seed=1)
+        target = dict(SETPOINTS, temperature=165.0)
+        for _ in range(60):
+            reading = plant.step(target, 1.0)
+
+        self.assertAlmostEqual(reading['temperature'], 165.0, delta=1.5)
+        self.assertAlmostEqual(reading['mixing_speed'], 61.0, delta=1.5)
+
+
+@override_settings(BATCH_COUNTER_SHARDS=0)
+class AcquisitionLoopTests(TestCase):
+    """Опрос источника для активных партий и запись буфера пачками"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()), batch_number='Z1')
+        self.loop = AcquisitionLoop(RandomWalkSource(), rate=10.0)
+        self.loop.refresh_batches()
+
+    def test_buffer_is_written_on_flush(self):
+        for _ in range(5):
+            self.loop.tick()
+        self.assertFalse(BatchParameter.objects.exists())
+
+        self.loop.flush()
+
+        self.assertEqual(BatchParameter.objects.filter(batch=self.batch).count(), 5)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.total_count, 5)
+        self.assertEqual(self.loop.report(1.0)['readings_per_second'], 5.0)
+        self.assertFalse(self.loop.buffers.get(self.batch.pk))
+
+    def test_readings_of_stopped_batch_are_dropped(self):
+        self.loop.tick()
+        Batch.objects.filter(pk=self.batch.pk).update(is_active=False, end_time=timezone.now())
+
+        with self.assertLogs('api.acquisition', 'WARNING'):
+            self.loop.flush()
+        self.assertFalse(BatchParameter.objects.exists())
+
+        self.loop.tick()
+        self.loop.refresh_batches()
+        self.assertEqual((self.loop.batches, self.loop.buffers), ([], {}))
+        self.assertNotIn(self.batch.pk, self.loop.source.last_values)
+
+    def test_random_walk_continues_from_latest_reading(self):
+        BatchParameter.objects.create(batch=self.batch, temperature=175.0, pressure=3.0, mixing_speed=62.0,
+                                      glazing_thickness=2.4)
+        source = get_data_source('api.acquisition.RandomWalkSource')
+
+        reading = source.read(self.batch)
+
+        self.assertAlmostEqual(reading['temperature'], 175.0, delta=0.2)
+        self.assertEqual(initial_parameters(self.batch.line_id)['temperature'], 170.0)
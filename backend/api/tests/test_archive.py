@@ -0,0 +1,88 @@
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.archive import (
+    ArchiveError, archive_batch, archive_directory, batch_time_range, count_batch_readings, iter_batch_blocks,
+    load_batch_arrays, verify_archive,
+)
+from api.chunks import append_readings
+from api.models import (
+    Batch, BatchArchive, BatchParameter, BatchParameterChunk, ComputerVisionData, PARAMETER_FIELDS, ProductionLine,
+    default_line_id,
+)
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _parameters(batch, count, offset=0.0):
+    # Строки записываются в обратном порядке времени: id не совпадает с порядком измерений
+    return [
+        BatchParameter(batch=batch, timestamp=START + timedelta(seconds=offset + index, microseconds=index),
+                       temperature=170.0 + index * 0.01, pressure=2.5, mixing_speed=60.0 - index * 0.001,
+                       glazing_thickness=2.0, is_defect=index % 7 == 0)
+        for index in reversed(range(count))
+    ]
+
+
+@override_settings(PARAMETER_CHUNK_SIZE=8)
+class ArchiveTests(TestCase):
+    """Перенос измерений завершенной партии в файлы и чтение из архива"""
+
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        override = override_settings(ARCHIVE_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()), batch_number='A1',
+                                          is_active=False, end_time=timezone.now())
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 50))
+        append_readings(self.batch, sorted(_parameters(self.batch, 20, offset=0.5), key=lambda item: item.timestamp))
+        ComputerVisionData.objects.create(batch=self.batch, timestamp=START, image_hash='a' * 64,
+                                          detected_objects={'bars': 3}, confidence_score=0.9)
+
+    def test_archive_keeps_measurements(self):
+        before = load_batch_arrays(self.batch.pk)
+        time_range = batch_time_range(self.batch.pk)
+
+        archive = archive_batch(self.batch)
+
+        self.assertEqual((archive.status, archive.parameter_count, archive.vision_count), ('archived', 70, 1))
+        self.assertFalse(BatchParameter.objects.filter(batch=self.batch).exists())
+        self.assertFalse(BatchParameterChunk.objects.filter(batch=self.batch).exists())
+        self.assertFalse(ComputerVisionData.objects.filter(batch=self.batch).exists())
+
+        after = load_batch_arrays(self.batch.pk)
+        for name in ('id', 'timestamp', 'is_defect') + PARAMETER_FIELDS:
+            self.assertEqual(after[name].tolist(), before[name].tolist(), name)
+        self.assertEqual(batch_time_range(self.batch.pk), time_range)
+        self.assertEqual(count_batch_readings(self.batch.pk), 70)
+
+        blocks = list(iter_batch_blocks(self.batch.pk, since=START + timedelta(seconds=10), block_size=16))
+        self.assertEqual([len(block['id']) for block in blocks], [16, 16, 16, 2])
+        self.assertEqual(blocks[0]['timestamp'][0], (START + timedelta(seconds=10, microseconds=10)).timestamp())
+
+    def test_repeated_archive_is_noop_and_checksums_are_verified(self):
+        archive = archive_batch(self.batch)
+        self.assertEqual(archive_batch(self.batch).pk, archive.pk)
+
+        with open(archive_directory(archive) / 'temperature.npy', 'r+b') as stored:
+            stored.seek(-8, 2)
+            stored.write(b'\0' * 8)
+        with self.assertRaises(ArchiveError):
+            verify_archive(archive)
+
+    def test_active_batch_is_not_archived(self):
+        Batch.objects.filter(pk=self.batch.pk).update(is_active=True)
+        self.batch.refresh_from_db()
+
+        with self.assertRaises(ArchiveError):
+            archive_batch(self.batch)
+        self.assertFalse(BatchArchive.objects.exists())
@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.benchmarks import SCENARIO_NAMES, compare, generate_history, run_scenarios
+from api.models import BatchParameter, ComputerVisionData, Notification, ParameterRollup
+
+
+@override_settings(BATCH_COUNTER_SHARDS=0)
+class BenchmarkTests(TestCase):
+    """Синтетическая история и замеры горячих точек API"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_generated_history_is_consistent(self):
+        batches = generate_history(3, 240, defect_rate=0.05, vision_every=20, line_count=2, seed=1)
+
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(len({batch.line_id for batch in batches}), 2)
+        for batch in batches:
+            readings = BatchParameter.objects.filter(batch=batch)
+            self.assertEqual(readings.count(), batch.total_count)
+            self.assertEqual(readings.filter(is_defect=True).count(), batch.defect_count)
+            self.assertEqual(ComputerVisionData.objects.filter(batch=batch).count(), 12)
+            self.assertEqual(sum(ParameterRollup.objects.filter(batch=batch).values_list('count', flat=True)), 240)
+        self.assertTrue(Notification.objects.filter(batch=batches[0], is_read=True).exists())
+        self.assertLess(batches[0].end_time, batches[2].start_time)
+
+    def test_scenarios_report_latency_and_queries(self):
+        generate_history(1, 60, seed=2)
+
+        results = run_scenarios(iterations=3, warmup=1)
+
+        self.assertEqual(set(results), set(SCENARIO_NAMES))
+        for result in results.values():
+            self.assertEqual(result['iterations'], 3)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # Запись измерения не обходится без базы
+        self.assertGreater(results['simulate_parameter']['queries_per_request'], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'batch_list': {'p50_ms': 10.0, 'p99_ms': 20.0, 'queries_per_request': 3.0}}
+        current = {
+            'batch_list': {'p50_ms': 11.0, 'p99_ms': 30.0, 'queries_per_request': 4.0},
+            'batch_detail': {'p50_ms': 1.0, 'p99_ms': 1.0, 'queries_per_request': 1.0},
+        }
+
+        rows = compare(current, baseline, threshold=0.2)
+
+        self.assertEqual([(row[1], row[5]) for row in rows],
+                         [('p50_ms', False), ('p99_ms', True), ('queries_per_request', True)])
+        self.assertAlmostEqual(rows[1][4], 0.5)
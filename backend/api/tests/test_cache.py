@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from api.cache import (
+    get_active_batch, get_active_setpoints, get_active_settings, get_latest_parameter, invalidate_active_batch,
+    invalidate_active_settings, remember_latest_parameter,
+)
+from api.models import Batch, BatchParameter, ProductionLine, ProductionSettings, default_line_id
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+class ActiveCacheTests(TestCase):
+    """Кэш активной партии, настройки, уставок и последнего измерения"""
+
+    def setUp(self):
+        cache.clear()
+        self.line = ProductionLine.objects.get(pk=default_line_id())
+        self.settings = ProductionSettings.objects.create(name='Кэш', temperature=170.0, pressure=2.5,
+                                                          mixing_speed=60.0, glazing_thickness=2.0)
+
+    def test_active_batch_is_cached_until_invalidated(self):
+        self.assertIsNone(get_active_batch())
+        batch = Batch.objects.create(line=self.line, batch_number='K1')
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_active_batch(self.line.pk))
+        invalidate_active_batch(self.line.pk)
+        self.assertEqual(get_active_batch(self.line.pk), batch)
+
+    def test_setpoints_apply_controller_values_of_active_settings(self):
+        ProductionLine.objects.filter(pk=self.line.pk).update(
+            active_settings=self.settings, setpoints={'settings_id': self.settings.pk, 'values': {'temperature': 171.5}}
+        )
+
+        self.assertEqual(get_active_settings(), self.settings)
+        self.assertEqual(get_active_setpoints()['temperature'], 171.5)
+        self.assertEqual(get_active_setpoints()['pressure'], 2.5)
+
+        # Поправки другой настройки не действуют
+        other = ProductionSettings.objects.create(name='Другая', temperature=165.0, pressure=2.4,
+                                                  mixing_speed=58.0, glazing_thickness=2.1)
+        ProductionLine.objects.filter(pk=self.line.pk).update(active_settings=other)
+        invalidate_active_settings()
+        self.assertEqual(get_active_setpoints()['temperature'], 165.0)
+
+    def test_latest_parameter_is_not_replaced_by_older(self):
+        batch = Batch.objects.create(line=self.line, batch_number='K2')
+        values = {'pressure': 2.5, 'mixing_speed': 60.0, 'glazing_thickness': 2.0}
+        BatchParameter.objects.bulk_create([
+            BatchParameter(batch=batch, timestamp=START + timedelta(seconds=index), temperature=170.0 + index, **values)
+            for index in range(3)
+        ])
+
+        self.assertEqual(get_latest_parameter(batch.pk)['temperature'], 172.0)
+        remember_latest_parameter(BatchParameter(batch=batch, timestamp=START, temperature=160.0, **values))
+        self.assertEqual(get_latest_parameter(batch.pk)['temperature'], 172.0)
+
+        newer = BatchParameter(batch=batch, timestamp=START + timedelta(minutes=1), temperature=175.0, **values)
+        remember_latest_parameter(newer, {'defect_risk': 0.25})
+        latest = get_latest_parameter(batch.pk)
+        self.assertEqual((latest['temperature'], latest['defect_risk']), (175.0, 0.25))
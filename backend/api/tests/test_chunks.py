@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api.chunks import (
+    CHUNK_ID_BASE, CHUNK_ID_STRIDE, append_readings, compact_batch_chunks, is_chunk_reading, load_chunk_arrays,
+    reading_chunk_id,
+)
+from api.models import Batch, BatchParameter, BatchParameterChunk, ProductionLine, default_line_id
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _parameters(batch, count, offset=0):
+    return [
+        BatchParameter(batch=batch, timestamp=START + timedelta(seconds=offset + index),
+                       temperature=170.0 + index * 0.1, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0,
+                       is_defect=index % 5 == 0)
+        for index in range(count)
+    ]
+
+
+@override_settings(PARAMETER_STORAGE='chunks', PARAMETER_CHUNK_SIZE=4)
+class ChunkStorageTests(APITestCase):
+    """Измерения в пачках: идентификаторы, объединение пачек и чтение вместе со строками"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()),
+                                          batch_number='K1', is_active=False)
+
+    def test_each_write_creates_new_chunks_with_stable_ids(self):
+        first = _parameters(self.batch, 6)
+        append_readings(self.batch, first)
+        second = _parameters(self.batch, 3, offset=6)
+        append_readings(self.batch, second)
+
+        chunks = list(BatchParameterChunk.objects.filter(batch=self.batch).order_by('id'))
+        self.assertEqual([chunk.count for chunk in chunks], [4, 2, 3])
+        ids = [parameter.pk for parameter in first + second]
+        self.assertTrue(all(is_chunk_reading(pk) for pk in ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(ids[0], CHUNK_ID_BASE + chunks[0].pk * CHUNK_ID_STRIDE)
+        self.assertEqual([reading_chunk_id(pk) for pk in ids[4:6]], [chunks[1].pk] * 2)
+        self.assertFalse(is_chunk_reading(1))
+
+        response = self.client.get(f'/api/parameters/{ids[5]}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(response.data['temperature'], 170.5, places=5)
+        self.assertEqual(self.client.delete(f'/api/parameters/{ids[5]}/').status_code, 405)
+
+    def test_compaction_keeps_data_and_never_raises_ids(self):
+        for offset in range(0, 9, 3):
+            append_readings(self.batch, _parameters(self.batch, 3, offset=offset))
+        before = load_chunk_arrays(self.batch.pk)
+
+        self.assertEqual(compact_batch_chunks(self.batch.pk), (3, 3))
+        with self.settings(PARAMETER_CHUNK_SIZE=10):
+            self.assertEqual(compact_batch_chunks(self.batch.pk), (3, 1))
+
+        after = load_chunk_arrays(self.batch.pk)
+        for name in ('timestamp', 'temperature', 'is_defect'):
+            self.assertEqual(after[name].tolist(), before[name].tolist())
+        self.assertTrue((after['id'] <= before['id']).all())
+        self.assertEqual(BatchParameterChunk.objects.get(batch=self.batch).defect_count, int(before['is_defect'].sum()))
+
+    def test_list_merges_chunks_with_rows(self):
+        rows = BatchParameter.objects.bulk_create(_parameters(self.batch, 5, offset=0.5))
+        append_readings(self.batch, _parameters(self.batch, 5))
+
+        url = f'/api/parameters/?batch_id={self.batch.pk}&ordering=timestamp&page_size=3'
+        items = []
+        while url:
+            response = self.client.get(url)
+            items += response.data['results']
+            url = response.data['next']
+
+        self.assertEqual(len(items), 10)
+        timestamps = [item['timestamp'] for item in items]
+        self.assertEqual(timestamps, sorted(timestamps))
+        # Строки и измерения из пачек чередуются по времени
+        self.assertEqual([is_chunk_reading(item['id']) for item in items], [True, False] * 5)
+        self.assertEqual({item['id'] for item in items if not is_chunk_reading(item['id'])}, {row.pk for row in rows})
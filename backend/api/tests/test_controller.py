@@ -0,0 +1,83 @@
+import numpy as np
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.controller import ControllerLoop, simulate
+from api.models import Batch, Notification, ProductionLine, ProductionSettings, SetpointAdjustment, default_line_id
+
+
+class OffsetStream:
+    """Измерения линии с постоянным отклонением температуры от цели"""
+
+    def __init__(self, offset, count=60, seed=1):
+        self.values = np.tile([170.0 + offset, 2.5, 60.0, 2.0], (count, 1))
+        self.values += np.random.default_rng(seed).normal(0, 0.05, self.values.shape)
+
+    def read(self, batch):
+        values, self.values = self.values, self.values[:0]
+        return values
+
+    def forget(self, batch_id):
+        pass
+
+
+@override_settings(SPC_BASELINE_READINGS=30)
+class ControllerLoopTests(TestCase):
+    """Шаги регулятора по потоку измерений и запись изменений уставок"""
+
+    def setUp(self):
+        cache.clear()
+        self.settings = ProductionSettings.objects.create(
+            name='Базовая', temperature=170.0, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0, is_active=True
+        )
+        self.line = ProductionLine.objects.get(pk=default_line_id())
+        self.line.active_settings = self.settings
+        self.line.save()
+        self.batch = Batch.objects.create(line=self.line, batch_number='L1')
+
+    def _run(self, dry_run, ticks=5):
+        loop = ControllerLoop(rate=1.0, dry_run=dry_run, stream=OffsetStream(offset=-2.0))
+        loop.refresh()
+        loop.poll()
+        for _ in range(ticks):
+            loop.tick(1.0)
+        loop.flush()
+        return loop
+
+    def test_dry_run_writes_only_journal(self):
+        loop = self._run(dry_run=True)
+
+        adjustments = SetpointAdjustment.objects.filter(line=self.line)
+        self.assertTrue(adjustments.exists())
+        self.assertFalse(adjustments.filter(is_dry_run=False).exists())
+        self.assertEqual(set(adjustments.values_list('parameter', flat=True)), {'temperature'})
+        # Температура ниже цели: уставка поднимается
+        self.assertTrue(all(item.value > item.previous_value for item in adjustments))
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.setpoints, {})
+        self.assertGreater(loop.controllers[self.line.pk].as_setpoints()['temperature'], 170.0)
+
+    def test_setpoints_are_published_without_dry_run(self):
+        loop = self._run(dry_run=False)
+
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.setpoints['settings_id'], self.settings.pk)
+        self.assertEqual(self.line.setpoints['values'], loop.controllers[self.line.pk].as_setpoints())
+        self.assertFalse(SetpointAdjustment.objects.filter(is_dry_run=True).exists())
+
+    def test_setpoint_stops_at_safe_limit_with_warning(self):
+        loop = self._run(dry_run=False, ticks=200)
+
+        controller = loop.controllers[self.line.pk]
+        self.assertAlmostEqual(controller.as_setpoints()['temperature'], 170.0 + controller.max_offset[0])
+        self.assertTrue(SetpointAdjustment.objects.filter(parameter='temperature', is_limited=True).exists())
+        warnings = Notification.objects.filter(batch=self.batch, notification_type='warning')
+        self.assertEqual(warnings.count(), 1)
+
+    def test_simulation_does_not_write(self):
+        result = simulate(self.line.pk, duration=30, rate=2, seed=3)
+
+        self.assertEqual(result['steps'], 60)
+        self.assertIn('defect_rate', result['controlled'])
+        self.assertIn('mean_deviation', result['open_loop'])
+        self.assertFalse(SetpointAdjustment.objects.exists())
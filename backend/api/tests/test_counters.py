@@ -0,0 +1,54 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.counters import fold_counters, increment_counters
+from api.models import Batch, BatchCounterShard, ProductionLine, default_line_id
+
+
+class CounterTests(TestCase):
+    """Счетчики партии увеличиваются выражением F() напрямую или через части"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()),
+                                          batch_number='C1', total_count=5, defect_count=1)
+
+    def _counts(self):
+        self.batch.refresh_from_db()
+        return self.batch.total_count, self.batch.defect_count
+
+    @override_settings(BATCH_COUNTER_SHARDS=0)
+    def test_increment_updates_batch_row(self):
+        increment_counters(self.batch.pk, 10, 2)
+        increment_counters(self.batch.pk, 3)
+        increment_counters(self.batch.pk, 0)
+
+        self.assertEqual(self._counts(), (18, 3))
+        self.assertFalse(BatchCounterShard.objects.exists())
+
+    @override_settings(BATCH_COUNTER_SHARDS=4)
+    def test_shards_are_folded_into_batch(self):
+        for _ in range(20):
+            increment_counters(self.batch.pk, 2, 1)
+
+        self.assertEqual(self._counts(), (5, 1))
+        self.assertLessEqual(BatchCounterShard.objects.filter(batch=self.batch).count(), 4)
+
+        self.assertEqual(fold_counters(self.batch.pk), 1)
+        self.assertEqual(self._counts(), (45, 21))
+        self.assertFalse(BatchCounterShard.objects.exclude(total_count=0, defect_count=0).exists())
+        # Повторный перенос ничего не добавляет
+        fold_counters()
+        self.assertEqual(self._counts(), (45, 21))
+
+    @override_settings(BATCH_COUNTER_SHARDS=2)
+    def test_fold_all_batches(self):
+        other = Batch.objects.create(line=self.batch.line, batch_number='C2', is_active=False)
+        increment_counters(self.batch.pk, 1)
+        increment_counters(other.pk, 7, 7)
+
+        self.assertEqual(fold_counters(), 2)
+
+        other.refresh_from_db()
+        self.assertEqual(self._counts(), (6, 1))
+        self.assertEqual((other.total_count, other.defect_count), (7, 7))
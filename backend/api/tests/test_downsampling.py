@@ -0,0 +1,72 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from api.downsampling import BucketAggregator, bucket_aggregate, lttb
+
+
+class DownsamplingTests(SimpleTestCase):
+    """Агрегаты по корзинам времени и выборка точек LTTB"""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.timestamps = np.sort(rng.uniform(0, 1000, 500))
+        self.values = {'temperature': rng.normal(170, 2, 500), 'pressure': rng.normal(2.5, 0.1, 500)}
+
+    def assertSameBuckets(self, first, second):
+        np.testing.assert_allclose(first['timestamp'], second['timestamp'])
+        self.assertEqual(first['count'].tolist(), second['count'].tolist())
+        for name, aggregates in first['series'].items():
+            for key, array in aggregates.items():
+                np.testing.assert_allclose(array, second['series'][name][key])
+
+    def test_bucket_aggregate(self):
+        timestamps = np.array([0.0, 1.0, 2.0, 9.0, 10.0])
+        result = bucket_aggregate(timestamps, {'value': np.array([1.0, 5.0, 3.0, 4.0, 8.0])}, 5, 0.0, 10.0)
+
+        # Последняя точка попадает в последнюю корзину, пустые корзины пропускаются
+        self.assertEqual(result['timestamp'].tolist(), [1.0, 3.0, 9.0])
+        self.assertEqual(result['count'].tolist(), [2, 1, 2])
+        self.assertEqual(result['series']['value']['min'].tolist(), [1.0, 3.0, 4.0])
+        self.assertEqual(result['series']['value']['max'].tolist(), [5.0, 3.0, 8.0])
+        self.assertEqual(result['series']['value']['avg'].tolist(), [3.0, 3.0, 6.0])
+
+    def test_aggregator_matches_bucket_aggregate_in_any_order(self):
+        expected = bucket_aggregate(self.timestamps, self.values, 40, 0.0, 1000.0)
+
+        aggregator = BucketAggregator(list(self.values), 40, 0.0, 1000.0)
+        order = np.random.default_rng(1).permutation(len(self.timestamps))
+        for block in np.array_split(order, 7):
+            aggregator.add(self.timestamps[block], {name: array[block] for name, array in self.values.items()})
+
+        self.assertEqual(aggregator.total, 500)
+        self.assertSameBuckets(aggregator.result(), expected)
+
+    def test_aggregator_accepts_summaries(self):
+        # Агрегаты по 10-секундным интервалам дают те же корзины шириной 50 секунд
+        intervals = np.floor(self.timestamps / 10) * 10
+        starts, index, counts = np.unique(intervals, return_inverse=True, return_counts=True)
+        mins, maxs, sums = {}, {}, {}
+        for name, array in self.values.items():
+            mins[name] = np.full(len(starts), np.inf)
+            maxs[name] = np.full(len(starts), -np.inf)
+            np.minimum.at(mins[name], index, array)
+            np.maximum.at(maxs[name], index, array)
+            sums[name] = np.bincount(index, weights=array)
+
+        aggregator = BucketAggregator(list(self.values), 20, 0.0, 1000.0)
+        aggregator.add_summaries(starts, counts, mins, maxs, sums)
+
+        self.assertSameBuckets(aggregator.result(), bucket_aggregate(self.timestamps, self.values, 20, 0.0, 1000.0))
+
+    def test_lttb_keeps_ends_and_peak(self):
+        timestamps = np.arange(100, dtype=np.float64)
+        values = np.zeros(100)
+        values[42] = 10.0
+
+        selected = lttb(timestamps, values, 10)
+
+        self.assertEqual(len(selected), 10)
+        self.assertEqual((selected[0], selected[-1]), (0, 99))
+        self.assertIn(42, selected)
+        self.assertTrue((np.diff(selected) > 0).all())
+        self.assertEqual(lttb(timestamps, values, 200).tolist(), list(range(100)))
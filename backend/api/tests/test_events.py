@@ -0,0 +1,69 @@
+import asyncio
+
+from django.test import AsyncClient, SimpleTestCase, TestCase
+
+from api import events
+from api.events import InMemoryBroker, get_broker, publish_rows
+
+
+class BrokerMixin:
+    """Отдельный брокер в памяти на время теста"""
+
+    def setUp(self):
+        previous = events._broker
+        events._broker = InMemoryBroker(buffer_size=5, queue_size=2)
+        self.addCleanup(setattr, events, '_broker', previous)
+        self.broker = events._broker
+
+
+class InMemoryBrokerTests(BrokerMixin, SimpleTestCase):
+    """Буфер последних событий и доставка подписчикам"""
+
+    def test_replay_keeps_last_events(self):
+        ids = [self.broker.publish('parameter', 1, [{'index': index}]) for index in range(7)]
+
+        self.assertEqual(ids, list(range(1, 8)))
+        self.assertEqual([event.id for event in self.broker.replay(0)], [3, 4, 5, 6, 7])
+        self.assertEqual([event.data for event in self.broker.replay(6)], [[{'index': 6}]])
+
+    async def test_subscription_receives_events_and_reports_lag(self):
+        subscription = await self.broker.asubscribe()
+        # Публикация идет из потока синхронного кода
+        await asyncio.to_thread(lambda: [self.broker.publish('notification', 2, index) for index in range(3)])
+        await asyncio.sleep(0)
+
+        first = await subscription.get()
+        self.assertEqual((first.type, first.batch_id, first.data), ('notification', 2, 0))
+        self.assertTrue(subscription.lagged)
+        self.assertEqual([event.data for event in await self.broker.areplay(first.id)], [1, 2])
+
+        subscription.close()
+        self.assertFalse(self.broker.subscribers)
+
+    async def test_event_stream_resumes_after_last_event_id(self):
+        self.broker.publish('parameter', 1, ['a'])
+        self.broker.publish('parameter', 2, ['b'])
+        self.broker.publish('parameter', 1, ['c'])
+
+        response = await AsyncClient().get('/api/events/?batch_id=1', headers={'Last-Event-ID': '1'})
+        content = response.streaming_content
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(await content.__anext__(), b'retry: 3000\n\n')
+        self.assertEqual(await content.__anext__(), b'id: 3\nevent: parameter\ndata: ["c"]\n\n')
+        await content.aclose()
+        self.assertEqual((await AsyncClient().get('/api/events/?batch_id=x')).status_code, 400)
+
+
+class PublishRowsTests(BrokerMixin, TestCase):
+    """Записи публикуются только после фиксации транзакции"""
+
+    def test_rows_are_published_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            publish_rows('parameter', 1, [{'id': 1}])
+            publish_rows('parameter', 1, [])
+        self.assertEqual(get_broker().replay(0), [])
+
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual([event.data for event in get_broker().replay(0)], [[{'id': 1}]])
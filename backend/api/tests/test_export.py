@@ -0,0 +1,74 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.chunks import append_readings
+from api.models import Batch, BatchParameter, Notification, ProductionLine, default_line_id
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _parameters(batch, count, offset=0.0):
+    return [
+        BatchParameter(batch=batch, timestamp=START + timedelta(seconds=offset + index),
+                       temperature=170.0 + index, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0,
+                       is_defect=index == 0)
+        for index in range(count)
+    ]
+
+
+@override_settings(PARAMETER_CHUNK_SIZE=3)
+class ExportTests(TestCase):
+    """Потоковая выгрузка истории в CSV и NDJSON"""
+
+    def setUp(self):
+        cache.clear()
+        line = ProductionLine.objects.get(pk=default_line_id())
+        self.batch = Batch.objects.create(line=line, batch_number='X1')
+        self.other = Batch.objects.create(line=line, batch_number='X2', is_active=False)
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 4) + _parameters(self.other, 2))
+        append_readings(self.batch, _parameters(self.batch, 4, offset=0.5))
+
+    def _content(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_merges_rows_and_chunks_by_time(self):
+        response, content = self._content(f'/api/export/parameters/?batch_id={self.batch.pk}')
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn(f'parameters-{self.batch.pk}-', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual([row['timestamp'] for row in rows], sorted(row['timestamp'] for row in rows))
+        self.assertEqual({row['batch_id'] for row in rows}, {str(self.batch.pk)})
+        self.assertEqual([row['is_defect'] for row in rows[:3]], ['True', 'True', 'False'])
+
+    def test_gzip_ndjson_with_time_window(self):
+        until = (START + timedelta(seconds=1)).isoformat().replace('+', '%2B')
+        _, content = self._content(f'/api/export/parameters/?format=ndjson&compress=gzip&until={until}')
+
+        records = [json.loads(line) for line in gzip.decompress(content).decode().splitlines()]
+        # Строки обеих партий за первую секунду и измерение из пачки между ними
+        self.assertEqual([record['batch_id'] for record in records],
+                         [self.batch.pk, self.other.pk, self.batch.pk, self.batch.pk, self.other.pk])
+        self.assertEqual(records[2]['timestamp'], (START + timedelta(seconds=0.5)).isoformat())
+
+    def test_notifications_and_errors(self):
+        Notification.objects.create(batch=self.batch, message='Брак, "партия"', notification_type='warning')
+
+        _, content = self._content('/api/export/notifications/')
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[1][4], 'Брак, "партия"')
+
+        self.assertEqual(self.client.get('/api/export/users/').status_code, 404)
+        self.assertEqual(self.client.get('/api/export/parameters/?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/export/parameters/?batch_id=x').status_code, 400)
+        self.assertEqual(self.client.post('/api/export/parameters/').status_code, 405)
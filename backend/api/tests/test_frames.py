@@ -0,0 +1,70 @@
+import hashlib
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from api.frames import delete_frame, frame_path, parse_range, store_frame
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+
+
+class ParseRangeTests(SimpleTestCase):
+    """Разбор заголовка Range"""
+
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_unsupported_and_invalid_ranges(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-1'):
+            self.assertIsNone(parse_range(header, 1000), header)
+        for header in ('bytes=1000-', 'bytes=5-4', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 1000)
+
+
+class FrameFileTests(SimpleTestCase):
+    """Кадры по хэшу: ETag, Range и неизменяемый кэш"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        override = override_settings(FRAMES_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.image_hash = store_frame(PNG)
+        self.url = f'/api/frames/{self.image_hash}/'
+
+    def test_frame_is_stored_once_by_content(self):
+        self.assertEqual(self.image_hash, hashlib.sha256(PNG).hexdigest())
+        path = frame_path(self.image_hash)
+        self.assertEqual(path.parent.name, self.image_hash[2:4])
+        modified = path.stat().st_mtime_ns
+        self.assertEqual(store_frame(PNG), self.image_hash)
+        self.assertEqual(path.stat().st_mtime_ns, modified)
+
+        delete_frame(self.image_hash)
+        self.assertFalse(path.exists())
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_full_and_partial_content(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), PNG)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=8-15')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 8-15/{len(PNG)}')
+        self.assertEqual(b''.join(partial.streaming_content), bytes(range(8)))
+
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f'bytes={len(PNG)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(self.client.get('/api/frames/not-a-hash/').status_code, 400)
@@ -0,0 +1,66 @@
+import json
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api.ingest import MAX_READINGS_PER_REQUEST
+from api.models import Batch, BatchParameter, Notification, ProductionLine, default_line_id
+
+NORMAL = {'temperature': 170.0, 'pressure': 2.5, 'mixing_speed': 60.0, 'glazing_thickness': 2.0}
+
+
+@override_settings(BATCH_COUNTER_SHARDS=0)
+class IngestTests(APITestCase):
+    """Пакетная загрузка измерений массивом JSON и потоком NDJSON"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()), batch_number='I1')
+        self.url = f'/api/batches/{self.batch.pk}/ingest/'
+
+    def test_json_readings_are_validated_one_by_one(self):
+        readings = [
+            dict(NORMAL, timestamp='2026-01-01T12:00:00Z'),
+            dict(NORMAL, temperature=190.0, timestamp='2026-01-01T12:00:01Z'),
+            dict(NORMAL, pressure='много'),
+            {'temperature': 170.0},
+        ]
+
+        response = self.client.post(self.url, {'readings': readings}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['accepted'], response.data['rejected'], response.data['defects']), (2, 2, 1))
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['accepted', 'accepted', 'rejected', 'rejected'])
+        self.assertEqual([result['is_defect'] for result in results[:2]], [False, True])
+        self.assertIn('pressure', results[2]['errors'])
+        self.assertEqual(set(results[3]['errors']), {'pressure', 'mixing_speed', 'glazing_thickness'})
+        self.assertEqual(
+            set(BatchParameter.objects.filter(batch=self.batch).values_list('id', flat=True)),
+            {results[0]['id'], results[1]['id']}
+        )
+
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.total_count, self.batch.defect_count), (2, 1))
+        self.assertEqual(Notification.objects.filter(batch=self.batch, notification_type='warning').count(), 1)
+
+    def test_ndjson_bad_line_rejects_only_that_reading(self):
+        lines = [json.dumps(NORMAL), '{"temperature": ', '', json.dumps(dict(NORMAL, timestamp='2026-01-01T12:00:00'))]
+
+        response = self.client.post(self.url, '\n'.join(lines).encode(), content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (2, 1))
+        rejected = response.data['results'][1]
+        self.assertEqual(rejected['index'], 1)
+        self.assertTrue(rejected['errors']['non_field_errors'][0].startswith('Строка 2:'))
+
+    def test_request_errors(self):
+        self.assertEqual(self.client.post(self.url, {'readings': 'нет'}, format='json').status_code, 400)
+        too_many = [NORMAL] * (MAX_READINGS_PER_REQUEST + 1)
+        self.assertEqual(self.client.post(self.url, too_many, format='json').status_code, 400)
+
+        Batch.objects.filter(pk=self.batch.pk).update(is_active=False)
+        self.assertEqual(self.client.post(self.url, [NORMAL], format='json').status_code, 400)
+        self.assertFalse(BatchParameter.objects.exists())
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api import metrics
+from api.metrics import MetricsRegistry
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_SLOW_REQUEST_MS=None, METRICS_NPLUSONE_THRESHOLD=3)
+class QueryMetricsTests(TestCase):
+    """Метрики запросов по представлениям и признак N+1"""
+
+    def setUp(self):
+        cache.clear()
+        previous = metrics.registry
+        metrics.registry = MetricsRegistry()
+        self.addCleanup(setattr, metrics, 'registry', previous)
+
+    def test_requests_are_recorded_by_view_and_action(self):
+        self.client.get('/api/batches/')
+        self.client.get('/api/batches/')
+        self.client.get('/api/batches/999999/')
+
+        registry = metrics.registry
+        self.assertEqual(registry.requests[('BatchViewSet.list', 'GET', 200)], 2)
+        self.assertEqual(registry.requests[('BatchViewSet.retrieve', 'GET', 404)], 1)
+        self.assertGreater(registry.queries[('BatchViewSet.list', 'GET')].sum, 0)
+        self.assertEqual(registry.sizes[('BatchViewSet.list', 'GET')].count, 2)
+
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('api_requests_total{endpoint="BatchViewSet.list",method="GET",status="200"} 2', text)
+        self.assertIn('api_request_duration_seconds_bucket{endpoint="BatchViewSet.list",method="GET",le="+Inf"} 2',
+                      text)
+        # Запросы к самим метрикам не учитываются
+        self.assertNotIn('endpoint="metrics"', text)
+
+    def test_streaming_response_is_recorded_on_close(self):
+        response = self.client.get('/api/export/notifications/')
+        self.assertFalse(metrics.registry.requests)
+
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(metrics.registry.requests[('export_data', 'GET', 200)], 1)
+
+    def test_repeated_sql_is_counted_as_nplusone(self):
+        registry = MetricsRegistry()
+        recorder = metrics._QueryRecorder()
+        for number in range(5):
+            recorder(lambda *args: None, 'SELECT * FROM api_batch WHERE id IN (%s, %s)', (number, number), False, {})
+        recorder(lambda *args: None, 'SELECT 1', (), False, {})
+
+        template, count = recorder.repeated(3)
+        self.assertEqual((template, count), ('SELECT * FROM api_batch WHERE id IN (...)', 5))
+        self.assertIsNone(recorder.repeated(6))
+        with self.assertLogs('api.metrics', 'WARNING'):
+            registry.record('BatchViewSet.list', 'GET', 200, 0.01, 6, 0.001, 100, (template, count))
+        self.assertEqual(registry.nplusone[('BatchViewSet.list', 'GET')], 1)
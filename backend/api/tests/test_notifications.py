@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.models import Batch, Notification, ProductionLine, default_line_id
+from api.notifications import notify
+
+
+@override_settings(NOTIFICATION_COALESCE_SECONDS=300)
+class NotifyTests(TestCase):
+    """Повторы непрочитанного уведомления объединяются в одну запись"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()), batch_number='N1')
+
+    def test_repeats_are_coalesced(self):
+        first = notify(self.batch, 'Брак', 'warning')
+        with self.assertNumQueries(2):
+            second = notify(self.batch, 'Брак', 'warning', count=4)
+
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(second.occurrences, 5)
+        self.assertEqual(second.timestamp, first.timestamp)
+        self.assertGreaterEqual(second.last_timestamp, first.last_timestamp)
+        # Другой текст, тип или партия - отдельные записи
+        notify(self.batch, 'Брак', 'error')
+        notify(self.batch, 'Другое', 'warning')
+        notify(None, 'Брак', 'warning')
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_read_notification_is_not_updated(self):
+        first = notify(self.batch, 'Брак', 'warning')
+        Notification.objects.filter(pk=first.pk).update(is_read=True)
+
+        second = notify(self.batch, 'Брак', 'warning')
+
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(Notification.objects.get(pk=first.pk).occurrences, 1)
+
+    def test_candidate_is_found_without_cache(self):
+        first = notify(self.batch, 'Брак', 'warning')
+        cache.clear()
+
+        self.assertEqual(notify(self.batch, 'Брак', 'warning').pk, first.pk)
+
+    @override_settings(NOTIFICATION_COALESCE_SECONDS=0)
+    def test_coalescing_can_be_disabled(self):
+        notify(self.batch, 'Брак', 'warning')
+        notify(self.batch, 'Брак', 'warning')
+
+        self.assertEqual(Notification.objects.filter(batch=self.batch).count(), 2)
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from api.models import Batch, BatchParameter, ProductionLine, default_line_id
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _readings(batch, count, start=START):
+    # Каждые два измерения имеют одинаковое время: порядок внутри пары задает id
+    return BatchParameter.objects.bulk_create([
+        BatchParameter(batch=batch, timestamp=start + timedelta(seconds=index // 2),
+                       temperature=170.0 + index, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0)
+        for index in range(count)
+    ])
+
+
+class CursorPaginationTests(APITestCase):
+    """Курсорная пагинация /parameters/ по (timestamp, id)"""
+
+    def setUp(self):
+        cache.clear()
+        line = ProductionLine.objects.get(pk=default_line_id())
+        self.batch = Batch.objects.create(line=line, batch_number='P1', is_active=False)
+        self.other = Batch.objects.create(line=line, batch_number='P2', is_active=False)
+        _readings(self.batch, 25)
+        _readings(self.other, 5)
+
+    def _pages(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_pages_cover_batch_once_newest_first(self):
+        pages = self._pages(f'/api/parameters/?batch_id={self.batch.pk}&page_size=10')
+
+        expected = list(
+            BatchParameter.objects.filter(batch=self.batch).order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_ascending_order_and_time_window(self):
+        since = (START + timedelta(seconds=3)).isoformat().replace('+00:00', 'Z')
+        until = (START + timedelta(seconds=7)).isoformat().replace('+00:00', 'Z')
+        pages = self._pages(
+            f'/api/parameters/?batch_id={self.batch.pk}&ordering=timestamp&page_size=4&since={since}&until={until}'
+        )
+
+        expected = list(
+            BatchParameter.objects.filter(
+                batch=self.batch, timestamp__gte=START + timedelta(seconds=3), timestamp__lte=START + timedelta(seconds=7)
+            ).order_by('timestamp', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(len(expected), 10)
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_rows_written_after_first_page_do_not_shift_pages(self):
+        response = self.client.get(f'/api/parameters/?batch_id={self.batch.pk}&page_size=10')
+        first = [item['id'] for item in response.data['results']]
+        # Новые измерения попадают в начало списка и не сдвигают следующие страницы
+        _readings(self.batch, 4, start=START + timedelta(hours=1))
+
+        rest = self._pages(response.data['next'])
+
+        self.assertEqual(len(set(first) | set(sum(rest, []))), 25)
+
+    def test_invalid_cursor_and_page_size(self):
+        self.assertEqual(self.client.get('/api/parameters/?cursor=bm90LWEtY3Vyc29y').status_code, 404)
+        self.assertEqual(self.client.get('/api/parameters/?page_size=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/parameters/?since=yesterday').status_code, 400)
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from api.ingest import defect_message
+from api.models import Batch, BatchParameter, Notification, ProductionLine, ProductionSettings, default_line_id
+from api.replay import build_candidate, coalesce, replay_batches
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+class CoalesceTests(SimpleTestCase):
+    """Объединение уведомлений при воспроизведении совпадает с notify"""
+
+    def test_window_counts_from_first_repeat(self):
+        events = [(0.0, 'a', 1), (100.0, 'a', 2), (250.0, 'b', 1), (301.0, 'a', 1), (350.0, 'a', 1)]
+
+        self.assertEqual(coalesce(events, 300), (3, 6))
+        self.assertEqual(coalesce(events, 0), (5, 6))
+
+
+class ReplayTests(TestCase):
+    """Воспроизведение партии с другими правилами без записи в базу"""
+
+    def setUp(self):
+        cache.clear()
+        self.settings = ProductionSettings.objects.create(name='Текущая', temperature=170.0, pressure=2.5,
+                                                          mixing_speed=60.0, glazing_thickness=2.0)
+        line = ProductionLine.objects.get(pk=default_line_id())
+        line.active_settings = self.settings
+        line.save()
+        self.batch = Batch.objects.create(line=line, batch_number='W1', is_active=False)
+        # Температура растет на 0.1 градуса в секунду: брак по умолчанию после 180
+        BatchParameter.objects.bulk_create([
+            BatchParameter(batch=self.batch, timestamp=START + timedelta(seconds=index), temperature=165.0 + index * 0.1,
+                           pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0, is_defect=index > 150)
+            for index in range(200)
+        ])
+        Notification.objects.create(batch=self.batch, message=defect_message('W1'), notification_type='warning',
+                                    occurrences=49)
+
+    def test_candidates_are_compared_with_actual(self):
+        candidates = [
+            build_candidate(self.settings),
+            build_candidate(self.settings, name='Строже', rules=[{'parameter': 'temperature', 'max_value': 175.0}]),
+        ]
+
+        result, = replay_batches([self.batch], candidates, workers=1)
+
+        actual = result['actual']
+        self.assertEqual((actual['defect_count'], actual['notifications'], actual['notification_occurrences']),
+                         (49, 1, 49))
+        current, strict = result['candidates']
+        self.assertEqual((current['defect_count'], current['flagged'], current['cleared']), (49, 0, 0))
+        self.assertEqual((strict['name'], strict['defect_count'], strict['flagged']), ('Строже', 99, 50))
+        self.assertEqual(strict['first_defect'], 101.0)
+        # Кроме брака рост температуры дает предупреждения о дрейфе
+        self.assertGreater(strict['drift_signals']['temperature']['up'], 0)
+        drifts = sum(sum(signals.values()) for signals in strict['drift_signals'].values())
+        self.assertEqual(strict['notification_occurrences'], 99 + drifts)
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_invalid_candidates(self):
+        with self.assertRaises(ValueError):
+            build_candidate(rules=[{'parameter': 'humidity'}])
+        with self.assertRaises(ValueError):
+            build_candidate(rules=[{'rule_type': 'shape', 'parameter': 'temperature'}])
+        with self.assertRaises(ValueError):
+            build_candidate(options={'DEBUG': True})
+        with self.assertRaises(ValueError):
+            build_candidate(setpoints={'temperature': 168.0})
+        self.assertEqual(build_candidate(self.settings, setpoints={'temperature': 168.0})['setpoints'][0], 168.0)
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.models import Batch, BatchParameter, ComputerVisionData, DefectRiskModel, ProductionLine, default_line_id
+from api.risk import get_risk_model, score_readings, train_line, vision_labels
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _parameters(batch, count, seed=0, offset=0):
+    temperatures = np.random.default_rng(seed).normal(170.0, 6.0, count)
+    return [
+        BatchParameter(batch=batch, timestamp=START + timedelta(seconds=offset + index), temperature=temperature,
+                       pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0,
+                       is_defect=not 160.0 <= temperature <= 180.0)
+        for index, temperature in enumerate(temperatures)
+    ]
+
+
+@override_settings(BATCH_COUNTER_SHARDS=0, RISK_VISION_WINDOW=1.0)
+class RiskModelTests(TestCase):
+    """Обучение модели риска по измерениям партий и оценка риска"""
+
+    def setUp(self):
+        cache.clear()
+        self.line = ProductionLine.objects.get(pk=default_line_id())
+        self.batch = Batch.objects.create(line=self.line, batch_number='Q1')
+
+    def test_training_is_incremental(self):
+        self.assertIsNone(score_readings(self.line.pk, [[170.0, 2.5, 60.0, 2.0]], [0.0]))
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 500))
+
+        self.assertEqual(train_line(self.line.pk), 500)
+        self.assertEqual(train_line(self.line.pk), 0)
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 100, seed=1, offset=500))
+        self.assertEqual(train_line(self.line.pk), 100)
+
+        record = DefectRiskModel.objects.get(line=self.line)
+        self.assertEqual(record.samples, 600)
+        self.assertEqual(record.positives, BatchParameter.objects.filter(is_defect=True).count())
+        self.assertTrue(get_risk_model(self.line.pk).trained)
+
+    @override_settings(RISK_LEARNING_RATE=1.0)
+    def test_risk_grows_with_deviation(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 2000))
+        train_line(self.line.pk)
+
+        # Каждое измерение оценивается отдельно, без приращений
+        risks = [
+            score_readings(self.line.pk, [[temperature, 2.5, 60.0, 2.0]], [0.0])[0]
+            for temperature in (156.0, 170.0, 184.0)
+        ]
+
+        self.assertLess(risks[1], 0.2)
+        self.assertGreater(risks[0], 0.5)
+        self.assertGreater(risks[2], 0.5)
+
+    def test_ingest_returns_risk_of_trained_model(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 200))
+        train_line(self.line.pk)
+
+        response = self.client.post(f'/api/batches/{self.batch.pk}/ingest/',
+                                    [{'temperature': 170.0, 'pressure': 2.5, 'mixing_speed': 60.0,
+                                      'glazing_thickness': 2.0}], content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(0.0 <= response.data['results'][0]['defect_risk'] <= 1.0)
+
+    def test_vision_defects_label_nearby_readings(self):
+        ComputerVisionData.objects.create(batch=self.batch, timestamp=START + timedelta(seconds=10), is_defect=True)
+        ComputerVisionData.objects.create(batch=self.batch, timestamp=START + timedelta(seconds=20))
+
+        timestamps = START.timestamp() + np.array([8.5, 9.0, 10.5, 11.0, 11.5, 20.0])
+        self.assertEqual(vision_labels(self.batch.pk, timestamps).tolist(), [False, True, True, True, False, False])
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api import rollups
+from api.chunks import append_readings
+from api.models import Batch, BatchParameter, ParameterRollup, ProductionLine, default_line_id
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+COMPARED = ('count', 'defect_count', 'temperature_min', 'temperature_max', 'temperature_sum', 'pressure_sumsq')
+
+
+def _parameters(batch, count, offset=0, step=10):
+    return [
+        BatchParameter(batch=batch, timestamp=START + timedelta(seconds=offset + index * step),
+                       temperature=165.0 + index, pressure=2.0 + index * 0.01, mixing_speed=60.0,
+                       glazing_thickness=2.0, is_defect=index % 4 == 0)
+        for index in range(count)
+    ]
+
+
+def _snapshot(batch):
+    return {
+        row['minute']: tuple(round(row[name], 6) for name in COMPARED)
+        for row in ParameterRollup.objects.filter(batch=batch).values('minute', *COMPARED)
+    }
+
+
+@override_settings(PARAMETER_CHUNK_SIZE=5)
+class CatchUpTests(APITestCase):
+    """catch_up учитывает новые строки и пачки так же, как полный пересчет"""
+
+    def setUp(self):
+        cache.clear()
+        line = ProductionLine.objects.get(pk=default_line_id())
+        self.batch = Batch.objects.create(line=line, batch_number='R1')
+
+    def test_catch_up_matches_rebuild(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 20))
+        append_readings(self.batch, _parameters(self.batch, 12, offset=3))
+
+        self.assertEqual(rollups.catch_up(), 20 + 3)
+        incremental = _snapshot(self.batch)
+        rollups.rebuild(self.batch.pk)
+
+        self.assertEqual(len(incremental), 4)
+        self.assertEqual(incremental, _snapshot(self.batch))
+        self.assertEqual(sum(value[0] for value in incremental.values()), 32)
+
+    def test_catch_up_processes_only_new_readings(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 6))
+        rollups.catch_up()
+        self.assertEqual(rollups.catch_up(), 0)
+
+        # Новые измерения попадают в уже посчитанную минуту и в новую
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 3, offset=55, step=5))
+        append_readings(self.batch, _parameters(self.batch, 2, offset=61))
+
+        self.assertEqual(rollups.catch_up(), 3 + 1)
+        incremental = _snapshot(self.batch)
+        rollups.rebuild(self.batch.pk)
+        self.assertEqual(incremental, _snapshot(self.batch))
+
+    def test_trend_reads_rollups(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, 12))
+        rollups.catch_up()
+
+        response = self.client.get(f'/api/batches/{self.batch.pk}/trend/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([point['count'] for point in response.data['minutes']], [6, 6])
+        summary = response.data['summary']
+        self.assertEqual((summary['count'], summary['defect_count']), (12, 3))
+        self.assertEqual(summary['parameters']['temperature']['min'], 165.0)
+        self.assertAlmostEqual(summary['parameters']['temperature']['mean'], 170.5)
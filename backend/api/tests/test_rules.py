@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.counters import fold_counters, increment_counters
+from api.models import Batch, BatchParameter, DefectRule, ProductionLine, ProductionSettings, default_line_id
+from api.rules import CompiledRuleSet, get_rule_set, reclassify_batch, with_default_limits
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+NORMAL = [170.0, 2.5, 60.0, 2.0]
+
+
+def _rule(rule_type, parameter, min_value=None, max_value=None, **secondary):
+    return dict({
+        'rule_type': rule_type, 'parameter': parameter, 'min_value': min_value, 'max_value': max_value,
+        'secondary_parameter': None, 'secondary_min_value': None, 'secondary_max_value': None,
+    }, **secondary)
+
+
+class CompiledRuleSetTests(TestCase):
+    """Векторная проверка измерений по правилам range, rate и condition"""
+
+    def test_default_limits(self):
+        rule_set = CompiledRuleSet.default()
+        values = [NORMAL, [181.0, 2.5, 60.0, 2.0], [170.0, 2.5, 54.0, 2.0], [160.0, 3.8, 55.0, 2.8]]
+
+        self.assertEqual(rule_set.evaluate(values).tolist(), [False, True, True, False])
+        self.assertFalse(rule_set.has_rate_rules)
+
+    def test_own_range_rule_replaces_default_limit_of_its_parameter(self):
+        rules = with_default_limits([_rule('range', 'temperature', max_value=175.0)])
+        rule_set = CompiledRuleSet(rules)
+
+        self.assertEqual(len(rules), 4)
+        self.assertEqual(rule_set.evaluate([[150.0, 2.5, 60.0, 2.0], [176.0, 2.5, 60.0, 2.0]]).tolist(), [False, True])
+        # Правило без границ снимает ограничение, остальные параметры проверяются по умолчанию
+        rule_set = CompiledRuleSet(with_default_limits([_rule('range', 'pressure')]))
+        self.assertEqual(rule_set.evaluate([[170.0, 9.0, 60.0, 2.0], [170.0, 9.0, 70.0, 2.0]]).tolist(), [False, True])
+
+    def test_rate_rule_uses_previous_reading(self):
+        rule_set = CompiledRuleSet(with_default_limits([_rule('rate', 'temperature', max_value=1.0)]))
+        values = np.array([NORMAL] * 4)
+        values[:, 0] = [170.0, 170.5, 173.0, 173.5]
+        timestamps = [0.0, 1.0, 2.0, 3.0]
+
+        self.assertTrue(rule_set.has_rate_rules)
+        self.assertEqual(rule_set.evaluate(values, timestamps).tolist(), [False, False, True, False])
+        previous = ([165.0, 2.5, 60.0, 2.0], -1.0)
+        self.assertEqual(rule_set.evaluate(values, timestamps, previous).tolist(), [True, False, True, False])
+        # Без времени скорость не проверяется
+        self.assertFalse(rule_set.evaluate(values).any())
+
+    def test_condition_rule(self):
+        rule = _rule('condition', 'temperature', min_value=175.0, secondary_parameter='pressure',
+                     secondary_max_value=2.2)
+        rule_set = CompiledRuleSet(with_default_limits([rule]))
+
+        self.assertTrue(rule_set.evaluate_one({'temperature': 176.0, 'pressure': 2.1, 'mixing_speed': 60.0,
+                                               'glazing_thickness': 2.0}))
+        self.assertFalse(rule_set.evaluate_one({'temperature': 176.0, 'pressure': 2.5, 'mixing_speed': 60.0,
+                                                'glazing_thickness': 2.0}))
+        self.assertFalse(rule_set.evaluate_one({'temperature': 170.0, 'pressure': 2.1, 'mixing_speed': 60.0,
+                                                'glazing_thickness': 2.0}))
+
+    def test_rule_set_of_settings(self):
+        cache.clear()
+        production_settings = ProductionSettings.objects.create(
+            name='Правила', temperature=170.0, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0
+        )
+        DefectRule.objects.create(settings=production_settings, parameter='temperature', min_value=168.0)
+        DefectRule.objects.create(settings=production_settings, parameter='pressure', max_value=2.6,
+                                  is_enabled=False)
+
+        rule_set = get_rule_set(production_settings)
+
+        self.assertEqual(rule_set.low[0], 168.0)
+        self.assertEqual(rule_set.high[1], 3.8)
+        self.assertEqual(get_rule_set(None).high[0], 180.0)
+
+
+@override_settings(BATCH_COUNTER_SHARDS=2)
+class ReclassifyTests(TestCase):
+    """Перепроверка брака меняет счетчик партии на разность"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()),
+                                          batch_number='D1', is_active=False)
+        BatchParameter.objects.bulk_create([
+            BatchParameter(batch=self.batch, timestamp=START + timedelta(seconds=index),
+                           temperature=165.0 + index, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0,
+                           is_defect=index >= 16)
+            for index in range(20)
+        ])
+        increment_counters(self.batch.pk, 20, 4)
+
+    def test_defect_count_changes_by_delta(self):
+        rule_set = CompiledRuleSet(with_default_limits([_rule('range', 'temperature', max_value=175.0)]))
+
+        # Измерения 11-19 выше 175 градусов
+        self.assertEqual(reclassify_batch(self.batch, rule_set), 5)
+        self.assertEqual(BatchParameter.objects.filter(batch=self.batch, is_defect=True).count(), 9)
+
+        # Счетчики в частях еще не перенесены: разность к ним прибавляется
+        fold_counters(self.batch.pk)
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.total_count, self.batch.defect_count), (20, 9))
+        self.assertEqual(reclassify_batch(self.batch, rule_set), 0)
@@ -0,0 +1,101 @@
+import numpy as np
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api.models import Batch, Notification, ProductionLine, ProductionSettings, default_line_id
+from api.spc import ControlChart, drift_message, get_control_chart
+
+SETPOINTS = [170.0, 2.5, 60.0, 2.0]
+LOW = [160.0, 2.0, 55.0, 1.8]
+HIGH = [180.0, 3.8, 65.0, 2.8]
+
+
+def _readings(count, shift=0.0, seed=0):
+    noise = np.random.default_rng(seed).normal(0, 0.5, (count, 4)) * [1, 0.01, 0.1, 0.01]
+    values = np.tile(SETPOINTS, (count, 1)) + noise
+    values[:, 0] += shift
+    return values
+
+
+class ControlChartTests(SimpleTestCase):
+    """EWMA и CUSUM по пачкам измерений"""
+
+    def _chart(self):
+        return ControlChart(1, SETPOINTS, LOW, HIGH, options={'SPC_BASELINE_READINGS': 30})
+
+    def test_batch_update_matches_one_by_one(self):
+        values = np.vstack([_readings(100), _readings(100, shift=1.0, seed=1)])
+        whole, single = self._chart(), self._chart()
+
+        whole.update(values)
+        for row in values:
+            single.update(row)
+
+        np.testing.assert_allclose(whole.ewma, single.ewma)
+        np.testing.assert_allclose(whole.cusum_high, single.cusum_high)
+        np.testing.assert_allclose(whole.cusum_low, single.cusum_low)
+        self.assertEqual(whole.drift.tolist(), single.drift.tolist())
+        self.assertEqual(whole.steps, 170)
+
+    def test_drift_is_reported_once_when_it_starts(self):
+        chart = self._chart()
+        self.assertEqual(chart.update(_readings(30)), {})
+        self.assertEqual(chart.as_dict()['parameters']['temperature']['sigma'], chart.sigma[0])
+
+        self.assertEqual(chart.update(_readings(50, seed=1)), {})
+        self.assertEqual(chart.update(_readings(50, shift=-2.0, seed=2)), {('temperature', 'down'): 1})
+        self.assertEqual(chart.as_dict()['parameters']['temperature']['status'], 'drift_down')
+        self.assertEqual(chart.as_dict()['parameters']['pressure']['status'], 'ok')
+        # Продолжающийся дрейф не дает новых сигналов
+        self.assertEqual(chart.update(_readings(20, shift=-2.0, seed=3)), {})
+
+    def test_baseline_before_monitoring(self):
+        chart = ControlChart(1, options={'SPC_BASELINE_READINGS': 30})
+        chart.update(_readings(10))
+
+        state = chart.as_dict()
+        self.assertEqual(state['parameters']['temperature']['status'], 'baseline')
+        self.assertIsNone(state['parameters']['temperature']['ewma_upper'])
+        self.assertIsNone(state['parameters']['temperature']['spec_min'])
+
+        chart.update(_readings(20, seed=1))
+        # Без настройки целью служит среднее базового участка
+        self.assertAlmostEqual(chart.target[0], _readings(30)[:, 0].mean(), delta=0.5)
+
+
+@override_settings(SPC_BASELINE_READINGS=30, BATCH_COUNTER_SHARDS=0, ROLLUP_CATCH_UP_DELAY=600)
+class ControlChartIngestTests(TestCase):
+    """Карты партии обновляются при записи измерений"""
+
+    def setUp(self):
+        cache.clear()
+        production_settings = ProductionSettings.objects.create(name='SPC', temperature=170.0, pressure=2.5,
+                                                                mixing_speed=60.0, glazing_thickness=2.0)
+        line = ProductionLine.objects.get(pk=default_line_id())
+        line.active_settings = production_settings
+        line.save()
+        self.batch = Batch.objects.create(line=line, batch_number='P1')
+
+    def _ingest(self, values):
+        readings = [dict(zip(('temperature', 'pressure', 'mixing_speed', 'glazing_thickness'), row)) for row in values]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/batches/{self.batch.pk}/ingest/', readings,
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_drift_warning_and_state_recovery(self):
+        self._ingest(_readings(60))
+        self._ingest(_readings(40, shift=3.0, seed=1))
+
+        message = drift_message('temperature', 'up', 'P1')
+        self.assertTrue(Notification.objects.filter(batch=self.batch, message=message).exists())
+        response = self.client.get(f'/api/batches/{self.batch.pk}/spc/')
+        self.assertEqual(response.data['readings'], 100)
+        self.assertEqual(response.data['parameters']['temperature']['status'], 'drift_up')
+        self.assertEqual(response.data['parameters']['temperature']['target'], 170.0)
+
+        # Без кэша состояние восстанавливается по истории партии
+        cache.clear()
+        chart = get_control_chart(self.batch)
+        self.assertEqual(chart.readings, 100)
+        self.assertEqual(chart.as_dict()['parameters']['temperature']['status'], 'drift_up')
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from api.models import Batch, BatchParameter, ProductionLine, default_line_id
+from api.stats import get_batch_statistics
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _parameters(batch, temperatures, offset=0):
+    return [
+        BatchParameter(batch=batch, timestamp=START + timedelta(seconds=(offset + index) * 10),
+                       temperature=temperature, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0,
+                       is_defect=not 160.0 <= temperature <= 180.0)
+        for index, temperature in enumerate(temperatures)
+    ]
+
+
+class BatchStatisticsTests(APITestCase):
+    """Инкрементальная статистика партии и итог завершенной партии"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()),
+                                          batch_number='T1', start_time=START)
+        self.temperatures = np.random.default_rng(5).normal(170.0, 4.0, 200)
+
+    def test_incremental_update_matches_full_calculation(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, self.temperatures[:120]))
+        get_batch_statistics(self.batch)
+        BatchParameter.objects.bulk_create(_parameters(self.batch, self.temperatures[120:], offset=120))
+        incremental = get_batch_statistics(self.batch)['parameters']['temperature']
+
+        self.assertEqual(incremental['count'], 200)
+        self.assertAlmostEqual(incremental['mean'], self.temperatures.mean())
+        self.assertAlmostEqual(incremental['std'], self.temperatures.std())
+        self.assertEqual(incremental['max'], self.temperatures.max())
+        self.assertAlmostEqual(incremental['percentiles']['p50'], np.median(self.temperatures), delta=0.2)
+        cache.clear()
+        full = get_batch_statistics(self.batch)['parameters']['temperature']
+        self.assertEqual(full['percentiles'], incremental['percentiles'])
+        self.assertAlmostEqual(full['in_spec_fraction'], incremental['in_spec_fraction'])
+
+    def test_in_spec_fraction_by_time(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, [170.0, 185.0, 170.0, 170.0]))
+        Batch.objects.filter(pk=self.batch.pk).update(is_active=False, end_time=START + timedelta(seconds=40))
+        self.batch.refresh_from_db()
+
+        response = self.client.get(f'/api/batches/{self.batch.pk}/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['count'], response.data['defect_count']), (4, 1))
+        self.assertEqual(response.data['duration_seconds'], 40.0)
+        self.assertEqual(response.data['in_spec_fraction'], 0.75)
+
+    def test_finished_batch_result_is_dropped_on_save(self):
+        BatchParameter.objects.bulk_create(_parameters(self.batch, [170.0, 171.0]))
+        self.batch.is_active = False
+        self.batch.end_time = START + timedelta(seconds=20)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.save()
+        self.assertEqual(get_batch_statistics(self.batch)['count'], 2)
+
+        # Итог завершенной партии берется из кэша
+        BatchParameter.objects.filter(batch=self.batch).update(temperature=175.0)
+        self.assertEqual(get_batch_statistics(self.batch)['parameters']['temperature']['max'], 171.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.save()
+        self.assertEqual(get_batch_statistics(self.batch)['parameters']['temperature']['max'], 175.0)
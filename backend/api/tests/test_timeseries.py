@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api import rollups
+from api.models import Batch, BatchParameter, ProductionLine, default_line_id
+from api.timeseries import iter_parameter_blocks, load_parameter_arrays
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+@override_settings(ROLLUP_CATCH_UP_DELAY=600)
+class SeriesTests(APITestCase):
+    """Чтение измерений блоками столбцов и прореженные ряды для графика"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(line=ProductionLine.objects.get(pk=default_line_id()),
+                                          batch_number='S1', is_active=False)
+        # Два часа измерений раз в 10 секунд, в обратном порядке записи
+        BatchParameter.objects.bulk_create([
+            BatchParameter(batch=self.batch, timestamp=START + timedelta(seconds=index * 10),
+                           temperature=160.0 + index % 20, pressure=2.5, mixing_speed=60.0, glazing_thickness=2.0,
+                           is_defect=index % 20 == 0)
+            for index in reversed(range(720))
+        ])
+        rollups.catch_up()
+
+    def test_blocks_are_ordered_by_time(self):
+        queryset = BatchParameter.objects.filter(batch=self.batch)
+        blocks = list(iter_parameter_blocks(queryset, block_size=100))
+
+        self.assertEqual([len(block['id']) for block in blocks], [100] * 7 + [20])
+        arrays = load_parameter_arrays(queryset)
+        timestamps = np.concatenate([block['timestamp'] for block in blocks])
+        self.assertEqual(timestamps.tolist(), arrays['timestamp'].tolist())
+        self.assertTrue((np.diff(timestamps) == 10).all())
+        self.assertEqual(int(arrays['is_defect'].sum()), 36)
+
+    def test_wide_buckets_use_minute_rollups(self):
+        response = self.client.get(f'/api/parameters/series/?batch_id={self.batch.pk}&points=10')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resolution'], 'minute')
+        self.assertEqual(response.data['total'], 720)
+        self.assertEqual(sum(response.data['counts']), 720)
+        self.assertEqual(len(response.data['timestamps']), 10)
+        temperature = response.data['series']['temperature']
+        self.assertEqual((min(temperature['min']), max(temperature['max'])), (160.0, 179.0))
+        self.assertAlmostEqual(sum(temperature['avg']) / 10, 169.5, places=0)
+
+    def test_narrow_buckets_read_measurements(self):
+        until = (START + timedelta(minutes=10)).isoformat()
+        url = f'/api/parameters/series/?batch_id={self.batch.pk}&points=100&since={START.isoformat()}&until={until}'
+        response = self.client.get(url.replace('+', '%2B'))
+
+        self.assertEqual(response.data['resolution'], 'reading')
+        self.assertEqual(response.data['total'], 61)
+        self.assertEqual(response.data['timestamps'][0], int(START.timestamp() * 1000) + 3000)
+
+    def test_lttb_and_errors(self):
+        response = self.client.get(f'/api/parameters/series/?batch_id={self.batch.pk}&method=lttb&points=50')
+
+        self.assertEqual(response.data['total'], 720)
+        self.assertEqual(len(response.data['series']['temperature']['timestamps']), 50)
+        self.assertEqual(self.client.get('/api/parameters/series/').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/parameters/series/?batch_id={self.batch.pk}&method=x').status_code, 400)
+        empty = self.client.get('/api/parameters/series/?batch_id=999999')
+        self.assertEqual((empty.status_code, empty.data['total']), (200, 0))
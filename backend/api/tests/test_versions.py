@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from api.counters import increment_counters
+from api.models import Batch, ProductionLine, default_line_id
+from api.versions import IMMUTABLE_CACHE_CONTROL, get_version
+
+
+@override_settings(BATCH_COUNTER_SHARDS=0)
+class ConditionalGetTests(APITestCase):
+    """ETag и 304 для списка и завершенной партии"""
+
+    def setUp(self):
+        cache.clear()
+        self.line = ProductionLine.objects.get(pk=default_line_id())
+        self.active = Batch.objects.create(line=self.line, batch_number='E1')
+        self.finished = Batch.objects.create(line=self.line, batch_number='E0', is_active=False,
+                                             end_time=timezone.now(), total_count=10, defect_count=2)
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/batches/')
+        etag = response['ETag']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertNotIn('Last-Modified', response)
+        repeated = self.client.get('/api/batches/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated['ETag'], etag)
+        # Ответ зависит от параметров запроса
+        self.assertEqual(self.client.get('/api/batches/?line_id=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_saved_batch_changes_list_etag(self):
+        etag = self.client.get('/api/batches/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.finished.batch_number = 'E0-1'
+            self.finished.save()
+
+        response = self.client.get('/api/batches/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_counters_change_list_etag_without_version_bump(self):
+        token = get_version('batches')
+        etag = self.client.get('/api/batches/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            increment_counters(self.active.pk, 5, 1)
+
+        self.assertEqual(get_version('batches'), token)
+        response = self.client.get('/api/batches/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        counts = {item['id']: item['total_count'] for item in response.data}
+        self.assertEqual(counts[self.active.pk], 5)
+
+    def test_if_modified_since_alone_is_ignored(self):
+        response = self.client.get('/api/batches/', HTTP_IF_MODIFIED_SINCE='Wed, 21 Oct 2099 07:28:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_finished_batch_is_immutable_until_counters_change(self):
+        # Без вложенных записей ответ по завершенной партии не меняется
+        url = f'/api/batches/{self.finished.pk}/?expand='
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Перепроверка брака меняет счетчики завершенной партии
+        Batch.objects.filter(pk=self.finished.pk).update(defect_count=3)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['defect_count'], 3)
+
+    def test_finished_batch_with_nested_records_is_revalidated(self):
+        url = f'/api/batches/{self.finished.pk}/'
+        response = self.client.get(url)
+
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_active_batch_is_not_validated(self):
+        response = self.client.get(f'/api/batches/{self.active.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
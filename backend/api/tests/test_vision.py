@@ -0,0 +1,113 @@
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import vision
+from api.cache import invalidate_active_batch
+from api.models import Batch, ComputerVisionData, ProductionLine, default_line_id
+from api.vision import FakeDetector, Frame, SyntheticFrameSource, VisionPipeline, get_job, new_job_id
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class BackpressureTests(SimpleTestCase):
+    """Ограниченная очередь конвейера вытесняет самые старые кадры"""
+
+    def test_full_queue_drops_oldest_frame(self):
+        pipeline = VisionPipeline(FakeDetector(seed=1), queue_size=2)
+        jobs = [new_job_id() for _ in range(4)]
+
+        accepted = [pipeline.submit(Frame(1, job_id=job_id)) for job_id in jobs]
+
+        self.assertEqual(accepted, [True, True, False, False])
+        stats = pipeline.stats()
+        self.assertEqual((stats['submitted'], stats['dropped'], stats['queued']), (4, 2, 2))
+        self.assertEqual([get_job(job_id)['status'] for job_id in jobs], ['dropped', 'dropped', 'queued', 'queued'])
+        queued = [pipeline.frames.get_nowait().job_id for _ in range(2)]
+        self.assertEqual(queued, jobs[2:])
+
+
+class PipelineTests(TransactionTestCase):
+    """Прогон конвейера с FakeDetector без камеры и модели"""
+
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(batch_number='V1', is_active=True)
+
+    def test_processed_frames_are_written_and_jobs_resolved(self):
+        pipeline = VisionPipeline(FakeDetector(seed=1, batch_latency=0, frame_latency=0),
+                                  queue_size=64, workers=2, batch_size=4, flush_interval=0.05)
+        jobs = [new_job_id() for _ in range(10)]
+        pipeline.start()
+        for job_id in jobs:
+            pipeline.submit(Frame(self.batch.pk, job_id=job_id))
+        pipeline.stop()
+
+        self.assertEqual(ComputerVisionData.objects.filter(batch=self.batch).count(), 10)
+        stats = pipeline.stats()
+        self.assertEqual((stats['processed'], stats['written'], stats['dropped']), (10, 10, 0))
+        ids = {get_job(job_id)['id'] for job_id in jobs}
+        self.assertEqual(ids, set(ComputerVisionData.objects.values_list('id', flat=True)))
+
+    def test_slow_detector_drops_frames_instead_of_queueing(self):
+        pipeline = VisionPipeline(FakeDetector(seed=1, batch_latency=0.05, frame_latency=0),
+                                  queue_size=2, workers=1, batch_size=1, flush_interval=0.05)
+        jobs = [new_job_id() for _ in range(20)]
+        pipeline.start()
+        for job_id in jobs:
+            pipeline.submit(Frame(self.batch.pk, job_id=job_id))
+        pipeline.stop()
+
+        stats = pipeline.stats()
+        self.assertGreater(stats['dropped'], 0)
+        self.assertEqual(stats['written'] + stats['dropped'], 20)
+        self.assertEqual(ComputerVisionData.objects.count(), stats['written'])
+        statuses = [get_job(job_id)['status'] for job_id in jobs]
+        self.assertEqual(statuses.count('dropped'), stats['dropped'])
+        self.assertEqual(statuses.count('done'), stats['written'])
+
+
+@override_settings(VISION_CAMERA_FPS=50.0, VISION_DETECTOR='api.vision.FakeDetector')
+class CameraTests(TransactionTestCase):
+    """Генератор кадров не пишет данные в остановленную партию"""
+
+    def setUp(self):
+        cache.clear()
+        self.line = ProductionLine.objects.get(pk=default_line_id())
+        self.batch = Batch.objects.create(line=self.line, batch_number='V2', is_active=True)
+
+    def tearDown(self):
+        vision.stop_camera(self.line.pk)
+        vision.get_pipeline().stop()
+
+    def test_stop_production_stops_camera(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/computer-vision/start_camera/').status_code, 200)
+        source = vision._sources[self.line.pk]
+
+        response = client.post(f'/api/batches/{self.batch.pk}/stop_production/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.line.pk, vision._sources)
+        self.assertTrue(source.stopped.is_set())
+
+    def test_source_stops_when_batch_is_stopped_elsewhere(self):
+        pipeline = VisionPipeline(FakeDetector(seed=1), queue_size=8)
+        source = SyntheticFrameSource(pipeline, self.batch.pk, fps=100.0, line_id=self.line.pk, check_interval=0.02)
+        source.start()
+        self.assertTrue(_wait(lambda: pipeline.submitted > 0))
+
+        Batch.objects.filter(pk=self.batch.pk).update(is_active=False)
+        invalidate_active_batch(self.line.pk)
+
+        self.assertTrue(_wait(lambda: not source.thread.is_alive()))
+        self.assertTrue(source.stopped.is_set())
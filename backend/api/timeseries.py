@@ -0,0 +1,62 @@
+"""
+Загрузка измерений партии в виде столбцов NumPy
+"""
+from itertools import islice
+
+import numpy as np
+
+from .models import PARAMETER_FIELDS
+
+# Количество строк, которые одновременно находятся в памяти в виде кортежей
+BLOCK_SIZE = 10000
+
+
+def empty_parameter_arrays():
+    arrays = {field: np.empty(0, dtype=np.float64) for field in PARAMETER_FIELDS}
+    arrays['id'] = np.empty(0, dtype=np.int64)
+    arrays['timestamp'] = np.empty(0, dtype=np.float64)
+    arrays['is_defect'] = np.empty(0, dtype=bool)
+    return arrays
+
+
+def iter_parameter_blocks(queryset, block_size=BLOCK_SIZE):
+    """
+    Измерения выборки блоками столбцов по block_size строк в порядке
+    (время, id). Строки читаются курсором (iterator), поэтому в памяти
+    одновременно находится только один блок кортежей.
+    """
+    rows = (
+        queryset.order_by('timestamp', 'id')
+        .values_list('id', 'timestamp', *PARAMETER_FIELDS, 'is_defect')
+        .iterator(chunk_size=block_size)
+    )
+    while True:
+        block = list(islice(rows, block_size))
+        if not block:
+            return
+        count = len(block)
+        columns = list(zip(*block))
+        arrays = {
+            'id': np.array(columns[0], dtype=np.int64),
+            'timestamp': np.fromiter((value.timestamp() for value in columns[1]), dtype=np.float64, count=count),
+            'is_defect': np.array(columns[-1], dtype=bool),
+        }
+        for position, field in enumerate(PARAMETER_FIELDS, start=2):
+            arrays[field] = np.array(columns[position], dtype=np.float64)
+        yield arrays
+
+
+def load_parameter_arrays(queryset):
+    """
+    Выгружает измерения в отдельные массивы по столбцам, упорядоченные по времени.
+    Время возвращается в секундах Unix (float64), вместе со столбцами
+    возвращаются первичные ключи измерений (id).
+    Из базы выбираются только нужные столбцы, без создания экземпляров моделей,
+    блоками (iter_parameter_blocks).
+    """
+    blocks = list(iter_parameter_blocks(queryset))
+    if not blocks:
+        return empty_parameter_arrays()
+    if len(blocks) == 1:
+        return blocks[0]
+    return {name: np.concatenate([block[name] for block in blocks]) for name in blocks[0]}
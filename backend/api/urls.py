@@ -1,18 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    BatchViewSet, BatchParameterViewSet,
-    ProductionSettingsViewSet, NotificationViewSet,
+    BatchViewSet, BatchParameterViewSet, ProductionLineViewSet,
+    ProductionSettingsViewSet, DefectRuleViewSet, NotificationViewSet,
     ComputerVisionViewSet
 )
+from .streams import event_stream, export_data, frame_file
 
 router = DefaultRouter()
+router.register(r'lines', ProductionLineViewSet)
 router.register(r'batches', BatchViewSet)
 router.register(r'parameters', BatchParameterViewSet)
 router.register(r'settings', ProductionSettingsViewSet)
+router.register(r'rules', DefectRuleViewSet)
 router.register(r'notifications', NotificationViewSet)
 router.register(r'computer-vision', ComputerVisionViewSet)
 
 urlpatterns = [
+    path('events/', event_stream, name='event-stream'),
+    path('export/<str:kind>/', export_data, name='export-data'),
+    path('frames/<str:image_hash>/', frame_file, name='frame-file'),
+    path('frames/<str:image_hash>/thumbnail/', frame_file, {'thumbnail': True}, name='frame-thumbnail'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
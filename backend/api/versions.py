@@ -0,0 +1,119 @@
+"""
+Версии ресурсов для условных GET-запросов (ETag, 304).
+
+Для каждого ресурса (settings, batches, notifications) в кэше хранится
+случайный токен. Токен меняется после фиксации любой записи, влияющей
+на ресурс (bump_version), поэтому ETag ответа можно вычислить до
+выполнения запроса к базе и сериализации: при совпадении
+с If-None-Match клиент получает 304 Not Modified.
+
+Last-Modified не отдается: время изменения в нем округляется до секунды,
+и If-Modified-Since давал бы 304 после изменения в ту же секунду.
+
+Токены хранятся в общем для процессов кэше (см. CACHES), поэтому записи
+фоновых команд (run_acquisition и др.) меняют их так же, как запросы
+к API. Срок хранения токенов (VERSION_CACHE_TIMEOUT) ограничивает
+рассинхронизацию, если кэш все же локальный: после его истечения
+создается новый токен и клиенты перечитывают данные. Ответы без
+Cache-Control получают no-cache: браузер каждый раз проверяет их
+условным запросом.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+
+VERSION_KEY = 'api:version_token:{resource}'
+
+# Завершенная партия без вложенных записей не меняется, такой ответ
+# можно хранить сколько угодно
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _timeout():
+    return getattr(settings, 'VERSION_CACHE_TIMEOUT', getattr(settings, 'ACTIVE_CACHE_TIMEOUT', 60))
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def get_version(resource):
+    """Токен ресурса; создается при первом обращении"""
+    key = VERSION_KEY.format(resource=resource)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), _timeout())
+        version = cache.get(key) or _new_version()
+    return version
+
+
+def bump_version(*resources):
+    """Меняет токены ресурсов после фиксации текущей транзакции"""
+    def bump():
+        version = _new_version()
+        cache.set_many({VERSION_KEY.format(resource=resource): version for resource in resources}, _timeout())
+
+    transaction.on_commit(bump)
+
+
+def make_etag(request, tokens):
+    """ETag ответа: токены ресурсов, путь с параметрами запроса и Accept"""
+    source = '|'.join([*tokens, request.get_full_path(), request.META.get('HTTP_ACCEPT', '')])
+    return '"%s"' % hashlib.md5(source.encode('utf-8')).hexdigest()
+
+
+def conditional_get(view_method):
+    """
+    Отвечает 304 на условный GET-запрос, не вызывая view_method,
+    если версии ресурсов не изменились (см. ConditionalGetMixin)
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        validators = None
+        if request.method in ('GET', 'HEAD'):
+            validators = self.get_conditional_validators(request, *args, **kwargs)
+        if validators is None:
+            return view_method(self, request, *args, **kwargs)
+
+        etag, cache_control = validators
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control or 'no-cache'
+        return response
+
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для list и retrieve.
+
+    version_resources - ресурсы, от которых зависят ответы представления.
+    Другие действия подключаются декоратором conditional_get, а для особых
+    случаев переопределяется get_conditional_validators.
+    """
+    version_resources = ()
+
+    def get_conditional_validators(self, request, *args, **kwargs):
+        """(ETag, Cache-Control) или None, если ответ нельзя проверить заранее"""
+        if not self.version_resources:
+            return None
+        tokens = [get_version(resource) for resource in self.version_resources]
+        return make_etag(request, tokens), None
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -1,80 +1,276 @@
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import MethodNotAllowed, NotFound, ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-import random
-from .models import Batch, BatchParameter, ProductionSettings, Notification, ComputerVisionData
+from rest_framework.reverse import reverse
+from . import vision
+from .acquisition import RandomWalkSource, initial_parameters
+from .archive import batch_time_range, iter_batch_blocks, load_batch_arrays
+from .chunks import get_chunk_parameter, chunk_parameters, is_chunk_reading, latest_parameter
+from .cache import (
+    get_active_batch, get_active_settings, get_active_setpoints, get_latest_parameter,
+    invalidate_active_batch, invalidate_active_settings, resolve_line_id
+)
+from .counters import fold_counters, increment_counters
+from .downsampling import BucketAggregator, lttb
+from .ingest import defect_message, ingest_readings, save_parameter, MAX_READINGS_PER_REQUEST
+from .models import (
+    Batch, BatchParameter, ProductionLine, ProductionSettings, DefectRule, Notification, ComputerVisionData,
+    ParameterRollup, SetpointAdjustment, DEFAULT_LINE_CODE, PARAMETER_FIELDS
+)
+from .notifications import notify
+from .pagination import TimestampCursorPagination, filter_time_window, parse_time_param
+from .parsers import NDJSONParser
+from .risk import get_risk_model, score_parameter
+from .rollups import minute_columns, overview, summarize
+from .rules import get_rule_set
 from .serializers import (
     BatchSerializer, BatchListSerializer, BatchParameterSerializer,
-    ProductionSettingsSerializer, NotificationSerializer, ComputerVisionDataSerializer
+    ProductionLineSerializer, ProductionSettingsSerializer, DefectRuleSerializer, NotificationSerializer,
+    ComputerVisionDataSerializer, SetpointAdjustmentSerializer
 )
+from .spc import forget_control_chart, get_control_chart, reset_control_chart
+from .stats import get_batch_statistics
+from .versions import ConditionalGetMixin, IMMUTABLE_CACHE_CONTROL, bump_version, conditional_get, get_version, make_etag
+
+# Ограничения на количество точек в прореженных рядах для графика
+SERIES_DEFAULT_POINTS = 1000
+SERIES_MIN_POINTS = 10
+SERIES_MAX_POINTS = 2000
+# Начиная с этой ширины интервала (секунды) ряд minmax строится по поминутным агрегатам
+SERIES_ROLLUP_WIDTH = 60
+
+# Количество последних изменений уставок в ответе /lines/{id}/setpoints/
+SETPOINT_ADJUSTMENTS_DEFAULT = 50
+SETPOINT_ADJUSTMENTS_MAX = 1000
+
+# Максимальная частота кадров генератора, запускаемого start_camera
+MAX_CAMERA_FPS = 120
+
+def get_line_id(request):
+    """
+    Линия из параметра line_id (в строке запроса или в теле запроса).
+    None означает линию по умолчанию
+    """
+    value = request.query_params.get('line_id')
+    if value is None and hasattr(request.data, 'get'):
+        value = request.data.get('line_id')
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({"line_id": "Параметр line_id должен быть целым числом"})
+
+def get_line(request):
+    """Линия из параметра line_id или линия по умолчанию; 404, если линии нет"""
+    return get_object_or_404(ProductionLine, pk=resolve_line_id(get_line_id(request)))
 
-class BatchViewSet(viewsets.ModelViewSet):
+class ProductionLineViewSet(viewsets.ModelViewSet):
+    """
+    API для управления производственными линиями
+    """
+    queryset = ProductionLine.objects.all()
+    serializer_class = ProductionLineSerializer
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_active_settings(serializer.instance.pk)
+    
+    @action(detail=True, methods=['get'])
+    def risk_model(self, request, pk=None):
+        """
+        Состояние модели риска брака линии: число учтенных измерений,
+        доля брака и веса признаков (в единицах σ)
+        """
+        line = self.get_object()
+        return Response(get_risk_model(line.pk).as_dict())
+    
+    @action(detail=True, methods=['get'])
+    def setpoints(self, request, pk=None):
+        """
+        Уставки линии: значения активной настройки (target), действующие
+        уставки с поправками регулятора (setpoints) и последние изменения
+        уставок (adjustments, не больше limit)
+        """
+        line = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', SETPOINT_ADJUSTMENTS_DEFAULT))
+        except ValueError:
+            return Response(
+                {"detail": "Параметр limit должен быть целым числом"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, SETPOINT_ADJUSTMENTS_MAX))
+        production_settings = get_active_settings(line.pk)
+        adjustments = SetpointAdjustment.objects.filter(line=line).order_by('-timestamp', '-id')[:limit]
+        return Response({
+            'settings': production_settings.pk if production_settings else None,
+            'target': {field: getattr(production_settings, field) for field in PARAMETER_FIELDS} if production_settings else None,
+            'setpoints': get_active_setpoints(line.pk),
+            'adjustments': SetpointAdjustmentSerializer(adjustments, many=True).data,
+        })
+
+class BatchViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API для управления партиями протеиновых батончиков
     """
     queryset = Batch.objects.all()
+    version_resources = ('batches',)
+    # Ресурсы, версии которых меняются вместе с вложенными записями партии
+    nested_version_resources = {
+        'parameters': 'batches',
+        'notifications': 'notifications',
+        'vision_data': 'batches',
+    }
+    
+    def get_conditional_validators(self, request, *args, **kwargs):
+        if self.action == 'list':
+            # Счетчики меняются с каждым измерением и версию партий не меняют
+            # (иначе каждое измерение сбрасывало бы ETag всех партий); счетчики
+            # активных партий входят в ETag списка сами
+            counters = Batch.objects.filter(is_active=True).order_by('pk').values_list(
+                'pk', 'total_count', 'defect_count'
+            )
+            tokens = [get_version('batches')] + [':'.join(map(str, row)) for row in counters]
+            return make_etag(request, tokens), None
+        if self.action != 'retrieve':
+            return super().get_conditional_validators(request, *args, **kwargs)
+        # Активная партия меняется с каждым измерением; завершенная не меняется,
+        # кроме перепроверки брака, поэтому счетчики входят в ETag
+        pk = str(kwargs.get('pk', ''))
+        if not pk.isdigit():
+            return None
+        row = Batch.objects.filter(pk=pk, is_active=False).values_list('end_time', 'total_count', 'defect_count').first()
+        if row is None or row[0] is None:
+            return None
+        end_time, total_count, defect_count = row
+        tokens = [pk, end_time.isoformat(), str(total_count), str(defect_count)]
+        relations = BatchSerializer.expanded_relations(self.get_serializer_context())
+        if not relations:
+            return make_etag(request, tokens), IMMUTABLE_CACHE_CONTROL
+        
+        # Вложенные записи меняются и после завершения партии (прочтение
+        # уведомлений, перенос в архив): в ETag входят версии их ресурсов,
+        # а ответ перепроверяется при каждом запросе
+        resources = sorted({self.nested_version_resources[name] for name in relations})
+        etag = make_etag(request, tokens + [get_version(resource) for resource in resources])
+        return etag, 'no-cache'
     
     def get_serializer_class(self):
         if self.action == 'list':
             return BatchListSerializer
         return BatchSerializer
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action != 'list':
+            context.update(BatchSerializer.context_from_query_params(self.request.query_params))
+        return context
+    
+    def get_queryset(self):
+        queryset = Batch.objects.all()
+        line_id = get_line_id(self.request) if self.action == 'list' else None
+        if line_id is not None:
+            queryset = queryset.filter(line_id=line_id)
+        if self.action == 'retrieve':
+            queryset = BatchSerializer.prefetch_latest(queryset, self.get_serializer_context())
+        return queryset
+    
+    def _save(self, save, serializer):
+        # Проверка в BatchSerializer.validate не исключает одновременного
+        # запуска: вторую активную партию линии отклоняет ограничение базы
+        try:
+            with transaction.atomic():
+                save(serializer)
+        except IntegrityError:
+            raise ValidationError({'is_active': ['На линии уже есть активная партия.']})
+        invalidate_active_batch(serializer.instance.line_id)
+    
+    def perform_create(self, serializer):
+        self._save(super().perform_create, serializer)
+    
+    def perform_update(self, serializer):
+        self._save(super().perform_update, serializer)
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_active_batch()
+    
     @action(detail=False, methods=['post'])
     def start_production(self, request):
         """
-        Запуск производства новой партии
+        Запуск производства новой партии на линии (line_id, по умолчанию основная линия)
         """
-        # Завершаем все активные партии
-        active_batches = Batch.objects.filter(is_active=True)
-        for batch in active_batches:
-            batch.is_active = False
-            batch.end_time = timezone.now()
-            batch.save()
-            
-            # Создаем уведомление о завершении партии
-            Notification.objects.create(
-                batch=batch,
-                message=f"Партия {batch.batch_number} завершена",
-                notification_type='info'
+        line = get_line(request)
+        batch_number = f"B{timezone.now().strftime('%Y%m%d%H%M%S')}"
+        if line.code != DEFAULT_LINE_CODE:
+            batch_number = f"{batch_number}-{line.code}"
+        
+        try:
+            with transaction.atomic():
+                # Блокируется только строка своей линии: запуски на других линиях не ждут
+                line = ProductionLine.objects.select_for_update().get(pk=line.pk)
+                
+                # Завершаем активную партию линии одним запросом
+                active_batches = list(Batch.objects.filter(line=line, is_active=True))
+                Batch.objects.filter(pk__in=[batch.pk for batch in active_batches]).update(
+                    is_active=False,
+                    end_time=timezone.now()
+                )
+                bump_version('batches')
+                for batch in active_batches:
+                    fold_counters(batch.pk)
+                    forget_control_chart(batch.pk)
+                    
+                    # Создаем уведомление о завершении партии
+                    notify(batch, f"Партия {batch.batch_number} завершена", 'info')
+                
+                # Создаем новую партию
+                batch = Batch.objects.create(
+                    line=line,
+                    batch_number=batch_number,
+                    start_time=timezone.now(),
+                    is_active=True
+                )
+        except IntegrityError:
+            return Response(
+                {"detail": f"Партия {batch_number} уже существует"},
+                status=status.HTTP_409_CONFLICT
             )
         
-        # Создаем новую партию
-        batch_number = f"B{timezone.now().strftime('%Y%m%d%H%M%S')}"
-        batch = Batch.objects.create(
-            batch_number=batch_number,
-            start_time=timezone.now(),
-            is_active=True
-        )
+        invalidate_active_batch(line.pk)
+        # Генератор кадров прежней партии линии останавливается
+        vision.stop_camera(line.pk)
         
         # Создаем уведомление о запуске партии
-        Notification.objects.create(
-            batch=batch,
-            message=f"Партия {batch.batch_number} запущена",
-            notification_type='success'
-        )
+        notify(batch, f"Партия {batch.batch_number} запущена", 'success')
         
         # Генерируем начальные параметры
-        settings = ProductionSettings.objects.filter(is_active=True).first()
+        settings = get_active_settings(line.pk)
         if settings:
-            BatchParameter.objects.create(
+            save_parameter(BatchParameter(
                 batch=batch,
                 temperature=settings.temperature,
                 pressure=settings.pressure,
                 mixing_speed=settings.mixing_speed,
                 glazing_thickness=settings.glazing_thickness
-            )
+            ))
         else:
             # Если настройки не найдены, используем значения по умолчанию
-            BatchParameter.objects.create(
+            save_parameter(BatchParameter(
                 batch=batch,
                 temperature=170.0,
                 pressure=2.5,
                 mixing_speed=60.0,
                 glazing_thickness=2.0
-            )
+            ))
         
-        return Response(BatchSerializer(batch).data, status=status.HTTP_201_CREATED)
+        return Response(BatchSerializer(batch, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'])
     def stop_production(self, request, pk=None):
@@ -90,16 +286,20 @@ class BatchViewSet(viewsets.ModelViewSet):
         
         batch.is_active = False
         batch.end_time = timezone.now()
-        batch.save()
+        batch.save(update_fields=['is_active', 'end_time'])
+        invalidate_active_batch(batch.line_id)
+        # Кадры камеры линии больше не относятся к этой партии
+        vision.stop_camera(batch.line_id)
+        
+        # Переносим накопленные части счетчиков, чтобы итоги партии были точными
+        if fold_counters(batch.pk):
+            batch.refresh_from_db(fields=['total_count', 'defect_count'])
+        forget_control_chart(batch.pk)
         
         # Создаем уведомление о завершении партии
-        Notification.objects.create(
-            batch=batch,
-            message=f"Партия {batch.batch_number} остановлена",
-            notification_type='info'
-        )
+        notify(batch, f"Партия {batch.batch_number} остановлена", 'info')
         
-        return Response(BatchSerializer(batch).data)
+        return Response(BatchSerializer(batch, context=self.get_serializer_context()).data)
     
     @action(detail=True, methods=['post'])
     def simulate_parameter(self, request, pk=None):
@@ -114,61 +314,110 @@ class BatchViewSet(viewsets.ModelViewSet):
             )
         
         # Получаем последний параметр
-        last_parameter = BatchParameter.objects.filter(batch=batch).order_by('-timestamp').first()
+        last_parameter = latest_parameter(batch.pk)
         
-        # Если параметры отсутствуют, используем значения по умолчанию
+        # Если параметры отсутствуют, используем значения по умолчанию,
+        # иначе генерируем новые значения на основе последних с небольшим отклонением
         if not last_parameter:
-            settings = ProductionSettings.objects.filter(is_active=True).first()
-            if settings:
-                temperature = settings.temperature
-                pressure = settings.pressure
-                mixing_speed = settings.mixing_speed
-                glazing_thickness = settings.glazing_thickness
-            else:
-                temperature = 170.0
-                pressure = 2.5
-                mixing_speed = 60.0
-                glazing_thickness = 2.0
+            values = initial_parameters(batch.line_id)
         else:
-            # Генерируем новые значения на основе последних с небольшим отклонением
-            temperature = last_parameter.temperature + random.uniform(-0.1, 0.2)
-            pressure = last_parameter.pressure + random.uniform(-0.01, 0.02)
-            mixing_speed = last_parameter.mixing_speed + random.uniform(-0.2, 0.2)
-            glazing_thickness = last_parameter.glazing_thickness + random.uniform(-0.01, 0.02)
-        
-        # Проверяем критические значения для выявления брака
-        is_defect = (
-            temperature < 160.0 or temperature > 180.0 or
-            pressure < 2.0 or pressure > 3.8 or
-            mixing_speed < 55.0 or mixing_speed > 65.0 or
-            glazing_thickness < 1.8 or glazing_thickness > 2.8
-        )
+            values = RandomWalkSource.step({field: getattr(last_parameter, field) for field in PARAMETER_FIELDS})
+        
+        # Проверяем измерение по правилам активной настройки производства линии
+        now = timezone.now()
+        previous = None
+        if last_parameter:
+            previous = (
+                [getattr(last_parameter, field) for field in PARAMETER_FIELDS],
+                last_parameter.timestamp.timestamp()
+            )
+        is_defect = get_rule_set(get_active_settings(batch.line_id)).evaluate_one(values, now.timestamp(), previous)
         
         # Создаем новый параметр
-        parameter = BatchParameter.objects.create(
+        parameter = save_parameter(BatchParameter(
             batch=batch,
-            temperature=temperature,
-            pressure=pressure,
-            mixing_speed=mixing_speed,
-            glazing_thickness=glazing_thickness,
-            is_defect=is_defect
-        )
+            timestamp=now,
+            is_defect=is_defect,
+            **values
+        ))
         
-        # Обновляем статистику партии
-        batch.total_count += 1
+        # Обновляем статистику партии атомарно, без перезаписи строки партии
+        increment_counters(batch.pk, 1, int(is_defect))
         if is_defect:
-            batch.defect_count += 1
-            
             # Создаем уведомление о браке
-            Notification.objects.create(
-                batch=batch,
-                message=f"Обнаружен брак в партии {batch.batch_number}",
-                notification_type='warning'
+            notify(batch, defect_message(batch.batch_number), 'warning')
+        
+        return Response(BatchParameterSerializer(parameter).data)
+    
+    @action(detail=True, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def ingest(self, request, pk=None):
+        """
+        Пакетная загрузка измерений параметров партии.
+        Принимает JSON-массив, объект {"readings": [...]} или поток NDJSON
+        """
+        batch = self.get_object()
+        if not batch.is_active:
+            return Response(
+                {"detail": "Нельзя загружать параметры для неактивной партии"},
+                status=status.HTTP_400_BAD_REQUEST
             )
         
-        batch.save()
+        readings = request.data
+        if isinstance(readings, dict):
+            readings = readings.get('readings')
+        if not isinstance(readings, list):
+            return Response(
+                {"detail": "Ожидался массив измерений"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(readings) > MAX_READINGS_PER_REQUEST:
+            return Response(
+                {"detail": f"Слишком много измерений в запросе (максимум {MAX_READINGS_PER_REQUEST})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Response(BatchParameterSerializer(parameter).data)
+        return Response(ingest_readings(batch, readings))
+    
+    @action(detail=True, methods=['get'])
+    def trend(self, request, pk=None):
+        """
+        Поминутный тренд параметров партии и сводка за интервал
+        по таблице агрегатов, без чтения исходных измерений
+        """
+        batch = self.get_object()
+        rollups = filter_time_window(
+            ParameterRollup.objects.filter(batch=batch), request.query_params, field='minute'
+        )
+        minutes = []
+        for rollup in rollups.order_by('minute').values():
+            point = summarize(rollup)
+            point['minute'] = rollup['minute']
+            minutes.append(point)
+        
+        return Response({
+            'batch_id': batch.id,
+            'summary': overview(rollups),
+            'minutes': minutes,
+        })
+    
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Статистика партии: количество, среднее, σ, минимум, максимум,
+        перцентили и доля времени в допуске по параметрам, доля брака во времени
+        """
+        batch = self.get_object()
+        return Response(get_batch_statistics(batch))
+    
+    @action(detail=True, methods=['get'])
+    def spc(self, request, pk=None):
+        """
+        Состояние контрольных карт EWMA и CUSUM по параметрам партии:
+        цель, σ, сглаженное значение и его границы, накопленные суммы,
+        скользящие среднее и σ, признак дрейфа
+        """
+        batch = self.get_object()
+        return Response(get_control_chart(batch).as_dict())
 
 class BatchParameterViewSet(viewsets.ModelViewSet):
     """
@@ -176,83 +425,228 @@ class BatchParameterViewSet(viewsets.ModelViewSet):
     """
     queryset = BatchParameter.objects.all()
     serializer_class = BatchParameterSerializer
+    pagination_class = TimestampCursorPagination
     
     def get_queryset(self):
         queryset = BatchParameter.objects.all()
         batch_id = self.request.query_params.get('batch_id', None)
         if batch_id is not None:
             queryset = queryset.filter(batch_id=batch_id)
-        return queryset
+        return filter_time_window(queryset, self.request.query_params)
+    
+    def get_extra_page_items(self, cursor, descending, limit):
+        """Измерения из пачек (см. chunks.py) для страницы списка"""
+        return chunk_parameters(
+            self.request.query_params.get('batch_id', None),
+            parse_time_param(self.request.query_params, 'since'),
+            parse_time_param(self.request.query_params, 'until'),
+            cursor, descending, limit
+        )
+    
+    def get_object(self):
+        pk = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if not (pk or '').isdigit() or not is_chunk_reading(pk):
+            return super().get_object()
+        # Измерения из пачек доступны только для чтения
+        if self.request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            raise MethodNotAllowed(self.request.method)
+        parameter = get_chunk_parameter(pk)
+        if parameter is None:
+            raise NotFound()
+        return parameter
     
     @action(detail=False, methods=['get'])
     def current_parameters(self, request):
         """
-        Получение текущих параметров активной партии
+        Получение текущих параметров активной партии линии (line_id)
+        и риска брака по модели линии (defect_risk, null - модель не обучена)
         """
-        active_batch = Batch.objects.filter(is_active=True).first()
+        active_batch = get_active_batch(get_line_id(request))
         if not active_batch:
             return Response(
                 {"detail": "Нет активных партий"},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        parameter = BatchParameter.objects.filter(batch=active_batch).order_by('-timestamp').first()
+        parameter = get_latest_parameter(active_batch.pk)
         if not parameter:
             return Response(
                 {"detail": "Нет параметров для активной партии"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        if 'defect_risk' not in parameter:
+            # Измерение записано не через ingest: риск без учета приращений
+            parameter = {**parameter, 'defect_risk': score_parameter(active_batch.line_id, parameter)}
         
-        return Response(BatchParameterSerializer(parameter).data)
+        return Response(parameter)
+    
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """
+        Прореженные ряды параметров партии для графика.
+        method=minmax - min/max/avg по равным интервалам времени,
+        method=lttb - выборка точек, сохраняющая форму ряда
+        """
+        batch_id = request.query_params.get('batch_id')
+        if not batch_id:
+            return Response(
+                {"detail": "Не указан параметр batch_id"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            batch_id = int(batch_id)
+        except ValueError:
+            return Response(
+                {"detail": "Параметр batch_id должен быть целым числом"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        method = request.query_params.get('method', 'minmax')
+        if method not in ('minmax', 'lttb'):
+            return Response(
+                {"detail": "Неизвестный метод прореживания"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            points = int(request.query_params.get('points', SERIES_DEFAULT_POINTS))
+        except ValueError:
+            return Response(
+                {"detail": "Параметр points должен быть целым числом"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        points = max(SERIES_MIN_POINTS, min(points, SERIES_MAX_POINTS))
+        
+        since = parse_time_param(request.query_params, 'since')
+        until = parse_time_param(request.query_params, 'until')
+        if method == 'lttb':
+            return Response(self._lttb_series(batch_id, since, until, points))
+        
+        response = {
+            'batch_id': batch_id,
+            'method': method,
+            'total': 0,
+            'series': {},
+            'timestamps': [],
+        }
+        if since is None or until is None:
+            time_range = batch_time_range(batch_id)
+            if time_range is None:
+                return Response(response)
+            since, until = since or time_range[0], until or time_range[1]
+        start, end = since.timestamp(), until.timestamp()
+        
+        # Измерения не загружаются целиком: широкие корзины собираются из
+        # поминутных агрегатов (измерения последних секунд активной партии
+        # могут еще не попасть в них), узкие - из блоков измерений
+        aggregator = BucketAggregator(PARAMETER_FIELDS, points, start, end)
+        if (end - start) / points >= SERIES_ROLLUP_WIDTH:
+            response['resolution'] = 'minute'
+            aggregator.add_summaries(*minute_columns(batch_id, since, until))
+        else:
+            response['resolution'] = 'reading'
+            for block in iter_batch_blocks(batch_id, since, until):
+                aggregator.add(block['timestamp'], {field: block[field] for field in PARAMETER_FIELDS})
+        response['total'] = aggregator.total
+        if not response['total']:
+            return Response(response)
+        
+        aggregated = aggregator.result()
+        # Время отдается в миллисекундах Unix
+        response['timestamps'] = (aggregated['timestamp'] * 1000).round().astype('int64').tolist()
+        response['counts'] = aggregated['count'].tolist()
+        for field, values in aggregated['series'].items():
+            response['series'][field] = {key: array.tolist() for key, array in values.items()}
+        return Response(response)
+    
+    def _lttb_series(self, batch_id, since, until, points):
+        # LTTB выбирает точки по соседним корзинам, поэтому ряд нужен целиком
+        arrays = load_batch_arrays(batch_id, since, until)
+        timestamps = arrays['timestamp']
+        response = {
+            'batch_id': batch_id,
+            'method': 'lttb',
+            'total': len(timestamps),
+            'series': {},
+        }
+        if not len(timestamps):
+            response['timestamps'] = []
+            return response
+        for field in PARAMETER_FIELDS:
+            selected = lttb(timestamps, arrays[field], points)
+            response['series'][field] = {
+                'timestamps': (timestamps[selected] * 1000).round().astype('int64').tolist(),
+                'values': arrays[field][selected].tolist(),
+            }
+        return response
 
-class ProductionSettingsViewSet(viewsets.ModelViewSet):
+class ProductionSettingsViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API для управления настройками производства
     """
     queryset = ProductionSettings.objects.all()
+    version_resources = ('settings',)
     serializer_class = ProductionSettingsSerializer
     
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_active_settings()
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_active_settings()
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_active_settings()
+    
     @action(detail=True, methods=['post'])
     def activate(self, request, pk=None):
         """
-        Активация настройки производства
+        Активация настройки производства на линии (line_id, по умолчанию основная линия)
         """
         settings = self.get_object()
+        line = get_line(request)
+        line.active_settings = settings
+        # Поправки регулятора относятся к прежней настройке
+        line.setpoints = {}
+        line.save(update_fields=['active_settings', 'setpoints'])
         
-        # Деактивируем все настройки
-        ProductionSettings.objects.all().update(is_active=False)
+        # Признак is_active отражает настройку основной линии
+        if line.code == DEFAULT_LINE_CODE:
+            ProductionSettings.objects.exclude(pk=settings.pk).update(is_active=False)
+            settings.is_active = True
+        # Отметка времени обновляется при каждой активации: по ней регулятор
+        # замечает повторную активацию той же настройки
+        settings.save(update_fields=['is_active', 'timestamp'])
+        bump_version('settings')
+        invalidate_active_settings(line.pk)
         
-        # Активируем выбранную настройку
-        settings.is_active = True
-        settings.save()
-        
-        # Если есть активная партия, создаем новые параметры на основе настроек
-        active_batch = Batch.objects.filter(is_active=True).first()
+        # Если на линии есть активная партия, создаем новые параметры на основе настроек
+        active_batch = get_active_batch(line.pk)
         if active_batch:
+            # Контрольные карты строятся заново относительно новой настройки
+            reset_control_chart(active_batch)
+            
             # Создаем новый параметр
-            BatchParameter.objects.create(
+            save_parameter(BatchParameter(
                 batch=active_batch,
                 temperature=settings.temperature,
                 pressure=settings.pressure,
                 mixing_speed=settings.mixing_speed,
                 glazing_thickness=settings.glazing_thickness
-            )
+            ))
             
             # Создаем уведомление об изменении настроек
-            Notification.objects.create(
-                batch=active_batch,
-                message=f"Настройки производства изменены на {settings.name}",
-                notification_type='info'
-            )
+            notify(active_batch, f"Настройки производства изменены на {settings.name}", 'info')
         
         return Response(ProductionSettingsSerializer(settings).data)
     
     @action(detail=False, methods=['get'])
+    @conditional_get
     def active(self, request):
         """
-        Получение активной настройки производства
+        Получение активной настройки производства линии (line_id)
         """
-        settings = ProductionSettings.objects.filter(is_active=True).first()
+        settings = get_active_settings(get_line_id(request))
         if not settings:
             return Response(
                 {"detail": "Нет активных настроек производства"},
@@ -261,19 +655,35 @@ class ProductionSettingsViewSet(viewsets.ModelViewSet):
         
         return Response(ProductionSettingsSerializer(settings).data)
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class DefectRuleViewSet(viewsets.ModelViewSet):
+    """
+    API для управления правилами выявления брака
+    """
+    queryset = DefectRule.objects.all()
+    serializer_class = DefectRuleSerializer
+    
+    def get_queryset(self):
+        queryset = DefectRule.objects.all()
+        settings_id = self.request.query_params.get('settings_id', None)
+        if settings_id is not None:
+            queryset = queryset.filter(settings_id=settings_id)
+        return queryset
+
+class NotificationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API для управления уведомлениями
     """
     queryset = Notification.objects.all()
+    version_resources = ('notifications',)
     serializer_class = NotificationSerializer
+    pagination_class = TimestampCursorPagination
     
     def get_queryset(self):
         queryset = Notification.objects.all()
         batch_id = self.request.query_params.get('batch_id', None)
         if batch_id is not None:
             queryset = queryset.filter(batch_id=batch_id)
-        return queryset
+        return filter_time_window(queryset, self.request.query_params)
     
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
@@ -281,6 +691,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
         Отметка всех уведомлений как прочитанных
         """
         Notification.objects.filter(is_read=False).update(is_read=True)
+        bump_version('notifications')
         return Response({"status": "success"})
 
 class ComputerVisionViewSet(viewsets.ModelViewSet):
@@ -289,60 +700,99 @@ class ComputerVisionViewSet(viewsets.ModelViewSet):
     """
     queryset = ComputerVisionData.objects.all()
     serializer_class = ComputerVisionDataSerializer
+    pagination_class = TimestampCursorPagination
     
     def get_queryset(self):
         queryset = ComputerVisionData.objects.all()
         batch_id = self.request.query_params.get('batch_id', None)
         if batch_id is not None:
             queryset = queryset.filter(batch_id=batch_id)
-        return queryset
+        return filter_time_window(queryset, self.request.query_params)
     
     @action(detail=False, methods=['post'])
     def start_camera(self, request):
         """
-        Запуск камеры и обработки видео
+        Запуск камеры и обработки видео.
+        Кадры с заданной частотой (fps) поступают в конвейер распознавания
         """
-        active_batch = Batch.objects.filter(is_active=True).first()
+        line_id = get_line_id(request)
+        active_batch = get_active_batch(line_id)
         if not active_batch:
             return Response(
                 {"detail": "Нет активных партий для работы камеры"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Здесь будет код для инициализации камеры
-        # Это заглушка для будущей реализации
+        try:
+            fps = float(request.data.get('fps', 0)) or None
+        except (TypeError, ValueError):
+            return Response({"detail": "Параметр fps должен быть числом"}, status=status.HTTP_400_BAD_REQUEST)
+        if fps is not None and not 0 < fps <= MAX_CAMERA_FPS:
+            return Response(
+                {"detail": f"Параметр fps должен быть в диапазоне (0, {MAX_CAMERA_FPS}]"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
+        vision.start_camera(active_batch.line_id, active_batch.id, fps)
         return Response({"status": "success", "message": "Камера запущена"})
     
     @action(detail=False, methods=['post'])
     def stop_camera(self, request):
         """
-        Остановка камеры и обработки видео
+        Остановка камеры и обработки видео на линии (line_id)
         """
-        # Здесь будет код для остановки камеры
-        # Это заглушка для будущей реализации
-        
+        vision.stop_camera(resolve_line_id(get_line_id(request)))
         return Response({"status": "success", "message": "Камера остановлена"})
     
     @action(detail=False, methods=['post'])
     def process_frame(self, request):
         """
-        Обработка кадра видео через YOLO
+        Постановка кадра (файл frame) в очередь распознавания.
+        Кадр относится к активной партии линии (line_id).
+        Результат записывается асинхронно и приходит в потоке событий (vision);
+        его также можно запросить по адресу из заголовка Location (frame_job)
         """
-        active_batch = Batch.objects.filter(is_active=True).first()
+        active_batch = get_active_batch(get_line_id(request))
         if not active_batch:
             return Response(
                 {"detail": "Нет активных партий для обработки кадра"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Здесь будет код для обработки кадра через YOLO
-        # Это заглушка для будущей реализации - просто создаем случайные данные
-        vision_data = ComputerVisionData.objects.create(
-            batch=active_batch,
-            detected_objects={"objects": ["protein_bar"], "boxes": [[100, 100, 200, 200]]},
-            confidence_score=random.uniform(0.7, 0.99),
-            is_defect=random.choice([True, False])
+        upload = request.FILES.get('frame')
+        pipeline = vision.get_pipeline()
+        pipeline.start()
+        job_id = vision.new_job_id()
+        accepted = pipeline.submit(vision.Frame(active_batch.id, upload.read() if upload else None, job_id=job_id))
+        location = request.build_absolute_uri(reverse('computervisiondata-frame-job', kwargs={'job_id': job_id}))
+        return Response(
+            {"status": "accepted", "job_id": job_id, "location": location,
+             "accepted": accepted, "queued": pipeline.frames.qsize()},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': location}
         )
-        
-        return Response(ComputerVisionDataSerializer(vision_data).data) 
\ No newline at end of file
+    
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f]{32})')
+    def frame_job(self, request, job_id=None):
+        """
+        Состояние распознавания кадра, принятого process_frame:
+        queued, done (с результатом), dropped (вытеснен из очереди) или failed
+        """
+        job = vision.get_job(job_id)
+        if job is None:
+            raise NotFound('Задание не найдено или устарело')
+        data = {"job_id": job_id, "status": job['status']}
+        if job['status'] == 'done':
+            record = ComputerVisionData.objects.filter(pk=job['id']).first()
+            if record is None:
+                raise NotFound('Результат распознавания удален')
+            data['result'] = self.get_serializer(record).data
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def camera_stats(self, request):
+        """
+        Состояние конвейера распознавания: частота обработки, очередь,
+        отброшенные кадры и задержки по этапам
+        """
+        return Response(vision.get_pipeline().stats())
\ No newline at end of file
@@ -0,0 +1,493 @@
+"""
+Конвейер обработки кадров компьютерного зрения.
+
+Кадры из источника (загрузка через API или генератор кадров) попадают
+в ограниченную очередь. Пул рабочих потоков забирает их микропакетами
+и передает детектору, результаты копятся и записываются в базу пачками
+(bulk_create). Если детектор не успевает, самые старые кадры в очереди
+отбрасываются: для контроля линии важнее свежие кадры, чем полная история.
+
+Содержимое кадров сохраняется в хранилище кадров (см. api/frames.py),
+запись результата ссылается на кадр по хэшу.
+
+По каждому этапу (ожидание в очереди, сохранение кадра, распознавание,
+запись) ведутся счетчики задержек, по обработанным кадрам - фактическая
+частота.
+
+Кадры, загруженные через API, получают номер задания (job_id). Состояние
+задания (queued, done, dropped, failed) хранится в кэше
+VISION_JOB_TIMEOUT секунд, поэтому результат можно запросить у любого
+процесса приложения.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import get_active_batch
+from .events import publish_rows
+from .frames import store_frame
+from .models import ComputerVisionData
+from .versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY = 'api:vision:job:{job_id}'
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def get_job(job_id):
+    """Состояние задания распознавания: словарь с ключом status или None"""
+    return cache.get(JOB_KEY.format(job_id=job_id))
+
+
+def _set_jobs(jobs):
+    """Сохраняет состояния заданий {job_id: состояние}"""
+    if jobs:
+        cache.set_many(
+            {JOB_KEY.format(job_id=job_id): job for job_id, job in jobs.items()},
+            getattr(settings, 'VISION_JOB_TIMEOUT', 600)
+        )
+
+
+class Frame:
+    """Кадр, ожидающий обработки"""
+
+    __slots__ = ('batch_id', 'data', 'received_at', 'captured_at', 'job_id')
+
+    def __init__(self, batch_id, data=None, captured_at=None, job_id=None):
+        self.batch_id = batch_id
+        self.data = data
+        self.received_at = time.monotonic()
+        self.captured_at = captured_at or timezone.now()
+        self.job_id = job_id
+
+
+class Detector:
+    """
+    Детектор дефектов. detect получает список кадров и возвращает
+    список результатов той же длины: словари с ключами
+    detected_objects, confidence_score и is_defect.
+    """
+
+    def detect(self, frames):
+        raise NotImplementedError
+
+
+class FakeDetector(Detector):
+    """
+    Детектор-заглушка для разработки и тестов: случайный результат
+    и имитация задержки распознавания (на микропакет и на кадр)
+    """
+
+    def __init__(self, defect_rate=0.1, batch_latency=0.005, frame_latency=0.002, seed=None):
+        self.defect_rate = defect_rate
+        self.batch_latency = batch_latency
+        self.frame_latency = frame_latency
+        self.random = random.Random(seed)
+
+    def detect(self, frames):
+        time.sleep(self.batch_latency + self.frame_latency * len(frames))
+        results = []
+        for _ in frames:
+            is_defect = self.random.random() < self.defect_rate
+            results.append({
+                'detected_objects': {"objects": ["protein_bar"], "boxes": [[100, 100, 200, 200]]},
+                'confidence_score': self.random.uniform(0.7, 0.99),
+                'is_defect': is_defect,
+            })
+        return results
+
+
+class OnnxDetector(Detector):
+    """
+    Детектор на ONNX Runtime (CPU). Модель задается настройкой
+    VISION_ONNX_MODEL и должна принимать тензор N x 3 x H x W (float32, 0..1)
+    и возвращать N x K x 6: x1, y1, x2, y2, уверенность, класс.
+    Классы из VISION_DEFECT_CLASSES считаются дефектами. Кадры без
+    содержимого или с нечитаемым изображением не распознаются и дают
+    пустой результат без дефекта.
+    Требует пакетов onnxruntime и Pillow.
+    """
+
+    def __init__(self, model_path=None, input_size=640, score_threshold=0.5, defect_classes=None):
+        try:
+            import numpy as np
+            import onnxruntime
+            from PIL import Image
+        except ImportError as exc:
+            raise ImproperlyConfigured(f'Для OnnxDetector нужны пакеты onnxruntime и Pillow: {exc}')
+        model_path = model_path or getattr(settings, 'VISION_ONNX_MODEL', None)
+        if not model_path:
+            raise ImproperlyConfigured('Не задан путь к модели VISION_ONNX_MODEL')
+        self.np = np
+        self.image = Image
+        self.session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+        self.defect_classes = set(defect_classes or getattr(settings, 'VISION_DEFECT_CLASSES', [1]))
+
+    def preprocess(self, frame):
+        """Тензор 3 x H x W кадра или None, если изображения нет или его не прочитать"""
+        import io
+        if not frame.data:
+            return None
+        try:
+            image = self.image.open(io.BytesIO(frame.data)).convert('RGB').resize((self.input_size, self.input_size))
+        except OSError:
+            logger.warning('Не удалось прочитать изображение кадра партии %s', frame.batch_id)
+            return None
+        return self.np.asarray(image, dtype=self.np.float32).transpose(2, 0, 1) / 255.0
+
+    def detect(self, frames):
+        np = self.np
+        results = [{
+            'detected_objects': {"objects": [], "boxes": []},
+            'confidence_score': 0.0,
+            'is_defect': False,
+        } for _ in frames]
+        tensors = [self.preprocess(frame) for frame in frames]
+        positions = [index for index, tensor in enumerate(tensors) if tensor is not None]
+        if not positions:
+            return results
+        output = self.session.run(None, {self.input_name: np.stack([tensors[index] for index in positions])})[0]
+        for index, detections in zip(positions, output):
+            detections = detections[detections[:, 4] >= self.score_threshold]
+            classes = detections[:, 5].astype(int).tolist()
+            results[index] = {
+                'detected_objects': {
+                    "objects": classes,
+                    "boxes": detections[:, :4].round(1).tolist(),
+                },
+                'confidence_score': float(detections[:, 4].max()) if len(detections) else 0.0,
+                'is_defect': any(cls in self.defect_classes for cls in classes),
+            }
+        return results
+
+
+class StageTimer:
+    """Счетчик задержек одного этапа конвейера"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=1000)
+
+    def add(self, seconds, count=1):
+        self.count += count
+        self.total += seconds * count
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def snapshot(self):
+        recent = sorted(self.recent)
+        p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0.0
+        return {
+            'count': self.count,
+            'avg_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p99_ms': p99 * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class VisionPipeline:
+    """Очередь кадров, пул распознавания и пакетная запись результатов"""
+
+    def __init__(self, detector, queue_size=64, workers=2, batch_size=8, batch_timeout=0.02,
+                 flush_size=200, flush_interval=0.5):
+        self.detector = detector
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.pending = []
+        self.workers_threads = []
+        self.writer_thread = None
+        self.running = threading.Event()
+        self.writing = threading.Event()
+
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.written = 0
+        self.completed_at = deque(maxlen=10000)
+        self.timers = {name: StageTimer() for name in ('queue', 'store', 'inference', 'write')}
+
+    @property
+    def is_running(self):
+        return self.running.is_set()
+
+    def start(self):
+        with self.lock:
+            if self.running.is_set():
+                return
+            self.running.set()
+            self.writing.set()
+            self.workers_threads = [
+                threading.Thread(target=self._work, name=f'vision-worker-{index}', daemon=True)
+                for index in range(self.workers)
+            ]
+            self.writer_thread = threading.Thread(target=self._write_loop, name='vision-writer', daemon=True)
+        for thread in self.workers_threads + [self.writer_thread]:
+            thread.start()
+
+    def stop(self, timeout=5.0):
+        """Останавливает конвейер, дообработав кадры из очереди и записав результаты"""
+        self.running.clear()
+        for thread in self.workers_threads:
+            thread.join(timeout)
+        self.writing.clear()
+        if self.writer_thread is not None:
+            self.writer_thread.join(timeout)
+        self.workers_threads = []
+        self.writer_thread = None
+
+    def submit(self, frame):
+        """
+        Ставит кадр в очередь. Если очередь заполнена, вытесняет самый
+        старый кадр. Возвращает False, если ради нового кадра пришлось
+        отбросить более старый (обработка не успевает за источником).
+        """
+        with self.lock:
+            self.submitted += 1
+        if frame.job_id:
+            _set_jobs({frame.job_id: {'status': 'queued'}})
+        displaced = False
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return not displaced
+            except queue.Full:
+                try:
+                    oldest = self.frames.get_nowait()
+                    displaced = True
+                    with self.lock:
+                        self.dropped += 1
+                    if oldest.job_id:
+                        _set_jobs({oldest.job_id: {'status': 'dropped'}})
+                except queue.Empty:
+                    pass
+
+    def _next_batch(self):
+        try:
+            frames = [self.frames.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_timeout
+        while len(frames) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                frames.append(self.frames.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return frames
+
+    def _work(self):
+        while self.running.is_set() or not self.frames.empty():
+            frames = self._next_batch()
+            if not frames:
+                continue
+            taken = time.monotonic()
+            try:
+                hashes = [store_frame(frame.data) if frame.data else None for frame in frames]
+            except OSError:
+                logger.exception('Не удалось сохранить кадры')
+                hashes = [None] * len(frames)
+            started = time.monotonic()
+            try:
+                results = self.detector.detect(frames)
+            except Exception:
+                logger.exception('Ошибка распознавания микропакета из %s кадров', len(frames))
+                _set_jobs({frame.job_id: {'status': 'failed'} for frame in frames if frame.job_id})
+                continue
+            finished = time.monotonic()
+            records = []
+            for frame, image_hash, result in zip(frames, hashes, results):
+                record = ComputerVisionData(
+                    batch_id=frame.batch_id, timestamp=frame.captured_at, image_hash=image_hash, **result
+                )
+                record._job_id = frame.job_id
+                records.append(record)
+            with self.lock:
+                for frame in frames:
+                    self.timers['queue'].add(taken - frame.received_at)
+                self.timers['store'].add((started - taken) / len(frames), len(frames))
+                self.timers['inference'].add((finished - started) / len(frames), len(frames))
+                self.pending.extend(records)
+                self.processed += len(records)
+                self.completed_at.extend([finished] * len(records))
+
+    def _write_loop(self):
+        from .serializers import ComputerVisionDataSerializer
+
+        last_flush = time.monotonic()
+        try:
+            while self.writing.is_set() or self.pending:
+                with self.lock:
+                    due = len(self.pending) >= self.flush_size or time.monotonic() - last_flush >= self.flush_interval
+                    records = self.pending if due else []
+                    if due:
+                        self.pending = []
+                if not due:
+                    time.sleep(0.01)
+                    continue
+                last_flush = time.monotonic()
+                if not records:
+                    continue
+                started = time.monotonic()
+                close_old_connections()
+                try:
+                    ComputerVisionData.objects.bulk_create(records)
+                except Exception:
+                    logger.exception('Не удалось записать %s результатов распознавания', len(records))
+                    _set_jobs({record._job_id: {'status': 'failed'} for record in records if record._job_id})
+                    continue
+                _set_jobs({
+                    record._job_id: {'status': 'done', 'id': record.pk}
+                    for record in records if record._job_id
+                })
+                by_batch = {}
+                for record in records:
+                    by_batch.setdefault(record.batch_id, []).append(record)
+                for batch_id, batch_records in by_batch.items():
+                    publish_rows('vision', batch_id, ComputerVisionDataSerializer(batch_records, many=True).data)
+                bump_version('batches')
+                with self.lock:
+                    self.timers['write'].add((time.monotonic() - started) / len(records), len(records))
+                    self.written += len(records)
+        finally:
+            connection.close()
+
+    def stats(self, window=10.0):
+        now = time.monotonic()
+        with self.lock:
+            recent = sum(1 for moment in self.completed_at if now - moment <= window)
+            return {
+                'running': self.is_running,
+                'queued': self.frames.qsize(),
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'processed': self.processed,
+                'written': self.written,
+                'fps': recent / window,
+                'stages': {name: timer.snapshot() for name, timer in self.timers.items()},
+            }
+
+
+class SyntheticFrameSource:
+    """
+    Генератор кадров с заданной частотой (замена камеры на время разработки).
+    Если задана линия line_id, раз в check_interval секунд генератор
+    проверяет, что его партия все еще активна на линии, и останавливается,
+    если ее остановили (в том числе в другом процессе)
+    """
+
+    def __init__(self, pipeline, batch_id, fps=15.0, frame_size=0, line_id=None, check_interval=1.0):
+        self.pipeline = pipeline
+        self.batch_id = batch_id
+        self.fps = fps
+        self.frame_size = frame_size
+        self.line_id = line_id
+        self.check_interval = check_interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='vision-source', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(1.0)
+
+    def is_batch_active(self):
+        batch = get_active_batch(self.line_id)
+        return batch is not None and batch.pk == self.batch_id
+
+    def _run(self):
+        period = 1.0 / self.fps
+        next_frame = last_check = time.monotonic()
+        try:
+            while not self.stopped.is_set():
+                if self.line_id is not None and time.monotonic() - last_check >= self.check_interval:
+                    last_check = time.monotonic()
+                    if not self.is_batch_active():
+                        logger.info('Партия %s больше не активна, генератор кадров остановлен', self.batch_id)
+                        self.stopped.set()
+                        break
+                data = random.randbytes(self.frame_size) if self.frame_size else None
+                self.pipeline.submit(Frame(self.batch_id, data))
+                next_frame += period
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    self.stopped.wait(delay)
+                else:
+                    next_frame = time.monotonic()
+        finally:
+            connection.close()
+
+
+_pipeline = None
+_sources = {}
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """Конвейер процесса, создается по настройкам VISION_*"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            detector = import_string(getattr(settings, 'VISION_DETECTOR', 'api.vision.FakeDetector'))()
+            _pipeline = VisionPipeline(
+                detector,
+                queue_size=getattr(settings, 'VISION_QUEUE_SIZE', 64),
+                workers=getattr(settings, 'VISION_WORKERS', 2),
+                batch_size=getattr(settings, 'VISION_BATCH_SIZE', 8),
+                flush_interval=getattr(settings, 'VISION_FLUSH_INTERVAL', 0.5),
+            )
+        return _pipeline
+
+
+def start_camera(line_id, batch_id, fps=None):
+    """Запускает конвейер и генератор кадров линии для партии"""
+    pipeline = get_pipeline()
+    pipeline.start()
+    with _pipeline_lock:
+        source = _sources.pop(line_id, None)
+        if source is not None:
+            source.stop()
+        source = _sources[line_id] = SyntheticFrameSource(
+            pipeline, batch_id, fps or getattr(settings, 'VISION_CAMERA_FPS', 15.0), line_id=line_id
+        )
+        source.start()
+    return pipeline
+
+
+def stop_camera(line_id):
+    """Останавливает генератор кадров линии; уже принятые кадры дообрабатываются"""
+    with _pipeline_lock:
+        source = _sources.pop(line_id, None)
+        if source is not None:
+            source.stop()
@@ -9,8 +9,11 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'protein_bar_ius.settings')
 
-application = get_asgi_application() 
\ No newline at end of file
+# Uvicorn не отдает статические файлы: ресурсы админки и Swagger
+# (STATIC_URL) отдаются из каталогов приложений самим приложением
+application = ASGIStaticFilesHandler(get_asgi_application()) 
\ No newline at end of file
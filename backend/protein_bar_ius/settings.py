@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -71,6 +72,13 @@ DATABASES = {
     }
 }
 
+# Локальный запуск без PostgreSQL (например, для manage.py run_benchmarks): DB_ENGINE=sqlite
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,6 +110,151 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Cache
+# Кэш общий для сервера и фоновых команд (run_acquisition, run_controller
+# и др.), поэтому хранится в Redis. Без REDIS_URL используется кэш в
+# памяти процесса: он годится, только если все работает в одном процессе
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'protein-bar-ius',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'protein-bar-ius',
+        }
+    }
+
+# Срок жизни кэша активной партии, настройки и последнего измерения, с
+ACTIVE_CACHE_TIMEOUT = 60
+
+# Срок жизни версий ресурсов для условных GET-запросов (см. api/versions.py), с
+VERSION_CACHE_TIMEOUT = 60
+
+# Срок жизни скомпилированных наборов правил брака (см. api/rules.py), с
+RULE_SET_CACHE_TIMEOUT = 300
+
+# Потоковая передача событий (см. api/events.py): через Redis события
+# доходят до клиентов из всех процессов
+EVENTS_BROKER = 'api.events.RedisBroker' if REDIS_URL else 'api.events.InMemoryBroker'
+EVENTS_BUFFER_SIZE = 1000
+EVENTS_SUBSCRIBER_QUEUE_SIZE = 500
+EVENTS_HEARTBEAT_SECONDS = 15
+
+# Количество частей счетчиков партии (см. api/counters.py). 0 - счетчики
+# увеличиваются прямо в строке партии; больше 0 - параллельные писатели
+# увеличивают разные части, которые переносит manage.py fold_batch_counters
+BATCH_COUNTER_SHARDS = 0
+
+# Уведомления (см. api/notifications.py): окно объединения повторов, с,
+# и срок хранения прочитанных уведомлений, дней (manage.py purge_notifications)
+NOTIFICATION_COALESCE_SECONDS = 300
+NOTIFICATION_RETENTION_DAYS = 30
+
+# Контрольные карты параметров (см. api/spc.py): размер базового участка
+# и скользящего окна, параметры EWMA (λ, ширина границ в σ) и CUSUM
+# (допуск k и порог h в σ), нижняя граница σ в долях ширины допуска,
+# количество измерений для восстановления состояния и срок его хранения, с
+SPC_BASELINE_READINGS = 30
+SPC_WINDOW = 50
+SPC_EWMA_LAMBDA = 0.2
+SPC_EWMA_L = 3.0
+SPC_CUSUM_K = 0.5
+SPC_CUSUM_H = 5.0
+SPC_MIN_SIGMA_FRACTION = 0.01
+SPC_WARMUP_READINGS = 200
+SPC_STATE_TIMEOUT = 24 * 3600
+
+# Статистика партии (см. api/stats.py): количество корзин гистограммы
+# для перцентилей, количество интервалов доли брака во времени и срок
+# хранения накопленной статистики активной партии и итога завершенной, с
+STATS_HISTOGRAM_BINS = 1000
+STATS_DEFECT_RATE_POINTS = 120
+STATS_STATE_TIMEOUT = 3600
+STATS_FINAL_TIMEOUT = 24 * 3600
+
+# Поминутные агрегаты (см. api/rollups.py) обновляются в фоне через
+# указанное количество секунд после записи измерений
+ROLLUP_CATCH_UP_DELAY = 1.0
+
+# Хранение измерений (см. api/chunks.py): 'rows' - строка на измерение,
+# 'chunks' - пачки по PARAMETER_CHUNK_SIZE измерений в компактном виде
+PARAMETER_STORAGE = os.environ.get('PARAMETER_STORAGE', 'rows')
+PARAMETER_CHUNK_SIZE = 1000
+
+# Получение измерений на стороне сервера (manage.py run_acquisition)
+ACQUISITION_SOURCE = 'api.acquisition.RandomWalkSource'
+ACQUISITION_RATE_HZ = 10.0
+
+# Конвейер компьютерного зрения (см. api/vision.py).
+# Для распознавания на ONNX Runtime: VISION_DETECTOR = 'api.vision.OnnxDetector'
+# и путь к модели в VISION_ONNX_MODEL
+VISION_DETECTOR = 'api.vision.FakeDetector'
+VISION_ONNX_MODEL = os.environ.get('VISION_ONNX_MODEL')
+VISION_DEFECT_CLASSES = [1]
+VISION_QUEUE_SIZE = 64
+VISION_WORKERS = 2
+VISION_BATCH_SIZE = 8
+VISION_FLUSH_INTERVAL = 0.5
+VISION_CAMERA_FPS = 15.0
+# Сколько секунд хранится состояние задания распознавания кадра (process_frame)
+VISION_JOB_TIMEOUT = 600
+
+# Хранилище кадров (см. api/frames.py) и сроки их хранения, дней
+# (manage.py purge_frames): кадры с дефектами хранятся дольше
+FRAMES_ROOT = Path(os.environ.get('FRAMES_ROOT', BASE_DIR / 'frames'))
+FRAMES_THUMBNAIL_SIZE = 160
+FRAMES_RETENTION_DEFECT_DAYS = 90
+FRAMES_RETENTION_OK_DAYS = 7
+
+# Архив измерений завершенных партий (см. api/archive.py,
+# manage.py archive_batches): партии, завершенные больше
+# ARCHIVE_AFTER_DAYS дней назад, переносятся из базы в файлы
+ARCHIVE_ROOT = Path(os.environ.get('ARCHIVE_ROOT', BASE_DIR / 'archive'))
+ARCHIVE_AFTER_DAYS = 30
+
+# Метрики запросов (см. api/metrics.py, /metrics): запросы дольше
+# METRICS_SLOW_REQUEST_MS пишутся в лог вместе с SQL (None - не писать),
+# повтор одного SQL-запроса METRICS_NPLUSONE_THRESHOLD раз считается N+1
+METRICS_ENABLED = True
+METRICS_SLOW_REQUEST_MS = 500
+METRICS_NPLUSONE_THRESHOLD = 10
+
+# Модель риска брака (см. api/risk.py, manage.py train_risk_model):
+# риск считается при записи измерений, обучение - отдельным процессом;
+# дефект зрения не дальше RISK_VISION_WINDOW секунд помечает измерение
+RISK_MODEL_CACHE_TIMEOUT = 60
+RISK_LEARNING_RATE = 0.1
+RISK_L2 = 1e-4
+RISK_BATCH_SIZE = 256
+RISK_VISION_WINDOW = 1.0
+
+# Регулятор уставок (см. api/controller.py, manage.py run_controller):
+# шаг регулирования CONTROLLER_RATE_HZ раз в секунду, запись изменений
+# раз в CONTROLLER_FLUSH_INTERVAL секунд; контуры по параметрам задаются
+# в CONTROLLER_LOOPS поверх DEFAULT_LOOPS. Уставки с поправками
+# регулятора кэшируются на SETPOINTS_CACHE_TIMEOUT секунд
+CONTROLLER_RATE_HZ = 10.0
+CONTROLLER_POLL_INTERVAL = 0.5
+CONTROLLER_FLUSH_INTERVAL = 1.0
+CONTROLLER_WARMUP_SECONDS = 60
+CONTROLLER_STALE_SECONDS = 5.0
+CONTROLLER_RISK_THRESHOLD = 0.5
+CONTROLLER_LOOPS = {}
+SETPOINTS_CACHE_TIMEOUT = 1
+
+# Воспроизведение партий с другими настройками (см. api/replay.py,
+# manage.py replay_batches): длительность пачки измерений, с, и число
+# процессов (None - по числу ядер)
+REPLAY_PACKET_SECONDS = 1.0
+REPLAY_WORKERS = None
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -18,8 +18,9 @@ export const stopProduction = (id) => api.post(`/batches/${id}/stop_production/`
 export const simulateParameter = (id) => api.post(`/batches/${id}/simulate_parameter/`);
 
 // Параметры API
-export const getParameters = (batchId) => api.get('/parameters/', { params: { batch_id: batchId } });
+export const getParameters = (batchId, params = {}) => api.get('/parameters/', { params: { batch_id: batchId, ...params } });
 export const getCurrentParameters = () => api.get('/parameters/current_parameters/');
+export const getParameterSeries = (batchId, params = {}) => api.get('/parameters/series/', { params: { batch_id: batchId, ...params } });
 
 // Настройки API
 export const getSettings = () => api.get('/settings/');
@@ -40,4 +41,13 @@ export const startCamera = () => api.post('/computer-vision/start_camera/');
 export const stopCamera = () => api.post('/computer-vision/stop_camera/');
 export const processFrame = () => api.post('/computer-vision/process_frame/');
 
+// Поток событий (Server-Sent Events)
+export const openEventStream = (params = {}) => {
+  const query = new URLSearchParams(params).toString();
+  return new EventSource(`${API_URL}/events/${query ? `?${query}` : ''}`);
+};
+
+// Следующая страница списка по ссылке next из ответа {next, first, results}
+export const getNextPage = (url) => api.get(url);
+
 export default api; 
\ No newline at end of file
@@ -5,7 +5,7 @@ import {
 } from '@mui/material';
 import RefreshIcon from '@mui/icons-material/Refresh';
 import DeleteSweepIcon from '@mui/icons-material/DeleteSweep';
-import { getNotifications, markAllRead } from '../api';
+import { getNotifications, markAllRead, openEventStream } from '../api';
 
 const NotificationsPanel = () => {
   const [notifications, setNotifications] = useState([]);
@@ -18,7 +18,7 @@ const NotificationsPanel = () => {
     
     try {
       const response = await getNotifications();
-      setNotifications(response.data);
+      setNotifications(response.data.results);
     } catch (err) {
       console.error('Ошибка при получении уведомлений:', err);
       setError('Не удалось получить уведомления');
@@ -30,10 +30,19 @@ const NotificationsPanel = () => {
   useEffect(() => {
     fetchNotifications();
     
-    // Настраиваем интервал для автоматического обновления уведомлений
-    const interval = setInterval(fetchNotifications, 10000);
+    // Новые уведомления приходят через поток событий сервера вместо опроса
+    const source = openEventStream();
+    source.addEventListener('notification', (event) => {
+      // Повторы приходят как обновление уже показанного уведомления (occurrences)
+      const received = JSON.parse(event.data).reverse();
+      const ids = new Set(received.map((notification) => notification.id));
+      setNotifications((previous) => [
+        ...received,
+        ...previous.filter((notification) => !ids.has(notification.id))
+      ].slice(0, 100));
+    });
     
-    return () => clearInterval(interval);
+    return () => source.close();
   }, []);
   
   const handleMarkAllRead = async () => {
@@ -120,6 +129,7 @@ const NotificationsPanel = () => {
                         sx={{ fontWeight: notification.is_read ? 'normal' : 'bold' }}
                       >
                         {notification.message}
+                        {notification.occurrences > 1 && ` (×${notification.occurrences})`}
                       </Typography>
                       <Chip 
                         label={
@@ -138,7 +148,9 @@ const NotificationsPanel = () => {
                       variant="body2"
                       color="text.secondary"
                     >
-                      {new Date(notification.timestamp).toLocaleString()}
+                      {notification.occurrences > 1
+                        ? `${new Date(notification.timestamp).toLocaleString()} — ${new Date(notification.last_timestamp).toLocaleString()}`
+                        : new Date(notification.timestamp).toLocaleString()}
                     </Typography>
                   }
                 />
@@ -11,7 +11,7 @@ import {
   Tooltip,
   Legend,
 } from 'chart.js';
-import { getParameters } from '../api';
+import { getParameterSeries } from '../api';
 
 // Регистрация компонентов Chart.js
 ChartJS.register(
@@ -40,24 +40,22 @@ const ParametersChart = ({ activeBatch, currentParameters }) => {
       setError('');
       
       try {
-        const response = await getParameters(activeBatch.id);
-        const parameters = response.data;
+        const response = await getParameterSeries(activeBatch.id);
+        const { timestamps: times, series } = response.data;
         
-        if (parameters.length === 0) {
+        if (times.length === 0) {
           setError('Нет данных для отображения на графике');
           setChartData(null);
           return;
         }
         
-        const timestamps = parameters.map(param => {
-          const date = new Date(param.timestamp);
-          return date.toLocaleTimeString();
-        }).reverse();
+        // Сервер возвращает не более ~1000 усредненных точек на ряд
+        const timestamps = times.map(time => new Date(time).toLocaleTimeString());
         
-        const temperatureData = parameters.map(param => param.temperature).reverse();
-        const pressureData = parameters.map(param => param.pressure).reverse();
-        const mixingSpeedData = parameters.map(param => param.mixing_speed).reverse();
-        const glazingThicknessData = parameters.map(param => param.glazing_thickness).reverse();
+        const temperatureData = series.temperature.avg;
+        const pressureData = series.pressure.avg;
+        const mixingSpeedData = series.mixing_speed.avg;
+        const glazingThicknessData = series.glazing_thickness.avg;
         
         setChartData({
           labels: timestamps,
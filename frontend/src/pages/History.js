@@ -4,18 +4,21 @@ import {
   Alert, Table, TableBody, TableCell, TableContainer, 
   TableHead, TableRow, IconButton, Collapse,
   Chip, Accordion, AccordionSummary, AccordionDetails,
-  Grid, Card, CardContent, Divider
+  Grid, Card, CardContent, Divider, Button
 } from '@mui/material';
 import KeyboardArrowDownIcon from '@mui/icons-material/KeyboardArrowDown';
 import KeyboardArrowUpIcon from '@mui/icons-material/KeyboardArrowUp';
 import ExpandMoreIcon from '@mui/icons-material/ExpandMore';
-import { getBatches, getParameters } from '../api';
+import { getBatches, getParameters, getNextPage } from '../api';
 
 // Компонент для отображения строки партии в таблице
 const BatchRow = ({ batch, onExpandChange }) => {
   const [open, setOpen] = useState(false);
   const [parameters, setParameters] = useState([]);
+  // Ссылка на следующую страницу измерений (курсорная пагинация API)
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
   
   const toggleOpen = () => {
@@ -34,7 +37,8 @@ const BatchRow = ({ batch, onExpandChange }) => {
     
     try {
       const response = await getParameters(batch.id);
-      setParameters(response.data);
+      setParameters(response.data.results);
+      setNextPage(response.data.next);
     } catch (err) {
       console.error('Ошибка при получении параметров партии:', err);
       setError('Не удалось получить параметры партии');
@@ -43,6 +47,23 @@ const BatchRow = ({ batch, onExpandChange }) => {
     }
   };
   
+  // Догрузка следующей страницы по ссылке next
+  const fetchMoreParameters = async () => {
+    setLoadingMore(true);
+    setError('');
+    
+    try {
+      const response = await getNextPage(nextPage);
+      setParameters((current) => [...current, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      console.error('Ошибка при получении параметров партии:', err);
+      setError('Не удалось получить параметры партии');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+  
   // Форматирование времени
   const formatDateTime = (dateTimeStr) => {
     return new Date(dateTimeStr).toLocaleString();
@@ -152,6 +173,19 @@ const BatchRow = ({ batch, onExpandChange }) => {
                   </Table>
                 </TableContainer>
               )}
+              
+              {!loading && parameters.length > 0 && (
+                <Box sx={{ display: 'flex', alignItems: 'center', justifyContent: 'space-between', mt: 1 }}>
+                  <Typography variant="body2" color="text.secondary">
+                    Показано {parameters.length} из {batch.total_count}
+                  </Typography>
+                  {nextPage && (
+                    <Button size="small" onClick={fetchMoreParameters} disabled={loadingMore}>
+                      {loadingMore ? 'Загрузка...' : 'Показать еще'}
+                    </Button>
+                  )}
+                </Box>
+              )}
             </Box>
           </Collapse>
         </TableCell>